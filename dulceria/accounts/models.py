@@ -65,6 +65,8 @@ class UserProfile(models.Model):
     role = models.CharField(max_length=50, choices=ROLE_CHOICES, default='employee', verbose_name='Rol')
     phone = models.CharField(max_length=20, blank=True, verbose_name='Teléfono')
     avatar = models.ImageField(upload_to='perfiles/', blank=True, null=True, verbose_name='Foto de perfil')
+    # Miniaturas y WebP generados a partir de `avatar` (ver production/imagenes.py)
+    avatar_derivados = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Derivados de la foto')
     state = models.CharField(max_length=20, choices=STATE_CHOICES, default='ACTIVO', verbose_name='Estado')
     mfa_enabled = models.BooleanField(default=False, verbose_name='MFA habilitado')
     sesiones_activas = models.PositiveIntegerField(default=0, verbose_name='Sesiones activas')
@@ -0,0 +1,80 @@
+"""
+Reporte de usuarios en Excel
+
+Lo genera el worker de exportaciones (production.export_jobs); la vista
+export_users_excel solo encola el trabajo.
+"""
+from django.db.models import Count
+from django.utils import timezone
+from openpyxl import Workbook
+
+from .models import UserProfile
+
+
+ENCABEZADOS_USUARIOS = [
+    'Username', 'Email', 'Nombre', 'Apellido', 'Rol', 'Estado', 'MFA',
+    'Organización', 'Teléfono', 'Área/Unidad', 'Observaciones', 'Último acceso'
+]
+
+
+def _ultimo_acceso(valor):
+    if not valor:
+        return ''
+    if timezone.is_aware(valor):
+        valor = timezone.localtime(valor)
+    return valor.strftime('%d-%m-%Y %H:%M')
+
+
+def escribir_reporte_usuarios(destino, progreso=None, cada=500):
+    """
+    Escribir el reporte de usuarios (hoja Usuarios y Resumen por Rol) en `destino`
+
+    `progreso`, si se entrega, se llama con las filas escritas cada `cada`
+    filas y al terminar. Retorna el total de usuarios exportados.
+    """
+    wb = Workbook(write_only=True)
+    roles = dict(UserProfile.ROLE_CHOICES)
+    estados = dict(UserProfile.STATE_CHOICES)
+
+    ws_usuarios = wb.create_sheet(title='Usuarios')
+    ws_usuarios.append(ENCABEZADOS_USUARIOS)
+    perfiles = UserProfile.objects.order_by('role', 'user__username').values_list(
+        'user__username', 'user__email', 'user__first_name', 'user__last_name', 'role', 'state',
+        'mfa_enabled', 'organization__name', 'phone', 'area', 'observaciones', 'user__last_login',
+    )
+    total = 0
+    for username, email, nombres, apellidos, rol, estado, mfa, organizacion, telefono, area, observaciones, ultimo in perfiles.iterator():
+        ws_usuarios.append([
+            username,
+            email,
+            nombres,
+            apellidos,
+            roles.get(rol, rol),
+            estados.get(estado, estado),
+            'Sí' if mfa else 'No',
+            organizacion or '',
+            telefono,
+            area,
+            observaciones,
+            _ultimo_acceso(ultimo),
+        ])
+        total += 1
+        if progreso and total % cada == 0:
+            progreso(total)
+
+    ws_resumen = wb.create_sheet(title='Resumen por Rol')
+    ws_resumen.append(['Rol', 'Descripción', 'Total de usuarios'])
+    conteos = {fila['role']: fila['total'] for fila in UserProfile.objects.values('role').annotate(total=Count('id'))}
+    for rol_value, rol_label in UserProfile.ROLE_CHOICES:
+        ws_resumen.append([rol_value, rol_label, conteos.get(rol_value, 0)])
+
+    wb.save(destino)
+    if progreso:
+        progreso(total)
+    return total
+
+
+def exportar_usuarios(trabajo, destino, avance):
+    """Escritor del tipo 'usuarios' para production.export_jobs"""
+    avance.estimar(UserProfile.objects.count())
+    return escribir_reporte_usuarios(destino, progreso=avance)
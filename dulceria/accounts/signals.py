@@ -224,3 +224,10 @@ def audit_movimiento_create(sender, instance, created, **kwargs):
             )
     except Exception:
         pass
+
+
+@receiver(post_save, sender=UserProfile)
+def generar_derivados_avatar(sender, instance, **kwargs):
+    """Generar miniaturas y WebP del avatar cuando cambia la foto de perfil"""
+    from production.imagenes import registrar_imagen_guardada
+    registrar_imagen_guardada(instance, 'avatar', 'avatar_derivados', kwargs.get('update_fields'))
@@ -113,6 +113,44 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# ==========================
+# EXPORTACIONES EN SEGUNDO PLANO
+# ==========================
+
+# 'hilo': las procesa un hilo del servidor web; 'comando': solo `manage.py procesar_exportaciones`
+EXPORTACIONES_WORKER = os.getenv('EXPORTACIONES_WORKER', 'hilo')
+EXPORTACIONES_DIAS_RETENCION = int(os.getenv('EXPORTACIONES_DIAS_RETENCION', '7'))
+
+# ==========================
+# ARCHIVO DE MOVIMIENTOS
+# ==========================
+
+# Antigüedad (días) desde la que `manage.py archivar_movimientos` traslada movimientos al archivo
+ARCHIVO_MOVIMIENTOS_DIAS = int(os.getenv('ARCHIVO_MOVIMIENTOS_DIAS', '365'))
+
+# ==========================
+# IDEMPOTENCIA DE MOVIMIENTOS
+# ==========================
+
+# Horas durante las que un reenvío del mismo formulario de movimiento devuelve el resultado original
+IDEMPOTENCIA_HORAS = int(os.getenv('IDEMPOTENCIA_HORAS', '24'))
+
+# ==========================
+# CONSULTA DE CÓDIGOS DE BARRAS
+# ==========================
+
+# Segundos entre revisiones de la versión compartida del índice de códigos (cambios de otros procesos)
+INDICE_CODIGOS_SEGUNDOS = float(os.getenv('INDICE_CODIGOS_SEGUNDOS', '1.0'))
+
+# ==========================
+# IMÁGENES DERIVADAS
+# ==========================
+
+# Anchos (px) de las miniaturas generadas para productos y avatares, separados por coma
+IMAGENES_ANCHOS = [int(ancho) for ancho in os.getenv('IMAGENES_ANCHOS', '160,320,640').split(',') if ancho.strip()]
+# Calidad de los derivados WebP y JPEG (1-100)
+IMAGENES_CALIDAD = int(os.getenv('IMAGENES_CALIDAD', '80'))
+
 # ==========================
 # CONFIGURACIÓN DE EMAIL
 # ==========================
@@ -183,6 +221,14 @@ if not USE_REDIS:
         }
     }
 
+# Límites de cache_utils.CacheFilas: los resultados más grandes se consultan siempre a la base de datos
+CACHE_FILAS_MAX_FILAS = int(os.getenv('CACHE_FILAS_MAX_FILAS', '5000'))
+CACHE_FILAS_MAX_BYTES = int(os.getenv('CACHE_FILAS_MAX_BYTES', str(1024 * 1024)))
+
+# Segundos que se reutiliza el grid renderizado de la tienda online. Guardar productos o
+# categorías lo invalida al instante; los cambios de stock por movimientos se ven al expirar
+TIENDA_CACHE_SEGUNDOS = int(os.getenv('TIENDA_CACHE_SEGUNDOS', '300'))
+
 # ==========================
 # CONFIGURACIÓN DE SESIONES Y SEGURIDAD
 # ==========================
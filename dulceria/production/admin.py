@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Category, Product, AlertRule, ProductAlertRule, Bodega, MovimientoInventario, Proveedor, ProductoProveedor
+from .models import Category, Product, AlertRule, ProductAlertRule, Bodega, MovimientoInventario, Proveedor, ProductoProveedor, StockBodega, StockSnapshot, VencimientoProximo, ContadorInventario, TrabajoExportacion, MovimientoArchivado, ClaveIdempotencia, Secuencia
 # Measurement y Device no se usan - comentado
 # from .models import Measurement
 
@@ -26,6 +26,12 @@ class ProductAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at')
     inlines = [ProductAlertRuleInline]
     
+    def get_readonly_fields(self, request, obj=None):
+        # El stock de un producto existente cambia con movimientos de inventario
+        if obj is not None:
+            return self.readonly_fields + ('stock',)
+        return self.readonly_fields
+    
     fieldsets = (
         ('Información Básica', {
             'fields': ('name', 'sku', 'category', 'description')
@@ -102,7 +108,7 @@ class MovimientoInventarioAdmin(admin.ModelAdmin):
     
     fieldsets = (
         ('Datos del Movimiento', {
-            'fields': ('fecha', 'tipo', 'producto', 'proveedor', 'bodega', 'cantidad')
+            'fields': ('fecha', 'tipo', 'producto', 'proveedor', 'bodega', 'bodega_destino', 'cantidad', 'costo_unitario')
         }),
         ('Control Avanzado', {
             'fields': ('lote', 'serie', 'fecha_vencimiento'),
@@ -123,6 +129,108 @@ class MovimientoInventarioAdmin(admin.ModelAdmin):
             obj.creado_por = request.user
         super().save_model(request, obj, form, change)
 
+@admin.register(StockBodega)
+class StockBodegaAdmin(admin.ModelAdmin):
+    list_display = ('producto', 'bodega', 'lote', 'fecha_vencimiento', 'cantidad', 'updated_at')
+    search_fields = ('producto__sku', 'producto__name', 'bodega__codigo', 'lote')
+    list_filter = ('bodega',)
+    ordering = ('bodega__codigo', 'producto__name', 'fecha_vencimiento', 'lote')
+    list_select_related = ('producto', 'bodega')
+    # Proyección mantenida por los movimientos: solo lectura
+    readonly_fields = ('producto', 'bodega', 'lote', 'fecha_vencimiento', 'cantidad', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'producto', 'bodega', 'cantidad', 'created_at')
+    search_fields = ('producto__sku', 'producto__name')
+    list_filter = ('fecha', 'bodega')
+    ordering = ('-fecha', 'producto__name')
+    list_select_related = ('producto', 'bodega')
+    readonly_fields = ('fecha', 'producto', 'bodega', 'cantidad', 'created_at')
+    date_hierarchy = 'fecha'
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(VencimientoProximo)
+class VencimientoProximoAdmin(admin.ModelAdmin):
+    list_display = ('fecha_vencimiento', 'producto', 'bodega', 'lote', 'cantidad', 'origen', 'generado_en')
+    search_fields = ('producto__sku', 'producto__name', 'lote')
+    list_filter = ('origen', 'bodega')
+    ordering = ('fecha_vencimiento', 'producto__name')
+    list_select_related = ('producto', 'bodega')
+    # Resultado del comando scan_vencimientos: solo lectura
+    readonly_fields = ('origen', 'producto', 'bodega', 'lote', 'fecha_vencimiento', 'cantidad', 'generado_en')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(ContadorInventario)
+class ContadorInventarioAdmin(admin.ModelAdmin):
+    list_display = ('clave', 'valor', 'updated_at')
+    search_fields = ('clave',)
+    ordering = ('clave',)
+    # Mantenidos por los movimientos y productos; se corrigen con reconciliar_contadores
+    readonly_fields = ('clave', 'valor', 'updated_at')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(Secuencia)
+class SecuenciaAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'valor')
+    ordering = ('nombre',)
+    # Las incrementa siguiente_valor(); editarlas a mano podría repetir SKU
+    readonly_fields = ('nombre', 'valor')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(MovimientoArchivado)
+class MovimientoArchivadoAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'tipo', 'producto', 'bodega', 'cantidad', 'lote', 'doc_referencia', 'archivado_en')
+    list_filter = ('tipo', 'bodega')
+    search_fields = ('producto__sku', 'producto__name', 'doc_referencia', 'lote')
+    ordering = ('-fecha',)
+    list_select_related = ('producto', 'bodega')
+    # Período cerrado: los movimientos archivados son de solo lectura
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(TrabajoExportacion)
+class TrabajoExportacionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'estado', 'progreso', 'total', 'solicitado_por', 'created_at', 'terminado_en')
+    list_filter = ('tipo', 'estado')
+    search_fields = ('nombre_archivo', 'solicitado_por__username')
+    ordering = ('-created_at',)
+    # Los crea y actualiza el worker de exportaciones (ver export_jobs)
+    readonly_fields = ('tipo', 'parametros', 'estado', 'progreso', 'total', 'archivo', 'nombre_archivo', 'error',
+                       'solicitado_por', 'created_at', 'iniciado_en', 'terminado_en')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(ClaveIdempotencia)
+class ClaveIdempotenciaAdmin(admin.ModelAdmin):
+    list_display = ('clave', 'usuario', 'created_at')
+    search_fields = ('clave', 'usuario__username')
+    ordering = ('-created_at',)
+    # Las registra movimiento_create (ver inventory_idempotencia)
+    readonly_fields = ('usuario', 'clave', 'resultado', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
 @admin.register(Proveedor)
 class ProveedorAdmin(admin.ModelAdmin):
     list_display = ('rut', 'razon_social', 'nombre_fantasia', 'email', 'estado', 'created_at')
@@ -11,8 +11,12 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db import models
 from django.db.models import Q, CharField, TextField, IntegerField, DecimalField, DateField, DateTimeField, BooleanField, EmailField, URLField, ForeignKey, ManyToManyField
 from django.http import JsonResponse
+from django.urls import reverse_lazy
+from django.utils.text import format_lazy
 from django.views.decorators.http import require_POST, require_http_methods
 from django.apps import apps
+from .inventory_autocompletar import ALCANCE_TODOS, SelectAutocompletar
+from .models import Product, Proveedor
 from .views import get_user_role
 
 
@@ -38,6 +42,11 @@ def check_permission(request, app_label, model_name, permission_type):
     return request.user.has_perm(permission)
 
 
+def _url_autocompletar(nombre_url):
+    """URL de autocompletado con el alcance 'todos' (las mismas filas que ofrece el campo del panel)"""
+    return format_lazy('{}?alcance={}', reverse_lazy(nombre_url), ALCANCE_TODOS)
+
+
 def get_widget_for_field(field):
     """Obtener widget apropiado según el tipo de campo del modelo"""
     # Verificar si es una instancia de campo o una clase
@@ -107,6 +116,16 @@ def get_widget_for_field(field):
     
     # ForeignKey
     elif isinstance(field, (ForeignKey, models.ForeignKey)):
+        # Productos y proveedores pueden ser miles: se buscan al escribir en vez de listarlos todos.
+        # El campo ofrece todas las filas, así que se busca en el alcance 'todos' (también inactivos y pendientes)
+        if field.remote_field.limit_choices_to:
+            return widgets.Select(attrs={'class': 'form-control'})
+        if field.related_model is Product:
+            return SelectAutocompletar(
+                _url_autocompletar('autocompletar_productos_api'), placeholder='SKU, nombre o código de barras...',
+            )
+        if field.related_model is Proveedor:
+            return SelectAutocompletar(_url_autocompletar('autocompletar_proveedores_api'), placeholder='RUT o razón social...')
         return widgets.Select(attrs={'class': 'form-control'})
     
     # ManyToManyField
@@ -642,10 +661,9 @@ def admin_model_delete(request, app_label, model_name, pk):
 @login_required
 @require_http_methods(["GET"])
 def admin_model_export_excel(request, app_label, model_name):
-    """Exportar objetos de un modelo a Excel"""
-    from openpyxl import Workbook
-    from django.http import HttpResponse
+    """Encolar la exportación a Excel de los objetos de un modelo"""
     from django.utils import timezone
+    from .export_jobs import encolar_exportacion
     
     role = get_user_role(request)
     
@@ -664,40 +682,62 @@ def admin_model_export_excel(request, app_label, model_name):
         messages.error(request, 'No tienes permiso para exportar este modelo.')
         return redirect('admin_panel')
     
+    timestamp = timezone.localtime(timezone.now()).strftime('%Y%m%d_%H%M%S')
+    filename = f"{model._meta.verbose_name_plural.replace(' ', '_')}_{timestamp}.xlsx"
+    encolar_exportacion('modelo_admin', request.user, filename, {
+        'app_label': app_label,
+        'model_name': model_name,
+        'q': request.GET.get('q', ''),
+    })
+    messages.info(request, f'La exportación de {model._meta.verbose_name_plural} se está generando. Podrás descargarla desde "Mis exportaciones".')
+    return redirect('exportaciones_list')
+
+
+def exportar_listado_modelo(trabajo, destino, avance):
+    """
+    Escritor del tipo 'modelo_admin' para production.export_jobs
+    
+    Aplica el get_queryset del admin (con el usuario que pidió la exportación),
+    la búsqueda `q` sobre search_fields y el orden del admin, y escribe las
+    columnas de list_display.
+    """
+    from django.http import HttpRequest
+    from openpyxl import Workbook
+    
+    app_label = trabajo.parametros['app_label']
+    model_name = trabajo.parametros['model_name']
+    search_query = trabajo.parametros.get('q', '')
+    
+    model = get_model_from_string(app_label, model_name)
+    if not model:
+        raise ValueError(f'Modelo {app_label}.{model_name} no encontrado.')
     model_admin = get_model_admin(app_label, model_name)
     
-    # Obtener queryset (aplicar los mismos filtros que en la lista)
-    queryset = model.objects.all()
+    # get_queryset de algunos admins filtra según request.user
+    request = HttpRequest()
+    request.user = trabajo.solicitado_por
     
-    # Aplicar filtros del admin si existen
+    queryset = model.objects.all()
     if model_admin and hasattr(model_admin, 'get_queryset'):
         queryset = model_admin.get_queryset(request)
     
-    # Aplicar búsqueda si existe
-    search_query = request.GET.get('q', '')
     if search_query and model_admin and hasattr(model_admin, 'search_fields'):
-        search_fields = model_admin.search_fields
         search_filter = Q()
-        for field in search_fields:
-            if '__' in field:
-                search_filter |= Q(**{f'{field}__icontains': search_query})
-            else:
-                search_filter |= Q(**{f'{field}__icontains': search_query})
+        for field in model_admin.search_fields:
+            search_filter |= Q(**{f'{field}__icontains': search_query})
         queryset = queryset.filter(search_filter)
     
-    # Ordenamiento
-    if model_admin and hasattr(model_admin, 'ordering'):
+    if model_admin and hasattr(model_admin, 'ordering') and model_admin.ordering:
         queryset = queryset.order_by(*model_admin.ordering)
     
-    # Obtener campos para mostrar
     list_display = ['__str__']
     if model_admin and hasattr(model_admin, 'list_display'):
         list_display = model_admin.list_display
     
-    # Crear workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = model._meta.verbose_name_plural[:31]  # Excel limita a 31 caracteres
+    avance.estimar(queryset.count())
+    
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=str(model._meta.verbose_name_plural)[:31])  # Excel limita a 31 caracteres
     
     # Encabezados
     headers = []
@@ -708,13 +748,14 @@ def admin_model_export_excel(request, app_label, model_name):
             # Intentar obtener el nombre legible del campo
             try:
                 field_obj = model._meta.get_field(field)
-                headers.append(field_obj.verbose_name.title())
-            except:
+                headers.append(str(field_obj.verbose_name).title())
+            except Exception:
                 headers.append(field.replace('_', ' ').title())
     ws.append(headers)
     
     # Datos
-    for obj in queryset:
+    total = 0
+    for obj in queryset.iterator(chunk_size=1000):
         row = []
         for field in list_display:
             if field == '__str__':
@@ -723,36 +764,23 @@ def admin_model_export_excel(request, app_label, model_name):
                 try:
                     if '__' in field:
                         # Campo relacionado
-                        parts = field.split('__')
                         value = obj
-                        for part in parts:
+                        for part in field.split('__'):
                             value = getattr(value, part, None)
                             if value is None:
                                 break
-                        row.append(str(value) if value is not None else '')
                     else:
                         # Campo directo
                         value = getattr(obj, field, None)
                         if callable(value):
                             value = value()
-                        row.append(str(value) if value is not None else '')
+                    row.append(str(value) if value is not None else '')
                 except Exception:
                     row.append('')
         ws.append(row)
+        total += 1
+        if total % 1000 == 0:
+            avance(total)
     
-    # Respuesta HTTP
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    now = timezone.now()
-    if timezone.is_naive(now):
-        timestamp = now.strftime('%Y%m%d_%H%M%S')
-    else:
-        timestamp = timezone.localtime(now).strftime('%Y%m%d_%H%M%S')
-    
-    filename = f"{model._meta.verbose_name_plural.replace(' ', '_')}_{timestamp}.xlsx"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    
-    wb.save(response)
-    return response
-
+    wb.save(destino)
+    return total
@@ -0,0 +1,367 @@
+"""
+Búsqueda de productos por texto con ranking de relevancia
+
+Cada producto guarda dos textos normalizados con normalizar_busqueda
+(minúsculas, sin tildes ni signos):
+
+- texto_busqueda: SKU, nombre, marca y categoría (peso PESO_PRINCIPAL).
+- texto_descripcion: la descripción (peso PESO_DESCRIPCION).
+
+Product.save() los recalcula, y un cambio de nombre de categoría reindexa
+sus productos. Según el motor, la búsqueda usa:
+
+- MySQL: índices FULLTEXT prod_busqueda_ft (texto_busqueda) y
+  prod_busqueda_todo_ft (ambos textos), en modo booleano con prefijos. La
+  relevancia es la de MATCH ... AGAINST, ponderada por campo.
+- SQLite: tabla virtual FTS5 production_producto_fts, sincronizada por
+  triggers. La relevancia es bm25 con un peso por columna. Las migraciones
+  que reconstruyen production_product (AddField, AlterField...) borran los
+  triggers: deben terminar con asegurar_indice_productos(schema_editor,
+  reconstruir=True), como 0022.
+- SQLite con la tabla FTS5 pero sin alguno de sus triggers (el índice
+  dejó de seguir los cambios): recorrido de los textos guardados, hasta
+  que reindexar_busqueda_productos vuelva a crearlos.
+- Otros motores, o SQLite sin FTS5: índice invertido propio
+  (TerminoProducto, una fila por término y producto con su peso). Se busca
+  por prefijo de término sobre un índice B-tree, y la relevancia es la suma
+  de los pesos.
+
+En los tres casos, cada palabra buscada debe estar como prefijo de algún
+término. Los plurales simples se reducen (caramelos -> caramelo*,
+limones -> limon*). El costo depende de los productos que coinciden, no del
+tamaño del catálogo.
+"""
+import logging
+
+from django.db import connection, connections, transaction
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.expressions import Case, RawSQL, When
+
+from .inventory_busqueda import SEPARADOR, componer_texto_busqueda, normalizar_busqueda
+
+
+TABLA_PRODUCTOS = 'production_product'
+TABLA_FTS_PRODUCTOS = 'production_producto_fts'
+TRIGGERS_FTS_PRODUCTOS = tuple(f'{TABLA_FTS_PRODUCTOS}_{sufijo}' for sufijo in ('ai', 'ad', 'au'))
+INDICE_FULLTEXT_PRINCIPAL = 'prod_busqueda_ft'
+INDICE_FULLTEXT_TODO = 'prod_busqueda_todo_ft'
+
+# innodb_ft_min_token_size por defecto: palabras más cortas no quedan en el índice FULLTEXT
+MIN_TOKEN_FULLTEXT = 3
+
+PESO_PRINCIPAL = 10
+PESO_DESCRIPCION = 1
+
+# Largo máximo de un término del índice invertido (TerminoProducto.termino)
+LARGO_TERMINO = 64
+
+logger = logging.getLogger(__name__)
+
+_motores = {}
+
+
+def textos_busqueda_producto(producto):
+    """(texto_busqueda, texto_descripcion) de una instancia de Product"""
+    return (
+        componer_texto_busqueda(producto.sku, producto.name, producto.marca, producto.category.name),
+        normalizar_busqueda(producto.description),
+    )
+
+
+def raiz_busqueda(token):
+    """Quitar el plural simple de una palabra buscada, para usarla como prefijo"""
+    if len(token) > 4 and token.endswith('es'):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s'):
+        return token[:-1]
+    return token
+
+
+def terminos_producto(texto_busqueda, texto_descripcion):
+    """{término: peso} del índice invertido; un término presente en ambos textos toma el mayor peso"""
+    terminos = {}
+    for texto, peso in ((texto_descripcion, PESO_DESCRIPCION), (texto_busqueda, PESO_PRINCIPAL)):
+        for termino in texto.replace(SEPARADOR, ' ').split():
+            terminos[termino[:LARGO_TERMINO]] = peso
+    return terminos
+
+
+def indexar_terminos(filas):
+    """
+    Reemplazar los términos del índice invertido de los productos en `filas`
+
+    `filas` es una lista de (id, texto_busqueda, texto_descripcion). Solo se
+    usa cuando el motor no tiene índice de texto (ver _motor_busqueda).
+    """
+    from .models import TerminoProducto
+
+    if not filas:
+        return
+    with transaction.atomic():
+        TerminoProducto.objects.filter(producto_id__in=[fila[0] for fila in filas]).delete()
+        TerminoProducto.objects.bulk_create(
+            [
+                TerminoProducto(producto_id=producto_id, termino=termino, peso=peso)
+                for producto_id, principal, descripcion in filas
+                for termino, peso in terminos_producto(principal, descripcion).items()
+            ],
+            batch_size=1000,
+        )
+
+
+def producto_guardado(producto_id, texto_busqueda, texto_descripcion):
+    """Mantener el índice invertido tras guardar un producto (los índices del motor se mantienen solos)"""
+    if _motor_busqueda() is None:
+        indexar_terminos([(producto_id, texto_busqueda, texto_descripcion)])
+
+
+def reindexar_busqueda_productos(queryset, chunk_size=2000, terminos=False):
+    """
+    Recalcular texto_busqueda y texto_descripcion de los productos de `queryset` por lotes de id
+
+    Solo escribe las filas cuyos textos cambiaron (UPDATE directo: no pasa
+    por save() ni por las señales) y, si el motor usa el índice invertido,
+    rehace los términos de esas filas. Con `terminos` se rehacen los términos
+    de todos los productos recorridos. Retorna cuántos productos se
+    actualizaron.
+    """
+    usar_terminos = terminos or _motor_busqueda() is None
+    conexion = connections[queryset.db]
+    sentencia = f'UPDATE {TABLA_PRODUCTOS} SET texto_busqueda = %s, texto_descripcion = %s WHERE id = %s'
+    ultimo_id = 0
+    actualizados = 0
+    while True:
+        filas = list(
+            queryset.filter(id__gt=ultimo_id).order_by('id').values_list(
+                'id', 'texto_busqueda', 'texto_descripcion', 'sku', 'name', 'marca', 'category__name', 'description',
+            )[:chunk_size]
+        )
+        cambios = []
+        indexar = []
+        for pk, principal, descripcion, sku, nombre, marca, categoria, texto in filas:
+            nuevos = (componer_texto_busqueda(sku, nombre, marca, categoria), normalizar_busqueda(texto))
+            if nuevos != (principal, descripcion):
+                cambios.append((*nuevos, pk))
+                if usar_terminos:
+                    indexar.append((pk, *nuevos))
+            elif terminos:
+                indexar.append((pk, principal, descripcion))
+        with transaction.atomic(using=queryset.db):
+            if cambios:
+                with conexion.cursor() as cursor:
+                    cursor.executemany(sentencia, cambios)
+            indexar_terminos(indexar)
+        actualizados += len(cambios)
+        if len(filas) < chunk_size:
+            return actualizados
+        ultimo_id = filas[-1][0]
+
+
+def _existe_fulltext(cursor, indice):
+    cursor.execute(
+        'SELECT COUNT(*) FROM information_schema.STATISTICS '
+        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s',
+        [TABLA_PRODUCTOS, indice],
+    )
+    return bool(cursor.fetchone()[0])
+
+
+def asegurar_indice_productos(schema_editor=None, reconstruir=False):
+    """
+    Crear el índice de texto del motor si no existe (FULLTEXT en MySQL, FTS5 y triggers en SQLite)
+
+    Retorna False si el motor no tiene índice de texto y la búsqueda usará el
+    índice invertido TerminoProducto.
+    """
+    conexion = schema_editor.connection if schema_editor else connection
+    _motores.pop(conexion.alias, None)
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'mysql':
+            if not _existe_fulltext(cursor, INDICE_FULLTEXT_PRINCIPAL):
+                cursor.execute(f'CREATE FULLTEXT INDEX {INDICE_FULLTEXT_PRINCIPAL} ON {TABLA_PRODUCTOS} (texto_busqueda)')
+            if not _existe_fulltext(cursor, INDICE_FULLTEXT_TODO):
+                cursor.execute(
+                    f'CREATE FULLTEXT INDEX {INDICE_FULLTEXT_TODO} ON {TABLA_PRODUCTOS} (texto_busqueda, texto_descripcion)'
+                )
+        elif conexion.vendor == 'sqlite':
+            try:
+                # prefix='2 3': índices de prefijos para que "car*" no recorra todos los términos
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS_PRODUCTOS} USING fts5("
+                    f"texto_busqueda, texto_descripcion, content='{TABLA_PRODUCTOS}', content_rowid='id', prefix='2 3')"
+                )
+            except Exception:
+                return False  # SQLite compilado sin FTS5: se usa el índice invertido
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {TABLA_FTS_PRODUCTOS}_ai AFTER INSERT ON {TABLA_PRODUCTOS} BEGIN '
+                f'INSERT INTO {TABLA_FTS_PRODUCTOS}(rowid, texto_busqueda, texto_descripcion) '
+                f'VALUES (new.id, new.texto_busqueda, new.texto_descripcion); END'
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {TABLA_FTS_PRODUCTOS}_ad AFTER DELETE ON {TABLA_PRODUCTOS} BEGIN '
+                f'INSERT INTO {TABLA_FTS_PRODUCTOS}({TABLA_FTS_PRODUCTOS}, rowid, texto_busqueda, texto_descripcion) '
+                f"VALUES ('delete', old.id, old.texto_busqueda, old.texto_descripcion); END"
+            )
+            # Solo al cambiar los textos: los UPDATE de stock no tocan el índice
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {TABLA_FTS_PRODUCTOS}_au AFTER UPDATE OF texto_busqueda, texto_descripcion '
+                f'ON {TABLA_PRODUCTOS} BEGIN '
+                f'INSERT INTO {TABLA_FTS_PRODUCTOS}({TABLA_FTS_PRODUCTOS}, rowid, texto_busqueda, texto_descripcion) '
+                f"VALUES ('delete', old.id, old.texto_busqueda, old.texto_descripcion); "
+                f'INSERT INTO {TABLA_FTS_PRODUCTOS}(rowid, texto_busqueda, texto_descripcion) '
+                f'VALUES (new.id, new.texto_busqueda, new.texto_descripcion); END'
+            )
+            if reconstruir:
+                cursor.execute(f"INSERT INTO {TABLA_FTS_PRODUCTOS}({TABLA_FTS_PRODUCTOS}) VALUES ('rebuild')")
+        else:
+            return False
+    return True
+
+
+def eliminar_indice_productos(schema_editor):
+    """Quitar el índice de texto creado por asegurar_indice_productos"""
+    conexion = schema_editor.connection
+    _motores.pop(conexion.alias, None)
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'mysql':
+            for indice in (INDICE_FULLTEXT_PRINCIPAL, INDICE_FULLTEXT_TODO):
+                try:
+                    cursor.execute(f'DROP INDEX {indice} ON {TABLA_PRODUCTOS}')
+                except Exception:
+                    pass
+        elif conexion.vendor == 'sqlite':
+            for trigger in TRIGGERS_FTS_PRODUCTOS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLA_FTS_PRODUCTOS}')
+
+
+def _motor_busqueda():
+    """
+    'fulltext', 'fts5', 'textos' o None (índice invertido) según el motor (se consulta una vez por proceso)
+
+    La tabla FTS5 solo sirve si están sus tres triggers: sin ellos el índice
+    no tiene los productos creados o editados después, y se recorren los
+    textos guardados ('textos').
+    """
+    if connection.alias not in _motores:
+        motor = None
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                motor = 'fulltext' if _existe_fulltext(cursor, INDICE_FULLTEXT_TODO) else None
+            elif connection.vendor == 'sqlite':
+                cursor.execute(
+                    "SELECT name FROM sqlite_master WHERE (type = 'table' AND name = %s) "
+                    f"OR (type = 'trigger' AND name IN ({', '.join(['%s'] * len(TRIGGERS_FTS_PRODUCTOS))}))",
+                    [TABLA_FTS_PRODUCTOS, *TRIGGERS_FTS_PRODUCTOS],
+                )
+                existentes = {fila[0] for fila in cursor.fetchall()}
+                if TABLA_FTS_PRODUCTOS in existentes:
+                    faltantes = [trigger for trigger in TRIGGERS_FTS_PRODUCTOS if trigger not in existentes]
+                    motor = 'textos' if faltantes else 'fts5'
+                    if faltantes:
+                        logger.warning(
+                            'Faltan los triggers %s del índice FTS5 de productos; la búsqueda recorre los textos '
+                            'hasta ejecutar reindexar_busqueda_productos', ', '.join(faltantes),
+                        )
+        _motores[connection.alias] = motor
+    return _motores[connection.alias]
+
+
+def _condiciones_prefijo(raiz):
+    """(en texto_busqueda, en texto_descripcion): `raiz` es prefijo de algún término del texto"""
+    return (
+        Q(texto_busqueda__startswith=raiz) | Q(texto_busqueda__contains=' ' + raiz),
+        Q(texto_descripcion__startswith=raiz) | Q(texto_descripcion__contains=' ' + raiz),
+    )
+
+
+def _buscar_textos(queryset, raices):
+    """Filtrar y puntuar recorriendo los textos guardados (sin índice): cada raíz debe ser prefijo de algún término"""
+    relevancia = Value(0, output_field=IntegerField())
+    for raiz in raices:
+        principal, descripcion = _condiciones_prefijo(raiz)
+        queryset = queryset.filter(principal | descripcion)
+        relevancia = relevancia + Case(
+            When(principal, then=Value(PESO_PRINCIPAL)), default=Value(PESO_DESCRIPCION), output_field=IntegerField(),
+        )
+    return queryset.annotate(relevancia=relevancia)
+
+
+def _buscar_terminos(queryset, raices):
+    """Filtrar y puntuar con el índice invertido: cada raíz debe ser prefijo de algún término del producto"""
+    from .models import TerminoProducto
+
+    coincide = Q()
+    cual = []
+    for i, raiz in enumerate(raices):
+        condicion = Q(termino__startswith=raiz)
+        coincide |= condicion
+        cual.append(When(condicion, then=Value(i)))
+    encontrados = (
+        TerminoProducto.objects.filter(coincide)
+        .values('producto_id')
+        .annotate(raices=Count(Case(*cual, output_field=IntegerField()), distinct=True))
+        .filter(raices=len(raices))
+        .values('producto_id')
+    )
+    relevancia = (
+        TerminoProducto.objects.filter(coincide, producto_id=OuterRef('pk'))
+        .values('producto_id')
+        .annotate(total=Sum('peso'))
+        .values('total')
+    )
+    return queryset.filter(id__in=encontrados).annotate(relevancia=Subquery(relevancia, output_field=IntegerField()))
+
+
+def buscar_productos(queryset, q):
+    """
+    Filtrar productos por el texto `q` y anotar su `relevancia` (mayor es mejor)
+
+    El queryset resultante queda ordenado por relevancia y luego por nombre;
+    un order_by posterior reemplaza ese orden.
+    """
+    palabras = [p for p in (normalizar_busqueda(palabra) for palabra in q.split()) if p]
+    if not palabras:
+        return queryset
+    raices = sorted({raiz_busqueda(token) for palabra in palabras for token in palabra.split()})
+
+    motor = _motor_busqueda()
+    if motor == 'fts5':
+        expresion = ' AND '.join(f'"{raiz}"*' for raiz in raices)
+        # extra(): la relevancia bm25 solo existe con la tabla FTS en el FROM de la misma consulta
+        queryset = queryset.extra(
+            tables=[TABLA_FTS_PRODUCTOS],
+            where=[f'{TABLA_FTS_PRODUCTOS}.rowid = {TABLA_PRODUCTOS}.id', f'{TABLA_FTS_PRODUCTOS} MATCH %s'],
+            params=[expresion],
+            select={'relevancia': f'-bm25({TABLA_FTS_PRODUCTOS}, %s, %s)'},
+            select_params=[PESO_PRINCIPAL, PESO_DESCRIPCION],
+        )
+    elif motor == 'fulltext':
+        largas = [raiz for raiz in raices if len(raiz) >= MIN_TOKEN_FULLTEXT]
+        cortas = [raiz for raiz in raices if len(raiz) < MIN_TOKEN_FULLTEXT]
+        if largas:
+            expresion = ' '.join(f'+{raiz}*' for raiz in largas)
+            queryset = queryset.filter(id__in=RawSQL(
+                f'SELECT id FROM {TABLA_PRODUCTOS} WHERE MATCH(texto_busqueda, texto_descripcion) AGAINST (%s IN BOOLEAN MODE)',
+                [expresion],
+            )).annotate(relevancia=RawSQL(
+                f'MATCH({TABLA_PRODUCTOS}.texto_busqueda) AGAINST (%s IN BOOLEAN MODE) * {PESO_PRINCIPAL} + '
+                f'MATCH({TABLA_PRODUCTOS}.texto_busqueda, {TABLA_PRODUCTOS}.texto_descripcion) AGAINST (%s IN BOOLEAN MODE) * {PESO_DESCRIPCION}',
+                [expresion, expresion],
+            ))
+        else:
+            queryset = queryset.annotate(relevancia=Value(0, output_field=IntegerField()))
+        # Palabras bajo el mínimo del índice FULLTEXT: prefijo de un término, sobre las filas ya filtradas
+        for raiz in cortas:
+            principal, descripcion = _condiciones_prefijo(raiz)
+            queryset = queryset.filter(principal | descripcion)
+    elif motor == 'textos':
+        queryset = _buscar_textos(queryset, raices)
+    else:
+        queryset = _buscar_terminos(queryset, raices)
+
+    # Palabras con varios términos ("OC-123" -> "oc 123"): exigirlas juntas, como en la búsqueda de movimientos
+    for palabra in palabras:
+        if ' ' in palabra:
+            queryset = queryset.filter(Q(texto_busqueda__contains=palabra) | Q(texto_descripcion__contains=palabra))
+    return queryset.order_by('-relevancia', 'name')
@@ -1,11 +1,28 @@
 """
 Utilidades para manejo de caché optimizado
 """
+import pickle
+import secrets
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
 from django.core.cache import cache
 from django.core.cache.backends.base import BaseCache
 
 
-def get_or_set_cache(key, callable_func, timeout=300):
+# Etiquetas de las entradas que dependen de productos y de categorías (ver CacheEtiquetada)
+ETIQUETA_PRODUCTOS = 'productos'
+ETIQUETA_CATEGORIAS = 'categorias'
+# Cambios de stock por movimientos (no emiten post_save de Product)
+ETIQUETA_STOCK = 'stock'
+
+_AUSENTE = object()
+
+
+def get_or_set_cache(key, callable_func, timeout=300, etiquetas=None):
     """
     Obtener valor del caché o ejecutar función y guardar resultado
     
@@ -13,10 +30,14 @@ def get_or_set_cache(key, callable_func, timeout=300):
         key: Clave del caché
         callable_func: Función que retorna el valor si no está en caché
         timeout: Tiempo de expiración en segundos (default: 5 minutos)
+        etiquetas: Etiquetas de la entrada; invalidar_etiquetas() sobre
+            cualquiera de ellas la deja obsoleta
     
     Returns:
         Valor del caché o resultado de la función
     """
+    if etiquetas:
+        key = clave_etiquetada(key, etiquetas)
     value = cache.get(key)
     if value is None:
         value = callable_func()
@@ -24,63 +45,248 @@ def get_or_set_cache(key, callable_func, timeout=300):
     return value
 
 
+def obtener_version(clave, backend=None):
+    """
+    Versión actual guardada en `clave` (para armar claves de caché versionadas)
+
+    Una versión que no existe (o que la caché expulsó) se inicia con un
+    número aleatorio de 48 bits y no en 1, para no volver a apuntar a
+    entradas cacheadas con una versión anterior que aún no expiran.
+    """
+    backend = backend or cache
+    version = backend.get(clave)
+    if version is None:
+        nueva = secrets.randbits(48)
+        backend.add(clave, nueva, timeout=None)
+        version = backend.get(clave)
+        if version is None:
+            # Caché caída (IGNORE_EXCEPTIONS): las lecturas también fallan, la versión no importa
+            version = nueva
+    return version
+
+
+def incrementar_version(clave, backend=None):
+    """
+    Incrementar la versión de `clave`: todas las claves armadas con la versión anterior quedan obsoletas
+
+    Es una sola operación atómica en la caché (O(1)), sin importar cuántas
+    entradas dependan de la versión; las obsoletas expiran solas.
+    """
+    backend = backend or cache
+    try:
+        return backend.incr(clave)
+    except ValueError:
+        # No existía: se crea con una versión nueva
+        return obtener_version(clave, backend)
+
+
+class CacheEtiquetada:
+    """
+    Invalidación generacional por etiquetas, sobre cualquier backend de caché
+
+    Cada etiqueta tiene una versión guardada en la misma caché
+    ('etiqueta:<nombre>'). La clave real de una entrada incluye las
+    versiones actuales de sus etiquetas, así que invalidar una etiqueta es
+    incrementar su versión: las entradas armadas con la anterior dejan de
+    encontrarse y expiran por su timeout. No necesita delete_pattern (que
+    solo existe en django-redis) ni recorrer claves, y con una caché
+    compartida (Redis) la invalidación se ve en todos los procesos.
+
+    Si la caché expulsa la versión de una etiqueta, la siguiente lectura la
+    recrea con un valor nuevo: las entradas anteriores quedan obsoletas y
+    nunca se sirve un valor viejo.
+    """
+
+    PREFIJO = 'etiqueta:'
+
+    def __init__(self, backend=None):
+        self._backend = backend
+
+    @property
+    def backend(self):
+        return self._backend or cache
+
+    def versiones(self, etiquetas):
+        """Versión actual de cada etiqueta, en el mismo orden (una lectura get_many)"""
+        claves = [self.PREFIJO + etiqueta for etiqueta in etiquetas]
+        encontradas = self.backend.get_many(claves)
+        return [
+            encontradas[clave] if clave in encontradas else obtener_version(clave, self.backend)
+            for clave in claves
+        ]
+
+    def clave(self, clave, etiquetas):
+        """Clave real de `clave` con las versiones actuales de sus etiquetas"""
+        etiquetas = sorted(set(etiquetas))
+        versiones = self.versiones(etiquetas)
+        return clave + '|' + '.'.join(f'{etiqueta}{version}' for etiqueta, version in zip(etiquetas, versiones))
+
+    def get(self, clave, etiquetas, default=None):
+        return self.backend.get(self.clave(clave, etiquetas), default)
+
+    def set(self, clave, valor, etiquetas, timeout=300):
+        self.backend.set(self.clave(clave, etiquetas), valor, timeout)
+
+    def get_or_set(self, clave, funcion, etiquetas, timeout=300):
+        """Valor cacheado de `clave` o el resultado de funcion(), que se guarda (aunque sea None)"""
+        real = self.clave(clave, etiquetas)
+        valor = self.backend.get(real, _AUSENTE)
+        if valor is _AUSENTE:
+            valor = funcion()
+            self.backend.set(real, valor, timeout)
+        return valor
+
+    def invalidar(self, *etiquetas):
+        """Dejar obsoletas todas las entradas con alguna de `etiquetas` (un incr por etiqueta)"""
+        for etiqueta in etiquetas:
+            incrementar_version(self.PREFIJO + etiqueta, self.backend)
+
+
+cache_etiquetada = CacheEtiquetada()
+
+
+def clave_etiquetada(clave, etiquetas):
+    """Clave real de `clave` en la caché por defecto, según las versiones actuales de `etiquetas`"""
+    return cache_etiquetada.clave(clave, etiquetas)
+
+
+def invalidar_etiquetas(*etiquetas):
+    """Invalidar en la caché por defecto todas las entradas de esas etiquetas"""
+    cache_etiquetada.invalidar(*etiquetas)
+
+
 def invalidate_cache_pattern(pattern):
     """
     Invalidar múltiples claves de caché que coincidan con un patrón
-    Solo funciona con Redis, con LocMem solo elimina la clave exacta
+
+    Las entradas nuevas deben guardarse con etiquetas e invalidarse con
+    invalidar_etiquetas(), que funciona en todos los backends. Aquí el
+    patrón 'prefijo*' se trata además como la etiqueta 'prefijo'; con
+    django-redis se sigue usando delete_pattern para las claves sin etiqueta.
     """
+    invalidar_etiquetas(pattern.rstrip('*'))
     try:
         # Intentar usar delete_pattern si está disponible (django-redis)
         if hasattr(cache, 'delete_pattern'):
             cache.delete_pattern(pattern)
-        else:
-            # Para LocMem, no podemos hacer pattern matching fácilmente
-            # Se puede implementar un registro de claves si es necesario
-            pass
     except Exception:
         pass
 
 
-def cache_query(key, queryset_func, timeout=300):
+class CacheFilas:
+    """
+    Caché de resultados de consultas: guarda las filas, no solo los ids
+
+    En un fallo se ejecuta el queryset con values_list y se guardan las
+    tuplas (compactas, sin el estado de los modelos). En un acierto se
+    reconstruyen objetos sin tocar la base de datos:
+    - con `campos`, namedtuples con esos nombres (se admiten campos
+      relacionados como 'category__name');
+    - sin `campos`, instancias del modelo con todos sus campos concretos
+      (Model.from_db); las relaciones no vienen cargadas.
+
+    Los resultados con más de `max_filas` filas o más de `max_bytes`
+    serializados no se guardan (se cuentan como omitidos), para que un
+    listado grande no desplace al resto de la caché. Cada llamada indica su
+    timeout y sus etiquetas (CacheEtiquetada). Las estadísticas de aciertos,
+    fallos y omitidos son del proceso.
+    """
+
+    def __init__(self, backend=None, max_filas=None, max_bytes=None):
+        self._etiquetada = CacheEtiquetada(backend)
+        self._max_filas = max_filas
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._contadores = {'aciertos': 0, 'fallos': 0, 'omitidos': 0}
+
+    @property
+    def backend(self):
+        return self._etiquetada.backend
+
+    @property
+    def max_filas(self):
+        return self._max_filas or getattr(settings, 'CACHE_FILAS_MAX_FILAS', 5000)
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes or getattr(settings, 'CACHE_FILAS_MAX_BYTES', 1024 * 1024)
+
+    def _contar(self, evento):
+        with self._lock:
+            self._contadores[evento] += 1
+
+    def estadisticas(self):
+        """Aciertos, fallos, omitidos y tasa de aciertos de este proceso"""
+        with self._lock:
+            datos = dict(self._contadores)
+        consultas = datos['aciertos'] + datos['fallos']
+        datos['tasa_aciertos'] = datos['aciertos'] / consultas if consultas else 0.0
+        return datos
+
+    def reiniciar_estadisticas(self):
+        with self._lock:
+            self._contadores = dict.fromkeys(self._contadores, 0)
+
+    def obtener(self, clave, queryset_func, campos=None, timeout=300, etiquetas=None):
+        """
+        Lista de objetos del queryset que retorna queryset_func(), desde la caché si está
+
+        `queryset_func` solo se llama en un fallo. `etiquetas` (por ejemplo
+        [ETIQUETA_PRODUCTOS]) deja la entrada obsoleta al invalidarlas.
+        """
+        real = self._etiquetada.clave(clave, etiquetas) if etiquetas else clave
+        guardado = self.backend.get(real)
+        if guardado is not None:
+            self._contar('aciertos')
+            return _reconstruir_filas(*guardado)
+
+        self._contar('fallos')
+        queryset = queryset_func()
+        modelo = queryset.model
+        if campos:
+            filas = list(queryset.values_list(*campos))
+            nombres = tuple(campos)
+        else:
+            nombres = tuple(campo.attname for campo in modelo._meta.concrete_fields)
+            filas = list(queryset.values_list(*nombres))
+        guardado = (modelo._meta.label, queryset.db, nombres, bool(campos), filas)
+
+        if len(filas) > self.max_filas or len(pickle.dumps(guardado, pickle.HIGHEST_PROTOCOL)) > self.max_bytes:
+            self._contar('omitidos')
+        else:
+            self.backend.set(real, guardado, timeout)
+        return _reconstruir_filas(*guardado)
+
+
+@lru_cache(maxsize=256)
+def _tipo_fila(nombres):
+    return namedtuple('Fila', nombres)
+
+
+def _reconstruir_filas(etiqueta_modelo, alias, nombres, como_tuplas, filas):
+    if como_tuplas:
+        tipo = _tipo_fila(nombres)
+        return [tipo._make(fila) for fila in filas]
+    modelo = apps.get_model(etiqueta_modelo)
+    return [modelo.from_db(alias, nombres, fila) for fila in filas]
+
+
+cache_filas = CacheFilas()
+
+
+def cache_query(key, queryset_func, timeout=300, campos=None, etiquetas=None):
     """
     Cachear el resultado de una query
     
     Args:
         key: Clave del caché
-        queryset_func: Función que retorna un QuerySet
+        queryset_func: Función que retorna un QuerySet (solo se llama si no está en caché)
         timeout: Tiempo de expiración en segundos
+        campos: Campos a guardar; sin campos se guardan todos los del modelo
+        etiquetas: Etiquetas de la entrada (ver CacheEtiquetada)
     
     Returns:
-        QuerySet (lista cacheada convertida a queryset si es posible)
+        Lista de namedtuples (con campos) o de instancias del modelo,
+        reconstruidas sin consultar la base de datos en un acierto
     """
-    cached_result = cache.get(key)
-    if cached_result is None:
-        queryset = queryset_func()
-        # Para querysets, cacheamos la lista de IDs y luego recreamos el queryset
-        if hasattr(queryset, 'values_list'):
-            ids = list(queryset.values_list('id', flat=True))
-            cache.set(key, ids, timeout)
-            # Retornar queryset filtrado por IDs
-            from django.db import models
-            model = queryset.model
-            return model.objects.filter(id__in=ids)
-        else:
-            # Si no es queryset, cachear directamente
-            cache.set(key, list(queryset), timeout)
-            return queryset
-    else:
-        # Si está cacheado, recrear queryset desde IDs
-        if isinstance(cached_result, list) and cached_result:
-            if isinstance(cached_result[0], int):
-                # Lista de IDs
-                queryset = queryset_func()
-                model = queryset.model
-                return model.objects.filter(id__in=cached_result)
-            else:
-                # Lista de objetos - retornar queryset filtrado
-                queryset = queryset_func()
-                model = queryset.model
-                ids = [obj.id if hasattr(obj, 'id') else obj.get('id') for obj in cached_result]
-                return model.objects.filter(id__in=ids)
-        return queryset_func()
-
+    return cache_filas.obtener(key, queryset_func, campos=campos, timeout=timeout, etiquetas=etiquetas)
@@ -0,0 +1,169 @@
+"""
+Exportaciones a Excel en segundo plano
+
+Las vistas de exportación solo crean un TrabajoExportacion y responden de
+inmediato. El trabajo lo procesa un worker:
+
+- EXPORTACIONES_WORKER = 'hilo' (por defecto): un hilo del mismo proceso
+  web, lanzado al confirmar la transacción que creó el trabajo.
+- EXPORTACIONES_WORKER = 'comando': `python manage.py procesar_exportaciones`,
+  en un proceso aparte, para que los workers web no generen reportes.
+
+Varios workers pueden correr a la vez: cada uno toma un trabajo con un
+UPDATE condicional sobre el estado, así que un trabajo nunca se procesa dos
+veces. El archivo se escribe primero a un temporal y luego se guarda bajo
+MEDIA_ROOT/exportaciones/ con una ruta aleatoria; la descarga pasa por una
+vista que verifica al usuario.
+"""
+import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import TrabajoExportacion
+
+
+logger = logging.getLogger(__name__)
+
+# Función que escribe cada tipo de exportación: f(trabajo, destino, avance) -> filas escritas
+ESCRITORES = {
+    'inventario': 'production.export_jobs.exportar_inventario',
+    'usuarios': 'accounts.reportes.exportar_usuarios',
+    'modelo_admin': 'production.admin_views.exportar_listado_modelo',
+}
+
+# Segundos mínimos entre escrituras del progreso en la base de datos
+INTERVALO_PROGRESO = 1.0
+
+_ejecutor = None
+_ejecutor_lock = threading.Lock()
+
+
+class Avance:
+    """Registra en el trabajo las filas escritas, como máximo una vez por INTERVALO_PROGRESO"""
+
+    def __init__(self, trabajo_id):
+        self.trabajo_id = trabajo_id
+        self._ultimo = 0.0
+
+    def estimar(self, total):
+        TrabajoExportacion.objects.filter(pk=self.trabajo_id).update(total=total)
+
+    def __call__(self, filas):
+        ahora = time.monotonic()
+        if ahora - self._ultimo >= INTERVALO_PROGRESO:
+            self._ultimo = ahora
+            TrabajoExportacion.objects.filter(pk=self.trabajo_id).update(progreso=filas)
+
+
+def exportar_inventario(trabajo, destino, avance):
+    """Reporte de inventario (productos, usuarios por rol y movimientos)"""
+    from accounts.models import UserProfile
+    from .inventory_export import escribir_reporte_inventario
+    from .models import MovimientoInventario, Product
+
+    avance.estimar(Product.objects.count() + UserProfile.objects.count() + MovimientoInventario.objects.count())
+    return escribir_reporte_inventario(destino, progreso=avance)
+
+
+def encolar_exportacion(tipo, usuario, nombre_archivo, parametros=None):
+    """Crear un trabajo de exportación pendiente y, en modo 'hilo', lanzarlo al confirmar la transacción"""
+    trabajo = TrabajoExportacion.objects.create(
+        tipo=tipo,
+        parametros=parametros or {},
+        nombre_archivo=nombre_archivo,
+        solicitado_por=usuario,
+    )
+    if getattr(settings, 'EXPORTACIONES_WORKER', 'hilo') == 'hilo':
+        transaction.on_commit(lambda: _obtener_ejecutor().submit(_procesar_en_hilo, trabajo.pk))
+    return trabajo
+
+
+def _obtener_ejecutor():
+    global _ejecutor
+    with _ejecutor_lock:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='exportaciones')
+        return _ejecutor
+
+
+def _procesar_en_hilo(trabajo_id):
+    # El hilo usa su propia conexión: cerrarla al terminar para no dejarla abierta
+    close_old_connections()
+    try:
+        procesar_trabajo(trabajo_id)
+        # Si quedaron trabajos pendientes (por ejemplo, de antes de reiniciar el servidor), procesarlos también
+        while procesar_siguiente():
+            pass
+    except Exception:
+        logger.exception('Error en el hilo de exportaciones')
+    finally:
+        close_old_connections()
+
+
+def tomar_trabajo(trabajo_id):
+    """Pasar el trabajo a en_proceso solo si sigue pendiente; True si este worker lo tomó"""
+    return bool(TrabajoExportacion.objects.filter(pk=trabajo_id, estado='pendiente').update(
+        estado='en_proceso', iniciado_en=timezone.now(),
+    ))
+
+
+def procesar_siguiente():
+    """Tomar y procesar el trabajo pendiente más antiguo; False si no había ninguno"""
+    for trabajo_id in TrabajoExportacion.objects.filter(estado='pendiente').order_by('created_at').values_list('pk', flat=True)[:10]:
+        if tomar_trabajo(trabajo_id):
+            procesar_trabajo(trabajo_id, tomado=True)
+            return True
+    return False
+
+
+def procesar_trabajo(trabajo_id, tomado=False):
+    """Generar el archivo de un trabajo; retorna False si otro worker ya lo había tomado"""
+    if not tomado and not tomar_trabajo(trabajo_id):
+        return False
+    trabajo = TrabajoExportacion.objects.select_related('solicitado_por').get(pk=trabajo_id)
+    avance = Avance(trabajo.pk)
+    try:
+        escribir = import_string(ESCRITORES[trabajo.tipo])
+        with tempfile.TemporaryFile(suffix='.xlsx') as temporal:
+            filas = escribir(trabajo, temporal, avance)
+            temporal.seek(0)
+            trabajo.archivo.save(trabajo.nombre_archivo, File(temporal), save=False)
+        TrabajoExportacion.objects.filter(pk=trabajo.pk).update(
+            estado='completado', progreso=filas, archivo=trabajo.archivo.name, terminado_en=timezone.now(),
+        )
+    except Exception as e:
+        logger.exception('Error al procesar la exportación %s', trabajo.pk)
+        TrabajoExportacion.objects.filter(pk=trabajo.pk).update(
+            estado='error', error=str(e)[:1000], terminado_en=timezone.now(),
+        )
+    return True
+
+
+def marcar_interrumpidos(segundos):
+    """Marcar como error los trabajos en proceso hace más de `segundos` (worker caído a mitad)"""
+    limite = timezone.now() - timedelta(seconds=segundos)
+    return TrabajoExportacion.objects.filter(estado='en_proceso', iniciado_en__lt=limite).update(
+        estado='error', error='El proceso que generaba la exportación se interrumpió.', terminado_en=timezone.now(),
+    )
+
+
+def limpiar_exportaciones(dias):
+    """Eliminar trabajos terminados hace más de `dias` días junto con sus archivos"""
+    limite = timezone.now() - timedelta(days=dias)
+    antiguos = TrabajoExportacion.objects.filter(estado__in=['completado', 'error'], terminado_en__lt=limite)
+    eliminados = 0
+    for trabajo in antiguos.iterator():
+        if trabajo.archivo:
+            trabajo.archivo.delete(save=False)
+        trabajo.delete()
+        eliminados += 1
+    return eliminados
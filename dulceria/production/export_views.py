@@ -0,0 +1,70 @@
+"""
+Vistas de las exportaciones en segundo plano (ver export_jobs)
+
+Los archivos quedan bajo MEDIA_ROOT, pero se descargan solo por
+exportacion_descargar, que verifica que el trabajo sea del usuario.
+"""
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.views.decorators.http import require_http_methods
+
+from .models import TrabajoExportacion
+
+
+def _trabajo_del_usuario(request, pk):
+    trabajo = get_object_or_404(TrabajoExportacion, pk=pk)
+    if trabajo.solicitado_por_id != request.user.id and not request.user.is_superuser:
+        raise Http404
+    return trabajo
+
+
+def _estado_trabajo(trabajo):
+    return {
+        'id': trabajo.pk,
+        'estado': trabajo.estado,
+        'estado_display': trabajo.get_estado_display(),
+        'progreso': trabajo.progreso,
+        'total': trabajo.total,
+        'porcentaje': trabajo.porcentaje,
+        'descargar_url': reverse('exportacion_descargar', args=[trabajo.pk]) if trabajo.estado == 'completado' else '',
+        'error': trabajo.error,
+    }
+
+
+@login_required
+@require_http_methods(["GET"])
+def exportaciones_list(request):
+    """Últimas exportaciones pedidas por el usuario"""
+    trabajos = TrabajoExportacion.objects.filter(solicitado_por=request.user)[:30]
+    return render(request, 'production/exportaciones.html', {
+        'trabajos': trabajos,
+        'hay_pendientes': any(t.estado in ('pendiente', 'en_proceso') for t in trabajos),
+    })
+
+
+@login_required
+@require_http_methods(["GET"])
+def exportacion_estado(request, pk):
+    """Estado y progreso de una exportación (JSON, para el sondeo de la página)"""
+    return JsonResponse(_estado_trabajo(_trabajo_del_usuario(request, pk)))
+
+
+@login_required
+@require_http_methods(["GET"])
+def exportacion_descargar(request, pk):
+    """Descargar el archivo de una exportación terminada"""
+    trabajo = _trabajo_del_usuario(request, pk)
+    if trabajo.estado != 'completado' or not trabajo.archivo:
+        raise Http404
+    try:
+        archivo = trabajo.archivo.open('rb')
+    except FileNotFoundError:
+        raise Http404('El archivo de la exportación ya no está disponible.')
+    return FileResponse(
+        archivo,
+        as_attachment=True,
+        filename=trabajo.nombre_archivo,
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
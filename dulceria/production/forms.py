@@ -89,6 +89,11 @@ class ProductForm(forms.ModelForm):
         else:
             self.fields['sku'].initial = 'Se generará automáticamente'
         
+        # El stock de un producto existente cambia con movimientos de inventario, que llevan la cuenta por bodega
+        if instance and instance.pk:
+            self.fields['stock'].disabled = True
+            self.fields['stock'].help_text = 'Se modifica registrando movimientos de inventario.'
+        
         # Configurar mes_vencimiento con nombres de meses
         self.fields['mes_vencimiento'].widget = forms.Select(attrs={'class': 'form-control'})
         self.fields['mes_vencimiento'].choices = [
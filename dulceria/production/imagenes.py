@@ -0,0 +1,180 @@
+"""
+Derivados de imágenes subidas (miniaturas en varios anchos y WebP)
+
+Las imágenes de productos y avatares se guardan tal como se suben, y las
+listas y la tienda las mostraban a tamaño completo. Al confirmarse el
+guardado que cambia la imagen (señales), se generan con Pillow versiones
+reducidas a los anchos de IMAGENES_ANCHOS. Cada ancho se guarda en WebP y en
+un formato de respaldo (JPEG, o PNG si la imagen tiene transparencia) bajo
+<carpeta>/derivados/ del mismo storage.
+
+Lo generado se anota en un JSONField del modelo (imagen_derivados,
+avatar_derivados), de modo que la plantilla arma el srcset sin tocar el
+storage:
+
+    {'origen': 'productos/foto.jpg', 'ancho': 1200, 'alto': 900,
+     'anchos': [160, 320, 640], 'respaldo': 'jpg', 'nombres': 2}
+
+Los derivados se nombran con el nombre completo del original
+(productos/derivados/foto.jpg-320w.webp), así foto.jpg y foto.png no
+comparten archivos. Los diccionarios sin 'nombres' son del esquema anterior
+(foto-320w.webp): no se consideran vigentes, y al regenerarlos se borran
+sus archivos con ese esquema.
+
+Si el diccionario no corresponde a la imagen actual (o está vacío), el tag
+{% imagen_responsive %} usa la imagen original. `manage.py
+generar_derivados_imagenes` genera los derivados de las imágenes existentes (y
+regenera los del esquema de nombres anterior).
+"""
+import logging
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+CARPETA_DERIVADOS = 'derivados'
+
+# Esquema de nombres de los derivados (ver nombre_derivado)
+VERSION_NOMBRES = 2
+
+# Extensión del respaldo -> (formato de Pillow, opciones de guardado)
+FORMATOS_RESPALDO = {
+    'jpg': ('JPEG', {'optimize': True, 'progressive': True}),
+    'png': ('PNG', {'optimize': True}),
+}
+
+
+def anchos_configurados():
+    return sorted(set(getattr(settings, 'IMAGENES_ANCHOS', (160, 320, 640))))
+
+
+def nombre_derivado(origen, ancho, extension):
+    """'productos/foto.jpg', 320, 'webp' -> 'productos/derivados/foto.jpg-320w.webp'"""
+    carpeta, archivo = posixpath.split(origen)
+    return posixpath.join(carpeta, CARPETA_DERIVADOS, f'{archivo}-{ancho}w.{extension}')
+
+
+def _nombre_derivado_anterior(origen, ancho, extension):
+    """Esquema sin 'nombres': 'productos/foto.jpg', 320, 'webp' -> 'productos/derivados/foto-320w.webp'"""
+    carpeta, archivo = posixpath.split(origen)
+    base = posixpath.splitext(archivo)[0]
+    return posixpath.join(carpeta, CARPETA_DERIVADOS, f'{base}-{ancho}w.{extension}')
+
+
+def nombres_derivados(derivados):
+    """Nombres en el storage de todos los archivos anotados en `derivados`"""
+    if not derivados.get('origen'):
+        return []
+    nombrar = nombre_derivado if derivados.get('nombres') == VERSION_NOMBRES else _nombre_derivado_anterior
+    return [
+        nombrar(derivados['origen'], ancho, extension)
+        for ancho in derivados.get('anchos', [])
+        for extension in ('webp', derivados.get('respaldo', 'jpg'))
+    ]
+
+
+def vigentes(archivo, derivados):
+    """True si `derivados` corresponde a la imagen guardada actualmente en `archivo`"""
+    return bool(
+        archivo and derivados and derivados.get('origen') == archivo.name and derivados.get('anchos')
+        and derivados.get('nombres') == VERSION_NOMBRES
+    )
+
+
+def _pendiente(archivo, derivados):
+    """True si hay que generar (o borrar) derivados para que correspondan a `archivo`"""
+    if not archivo:
+        return bool(derivados)
+    return not vigentes(archivo, derivados)
+
+
+def _guardar(storage, nombre, imagen, formato, opciones):
+    contenido = BytesIO()
+    imagen.save(contenido, format=formato, **opciones)
+    # Se reemplaza el archivo anterior con el mismo nombre en vez de dejar que el storage agregue un sufijo
+    if storage.exists(nombre):
+        storage.delete(nombre)
+    storage.save(nombre, ContentFile(contenido.getvalue()))
+
+
+def generar_derivados(archivo):
+    """
+    Generar los derivados de `archivo` (FieldFile) y retornar el diccionario que los describe
+
+    Nunca se amplía: los anchos mayores que la imagen se reemplazan por su
+    ancho original. Retorna {} si el archivo no es una imagen legible.
+    """
+    storage = archivo.storage
+    try:
+        with storage.open(archivo.name, 'rb') as contenido:
+            imagen = Image.open(contenido)
+            imagen.load()
+    except (OSError, Image.DecompressionBombError) as exc:
+        logger.warning('No se pudieron generar derivados de %s: %s', archivo.name, exc)
+        return {}
+
+    # Las fotos de celular vienen giradas con EXIF; los derivados se guardan ya rotados y sin metadatos
+    imagen = ImageOps.exif_transpose(imagen)
+    transparente = imagen.mode in ('RGBA', 'LA', 'PA') or (imagen.mode == 'P' and 'transparency' in imagen.info)
+    imagen = imagen.convert('RGBA' if transparente else 'RGB')
+    respaldo = 'png' if transparente else 'jpg'
+    formato_respaldo, opciones_respaldo = FORMATOS_RESPALDO[respaldo]
+    calidad = getattr(settings, 'IMAGENES_CALIDAD', 80)
+    if formato_respaldo == 'JPEG':
+        opciones_respaldo = dict(opciones_respaldo, quality=calidad)
+
+    ancho, alto = imagen.size
+    anchos = sorted({min(a, ancho) for a in anchos_configurados()})
+    for destino in anchos:
+        reducida = imagen if destino == ancho else imagen.resize(
+            (destino, max(1, round(alto * destino / ancho))), Image.Resampling.LANCZOS,
+        )
+        _guardar(storage, nombre_derivado(archivo.name, destino, 'webp'), reducida, 'WEBP', {'quality': calidad})
+        _guardar(storage, nombre_derivado(archivo.name, destino, respaldo), reducida, formato_respaldo, opciones_respaldo)
+
+    return {
+        'origen': archivo.name, 'ancho': ancho, 'alto': alto, 'anchos': anchos, 'respaldo': respaldo,
+        'nombres': VERSION_NOMBRES,
+    }
+
+
+def eliminar_derivados(storage, derivados, conservar=()):
+    for nombre in nombres_derivados(derivados):
+        if nombre not in conservar and storage.exists(nombre):
+            storage.delete(nombre)
+
+
+def actualizar_derivados(instancia, campo, campo_derivados, forzar=False):
+    """
+    Regenerar los derivados de `instancia.<campo>` si la imagen cambió (o con `forzar`)
+
+    Borra los derivados de la imagen anterior que ya no se usan y guarda el
+    nuevo diccionario con un UPDATE directo (sin volver a disparar señales).
+    Retorna True si hubo cambios.
+    """
+    archivo = getattr(instancia, campo)
+    anteriores = getattr(instancia, campo_derivados) or {}
+    if not forzar and not _pendiente(archivo, anteriores):
+        return False
+
+    nuevos = generar_derivados(archivo) if archivo else {}
+    eliminar_derivados(archivo.storage, anteriores, conservar=set(nombres_derivados(nuevos)))
+    type(instancia)._default_manager.filter(pk=instancia.pk).update(**{campo_derivados: nuevos})
+    setattr(instancia, campo_derivados, nuevos)
+    return True
+
+
+def registrar_imagen_guardada(instancia, campo, campo_derivados, update_fields=None):
+    """Generar los derivados al confirmarse la transacción del guardado, si pudo cambiar la imagen; retorna si quedó programado"""
+    if update_fields is not None and campo not in update_fields:
+        return False
+    if not _pendiente(getattr(instancia, campo), getattr(instancia, campo_derivados)):
+        return False
+    transaction.on_commit(lambda: actualizar_derivados(instancia, campo, campo_derivados))
+    return True
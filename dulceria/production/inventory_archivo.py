@@ -0,0 +1,123 @@
+"""
+Archivo de movimientos de inventario antiguos
+
+La tabla activa (MovimientoInventario) solo crece, y listas, búsquedas y
+agregados pagan por todo el historial. Los movimientos con más de
+ARCHIVO_MOVIMIENTOS_DIAS días y ya cubiertos por un snapshot de stock se
+trasladan por lotes a MovimientoArchivado (misma estructura y mismo id).
+Como el snapshot ya refleja esos movimientos, trasladarlos no cambia ningún
+saldo ni contador.
+
+El período archivado queda cerrado: no se registran movimientos con fecha
+anterior al fin del día del último movimiento archivado. Así todo movimiento
+archivado es anterior a todo movimiento activo, y las consultas leen la
+tabla activa salvo que el rango de fechas pedido llegue al archivo
+(modelos_para_rango).
+"""
+import heapq
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import MovimientoArchivado, MovimientoInventario
+
+
+TAMANO_LOTE = 2000
+
+
+def limite_archivo():
+    """Fecha del movimiento archivado más reciente; None si el archivo está vacío"""
+    return MovimientoArchivado.objects.aggregate(limite=Max('fecha'))['limite']
+
+
+def inicio_periodo_abierto():
+    """Primer instante en que se pueden registrar movimientos (None si no hay período cerrado)"""
+    from .inventory_snapshots import fin_del_dia
+
+    limite = limite_archivo()
+    if limite is None:
+        return None
+    return fin_del_dia(timezone.localtime(limite).date())
+
+
+def modelos_para_rango(inicio):
+    """
+    Modelos que hay que consultar para movimientos con fecha >= `inicio`
+
+    `inicio` None significa todo el historial. Solo se incluye el archivo
+    cuando el rango empieza en o antes de su movimiento más reciente.
+    """
+    limite = limite_archivo()
+    if limite is not None and (inicio is None or inicio <= limite):
+        return [MovimientoInventario, MovimientoArchivado]
+    return [MovimientoInventario]
+
+
+def recorrer_historial(orden, campos, chunk_size=5000):
+    """
+    Recorrer el historial completo (archivo y tabla activa) ordenado por `orden` ascendente
+
+    Genera tuplas con los `campos` pedidos. Cada tabla se lee con
+    values_list por lotes y ambas se intercalan según `orden`, de modo que el
+    resultado es el mismo que si nunca se hubiera archivado nada.
+    """
+    n = len(orden)
+    fuentes = [
+        modelo.objects.order_by(*orden).values_list(*orden, *campos).iterator(chunk_size=chunk_size)
+        for modelo in (MovimientoArchivado, MovimientoInventario)
+    ]
+    for fila in heapq.merge(*fuentes, key=lambda fila: fila[:n]):
+        yield fila[n:]
+
+
+def archivar_movimientos(dias=None, lote=TAMANO_LOTE, progreso=None):
+    """
+    Trasladar al archivo los movimientos anteriores a hoy - `dias` ya cubiertos por un snapshot
+
+    El corte es el fin del día del último snapshot en o antes de esa fecha;
+    sin snapshot no se archiva nada. Cada lote se copia y se borra de la
+    tabla activa en una transacción. El borrado es un DELETE directo: no pasa
+    por MovimientoInventario.delete(), que revertiría el stock. En SQLite el
+    trigger de FTS5 quita las filas del índice de búsqueda. `progreso`, si se
+    entrega, se llama con el total trasladado después de cada lote.
+    Retorna (cantidad trasladada, fecha del snapshot usado o None).
+    """
+    from .inventory_snapshots import fin_del_dia, ultimo_snapshot
+
+    if dias is None:
+        dias = getattr(settings, 'ARCHIVO_MOVIMIENTOS_DIAS', 365)
+    snapshot = ultimo_snapshot(timezone.localdate() - timedelta(days=dias))
+    if snapshot is None:
+        return 0, None
+    corte = fin_del_dia(snapshot)
+
+    campos = [campo.attname for campo in MovimientoInventario._meta.concrete_fields]
+    tabla = MovimientoInventario._meta.db_table
+    alias = router.db_for_write(MovimientoInventario)
+    total = 0
+    while True:
+        with transaction.atomic(using=alias):
+            # Usa mov_fecha_idx; los movimientos tan antiguos casi nunca se editan, pero se bloquean igual
+            filas = list(
+                MovimientoInventario.objects.select_for_update().filter(fecha__lt=corte)
+                .order_by('fecha', 'id').values_list(*campos)[:lote]
+            )
+            if not filas:
+                break
+            ahora = timezone.now()
+            MovimientoArchivado.objects.bulk_create(
+                [MovimientoArchivado(archivado_en=ahora, **dict(zip(campos, fila))) for fila in filas],
+                batch_size=500,
+            )
+            ids = [fila[0] for fila in filas]
+            with connections[alias].cursor() as cursor:
+                cursor.execute(f'DELETE FROM {tabla} WHERE id IN ({", ".join(["%s"] * len(ids))})', ids)
+        total += len(filas)
+        if progreso:
+            progreso(total)
+        if len(filas) < lote:
+            break
+    return total, snapshot
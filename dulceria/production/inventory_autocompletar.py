@@ -0,0 +1,223 @@
+"""
+Autocompletado de productos y proveedores para los formularios
+
+Los formularios de movimientos (y los del panel de administración con
+campos de producto o proveedor) ya no incluyen todos los productos y
+proveedores como <option>. SelectAutocompletar solo dibuja la opción
+seleccionada, y el navegador pide las demás a los endpoints de
+autocompletado mientras se escribe (static/js/autocompletar.js).
+
+Cada proceso mantiene por tipo un índice ordenado de claves normalizadas,
+cada una apuntando a un id:
+- productos: SKU, EAN/UPC y cada sufijo de palabra del nombre;
+- proveedores: RUT sin puntos ni guion, y cada sufijo de palabra de la
+  razón social y del nombre de fantasía.
+
+Los formularios de movimientos usan el alcance 'vigentes' (productos
+activos y aprobados, proveedores ACTIVO), igual que el queryset de sus
+campos. El panel de administración lista todas las filas en sus campos, y
+pide el alcance 'todos' (?alcance=todos) para poder elegir también
+productos inactivos o pendientes y proveedores inactivos.
+
+La búsqueda por prefijo es una búsqueda binaria más la lectura de, como
+máximo, `limite` coincidencias. Los guardados y eliminaciones incrementan
+una versión en la caché, compartida por los índices de ambos alcances. Cada
+proceso la revisa como máximo cada INDICE_CODIGOS_SEGUNDOS y reconstruye su
+índice si cambió, con una consulta (igual que inventory_codigos).
+"""
+import threading
+import time
+from bisect import bisect_left
+from functools import partial
+
+from django import forms
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .inventory_busqueda import normalizar_busqueda
+from .models import Product, Proveedor
+
+
+ALCANCE_VIGENTES = 'vigentes'
+ALCANCE_TODOS = 'todos'
+
+LIMITE_RESULTADOS = 10
+LIMITE_MAXIMO = 50
+
+# Campos que cambian las claves o la visibilidad de una fila en el índice
+CAMPOS_PRODUCTO = {'sku', 'ean_upc', 'name', 'is_active', 'estado_aprobacion'}
+CAMPOS_PROVEEDOR = {'rut', 'razon_social', 'nombre_fantasia', 'estado'}
+
+# Candidatos revisados como máximo cuando la búsqueda tiene varias palabras
+MAX_CANDIDATOS = 2000
+
+
+def _sufijos_de_palabra(texto):
+    """'alfajor cereza 359' -> ['alfajor cereza 359', 'cereza 359', '359']"""
+    palabras = normalizar_busqueda(texto).split()
+    return [' '.join(palabras[i:]) for i in range(len(palabras))]
+
+
+def _compactar(texto):
+    """Clave sin separadores, para códigos: '12.345.678-9' -> '123456789', 'SKU-001' -> 'sku001'"""
+    return normalizar_busqueda(texto).replace(' ', '')
+
+
+def _cargar_productos(alcance=ALCANCE_VIGENTES):
+    productos = Product.objects.all()
+    if alcance == ALCANCE_VIGENTES:
+        productos = productos.filter(is_active=True, estado_aprobacion='APROBADO')
+    productos = productos.values_list('id', 'sku', 'ean_upc', 'name')
+    for pk, sku, ean, nombre in productos.iterator(chunk_size=5000):
+        claves = [_compactar(sku), *_sufijos_de_palabra(nombre)]
+        if ean:
+            claves.append(_compactar(ean))
+        yield pk, f'{nombre} ({sku})', claves
+
+
+def _cargar_proveedores(alcance=ALCANCE_VIGENTES):
+    proveedores = Proveedor.objects.all()
+    if alcance == ALCANCE_VIGENTES:
+        proveedores = proveedores.filter(estado='ACTIVO')
+    proveedores = proveedores.values_list('id', 'rut', 'razon_social', 'nombre_fantasia')
+    for pk, rut, razon_social, fantasia in proveedores.iterator(chunk_size=5000):
+        claves = [_compactar(rut), *_sufijos_de_palabra(razon_social), *_sufijos_de_palabra(fantasia)]
+        yield pk, f'{razon_social} ({rut})', claves
+
+
+class IndicePrefijos:
+    """Lista ordenada de (clave, id) de un proceso, reconstruida cuando cambia su versión en la caché"""
+
+    def __init__(self, nombre, cargar):
+        self.clave_version = f'autocompletar_{nombre}_version'
+        self._cargar = cargar
+        self._lock = threading.Lock()
+        self._claves = None
+        self._ids = []
+        self._etiquetas = {}
+        self._version = None
+        self._revisado = 0.0
+
+    def invalidar(self):
+        """Marcar el índice como desactualizado en todos los procesos"""
+        if not cache.add(self.clave_version, 1, timeout=None):
+            try:
+                cache.incr(self.clave_version)
+            except ValueError:
+                pass
+
+    def _vigente(self):
+        ahora = time.monotonic()
+        segundos = getattr(settings, 'INDICE_CODIGOS_SEGUNDOS', 1.0)
+        if self._claves is not None and ahora - self._revisado < segundos:
+            return
+        with self._lock:
+            if self._claves is not None and ahora - self._revisado < segundos:
+                return
+            version = cache.get(self.clave_version)
+            if self._claves is None or version != self._version:
+                self._reconstruir(version)
+            self._revisado = ahora
+
+    def _reconstruir(self, version):
+        pares = []
+        etiquetas = {}
+        for pk, etiqueta, claves in self._cargar():
+            etiquetas[pk] = etiqueta
+            pares.extend((clave, pk) for clave in set(claves) if clave)
+        pares.sort()
+        # Se reemplazan las estructuras completas: un lector ve el índice anterior o el nuevo
+        self._claves, self._ids, self._etiquetas = [clave for clave, _ in pares], [pk for _, pk in pares], etiquetas
+        self._version = version
+
+    def buscar(self, texto, limite=LIMITE_RESULTADOS):
+        """
+        Hasta `limite` resultados {'id', 'texto'} cuyas claves empiezan con lo escrito
+
+        Con varias palabras en otro orden que el nombre, se buscan candidatos
+        por la palabra más larga (revisando a lo más MAX_CANDIDATOS) y se
+        exige que las demás sean prefijo de alguna palabra de la etiqueta.
+        """
+        self._vigente()
+        claves, ids, etiquetas = self._claves, self._ids, self._etiquetas
+        palabras = normalizar_busqueda(texto).split()
+        if not palabras:
+            return []
+        # Probar primero el texto completo (nombre o razón social) y luego como código sin separadores
+        prefijos = [' '.join(palabras)]
+        if len(palabras) > 1:
+            prefijos.append(''.join(palabras))
+        resultados = []
+        vistos = set()
+        for prefijo in prefijos:
+            i = bisect_left(claves, prefijo)
+            while i < len(claves) and len(resultados) < limite and claves[i].startswith(prefijo):
+                if ids[i] not in vistos:
+                    vistos.add(ids[i])
+                    resultados.append(ids[i])
+                i += 1
+        if len(resultados) < limite and len(palabras) > 1:
+            # Palabras en otro orden ("cereza alfajor"): candidatos por la palabra más larga, filtrados por las demás
+            posicion = max(range(len(palabras)), key=lambda j: len(palabras[j]))
+            guia = palabras[posicion]
+            otras = palabras[:posicion] + palabras[posicion + 1:]
+            i = bisect_left(claves, guia)
+            fin = min(len(claves), i + MAX_CANDIDATOS)
+            while i < fin and len(resultados) < limite and claves[i].startswith(guia):
+                pk = ids[i]
+                if pk not in vistos:
+                    vistos.add(pk)
+                    terminos = normalizar_busqueda(etiquetas[pk]).split()
+                    if all(any(t.startswith(p) for t in terminos) for p in otras):
+                        resultados.append(pk)
+                i += 1
+        return [{'id': pk, 'texto': etiquetas[pk]} for pk in resultados]
+
+
+# Los índices del mismo nombre comparten la versión: invalidar uno invalida ambos alcances
+indice_productos = IndicePrefijos('productos', _cargar_productos)
+indice_proveedores = IndicePrefijos('proveedores', _cargar_proveedores)
+indice_productos_todos = IndicePrefijos('productos', partial(_cargar_productos, ALCANCE_TODOS))
+indice_proveedores_todos = IndicePrefijos('proveedores', partial(_cargar_proveedores, ALCANCE_TODOS))
+
+INDICES = {
+    'productos': {ALCANCE_VIGENTES: indice_productos, ALCANCE_TODOS: indice_productos_todos},
+    'proveedores': {ALCANCE_VIGENTES: indice_proveedores, ALCANCE_TODOS: indice_proveedores_todos},
+}
+
+
+def registrar_cambio(indice, campos, update_fields=None):
+    """Invalidar `indice` (en todos sus alcances) al confirmarse la transacción, salvo guardados parciales que no tocan `campos`"""
+    if update_fields is not None and not campos.intersection(update_fields):
+        return
+    transaction.on_commit(indice.invalidar)
+
+
+class SelectAutocompletar(forms.Select):
+    """
+    Select que solo incluye la opción seleccionada
+
+    El resto se busca con `url` (endpoint de autocompletado). Así el
+    formulario se dibuja en tiempo constante aunque el queryset del campo
+    tenga miles de filas. La validación sigue siendo la del ModelChoiceField
+    (una consulta por clave primaria).
+    """
+
+    def __init__(self, url, attrs=None, placeholder='Escribe para buscar...'):
+        attrs = {'class': 'form-control', **(attrs or {})}
+        attrs['data-autocompletar-url'] = url
+        attrs['data-placeholder'] = placeholder
+        super().__init__(attrs=attrs)
+
+    def optgroups(self, name, value, attrs=None):
+        seleccionados = {str(v) for v in value if v not in (None, '')}
+        opciones = [self.create_option(name, '', '---------', not seleccionados, 0)]
+        queryset = getattr(self.choices, 'queryset', None)
+        if seleccionados and queryset is not None:
+            campo = self.choices.field
+            for indice, obj in enumerate(queryset.filter(pk__in=seleccionados), start=1):
+                opciones.append(self.create_option(
+                    name, campo.prepare_value(obj), campo.label_from_instance(obj), True, indice,
+                ))
+        return [(None, opciones, 0)]
@@ -0,0 +1,208 @@
+"""
+Índice de búsqueda de movimientos de inventario
+
+Cada movimiento guarda en texto_busqueda una versión normalizada (minúsculas,
+sin tildes ni signos) de SKU, nombre del producto, razón social y RUT del
+proveedor, documento de referencia, lote y serie. La búsqueda filtra sobre esa
+única columna, sin joins:
+
+- MySQL: índice FULLTEXT mov_busqueda_ft (modo booleano con prefijos).
+- SQLite: tabla virtual FTS5 production_movimiento_fts, sincronizada por triggers.
+- Otros motores, y el archivo de movimientos: LIKE sobre la columna.
+
+En todos los casos se exige además que cada palabra buscada aparezca tal cual
+en el texto normalizado, de modo que "OC-123" encuentra "oc 123" y no
+movimientos que solo contengan "oc" y "123" por separado.
+"""
+import re
+import unicodedata
+
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+
+TABLA_MOVIMIENTOS = 'production_movimientoinventario'
+TABLA_FTS = 'production_movimiento_fts'
+INDICE_FULLTEXT = 'mov_busqueda_ft'
+
+# innodb_ft_min_token_size por defecto: palabras más cortas no quedan en el índice FULLTEXT
+MIN_TOKEN_FULLTEXT = 3
+
+SEPARADOR = ' | '
+
+_motores = {}
+
+
+def normalizar_busqueda(texto):
+    """Minúsculas, sin tildes (á -> a, ñ -> n) y solo letras y dígitos separados por un espacio"""
+    if not texto:
+        return ''
+    texto = unicodedata.normalize('NFKD', str(texto))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+    return ' '.join(re.findall(r'[^\W_]+', texto))
+
+
+def componer_texto_busqueda(*partes):
+    """Texto indexado de un movimiento; las partes se separan para que una palabra no cruce de un campo a otro"""
+    return SEPARADOR.join(normalizar_busqueda(parte) for parte in partes)
+
+
+def texto_busqueda_movimiento(movimiento):
+    """texto_busqueda de una instancia de MovimientoInventario"""
+    producto = movimiento.producto
+    proveedor = movimiento.proveedor
+    return componer_texto_busqueda(
+        producto.sku, producto.name,
+        proveedor.razon_social if proveedor else '', proveedor.rut if proveedor else '',
+        movimiento.doc_referencia, movimiento.lote, movimiento.serie,
+    )
+
+
+CAMPOS_REINDEXAR = (
+    'producto__sku', 'producto__name', 'proveedor__razon_social', 'proveedor__rut',
+    'doc_referencia', 'lote', 'serie',
+)
+
+
+def reindexar_busqueda_movimientos(queryset, chunk_size=2000):
+    """
+    Recalcular texto_busqueda de los movimientos de `queryset` por lotes de id
+
+    Solo escribe las filas cuyo texto cambió, con un UPDATE parametrizado por
+    fila (executemany): bulk_update arma un CASE por lote que en tablas grandes
+    cuesta mucho más. Retorna cuántas se actualizaron.
+    """
+    conexion = connections[queryset.db]
+    sentencia = f'UPDATE {queryset.model._meta.db_table} SET texto_busqueda = %s WHERE id = %s'
+    ultimo_id = 0
+    actualizados = 0
+    while True:
+        filas = list(
+            queryset.filter(id__gt=ultimo_id).order_by('id').values_list('id', 'texto_busqueda', *CAMPOS_REINDEXAR)[:chunk_size]
+        )
+        cambios = []
+        for pk, actual, *partes in filas:
+            nuevo = componer_texto_busqueda(*partes)
+            if nuevo != actual:
+                cambios.append((nuevo, pk))
+        if cambios:
+            with transaction.atomic(using=queryset.db), conexion.cursor() as cursor:
+                cursor.executemany(sentencia, cambios)
+            actualizados += len(cambios)
+        if len(filas) < chunk_size:
+            return actualizados
+        ultimo_id = filas[-1][0]
+
+
+def asegurar_indice_busqueda(schema_editor=None, reconstruir=False):
+    """
+    Crear el índice de texto del motor si no existe (FULLTEXT en MySQL, FTS5 y triggers en SQLite)
+
+    En SQLite, si una migración posterior reconstruye la tabla de movimientos
+    los triggers se pierden: ejecutar `reindexar_busqueda_movimientos` los
+    vuelve a crear y reconstruye el índice.
+    """
+    conexion = schema_editor.connection if schema_editor else connection
+    _motores.pop(conexion.alias, None)
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'mysql':
+            cursor.execute(
+                'SELECT COUNT(*) FROM information_schema.STATISTICS '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s',
+                [TABLA_MOVIMIENTOS, INDICE_FULLTEXT],
+            )
+            if not cursor.fetchone()[0]:
+                cursor.execute(f'CREATE FULLTEXT INDEX {INDICE_FULLTEXT} ON {TABLA_MOVIMIENTOS} (texto_busqueda)')
+        elif conexion.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5("
+                    f"texto_busqueda, content='{TABLA_MOVIMIENTOS}', content_rowid='id')"
+                )
+            except Exception:
+                return False  # SQLite compilado sin FTS5: la búsqueda usa LIKE
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ai AFTER INSERT ON {TABLA_MOVIMIENTOS} BEGIN '
+                f'INSERT INTO {TABLA_FTS}(rowid, texto_busqueda) VALUES (new.id, new.texto_busqueda); END'
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ad AFTER DELETE ON {TABLA_MOVIMIENTOS} BEGIN '
+                f"INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, texto_busqueda) VALUES ('delete', old.id, old.texto_busqueda); END"
+            )
+            cursor.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_au AFTER UPDATE OF texto_busqueda ON {TABLA_MOVIMIENTOS} BEGIN '
+                f"INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, texto_busqueda) VALUES ('delete', old.id, old.texto_busqueda); "
+                f'INSERT INTO {TABLA_FTS}(rowid, texto_busqueda) VALUES (new.id, new.texto_busqueda); END'
+            )
+            if reconstruir:
+                cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')")
+        else:
+            return False
+    return True
+
+
+def eliminar_indice_busqueda(schema_editor):
+    """Quitar el índice de texto creado por asegurar_indice_busqueda"""
+    conexion = schema_editor.connection
+    _motores.pop(conexion.alias, None)
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'mysql':
+            try:
+                cursor.execute(f'DROP INDEX {INDICE_FULLTEXT} ON {TABLA_MOVIMIENTOS}')
+            except Exception:
+                pass
+        elif conexion.vendor == 'sqlite':
+            for sufijo in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {TABLA_FTS}_{sufijo}')
+            cursor.execute(f'DROP TABLE IF EXISTS {TABLA_FTS}')
+
+
+def _motor_busqueda():
+    """'fulltext', 'fts5' o None según el motor y el índice disponible (se consulta una vez por proceso)"""
+    if connection.alias not in _motores:
+        motor = None
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(
+                    'SELECT COUNT(*) FROM information_schema.STATISTICS '
+                    'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s',
+                    [TABLA_MOVIMIENTOS, INDICE_FULLTEXT],
+                )
+                motor = 'fulltext' if cursor.fetchone()[0] else None
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLA_FTS])
+                motor = 'fts5' if cursor.fetchone()[0] else None
+        _motores[connection.alias] = motor
+    return _motores[connection.alias]
+
+
+def filtrar_busqueda_movimientos(queryset, q):
+    """Filtrar movimientos por el texto `q` usando el índice de búsqueda"""
+    palabras = [p for p in (normalizar_busqueda(palabra) for palabra in q.split()) if p]
+    if not palabras:
+        return queryset
+    tokens = sorted({token for palabra in palabras for token in palabra.split()})
+
+    # El índice de texto existe solo sobre la tabla activa; en el archivo (MovimientoArchivado) se usa LIKE
+    motor = _motor_busqueda() if queryset.model._meta.db_table == TABLA_MOVIMIENTOS else None
+    if motor == 'fts5':
+        expresion = ' AND '.join(f'"{token}"*' for token in tokens)
+        queryset = queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s', [expresion]
+        ))
+    elif motor == 'fulltext':
+        largos = [token for token in tokens if len(token) >= MIN_TOKEN_FULLTEXT]
+        if largos:
+            expresion = ' '.join(f'+{token}*' for token in largos)
+            queryset = queryset.filter(id__in=RawSQL(
+                f'SELECT id FROM {TABLA_MOVIMIENTOS} WHERE MATCH(texto_busqueda) AGAINST (%s IN BOOLEAN MODE)', [expresion]
+            ))
+
+    for palabra in palabras:
+        if motor is None:
+            # Sin índice: igual que FTS, cada palabra debe empezar al inicio de un término
+            queryset = queryset.filter(Q(texto_busqueda__startswith=palabra) | Q(texto_busqueda__contains=' ' + palabra))
+        else:
+            queryset = queryset.filter(texto_busqueda__contains=palabra)
+    return queryset
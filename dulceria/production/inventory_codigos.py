@@ -0,0 +1,203 @@
+"""
+Índice en memoria de códigos de barras para la consulta en caja
+
+Cada proceso mantiene un diccionario EAN/UPC -> producto y SKU -> producto
+con los productos activos y aprobados (nombre, precio y stock). La consulta
+es una búsqueda en el diccionario, sin ir a la base de datos.
+
+Mantención del índice:
+- Los guardados y eliminaciones de Product (señales) y los cambios de stock
+  (aplicar_delta_stock) parchean la entrada del producto en el proceso que
+  los hizo, al confirmarse la transacción.
+- Para los demás procesos, cada cambio incrementa una versión compartida en
+  la caché. Cada proceso revisa esa versión como máximo una vez cada
+  INDICE_CODIGOS_SEGUNDOS y, si otro proceso la cambió, reconstruye el
+  índice completo (una consulta). Con varios procesos web la caché debe ser
+  compartida (Redis); con LocMem cada proceso solo ve sus propios cambios
+  hasta que el índice se reconstruye por otro motivo.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Product
+
+
+CLAVE_VERSION = 'indice_codigos_version'
+
+CAMPOS_INDICE = ('id', 'sku', 'ean_upc', 'name', 'price', 'iva', 'stock', 'uom_venta')
+
+
+def normalizar_codigo(codigo):
+    """Código tal como se guarda en el índice: sin espacios y en mayúsculas (SKU-001 = sku-001)"""
+    return (codigo or '').strip().upper()
+
+
+def _entrada(id, sku, ean_upc, name, price, iva, stock, uom_venta):
+    return {
+        'id': id,
+        'sku': sku,
+        'ean_upc': ean_upc or '',
+        'nombre': name,
+        'precio': str(price) if price is not None else None,
+        'iva': str(iva),
+        'stock': stock,
+        'unidad': uom_venta,
+    }
+
+
+def _indexable(producto):
+    return producto.is_active and producto.estado_aprobacion == 'APROBADO'
+
+
+def _incrementar_version():
+    """Incrementar la versión compartida; retorna la nueva versión o None si la caché falló"""
+    if cache.add(CLAVE_VERSION, 1, timeout=None):
+        return 1
+    try:
+        return cache.incr(CLAVE_VERSION)
+    except ValueError:
+        # La clave se expulsó entre add e incr: la próxima revisión reconstruirá
+        return None
+
+
+class IndiceCodigos:
+    """Índice de un proceso; los lectores nunca bloquean, solo la reconstrucción y los parches toman el lock"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._por_ean = {}
+        self._por_sku = {}
+        self._por_id = None
+        self._version = None
+        self._revisado = 0.0
+
+    def buscar(self, codigo):
+        """Entrada del producto con ese EAN/UPC o SKU; None si no existe o no está activo y aprobado"""
+        self._vigente()
+        codigo = normalizar_codigo(codigo)
+        return self._por_ean.get(codigo) or self._por_sku.get(codigo)
+
+    def __len__(self):
+        self._vigente()
+        return len(self._por_id)
+
+    def _vigente(self):
+        ahora = time.monotonic()
+        segundos = getattr(settings, 'INDICE_CODIGOS_SEGUNDOS', 1.0)
+        if self._por_id is not None and ahora - self._revisado < segundos:
+            return
+        with self._lock:
+            if self._por_id is not None and ahora - self._revisado < segundos:
+                return
+            version = cache.get(CLAVE_VERSION)
+            if self._por_id is None or version != self._version:
+                self._reconstruir(version)
+            self._revisado = ahora
+
+    def _reconstruir(self, version):
+        # La versión se lee antes de la consulta: un cambio durante la carga provoca otra reconstrucción
+        por_ean, por_sku, por_id = {}, {}, {}
+        productos = Product.objects.filter(is_active=True, estado_aprobacion='APROBADO').values_list(*CAMPOS_INDICE)
+        for fila in productos.iterator(chunk_size=5000):
+            entrada = _entrada(*fila)
+            por_id[entrada['id']] = entrada
+            por_sku[normalizar_codigo(entrada['sku'])] = entrada
+            if entrada['ean_upc']:
+                por_ean[normalizar_codigo(entrada['ean_upc'])] = entrada
+        # Se reemplazan los diccionarios completos: un lector ve el índice anterior o el nuevo, nunca uno a medias
+        self._por_ean, self._por_sku, self._por_id = por_ean, por_sku, por_id
+        self._version = version
+
+    def _parchear(self, cambio):
+        """Aplicar `cambio` al índice local y publicar la nueva versión para los demás procesos"""
+        nueva = _incrementar_version()
+        with self._lock:
+            if self._por_id is None:
+                return
+            cambio()
+            # Solo si nadie más cambió la versión el índice local sigue al día; si no, se reconstruye en la próxima revisión
+            if nueva is not None and nueva == (self._version or 0) + 1:
+                self._version = nueva
+
+    def _quitar(self, producto_id):
+        anterior = self._por_id.pop(producto_id, None)
+        if anterior is None:
+            return
+        self._soltar(self._por_sku, anterior['sku'], producto_id)
+        self._soltar(self._por_ean, anterior['ean_upc'], producto_id)
+
+    @staticmethod
+    def _soltar(por_codigo, codigo, producto_id):
+        """Quitar el código solo si todavía apunta a ese producto (otro pudo tomarlo)"""
+        codigo = normalizar_codigo(codigo)
+        if codigo and por_codigo.get(codigo, {}).get('id') == producto_id:
+            del por_codigo[codigo]
+
+    def _poner(self, entrada):
+        # Primero se publican los códigos nuevos y después se quitan los que el producto dejó de tener,
+        # para que un lector concurrente nunca deje de encontrar el producto
+        anterior = self._por_id.get(entrada['id'])
+        sku, ean = normalizar_codigo(entrada['sku']), normalizar_codigo(entrada['ean_upc'])
+        self._por_id[entrada['id']] = entrada
+        self._por_sku[sku] = entrada
+        if ean:
+            self._por_ean[ean] = entrada
+        if anterior is None:
+            return
+        if normalizar_codigo(anterior['sku']) != sku:
+            self._soltar(self._por_sku, anterior['sku'], entrada['id'])
+        if normalizar_codigo(anterior['ean_upc']) != ean:
+            self._soltar(self._por_ean, anterior['ean_upc'], entrada['id'])
+
+    def producto_guardado(self, producto_id, entrada, conservar_stock=False):
+        """
+        Reemplazar la entrada del producto (o quitarla si `entrada` es None)
+
+        Con `conservar_stock` (guardado parcial que no escribió el stock) se
+        mantiene el stock indexado, porque el de la instancia puede estar
+        desactualizado.
+        """
+        def cambio():
+            if entrada is None:
+                self._quitar(producto_id)
+                return
+            anterior = self._por_id.get(producto_id)
+            self._poner(dict(entrada, stock=anterior['stock']) if conservar_stock and anterior else entrada)
+        self._parchear(cambio)
+
+    def stock_cambiado(self, producto_id, delta):
+        def cambio():
+            anterior = self._por_id.get(producto_id)
+            if anterior is not None:
+                # Entrada nueva en vez de modificarla: un lector concurrente ve un stock u otro, completo
+                self._poner(dict(anterior, stock=int(anterior['stock'] + delta)))
+        self._parchear(cambio)
+
+
+indice = IndiceCodigos()
+
+
+def buscar_codigo(codigo):
+    """Producto activo y aprobado con ese EAN/UPC o SKU (dict listo para JSON) o None"""
+    return indice.buscar(codigo)
+
+
+def registrar_producto_guardado(producto, update_fields=None):
+    """Parchear el índice con el producto al confirmarse la transacción del guardado"""
+    entrada = _entrada(*(getattr(producto, campo) for campo in CAMPOS_INDICE)) if _indexable(producto) else None
+    producto_id = producto.pk
+    conservar_stock = update_fields is not None and 'stock' not in update_fields
+    transaction.on_commit(lambda: indice.producto_guardado(producto_id, entrada, conservar_stock))
+
+
+def registrar_producto_eliminado(producto_id):
+    transaction.on_commit(lambda: indice.producto_guardado(producto_id, None))
+
+
+def registrar_cambio_stock(producto_id, delta):
+    """Sumar `delta` al stock indexado al confirmarse la transacción del movimiento"""
+    transaction.on_commit(lambda: indice.stock_cambiado(producto_id, delta))
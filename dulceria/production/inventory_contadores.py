@@ -0,0 +1,143 @@
+"""
+Contadores precalculados del dashboard de inventario
+
+Los valores se mantienen incrementalmente desde las escrituras (ver
+sumar_contadores en models): stock total, productos con stock, movimientos
+por día y, por bodega, unidades y productos con saldo. El escaneo de
+vencimientos guarda además el total de su resumen y cuántos registros
+estarán vencidos cada día hasta su límite. Aquí está la lectura para el
+dashboard y la reconciliación, que los recalcula con consultas agregadas y
+corrige lo que haya derivado (por ejemplo, un proceso que terminó entre el
+commit y la suma de un contador).
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .inventory_archivo import modelos_para_rango
+from .models import (
+    CONTADOR_PRODUCTOS_CON_STOCK, CONTADOR_STOCK_TOTAL, CONTADOR_VENCIMIENTOS_TOTAL,
+    Bodega, ContadorInventario, ContadorPendiente, Product, StockBodega,
+    clave_movimientos_dia, clave_productos_bodega, clave_stock_bodega, clave_vencidos_al,
+)
+
+
+def calcular_contadores(dias=7):
+    """Valores correctos de los contadores globales, por bodega y de movimientos de los últimos `dias` días"""
+    hoy = timezone.localdate()
+    desde = hoy - timedelta(days=dias - 1)
+    valores = Product.objects.filter(is_active=True, estado_aprobacion='APROBADO').aggregate(
+        stock_total=Sum('stock'),
+        productos_con_stock=Count('id', filter=Q(stock__gt=0)),
+    )
+    contadores = {
+        CONTADOR_STOCK_TOTAL: valores['stock_total'] or 0,
+        CONTADOR_PRODUCTOS_CON_STOCK: valores['productos_con_stock'],
+    }
+    for bodega_id in Bodega.objects.values_list('id', flat=True):
+        contadores[clave_stock_bodega(bodega_id)] = 0
+        contadores[clave_productos_bodega(bodega_id)] = 0
+    saldos = StockBodega.objects.order_by().values('producto_id', 'bodega_id').annotate(total=Sum('cantidad'))
+    for bodega_id, total in saldos.values_list('bodega_id', 'total').iterator(chunk_size=5000):
+        contadores[clave_stock_bodega(bodega_id)] += total
+        contadores[clave_productos_bodega(bodega_id)] += 1 if total > 0 else 0
+    for dia in range(dias):
+        contadores[clave_movimientos_dia(desde + timedelta(days=dia))] = 0
+    # Rango sobre la columna fecha (usa mov_fecha_idx) y agrupación por día local
+    inicio = timezone.make_aware(datetime.combine(desde, time.min))
+    # Los movimientos archivados siguen contando en el día en que se registraron
+    for modelo in modelos_para_rango(inicio):
+        por_dia = modelo.objects.filter(
+            fecha__gte=inicio
+        ).annotate(dia=TruncDate('fecha')).order_by().values('dia').annotate(total=Count('id')).values_list('dia', 'total')
+        for dia, total in por_dia:
+            if dia <= hoy:
+                contadores[clave_movimientos_dia(dia)] += total
+    return contadores
+
+
+def reconciliar_contadores(dias=7):
+    """
+    Recalcular los contadores y guardar los valores correctos
+
+    Las sumas confirmadas que aún no se aplicaron (ContadorPendiente) ya
+    están en los agregados: la reconciliación las lee en la misma lectura
+    consistente que los agregados y las borra, de modo que _aplicar_contadores
+    no las vuelva a sumar. Supone que las lecturas de la transacción ven una
+    misma instantánea (REPEATABLE READ de MySQL/InnoDB, o SQLite, que
+    serializa las escrituras).
+
+    Retorna {clave: (valor_guardado, valor_correcto)} de los que estaban desviados.
+    """
+    with transaction.atomic():
+        # Bloquear primero las filas: las sumas que lleguen durante el cálculo esperan al final de la reconciliación
+        existentes = dict(ContadorInventario.objects.select_for_update().values_list('clave', 'valor'))
+        correctos = calcular_contadores(dias)
+        pendientes = list(ContadorPendiente.objects.values_list('id', flat=True))
+        desviados = {
+            clave: (existentes.get(clave), valor)
+            for clave, valor in correctos.items()
+            if existentes.get(clave) != valor
+        }
+        for clave, (_, valor) in desviados.items():
+            ContadorInventario.objects.update_or_create(clave=clave, defaults={'valor': valor})
+        for inicio in range(0, len(pendientes), 1000):
+            ContadorPendiente.objects.filter(id__in=pendientes[inicio:inicio + 1000]).delete()
+    return desviados
+
+
+def contadores_dashboard():
+    """
+    Valores para el dashboard: stock total, productos con stock, movimientos de
+    hoy, stock por bodega y resumen de vencimientos
+
+    Una lectura de las bodegas y una de los contadores por clave, sin
+    agregados; si los contadores globales o los de alguna bodega aún no
+    existen (instalación o bodega nueva) se reconcilian una vez.
+    """
+    hoy = timezone.localdate()
+    clave_hoy = clave_movimientos_dia(hoy)
+    bodegas = list(Bodega.objects.order_by('codigo').values_list('id', 'codigo', 'nombre'))
+    requeridas = [CONTADOR_STOCK_TOTAL, CONTADOR_PRODUCTOS_CON_STOCK]
+    for bodega_id, _, _ in bodegas:
+        requeridas += [clave_stock_bodega(bodega_id), clave_productos_bodega(bodega_id)]
+    claves = [*requeridas, clave_hoy, CONTADOR_VENCIMIENTOS_TOTAL, clave_vencidos_al(hoy)]
+
+    def leer():
+        return {
+            clave: (valor, actualizado)
+            for clave, valor, actualizado in ContadorInventario.objects.filter(clave__in=claves).values_list(
+                'clave', 'valor', 'updated_at'
+            )
+        }
+
+    filas = leer()
+    if any(clave not in filas for clave in requeridas):
+        reconciliar_contadores(dias=1)
+        filas = leer()
+    valores = {clave: valor for clave, (valor, _) in filas.items()}
+
+    stock_por_bodega = [
+        {
+            'bodega__codigo': codigo, 'bodega__nombre': nombre,
+            'total': valores.get(clave_stock_bodega(bodega_id), 0),
+            'productos': valores.get(clave_productos_bodega(bodega_id), 0),
+        }
+        for bodega_id, codigo, nombre in bodegas
+    ]
+    total_vencimientos, generado_en = filas.get(CONTADOR_VENCIMIENTOS_TOTAL, (0, None))
+    return {
+        'stock_total': valores.get(CONTADOR_STOCK_TOTAL, 0),
+        'productos_unicos': valores.get(CONTADOR_PRODUCTOS_CON_STOCK, 0),
+        'movimientos_hoy': valores.get(clave_hoy, 0),
+        'stock_por_bodega': [fila for fila in stock_por_bodega if fila['total'] or fila['productos']],
+        'vencimientos_resumen': {
+            'total': total_vencimientos,
+            # Pasado el límite del escaneo todos sus registros están vencidos
+            'vencidos': valores.get(clave_vencidos_al(hoy), total_vencimientos),
+            'generado_en': generado_en,
+        },
+    }
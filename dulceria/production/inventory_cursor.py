@@ -0,0 +1,146 @@
+"""
+Paginación por cursor (keyset) para la lista de movimientos
+
+En vez de OFFSET/LIMIT, cada página continúa desde la última fila de la
+anterior según el orden (fecha, created_at, id) descendente, que cubre el
+índice mov_fecha_creado_idx. Así la página N+1 cuesta lo mismo que la
+primera, sin importar el tamaño del historial. Los tokens de navegación son
+opacos para el cliente (JSON en base64).
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.db import connection
+from django.db.models import Q
+
+
+SIGUIENTE = 's'
+ANTERIOR = 'a'
+
+LIMITE_CONTEO = 10000
+
+
+def codificar_token(movimiento, direccion):
+    """Token opaco que apunta a un movimiento (fecha, created_at, id) en una dirección"""
+    datos = [direccion, movimiento.fecha.isoformat(), movimiento.created_at.isoformat(), movimiento.pk]
+    return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode().rstrip('=')
+
+
+def decodificar_token(token):
+    """Retorna (direccion, fecha, created_at, id); None si el token no es válido"""
+    if not token:
+        return None
+    try:
+        relleno = '=' * (-len(token) % 4)
+        direccion, fecha, creado, pk = json.loads(base64.urlsafe_b64decode(token + relleno))
+        if direccion not in (SIGUIENTE, ANTERIOR):
+            return None
+        return direccion, datetime.fromisoformat(fecha), datetime.fromisoformat(creado), int(pk)
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+class PaginaCursor:
+    """Página de resultados con los tokens para la página siguiente y la anterior"""
+
+    def __init__(self, objetos, token_siguiente, token_anterior):
+        self.object_list = objetos
+        self.token_siguiente = token_siguiente
+        self.token_anterior = token_anterior
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.token_siguiente is not None
+
+    def has_previous(self):
+        return self.token_anterior is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def paginar_por_cursor(queryset, token, por_pagina):
+    """
+    Obtener una página de `queryset` en orden (fecha, created_at, id) descendente
+
+    `token` es el recibido en la petición (o None para la primera página).
+    Un token inválido se trata como la primera página. Se lee una fila extra
+    para saber si hay más resultados en la dirección de avance. `queryset`
+    puede ser una lista de querysets (tabla activa y archivo): se lee la
+    página de cada uno y se intercalan según el orden.
+    """
+    querysets = queryset if isinstance(queryset, (list, tuple)) else [queryset]
+    cursor = decodificar_token(token)
+    if cursor is None:
+        direccion = SIGUIENTE
+        paginas = [qs.order_by('-fecha', '-created_at', '-id') for qs in querysets]
+    else:
+        direccion, fecha, creado, pk = cursor
+        if direccion == SIGUIENTE:
+            # fecha__lte redundante: deja el rango del índice acotado aunque el OR no lo sea
+            paginas = [qs.filter(fecha__lte=fecha).filter(
+                Q(fecha__lt=fecha) | Q(fecha=fecha, created_at__lt=creado) | Q(fecha=fecha, created_at=creado, id__lt=pk)
+            ).order_by('-fecha', '-created_at', '-id') for qs in querysets]
+        else:
+            paginas = [qs.filter(fecha__gte=fecha).filter(
+                Q(fecha__gt=fecha) | Q(fecha=fecha, created_at__gt=creado) | Q(fecha=fecha, created_at=creado, id__gt=pk)
+            ).order_by('fecha', 'created_at', 'id') for qs in querysets]
+
+    filas = [fila for pagina in paginas for fila in pagina[:por_pagina + 1]]
+    if len(paginas) > 1:
+        filas.sort(key=lambda m: (m.fecha, m.created_at, m.pk), reverse=direccion == SIGUIENTE)
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+    if direccion == ANTERIOR:
+        filas.reverse()
+
+    if not filas:
+        return PaginaCursor(filas, None, None)
+
+    hay_siguiente = hay_mas if direccion == SIGUIENTE else True
+    hay_anterior = cursor is not None if direccion == SIGUIENTE else hay_mas
+    return PaginaCursor(
+        filas,
+        codificar_token(filas[-1], SIGUIENTE) if hay_siguiente else None,
+        codificar_token(filas[0], ANTERIOR) if hay_anterior else None,
+    )
+
+
+def _filas_estimadas_tabla(modelo):
+    """Filas estimadas por las estadísticas del motor (MySQL/PostgreSQL); None si no hay"""
+    tabla = modelo._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [tabla],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s', [tabla])
+        else:
+            return None
+        fila = cursor.fetchone()
+    return int(fila[0]) if fila and fila[0] is not None and fila[0] >= 0 else None
+
+
+def conteo_aproximado(queryset, limite=LIMITE_CONTEO):
+    """
+    Total aproximado de un queryset sin recorrer toda la tabla
+
+    Sin filtros usa las estadísticas del motor. Con filtros cuenta como
+    máximo `limite` filas (COUNT sobre una subconsulta con LIMIT).
+    Retorna (total, exacto): exacto es False si el total es una estimación o un tope.
+    """
+    if not queryset.query.where:
+        estimado = _filas_estimadas_tabla(queryset.model)
+        if estimado is not None:
+            return estimado, False
+    total = queryset.select_related(None).order_by()[:limite + 1].count()
+    return min(total, limite), total <= limite
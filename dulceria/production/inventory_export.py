@@ -0,0 +1,329 @@
+"""
+Reporte de inventario en Excel (productos, usuarios por rol y movimientos)
+
+El libro se escribe con openpyxl en modo write_only, que vuelca cada fila a
+disco al agregarla, y las filas se leen con values_list en lotes por cursor
+(keyset) en vez de instancias del ORM. Con MySQL, QuerySet.iterator() no
+evita que el driver cargue el resultado completo en memoria; paginar por
+cursor sí, y cada lote usa el índice del orden. Así la memoria se mantiene
+plana sin importar cuántos movimientos haya.
+
+Para integraciones hay además una salida CSV / NDJSON de movimientos (ver
+lineas_movimientos) que no pasa por openpyxl ni arma instancias del ORM.
+"""
+import csv
+import heapq
+import io
+import json
+
+from django.db.models import Q
+from django.utils import timezone
+from openpyxl import Workbook
+
+from accounts.models import UserProfile
+from .models import MovimientoInventario, Product
+
+
+ENCABEZADOS_PRODUCTOS = [
+    'SKU', 'Nombre', 'Categoría', 'Estado Aprobación', 'Stock', 'Stock Mínimo',
+    'Stock Máximo', 'Precio Venta', 'IVA (%)', 'Unidad Compra', 'Unidad Venta',
+    'Factor Conversión', 'Perecible', 'Control Lote', 'Control Serie',
+    'Fecha Vencimiento', 'Creado Por'
+]
+
+ENCABEZADOS_USUARIOS = [
+    'Username', 'Email', 'Nombres', 'Apellidos', 'Rol', 'Estado',
+    'MFA Habilitado', 'Organización', 'Teléfono', 'Área / Unidad',
+    'Observaciones', 'Último acceso'
+]
+
+ENCABEZADOS_MOVIMIENTOS = [
+    'Fecha', 'Tipo', 'SKU', 'Producto', 'Proveedor', 'Bodega', 'Cantidad',
+    'Lote', 'Serie', 'Fecha Vencimiento', 'Doc. Referencia', 'Motivo',
+    'Observaciones', 'Creado Por'
+]
+
+CAMPOS_MOVIMIENTOS = (
+    'fecha', 'tipo', 'producto__sku', 'producto__name', 'proveedor__razon_social', 'bodega__codigo',
+    'cantidad', 'lote', 'serie', 'fecha_vencimiento', 'doc_referencia', 'motivo', 'observaciones',
+    'creado_por__first_name', 'creado_por__last_name', 'creado_por__username',
+)
+
+TAMANO_LOTE = 2000
+
+
+def _fecha_hora(valor):
+    if not valor:
+        return ''
+    if timezone.is_aware(valor):
+        valor = timezone.localtime(valor)
+    return valor.strftime('%d-%m-%Y %H:%M')
+
+
+def _nombre_usuario(nombres, apellidos, username):
+    # Igual que User.get_full_name(), con el username si no tiene nombre
+    return f'{nombres or ""} {apellidos or ""}'.strip() or (username or '')
+
+
+def recorrer_movimientos(queryset, campos, chunk_size=TAMANO_LOTE):
+    """
+    Recorrer movimientos en orden (fecha, created_at, id) descendente, en lotes por cursor
+
+    Genera tuplas con los `campos` pedidos. Cada lote continúa desde la última
+    fila del anterior (índice mov_fecha_creado_idx), sin OFFSET. `queryset`
+    puede ser una lista de querysets (tabla activa y archivo): se recorren a
+    la vez y se intercalan según el orden.
+    """
+    if isinstance(queryset, (list, tuple)):
+        fuentes = [_recorrer_con_clave(qs, campos, chunk_size) for qs in queryset]
+        for fila in heapq.merge(*fuentes, key=lambda fila: fila[:3], reverse=True):
+            yield fila[3:]
+        return
+    for fila in _recorrer_con_clave(queryset, campos, chunk_size):
+        yield fila[3:]
+
+
+def _recorrer_con_clave(queryset, campos, chunk_size):
+    # Filas (fecha, created_at, id, *campos) de un queryset, por lotes con cursor
+    ultimo = None
+    while True:
+        pagina = queryset
+        if ultimo is not None:
+            fecha, creado, pk = ultimo
+            pagina = pagina.filter(fecha__lte=fecha).filter(
+                Q(fecha__lt=fecha) | Q(fecha=fecha, created_at__lt=creado) | Q(fecha=fecha, created_at=creado, id__lt=pk)
+            )
+        filas = list(
+            pagina.order_by('-fecha', '-created_at', '-id').values_list('fecha', 'created_at', 'id', *campos)[:chunk_size]
+        )
+        yield from filas
+        if len(filas) < chunk_size:
+            return
+        ultimo = filas[-1][:3]
+
+
+def filas_productos(chunk_size=TAMANO_LOTE):
+    """Filas de la hoja Productos, en orden de SKU y por lotes"""
+    estados = dict(Product.ESTADO_APROBACION_CHOICES)
+    ultimo_sku = None
+    while True:
+        productos = Product.objects.order_by('sku')
+        if ultimo_sku is not None:
+            productos = productos.filter(sku__gt=ultimo_sku)
+        filas = list(productos.values_list(
+            'sku', 'name', 'category__name', 'estado_aprobacion', 'stock', 'stock_minimo', 'stock_maximo',
+            'price', 'iva', 'uom_compra', 'uom_venta', 'factor_conversion', 'es_perecible',
+            'control_por_lote', 'control_por_serie', 'fecha_vencimiento',
+            'creado_por__first_name', 'creado_por__last_name', 'creado_por__username',
+        )[:chunk_size])
+        for (sku, nombre, categoria, estado, stock, stock_minimo, stock_maximo, precio, iva, uom_compra,
+             uom_venta, factor, perecible, lote, serie, vencimiento, nombres, apellidos, username) in filas:
+            yield [
+                sku,
+                nombre,
+                categoria or '',
+                estados.get(estado, estado),
+                stock,
+                stock_minimo,
+                stock_maximo or '',
+                precio or '',
+                iva,
+                uom_compra,
+                uom_venta,
+                factor,
+                'Sí' if perecible else 'No',
+                'Sí' if lote else 'No',
+                'Sí' if serie else 'No',
+                vencimiento.strftime('%d-%m-%Y') if vencimiento else '',
+                _nombre_usuario(nombres, apellidos, username),
+            ]
+        if len(filas) < chunk_size:
+            return
+        ultimo_sku = filas[-1][0]
+
+
+def filas_usuarios(rol):
+    """Filas de la hoja de usuarios de un rol"""
+    roles = dict(UserProfile.ROLE_CHOICES)
+    estados = dict(UserProfile.STATE_CHOICES)
+    perfiles = UserProfile.objects.filter(role=rol).order_by('user__username').values_list(
+        'user__username', 'user__email', 'user__first_name', 'user__last_name', 'role', 'state',
+        'mfa_enabled', 'organization__name', 'phone', 'area', 'observaciones', 'user__last_login',
+    )
+    for username, email, nombres, apellidos, role, estado, mfa, organizacion, telefono, area, observaciones, ultimo in perfiles.iterator():
+        yield [
+            username,
+            email,
+            nombres,
+            apellidos,
+            roles.get(role, role),
+            estados.get(estado, estado),
+            'Sí' if mfa else 'No',
+            organizacion or '',
+            telefono,
+            area,
+            observaciones,
+            _fecha_hora(ultimo),
+        ]
+
+
+def filas_movimientos(queryset=None, chunk_size=TAMANO_LOTE):
+    """Filas de la hoja Movimientos, de la más reciente a la más antigua"""
+    tipos = dict(MovimientoInventario.TIPO_MOVIMIENTO_CHOICES)
+    if queryset is None:
+        queryset = MovimientoInventario.objects.all()
+    for (fecha, tipo, sku, nombre, proveedor, bodega, cantidad, lote, serie, vencimiento, doc,
+         motivo, observaciones, nombres, apellidos, username) in recorrer_movimientos(queryset, CAMPOS_MOVIMIENTOS, chunk_size):
+        yield [
+            _fecha_hora(fecha),
+            tipos.get(tipo, tipo),
+            sku or '',
+            nombre or '',
+            proveedor or '',
+            bodega or '',
+            cantidad,
+            lote,
+            serie,
+            vencimiento.strftime('%d-%m-%Y') if vencimiento else '',
+            doc,
+            motivo,
+            observaciones,
+            _nombre_usuario(nombres, apellidos, username),
+        ]
+
+
+def _nombre_hoja_usuarios(etiqueta):
+    nombre_hoja = f"Usuarios {etiqueta}"
+    if len(nombre_hoja) > 31:
+        nombre_hoja = nombre_hoja[:28] + '...'
+    return nombre_hoja
+
+
+def escribir_reporte_inventario(destino, progreso=None, cada=TAMANO_LOTE):
+    """
+    Escribir el reporte de inventario en `destino` (ruta o archivo binario)
+
+    `progreso`, si se entrega, se llama con la cantidad de filas escritas
+    cada `cada` filas y al terminar. Retorna el total de filas de datos.
+    """
+    wb = Workbook(write_only=True)
+    total = 0
+
+    def escribir(hoja, filas):
+        nonlocal total
+        for fila in filas:
+            hoja.append(fila)
+            total += 1
+            if progreso and total % cada == 0:
+                progreso(total)
+
+    ws_productos = wb.create_sheet(title='Productos')
+    ws_productos.append(ENCABEZADOS_PRODUCTOS)
+    escribir(ws_productos, filas_productos())
+
+    # Una hoja por rol con usuarios, en el orden de ROLE_CHOICES
+    for valor_rol, etiqueta in UserProfile.ROLE_CHOICES:
+        filas = filas_usuarios(valor_rol)
+        primera = next(filas, None)
+        if primera is None:
+            continue
+        ws_rol = wb.create_sheet(title=_nombre_hoja_usuarios(etiqueta))
+        ws_rol.append(ENCABEZADOS_USUARIOS)
+        escribir(ws_rol, [primera])
+        escribir(ws_rol, filas)
+
+    ws_mov = wb.create_sheet(title='Movimientos')
+    ws_mov.append(ENCABEZADOS_MOVIMIENTOS)
+    escribir(ws_mov, filas_movimientos())
+
+    wb.save(destino)
+    if progreso:
+        progreso(total)
+    return total
+
+
+# Exportación para integraciones: valores crudos (códigos, ISO 8601) en vez de etiquetas
+ENCABEZADOS_INTEGRACION = [
+    'id', 'fecha', 'tipo', 'sku', 'producto', 'proveedor_rut', 'bodega', 'bodega_destino', 'cantidad',
+    'costo_unitario', 'lote', 'serie', 'fecha_vencimiento', 'doc_referencia', 'motivo', 'observaciones',
+    'creado_por', 'created_at',
+]
+
+CAMPOS_INTEGRACION = (
+    'id', 'fecha', 'tipo', 'producto__sku', 'producto__name', 'proveedor__rut', 'bodega__codigo',
+    'bodega_destino__codigo', 'cantidad', 'costo_unitario', 'lote', 'serie', 'fecha_vencimiento',
+    'doc_referencia', 'motivo', 'observaciones', 'creado_por__username', 'created_at',
+)
+
+# Filas por trozo de la respuesta: trozos de una fila hacen que GZipMiddleware comprima mal y lento
+FILAS_POR_TROZO = 500
+
+_json = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+
+def _conversores_integracion():
+    """
+    Una función por columna de CAMPOS_INTEGRACION: fechas y horas en ISO 8601
+    (hora local con desfase), decimales como texto, el resto tal cual
+
+    Se arman una vez por exportación: la zona horaria se resuelve al inicio
+    y no en cada fila (timezone.localtime la consulta en cada llamada).
+    """
+    zona = timezone.get_current_timezone()
+
+    def fecha_hora(valor):
+        return valor.astimezone(zona).isoformat() if valor is not None else None
+
+    def fecha(valor):
+        return valor.isoformat() if valor is not None else None
+
+    def decimal(valor):
+        return str(valor) if valor is not None else None
+
+    especiales = {
+        'fecha': fecha_hora, 'created_at': fecha_hora, 'fecha_vencimiento': fecha,
+        'cantidad': decimal, 'costo_unitario': decimal,
+    }
+    return [especiales.get(campo) for campo in CAMPOS_INTEGRACION]
+
+
+def lineas_movimientos(queryset, formato='csv', chunk_size=TAMANO_LOTE, filas_por_trozo=FILAS_POR_TROZO):
+    """
+    Generar la exportación de `queryset` en CSV (con encabezado) o NDJSON, en trozos de texto
+
+    Las filas salen de recorrer_movimientos (values_list por cursor) y se
+    agrupan de a `filas_por_trozo` antes de entregarlas a la respuesta.
+    """
+    conversores = list(enumerate(_conversores_integracion()))
+    conversores = [(i, convertir) for i, convertir in conversores if convertir]
+
+    def convertir(fila):
+        fila = list(fila)
+        for i, conversor in conversores:
+            fila[i] = conversor(fila[i])
+        return fila
+
+    buffer = io.StringIO()
+    if formato == 'ndjson':
+        def escribir(fila):
+            buffer.write(_json(dict(zip(ENCABEZADOS_INTEGRACION, convertir(fila)))))
+            buffer.write('\n')
+    else:
+        # csv escribe None como campo vacío
+        writer = csv.writer(buffer)
+        writer.writerow(ENCABEZADOS_INTEGRACION)
+
+        def escribir(fila):
+            writer.writerow(convertir(fila))
+
+    pendientes = 0
+    for fila in recorrer_movimientos(queryset, CAMPOS_INTEGRACION, chunk_size):
+        escribir(fila)
+        pendientes += 1
+        if pendientes == filas_por_trozo:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pendientes = 0
+    if buffer.tell():
+        yield buffer.getvalue()
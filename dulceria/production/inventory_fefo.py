@@ -0,0 +1,145 @@
+"""
+Asignación de salidas a lotes por vencimiento (FEFO: first-expired, first-out)
+
+Los saldos por lote se leen de StockBodega, cuyo índice único
+(producto, bodega, fecha_vencimiento, lote) entrega los lotes de un producto
+en una bodega ya ordenados por vencimiento, sin recorrer el historial de
+movimientos. Una salida que abarca varios lotes se registra como un
+movimiento por lote, de modo que editar o eliminar cada parte revierte
+exactamente el lote que consumió.
+"""
+from bisect import insort
+from datetime import date
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import MovimientoInventario, StockBodega
+
+
+def requiere_fefo(producto):
+    """Las salidas sin lote de productos perecibles o con control por lote se asignan por FEFO"""
+    return producto.es_perecible or producto.control_por_lote
+
+
+def _orden_fefo(fecha_vencimiento, lote):
+    # Los lotes sin vencimiento van al final, igual que NULLS LAST en la consulta
+    return (fecha_vencimiento is None, fecha_vencimiento or date.min, lote)
+
+
+class AsignadorFEFO:
+    """
+    Saldos por lote de los pares (producto, bodega) usados en una transacción
+
+    Las filas de StockBodega se bloquean al cargarlas, y las asignaciones
+    descuentan de la copia en memoria para que varias salidas del mismo
+    producto dentro de la transacción no tomen dos veces el mismo lote.
+    """
+
+    def __init__(self):
+        self._lotes = {}
+
+    def cargar(self, pares):
+        """Cargar (y bloquear) de una vez los lotes de varios pares (producto, bodega)"""
+        pares = set(pares) - set(self._lotes)
+        if not pares:
+            return
+        for par in pares:
+            self._lotes[par] = []
+        filas = StockBodega.objects.select_for_update().filter(
+            producto_id__in={p for p, _ in pares}, bodega_id__in={b for _, b in pares}
+        ).order_by('producto_id', 'bodega_id', F('fecha_vencimiento').asc(nulls_last=True), 'lote').values_list(
+            'producto_id', 'bodega_id', 'fecha_vencimiento', 'lote', 'cantidad'
+        )
+        for producto_id, bodega_id, fecha_vencimiento, lote, cantidad in filas:
+            if (producto_id, bodega_id) in pares:
+                self._lotes[(producto_id, bodega_id)].append(
+                    [_orden_fefo(fecha_vencimiento, lote), fecha_vencimiento, lote, cantidad]
+                )
+
+    def lotes(self, producto_id, bodega_id):
+        """Lista [orden, vencimiento, lote, cantidad] de un par, en orden FEFO"""
+        self.cargar([(producto_id, bodega_id)])
+        return self._lotes[(producto_id, bodega_id)]
+
+    def registrar(self, efectos):
+        """Reflejar en los pares cargados los efectos de un movimiento aún no aplicado"""
+        for (producto_id, bodega_id, lote, fecha_vencimiento), delta in efectos:
+            lotes = self._lotes.get((producto_id, bodega_id))
+            if lotes is None or not delta:
+                continue
+            orden = _orden_fefo(fecha_vencimiento, lote)
+            for entrada in lotes:
+                if entrada[0] == orden:
+                    entrada[3] += delta
+                    break
+            else:
+                insort(lotes, [orden, fecha_vencimiento, lote, delta])
+
+    def vencimiento(self, producto_id, bodega_id, lote):
+        """Vencimiento más próximo con stock de un lote (None si no está registrado)"""
+        for _, fecha_vencimiento, lote_actual, cantidad in self.lotes(producto_id, bodega_id):
+            if lote_actual == lote and cantidad > 0:
+                return fecha_vencimiento
+        return None
+
+    def asignar(self, producto_id, bodega_id, unidades):
+        """
+        Repartir `unidades` entre los lotes con stock, del vencimiento más próximo al más lejano
+
+        Retorna [(lote, fecha_vencimiento, unidades), ...]. Lo que no alcanza a
+        cubrirse con lotes se asigna al stock sin lote; el control de stock del
+        producto decide si la salida procede.
+        """
+        asignaciones = []
+        restante = unidades
+        for entrada in self.lotes(producto_id, bodega_id):
+            if restante <= 0:
+                break
+            tomar = min(restante, entrada[3])
+            if tomar <= 0:
+                continue
+            entrada[3] -= tomar
+            restante -= tomar
+            asignaciones.append((entrada[2], entrada[1], tomar))
+        if restante > 0:
+            self.registrar([((producto_id, bodega_id, '', None), -restante)])
+            asignaciones.append(('', None, restante))
+        return asignaciones
+
+
+def dividir_salida(movimiento, asignador):
+    """
+    Repartir una salida sin lote entre lotes por FEFO
+
+    Retorna la lista de movimientos (sin guardar) en que queda la salida: el
+    mismo movimiento si cabe en un lote, o una copia por cada lote consumido.
+    La fracción decimal de la cantidad queda en la última parte.
+    """
+    unidades = int(float(movimiento.cantidad))
+    if unidades <= 0:
+        return [movimiento]
+    asignaciones = asignador.asignar(movimiento.producto_id, movimiento.bodega_id, unidades)
+    fraccion = movimiento.cantidad - unidades
+
+    campos = [f.attname for f in MovimientoInventario._meta.concrete_fields if not f.primary_key]
+    piezas = []
+    for indice, (lote, fecha_vencimiento, cantidad) in enumerate(asignaciones):
+        if indice == 0:
+            pieza = movimiento
+        else:
+            pieza = MovimientoInventario(**{campo: getattr(movimiento, campo) for campo in campos})
+        pieza.lote = lote
+        pieza.fecha_vencimiento = fecha_vencimiento
+        pieza.cantidad = cantidad + (fraccion if indice == len(asignaciones) - 1 else 0)
+        piezas.append(pieza)
+    return piezas
+
+
+def registrar_salida_fefo(movimiento):
+    """Guardar una salida sin lote repartida por FEFO; retorna los movimientos creados"""
+    with transaction.atomic():
+        piezas = dividir_salida(movimiento, AsignadorFEFO())
+        for pieza in piezas:
+            pieza.save()
+    return piezas
@@ -3,6 +3,9 @@ Formularios para el módulo de inventario
 """
 from django import forms
 from django.core.validators import MinValueValidator
+from django.urls import reverse_lazy
+from .inventory_archivo import inicio_periodo_abierto
+from .inventory_autocompletar import SelectAutocompletar
 from .models import MovimientoInventario, Bodega, Product, Proveedor
 
 
@@ -12,8 +15,8 @@ class MovimientoInventarioForm(forms.ModelForm):
     class Meta:
         model = MovimientoInventario
         fields = [
-            'fecha', 'tipo', 'producto', 'proveedor', 'bodega', 'cantidad',
-            'lote', 'serie', 'fecha_vencimiento',
+            'fecha', 'tipo', 'producto', 'proveedor', 'bodega', 'bodega_destino', 'cantidad',
+            'costo_unitario', 'lote', 'serie', 'fecha_vencimiento',
             'doc_referencia', 'observaciones', 'motivo'
         ]
         widgets = {
@@ -22,14 +25,25 @@ class MovimientoInventarioForm(forms.ModelForm):
                 'type': 'datetime-local'
             }),
             'tipo': forms.Select(attrs={'class': 'form-control'}),
-            'producto': forms.Select(attrs={'class': 'form-control'}),
-            'proveedor': forms.Select(attrs={'class': 'form-control'}),
+            # Solo se dibuja la opción seleccionada; las demás se buscan al escribir
+            'producto': SelectAutocompletar(
+                reverse_lazy('autocompletar_productos_api'), placeholder='SKU, nombre o código de barras...'
+            ),
+            'proveedor': SelectAutocompletar(
+                reverse_lazy('autocompletar_proveedores_api'), placeholder='RUT o razón social...'
+            ),
             'bodega': forms.Select(attrs={'class': 'form-control'}),
+            'bodega_destino': forms.Select(attrs={'class': 'form-control'}),
             'cantidad': forms.NumberInput(attrs={
                 'class': 'form-control',
                 'step': '0.01',
                 'min': '0'
             }),
+            'costo_unitario': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'step': '0.01',
+                'min': '0'
+            }),
             'lote': forms.TextInput(attrs={
                 'class': 'form-control',
                 'maxlength': '50',
@@ -66,7 +80,9 @@ class MovimientoInventarioForm(forms.ModelForm):
             'producto': 'Producto',
             'proveedor': 'Proveedor',
             'bodega': 'Bodega',
+            'bodega_destino': 'Bodega de Destino',
             'cantidad': 'Cantidad',
+            'costo_unitario': 'Costo Unitario',
             'lote': 'Lote',
             'serie': 'Serie',
             'fecha_vencimiento': 'Fecha de Vencimiento',
@@ -77,21 +93,23 @@ class MovimientoInventarioForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # Filtrar productos activos y aprobados
+        # Filtrar productos activos y aprobados (el widget no los lista: solo valida la opción elegida)
         self.fields['producto'].queryset = Product.objects.filter(
             is_active=True,
             estado_aprobacion='APROBADO'
-        ).order_by('name')
+        )
         
         # Filtrar proveedores activos
         self.fields['proveedor'].queryset = Proveedor.objects.filter(
             estado='ACTIVO'
-        ).order_by('razon_social')
+        )
         
         # Filtrar bodegas activas
         self.fields['bodega'].queryset = Bodega.objects.filter(
             is_active=True
         ).order_by('codigo')
+        self.fields['bodega_destino'].queryset = self.fields['bodega'].queryset
+        self.fields['bodega_destino'].required = False
         
         # Hacer proveedor opcional
         self.fields['proveedor'].required = False
@@ -102,6 +120,16 @@ class MovimientoInventarioForm(forms.ModelForm):
             self.fields['tipo'].widget.attrs['readonly'] = True
             self.fields['producto'].widget.attrs['readonly'] = True
     
+    def clean_fecha(self):
+        fecha = self.cleaned_data.get('fecha')
+        # El período archivado está cerrado: sus saldos ya quedaron en los snapshots
+        abierto_desde = inicio_periodo_abierto()
+        if fecha is not None and abierto_desde is not None and fecha < abierto_desde:
+            raise forms.ValidationError(
+                f'El período anterior al {abierto_desde:%d/%m/%Y} está cerrado y archivado; no se pueden registrar movimientos en él.'
+            )
+        return fecha
+    
     def clean_cantidad(self):
         cantidad = self.cleaned_data.get('cantidad')
         if cantidad is not None and cantidad <= 0:
@@ -119,5 +147,45 @@ class MovimientoInventarioForm(forms.ModelForm):
                 'proveedor': 'Los movimientos de ingreso deben tener un proveedor asociado.'
             })
         
+        # Validar que las transferencias indiquen una bodega de destino distinta a la de origen
+        if tipo == 'transferencia':
+            bodega = cleaned_data.get('bodega')
+            bodega_destino = cleaned_data.get('bodega_destino')
+            if not bodega_destino:
+                raise forms.ValidationError({
+                    'bodega_destino': 'Las transferencias deben indicar una bodega de destino.'
+                })
+            if bodega and bodega_destino == bodega:
+                raise forms.ValidationError({
+                    'bodega_destino': 'La bodega de destino debe ser distinta a la bodega de origen.'
+                })
+        else:
+            cleaned_data['bodega_destino'] = None
+        
+        # El costo unitario solo aplica a ingresos (vacío: se usa el costo pactado con el proveedor)
+        if tipo != 'ingreso':
+            cleaned_data['costo_unitario'] = None
+        
         return cleaned_data
 
+
+
+class ImportarMovimientosForm(forms.Form):
+    """Formulario para la carga masiva de movimientos desde CSV o XLSX"""
+    
+    EXTENSIONES_PERMITIDAS = ('.csv', '.xlsx')
+    
+    archivo = forms.FileField(
+        label='Archivo',
+        help_text='CSV o XLSX con encabezados: fecha, tipo, sku, bodega, cantidad, proveedor_rut, bodega_destino, lote, serie, fecha_vencimiento, doc_referencia, motivo, observaciones',
+        widget=forms.ClearableFileInput(attrs={
+            'class': 'form-control',
+            'accept': '.csv,.xlsx'
+        })
+    )
+    
+    def clean_archivo(self):
+        archivo = self.cleaned_data.get('archivo')
+        if archivo and not archivo.name.lower().endswith(self.EXTENSIONES_PERMITIDAS):
+            raise forms.ValidationError('Solo se permiten archivos CSV o XLSX.')
+        return archivo
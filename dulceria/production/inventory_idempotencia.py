@@ -0,0 +1,101 @@
+"""
+Idempotencia del registro de movimientos
+
+Los lectores de código de barras y el Wi-Fi de bodega provocan reenvíos del
+mismo formulario (doble clic, reintento tras un timeout). Cada envío lleva
+una clave: el formulario la trae en el campo oculto `clave_idempotencia` y
+los clientes HTTP pueden mandarla en la cabecera Idempotency-Key.
+
+- La primera vez, la clave se inserta en ClaveIdempotencia dentro de la
+  misma transacción que registra el movimiento, y se guarda el resultado.
+- Un reenvío encuentra la clave con una sola búsqueda por el índice único
+  (usuario, clave) y recibe el resultado original, sin tocar el stock.
+- Si dos envíos llegan a la vez, el segundo INSERT espera a que el primero
+  confirme y falla por la restricción única; entonces lee el resultado.
+  Si el primero falla (por ejemplo, stock insuficiente), su clave se
+  revierte con él y el reintento se procesa normalmente.
+
+Las claves vencen a las IDEMPOTENCIA_HORAS horas; `manage.py
+limpiar_claves_idempotencia` borra las vencidas.
+"""
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import ClaveIdempotencia
+
+
+CAMPO_CLAVE = 'clave_idempotencia'
+CABECERA_CLAVE = 'HTTP_IDEMPOTENCY_KEY'
+
+_CLAVE_VALIDA = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+def _limite_vigencia():
+    return timezone.now() - timedelta(hours=getattr(settings, 'IDEMPOTENCIA_HORAS', 24))
+
+
+def clave_de_solicitud(request):
+    """Clave de idempotencia del envío (campo del formulario o cabecera); None si no trae una válida"""
+    clave = (request.POST.get(CAMPO_CLAVE) or request.META.get(CABECERA_CLAVE) or '').strip()
+    return clave if _CLAVE_VALIDA.match(clave) else None
+
+
+def buscar_resultado(usuario, clave):
+    """Resultado guardado de una clave vigente del usuario; None si la clave no se ha usado"""
+    return (
+        ClaveIdempotencia.objects
+        .filter(usuario=usuario, clave=clave, created_at__gte=_limite_vigencia())
+        .values_list('resultado', flat=True)
+        .first()
+    )
+
+
+def _reservar_clave(usuario, clave):
+    """Insertar la clave; retorna el registro, o None si otro envío ya la registró"""
+    try:
+        with transaction.atomic():
+            return ClaveIdempotencia.objects.create(usuario=usuario, clave=clave)
+    except IntegrityError:
+        pass
+    # La clave existe: si está vencida (no se ha limpiado aún) se libera para este envío
+    if not ClaveIdempotencia.objects.filter(usuario=usuario, clave=clave, created_at__lt=_limite_vigencia()).delete()[0]:
+        return None
+    with transaction.atomic():
+        return ClaveIdempotencia.objects.create(usuario=usuario, clave=clave)
+
+
+def ejecutar_una_vez(usuario, clave, operacion):
+    """
+    Ejecutar `operacion()` una sola vez por clave y usuario
+
+    `operacion` registra el movimiento y retorna un resultado serializable en
+    JSON (lo que hace falta para volver a responder). Retorna (resultado,
+    repetido): repetido es True cuando la clave ya se había procesado y el
+    resultado es el guardado. Sin clave, simplemente ejecuta la operación.
+    Las excepciones de `operacion` revierten también la clave. La vista
+    consulta antes buscar_resultado para responder los reenvíos sin validar
+    el formulario; aquí la restricción única cubre los envíos simultáneos.
+    """
+    if not clave:
+        return operacion(), False
+
+    with transaction.atomic():
+        registro = _reservar_clave(usuario, clave)
+        if registro is None:
+            return buscar_resultado(usuario, clave) or {}, True
+        resultado = operacion()
+        ClaveIdempotencia.objects.filter(pk=registro.pk).update(resultado=resultado)
+    return resultado, False
+
+
+def limpiar_claves(horas=None):
+    """Eliminar las claves más antiguas que `horas` (por defecto IDEMPOTENCIA_HORAS); retorna cuántas"""
+    if horas is None:
+        limite = _limite_vigencia()
+    else:
+        limite = timezone.now() - timedelta(hours=horas)
+    return ClaveIdempotencia.objects.filter(created_at__lt=limite).delete()[0]
@@ -0,0 +1,553 @@
+"""
+Importación masiva de movimientos de inventario (CSV / XLSX)
+
+Todas las filas se validan antes de escribir nada, incluido el saldo de cada
+producto/bodega/lote recorriendo el archivo en orden. Luego los movimientos se
+insertan con bulk_create en lotes y el stock se actualiza con un único UPDATE
+por producto (y por producto/bodega/lote), en vez de ejecutar
+MovimientoInventario.save() fila por fila. Los ingresos con costo actualizan
+el costo promedio de cada producto en el orden del archivo.
+"""
+import csv
+import io
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Min, Q, Sum
+from django.utils import timezone
+
+from .inventory_archivo import inicio_periodo_abierto
+from .inventory_busqueda import componer_texto_busqueda
+from .inventory_fefo import AsignadorFEFO
+from .models import (
+    Bodega, MovimientoInventario, Product, ProductoProveedor, Proveedor, StockBodega, StockSnapshot,
+    ajustar_snapshots, aplicar_deltas_stock, clave_movimientos_dia, promedio_ponderado, sumar_contadores,
+)
+
+
+# Columnas reconocidas en el archivo (la primera fila debe contener los encabezados)
+COLUMNAS = [
+    'fecha', 'tipo', 'sku', 'bodega', 'cantidad', 'proveedor_rut', 'bodega_destino',
+    'lote', 'serie', 'fecha_vencimiento', 'doc_referencia', 'motivo', 'observaciones',
+    'costo_unitario',
+]
+COLUMNAS_REQUERIDAS = ['tipo', 'sku', 'bodega', 'cantidad']
+
+# Campos del modelo en el mismo orden que las tuplas validadas
+CAMPOS_MOVIMIENTO = [
+    'fecha', 'tipo', 'producto_id', 'bodega_id', 'cantidad', 'proveedor_id', 'bodega_destino_id',
+    'lote', 'serie', 'fecha_vencimiento', 'doc_referencia', 'motivo', 'observaciones',
+    'costo_unitario',
+]
+
+FORMATOS_FECHA = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d', '%d-%m-%Y %H:%M', '%d-%m-%Y', '%d/%m/%Y %H:%M', '%d/%m/%Y']
+
+MAX_ERRORES_REPORTADOS = 50
+
+# MovimientoInventario.cantidad es DecimalField(max_digits=12, decimal_places=2)
+MAX_CANTIDAD = Decimal('1e10')
+# MovimientoInventario.costo_unitario es DecimalField(max_digits=18, decimal_places=6)
+MAX_COSTO = Decimal('1e12')
+
+I_SKU, I_BODEGA, I_PROVEEDOR, I_BODEGA_DESTINO = (
+    COLUMNAS.index(c) for c in ('sku', 'bodega', 'proveedor_rut', 'bodega_destino')
+)
+
+
+class ErrorImportacion(Exception):
+    """El archivo contiene filas inválidas; no se importó ningún movimiento"""
+
+    def __init__(self, errores):
+        self.errores = errores
+        super().__init__(f'{len(errores)} error(es) en el archivo de importación')
+
+
+def leer_filas(archivo, nombre):
+    """
+    Generar diccionarios {columna: valor} desde un archivo CSV o XLSX
+
+    Los XLSX se leen con openpyxl en modo read_only para no cargar la hoja
+    completa en memoria.
+    """
+    if nombre.lower().endswith('.xlsx'):
+        from openpyxl import load_workbook
+        wb = load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            filas = wb.active.iter_rows(values_only=True)
+            encabezados = [str(c).strip().lower() if c is not None else '' for c in next(filas, [])]
+            for valores in filas:
+                if valores and any(v not in (None, '') for v in valores):
+                    yield dict(zip(encabezados, valores))
+        finally:
+            wb.close()
+    else:
+        texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+        muestra = texto.read(4096)
+        texto.seek(0)
+        try:
+            dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+        except csv.Error:
+            dialecto = csv.excel
+        lector = csv.DictReader(texto, dialect=dialecto)
+        lector.fieldnames = [(c or '').strip().lower() for c in (lector.fieldnames or [])]
+        for fila in lector:
+            if any(v not in (None, '') for v in fila.values()):
+                yield fila
+
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    return str(valor).strip()
+
+
+def _parsear_decimal(valor, nombre, maximo):
+    try:
+        numero = Decimal(_texto(valor).replace(',', '.'))
+    except InvalidOperation:
+        numero = None
+    if numero is None or not numero.is_finite():
+        raise ValueError(f'{nombre} no es un número válido: "{_texto(valor)}"')
+    if numero >= maximo:
+        raise ValueError(f'{nombre} {numero} excede el máximo permitido')
+    return numero
+
+
+def _parsear_fecha(valor, solo_fecha=False):
+    if isinstance(valor, datetime):
+        resultado = valor
+    elif isinstance(valor, date):
+        resultado = datetime.combine(valor, datetime.min.time())
+    else:
+        texto = _texto(valor)
+        try:
+            # Ruta rápida para el formato ISO (YYYY-MM-DD[ HH:MM[:SS]])
+            resultado = datetime.fromisoformat(texto)
+        except ValueError:
+            for formato in FORMATOS_FECHA:
+                try:
+                    resultado = datetime.strptime(texto, formato)
+                    break
+                except ValueError:
+                    continue
+            else:
+                raise ValueError(f'fecha inválida "{texto}"')
+    if solo_fecha:
+        return resultado.date()
+    if timezone.is_naive(resultado):
+        resultado = timezone.make_aware(resultado)
+    return resultado
+
+
+def _mapa_por_clave(queryset, campo, claves, chunk_size=1000):
+    """Resolver claves naturales (SKU, código, RUT) a IDs con consultas IN por lotes"""
+    claves = list(claves)
+    mapa = {}
+    for i in range(0, len(claves), chunk_size):
+        lote = claves[i:i + chunk_size]
+        mapa.update(queryset.filter(**{f'{campo}__in': lote}).values_list(campo, 'id'))
+    return mapa
+
+
+def validar_filas(filas):
+    """
+    Validar todas las filas y devolver una lista de tuplas en el orden de CAMPOS_MOVIMIENTO
+
+    Lanza ErrorImportacion con el detalle por línea si alguna fila es inválida.
+    """
+    # Primera pasada: guardar cada fila como tupla compacta y reunir las claves a resolver
+    crudas = []
+    skus, codigos_bodega, ruts = set(), set(), set()
+    for fila in filas:
+        if not crudas:
+            faltantes = [c for c in COLUMNAS_REQUERIDAS if c not in fila]
+            if faltantes:
+                raise ErrorImportacion([f'Faltan columnas requeridas: {", ".join(faltantes)}'])
+        cruda = tuple(fila.get(c) for c in COLUMNAS)
+        crudas.append(cruda)
+        skus.add(_texto(cruda[I_SKU]))
+        codigos_bodega.add(_texto(cruda[I_BODEGA]))
+        codigos_bodega.add(_texto(cruda[I_BODEGA_DESTINO]))
+        ruts.add(_texto(cruda[I_PROVEEDOR]))
+    if not crudas:
+        raise ErrorImportacion(['El archivo no contiene movimientos.'])
+
+    # Resolver todas las referencias con un puñado de consultas
+    productos = _mapa_por_clave(Product.objects.all(), 'sku', skus)
+    bodegas = _mapa_por_clave(Bodega.objects.filter(is_active=True), 'codigo', codigos_bodega - {''})
+    proveedores = _mapa_por_clave(Proveedor.objects.all(), 'rut', ruts - {''})
+    # Costos pactados, para los ingresos que no traen costo_unitario
+    costos_proveedor = {
+        (producto_id, proveedor_id): costo
+        for producto_id, proveedor_id, costo in ProductoProveedor.objects.filter(
+            proveedor_id__in=list(proveedores.values())
+        ).values_list('product_id', 'proveedor_id', 'costo')
+    }
+
+    tipos_validos = dict(MovimientoInventario.TIPO_MOVIMIENTO_CHOICES)
+    ahora = timezone.now()
+    # Período archivado: cerrado para nuevos movimientos (ver inventory_archivo)
+    abierto_desde = inicio_periodo_abierto()
+    # Los archivos suelen repetir las mismas fechas: parsear cada valor una sola vez
+    fechas = {}
+    vencimientos = {}
+    validas = []
+    errores = []
+
+    for linea, cruda in enumerate(crudas, start=2):  # La línea 1 son los encabezados
+        fila = dict(zip(COLUMNAS, cruda))
+        try:
+            tipo = _texto(fila.get('tipo')).lower()
+            if tipo not in tipos_validos:
+                raise ValueError(f'tipo de movimiento inválido "{tipo}"')
+
+            sku = _texto(fila.get('sku'))
+            if sku not in productos:
+                raise ValueError(f'producto con SKU "{sku}" no existe')
+
+            codigo_bodega = _texto(fila.get('bodega'))
+            if codigo_bodega not in bodegas:
+                raise ValueError(f'bodega "{codigo_bodega}" no existe o no está activa')
+
+            cantidad = _parsear_decimal(fila.get('cantidad'), 'cantidad', MAX_CANTIDAD)
+            if cantidad <= 0:
+                raise ValueError('la cantidad debe ser mayor a 0')
+            cantidad = cantidad.quantize(Decimal('0.01'))
+
+            rut = _texto(fila.get('proveedor_rut'))
+            if rut and rut not in proveedores:
+                raise ValueError(f'proveedor con RUT "{rut}" no existe')
+            if tipo == 'ingreso' and not rut:
+                raise ValueError('los movimientos de ingreso deben tener un proveedor asociado')
+
+            codigo_destino = _texto(fila.get('bodega_destino'))
+            bodega_destino_id = None
+            if tipo == 'transferencia':
+                if codigo_destino not in bodegas:
+                    raise ValueError('las transferencias deben indicar una bodega de destino válida')
+                if codigo_destino == codigo_bodega:
+                    raise ValueError('la bodega de destino debe ser distinta a la bodega de origen')
+                bodega_destino_id = bodegas[codigo_destino]
+
+            costo = None
+            if tipo == 'ingreso':
+                if _texto(fila.get('costo_unitario')):
+                    costo = _parsear_decimal(fila.get('costo_unitario'), 'costo unitario', MAX_COSTO)
+                    if costo < 0:
+                        raise ValueError('el costo unitario no puede ser negativo')
+                    costo = costo.quantize(Decimal('0.000001'))
+                else:
+                    costo = costos_proveedor.get((productos[sku], proveedores[rut]))
+
+            valor_fecha = fila['fecha']
+            if not _texto(valor_fecha):
+                fecha = ahora
+            else:
+                if valor_fecha not in fechas:
+                    fechas[valor_fecha] = _parsear_fecha(valor_fecha)
+                fecha = fechas[valor_fecha]
+                if abierto_desde is not None and fecha < abierto_desde:
+                    raise ValueError(f'la fecha es anterior al {abierto_desde:%d/%m/%Y}, período cerrado y archivado')
+
+            valor_vencimiento = fila['fecha_vencimiento']
+            if not _texto(valor_vencimiento):
+                vencimiento = None
+            else:
+                if valor_vencimiento not in vencimientos:
+                    vencimientos[valor_vencimiento] = _parsear_fecha(valor_vencimiento, solo_fecha=True)
+                vencimiento = vencimientos[valor_vencimiento]
+
+            validas.append((
+                fecha, tipo, productos[sku], bodegas[codigo_bodega], cantidad,
+                proveedores.get(rut), bodega_destino_id,
+                _texto(fila.get('lote'))[:50], _texto(fila.get('serie'))[:50], vencimiento,
+                _texto(fila.get('doc_referencia'))[:100], _texto(fila.get('motivo'))[:255],
+                _texto(fila.get('observaciones')), costo,
+            ))
+        except ValueError as e:
+            errores.append(f'Línea {linea}: {e}')
+            if len(errores) >= MAX_ERRORES_REPORTADOS:
+                errores.append('Se detuvo la validación por exceso de errores.')
+                break
+
+    if errores:
+        raise ErrorImportacion(errores)
+    errores = validar_saldos(
+        validas, {pk: sku for sku, pk in productos.items()}, {pk: codigo for codigo, pk in bodegas.items()}
+    )
+    if errores:
+        raise ErrorImportacion(errores)
+    return validas
+
+
+def validar_saldos(validas, skus, codigos_bodega):
+    """
+    Recorrer las filas validadas en el orden del archivo con el saldo de cada (producto, bodega, lote)
+
+    Aplica la regla de aplicar_delta_stock_bodega fila por fila: una salida
+    (o transferencia) con lote debe caber en ese lote, y una sin lote toma de
+    la fila sin lote y luego de los lotes por FEFO. Así una salida anterior a
+    su ingreso en el archivo se informa por línea en vez de fallar a mitad de
+    la importación. Retorna la lista de errores (vacía si todo cabe).
+    """
+    i_tipo, i_producto, i_bodega, i_cantidad, i_destino, i_lote, i_vencimiento = (
+        CAMPOS_MOVIMIENTO.index(c) for c in (
+            'tipo', 'producto_id', 'bodega_id', 'cantidad', 'bodega_destino_id', 'lote', 'fecha_vencimiento',
+        )
+    )
+    efectos_filas = [
+        MovimientoInventario.calcular_efectos(
+            valores[i_tipo], valores[i_producto], valores[i_bodega], valores[i_destino],
+            valores[i_lote], valores[i_cantidad], fecha_vencimiento=valores[i_vencimiento],
+        )[1]
+        for valores in validas
+    ]
+    # Solo importan los pares (producto, bodega) de los que sale stock
+    pares = {clave[:2] for efectos in efectos_filas for clave, delta in efectos if delta < 0}
+    if not pares:
+        return []
+    saldos = {par: {} for par in pares}
+    ids_productos = list({producto_id for producto_id, _ in pares})
+    for i in range(0, len(ids_productos), 1000):
+        filas = StockBodega.objects.filter(
+            producto_id__in=ids_productos[i:i + 1000], bodega_id__in={bodega_id for _, bodega_id in pares}
+        ).order_by().values('producto_id', 'bodega_id', 'lote').annotate(
+            total=Sum('cantidad'), vencimiento=Min('fecha_vencimiento')
+        ).values_list('producto_id', 'bodega_id', 'lote', 'total', 'vencimiento')
+        for producto_id, bodega_id, lote, total, vencimiento in filas:
+            if (producto_id, bodega_id) in saldos:
+                saldos[(producto_id, bodega_id)][lote] = [total, vencimiento]
+
+    errores = []
+    for linea, (valores, efectos) in enumerate(zip(validas, efectos_filas), start=2):
+        faltante = None
+        for (producto_id, bodega_id, lote, _), delta in efectos:
+            lotes = saldos.get((producto_id, bodega_id))
+            if lotes is None or delta >= 0:
+                continue
+            disponible = lotes.get(lote, [0])[0] if lote else sum(max(saldo, 0) for saldo, _ in lotes.values())
+            if disponible < -delta:
+                faltante = (bodega_id, lote, -delta, disponible)
+                break
+        if faltante is not None:
+            bodega_id, lote, unidades, disponible = faltante
+            detalle = f'del lote "{lote}" ' if lote else ''
+            errores.append(
+                f'Línea {linea}: stock insuficiente de "{skus[valores[i_producto]]}" {detalle}en la bodega '
+                f'"{codigos_bodega[bodega_id]}": se requieren {unidades} y hay {disponible} en ese punto del archivo'
+            )
+            if len(errores) >= MAX_ERRORES_REPORTADOS:
+                errores.append('Se detuvo la validación por exceso de errores.')
+                break
+            continue
+        for (producto_id, bodega_id, lote, vencimiento), delta in efectos:
+            lotes = saldos.get((producto_id, bodega_id))
+            if lotes is None:
+                continue
+            if delta >= 0 or lote:
+                saldo = lotes.setdefault(lote, [0, vencimiento])
+                saldo[0] += delta
+                continue
+            # Sin lote: primero la fila sin lote, luego los lotes del vencimiento más próximo al más lejano
+            restante = -delta
+            for clave in sorted(lotes, key=lambda clave: (clave != '', lotes[clave][1] is None, lotes[clave][1] or date.min, clave)):
+                tomar = min(restante, max(lotes[clave][0], 0))
+                lotes[clave][0] -= tomar
+                restante -= tomar
+                if not restante:
+                    break
+    return errores
+
+
+def actualizar_promedios(validas):
+    """
+    Actualizar el costo promedio de los productos con ingresos valorizados
+
+    Bloquea esos productos y recorre sus movimientos en el orden del archivo
+    partiendo del stock y promedio vigentes; un UPDATE por producto al final.
+    Debe llamarse dentro de la transacción de importación, antes de aplicar el stock.
+    """
+    i_tipo, i_producto, i_cantidad, i_costo = (
+        CAMPOS_MOVIMIENTO.index(c) for c in ('tipo', 'producto_id', 'cantidad', 'costo_unitario')
+    )
+    ids = {v[i_producto] for v in validas if v[i_tipo] == 'ingreso' and v[i_costo] is not None}
+    if not ids:
+        return
+    estados = {
+        producto_id: [stock, promedio]
+        for producto_id, stock, promedio in Product.objects.select_for_update().filter(
+            pk__in=ids
+        ).values_list('id', 'stock', 'costo_promedio')
+    }
+    for valores in validas:
+        estado = estados.get(valores[i_producto])
+        if estado is None:
+            continue
+        delta = MovimientoInventario.calcular_efectos(
+            valores[i_tipo], None, None, None, '', valores[i_cantidad]
+        )[0]
+        if valores[i_tipo] == 'ingreso' and valores[i_costo] is not None and delta > 0:
+            estado[1] = promedio_ponderado(estado[0], estado[1], delta, valores[i_costo])
+        estado[0] += delta
+    for producto_id, (_, promedio) in estados.items():
+        Product.objects.filter(pk=producto_id).update(costo_promedio=promedio)
+
+
+def asignar_lotes(validas):
+    """
+    Completar lote y vencimiento de las salidas antes de aplicar el stock
+
+    Las salidas sin lote de productos perecibles o con control por lote se
+    reparten por FEFO en una fila por lote, y las salidas/transferencias con
+    lote pero sin vencimiento toman el registrado en la bodega. El archivo se
+    recorre en orden para que cada salida vea los ingresos de filas anteriores.
+    Debe llamarse dentro de la transacción de importación.
+    """
+    i_tipo, i_producto, i_bodega, i_cantidad, i_destino, i_lote, i_vencimiento = (
+        CAMPOS_MOVIMIENTO.index(c) for c in (
+            'tipo', 'producto_id', 'bodega_id', 'cantidad', 'bodega_destino_id', 'lote', 'fecha_vencimiento',
+        )
+    )
+    sin_lote = {v[i_producto] for v in validas if v[i_tipo] == 'salida' and not v[i_lote]}
+    fefo = set(Product.objects.filter(pk__in=sin_lote).filter(
+        Q(es_perecible=True) | Q(control_por_lote=True)
+    ).values_list('id', flat=True)) if sin_lote else set()
+
+    def es_fefo(valores):
+        return valores[i_tipo] == 'salida' and not valores[i_lote] and valores[i_producto] in fefo
+
+    def sin_vencimiento(valores):
+        return valores[i_tipo] in ('salida', 'transferencia') and valores[i_lote] and valores[i_vencimiento] is None
+
+    pares = {(v[i_producto], v[i_bodega]) for v in validas if es_fefo(v) or sin_vencimiento(v)}
+    if not pares:
+        return validas
+    asignador = AsignadorFEFO()
+    asignador.cargar(pares)
+
+    resultado = []
+    for valores in validas:
+        if es_fefo(valores) and int(float(valores[i_cantidad])) > 0:
+            unidades = int(float(valores[i_cantidad]))
+            asignaciones = asignador.asignar(valores[i_producto], valores[i_bodega], unidades)
+            for indice, (lote, fecha_vencimiento, cantidad) in enumerate(asignaciones):
+                pieza = list(valores)
+                pieza[i_lote] = lote
+                pieza[i_vencimiento] = fecha_vencimiento
+                pieza[i_cantidad] = Decimal(cantidad)
+                if indice == len(asignaciones) - 1:
+                    pieza[i_cantidad] += valores[i_cantidad] - unidades
+                resultado.append(tuple(pieza))
+            continue
+        if sin_vencimiento(valores):
+            valores = list(valores)
+            valores[i_vencimiento] = asignador.vencimiento(valores[i_producto], valores[i_bodega], valores[i_lote])
+            valores = tuple(valores)
+        # Mantener al día los saldos en memoria con el resto de las filas del archivo
+        asignador.registrar(MovimientoInventario.calcular_efectos(
+            valores[i_tipo], valores[i_producto], valores[i_bodega], valores[i_destino],
+            valores[i_lote], valores[i_cantidad], fecha_vencimiento=valores[i_vencimiento],
+        )[1])
+        resultado.append(valores)
+    return resultado
+
+
+def textos_busqueda(validas):
+    """texto_busqueda de cada fila validada (bulk_create no pasa por MovimientoInventario.save)"""
+    i_producto, i_proveedor, i_doc, i_lote, i_serie = (
+        CAMPOS_MOVIMIENTO.index(c) for c in ('producto_id', 'proveedor_id', 'doc_referencia', 'lote', 'serie')
+    )
+    productos = {
+        pk: (sku, nombre)
+        for pk, sku, nombre in Product.objects.filter(
+            pk__in={valores[i_producto] for valores in validas}
+        ).values_list('pk', 'sku', 'name')
+    }
+    proveedores = {
+        pk: (razon_social, rut)
+        for pk, razon_social, rut in Proveedor.objects.filter(
+            pk__in={valores[i_proveedor] for valores in validas} - {None}
+        ).values_list('pk', 'razon_social', 'rut')
+    }
+    return [
+        componer_texto_busqueda(
+            *productos[valores[i_producto]], *proveedores.get(valores[i_proveedor], ('', '')),
+            valores[i_doc], valores[i_lote], valores[i_serie],
+        )
+        for valores in validas
+    ]
+
+
+def importar_movimientos(filas, usuario=None, chunk_size=2000):
+    """
+    Validar e importar movimientos en una sola transacción
+
+    Retorna la cantidad de movimientos creados. Si alguna fila es inválida o
+    dejaría sin saldo su producto/bodega/lote no se importa nada.
+    """
+    validas = validar_filas(filas)
+
+    i_tipo, i_producto, i_bodega, i_cantidad, i_destino, i_lote, i_vencimiento = (
+        CAMPOS_MOVIMIENTO.index(c) for c in (
+            'tipo', 'producto_id', 'bodega_id', 'cantidad', 'bodega_destino_id', 'lote', 'fecha_vencimiento',
+        )
+    )
+    usuario_id = usuario.pk if usuario else None
+    with transaction.atomic():
+        validas = asignar_lotes(validas)
+
+        deltas_producto = defaultdict(int)
+        deltas_bodega = defaultdict(int)
+        # Filas con fecha en o antes del último snapshot: sus deltas por día corrigen esos cierres
+        i_fecha = CAMPOS_MOVIMIENTO.index('fecha')
+        ultimo_cierre = StockSnapshot.objects.order_by('-fecha').values_list('fecha', flat=True).first()
+        deltas_cierres = defaultdict(lambda: (defaultdict(int), defaultdict(int)))
+        for valores in validas:
+            delta, efectos = MovimientoInventario.calcular_efectos(
+                valores[i_tipo], valores[i_producto], valores[i_bodega],
+                valores[i_destino], valores[i_lote], valores[i_cantidad],
+                fecha_vencimiento=valores[i_vencimiento],
+            )
+            deltas_producto[valores[i_producto]] += delta
+            for clave, delta_bodega in efectos:
+                deltas_bodega[clave] += delta_bodega
+            if ultimo_cierre is not None and timezone.localtime(valores[i_fecha]).date() <= ultimo_cierre:
+                del_dia_producto, del_dia_bodega = deltas_cierres[timezone.localtime(valores[i_fecha]).date()]
+                del_dia_producto[valores[i_producto]] += delta
+                for clave, delta_bodega in efectos:
+                    del_dia_bodega[clave] += delta_bodega
+
+        actualizar_promedios(validas)
+
+        # Un UPDATE condicional por producto con el delta neto del archivo
+        aplicar_deltas_stock(deltas_producto, deltas_bodega)
+        for fecha, (del_dia_producto, del_dia_bodega) in deltas_cierres.items():
+            ajustar_snapshots(fecha, del_dia_producto, del_dia_bodega)
+
+        # Contadores de movimientos por día del dashboard
+        sumar_contadores(Counter(clave_movimientos_dia(valores[i_fecha]) for valores in validas))
+
+        textos = textos_busqueda(validas)
+        for inicio in range(0, len(validas), chunk_size):
+            MovimientoInventario.objects.bulk_create(
+                [
+                    MovimientoInventario(
+                        creado_por_id=usuario_id, texto_busqueda=texto, **dict(zip(CAMPOS_MOVIMIENTO, valores))
+                    )
+                    for valores, texto in zip(validas[inicio:inicio + chunk_size], textos[inicio:inicio + chunk_size])
+                ],
+                batch_size=chunk_size,
+            )
+
+        # Un único registro de auditoría para todo el lote (bulk_create no emite señales)
+        from accounts.models_audit import AuditLog
+        AuditLog.objects.create(
+            usuario=usuario,
+            accion='IMPORT',
+            modelo='MovimientoInventario',
+            descripcion=f'Importación masiva de {len(validas)} movimientos de inventario en {len(deltas_producto)} productos',
+        )
+
+    return len(validas)
@@ -0,0 +1,308 @@
+"""
+Kardex (tarjeta de existencias) por producto con saldo y valorización acumulados
+
+Los movimientos se leen en orden cronológico, página por página, con
+paginación por cursor (fecha, id) sobre el índice mov_prod_fecha_idx, de modo
+que productos con cientos de miles de movimientos no se cargan en memoria.
+Si la base de datos soporta funciones de ventana, el saldo acumulado de cada
+página se calcula en SQL con SUM() OVER; si no, se acumula en Python.
+
+La valorización es de promedio ponderado móvil: cada ingreso entra a su
+costo_unitario registrado y las salidas, ajustes y transferencias al
+promedio vigente en ese momento. El cursor lleva el saldo y el valor del
+saldo de la última fila, de modo que cada página continúa la anterior.
+"""
+import base64
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When, Window
+from django.db.models.functions import Floor
+from django.utils import timezone
+
+from .inventory_snapshots import fin_del_dia, stock_a_fecha
+from .inventory_archivo import limite_archivo
+from .models import MovimientoArchivado, MovimientoInventario, SIGNO_STOCK_POR_TIPO, StockBodega
+
+
+CAMPOS_KARDEX = [
+    'id', 'fecha', 'tipo', 'cantidad', 'lote', 'doc_referencia',
+    'bodega__codigo', 'bodega_destino__codigo', 'proveedor__razon_social',
+]
+
+ENCABEZADOS_KARDEX = [
+    'Fecha', 'Tipo', 'Bodega', 'Bodega Destino', 'Proveedor', 'Lote', 'Doc. Referencia',
+    'Entrada', 'Salida', 'Saldo', 'Costo Unitario', 'Valor Movimiento', 'Valor Saldo',
+]
+
+
+CENTAVO = Decimal('0.01')
+DECIMALES_PROMEDIO = Decimal('0.000001')
+
+
+def costo_apertura(producto):
+    """Costo del stock que no viene de ingresos valorizados (stock inicial): estándar, o promedio si no hay estándar"""
+    return producto.costo_estandar or producto.costo_promedio or Decimal('0')
+
+
+def valorizar(saldo, valor, promedio, delta, tipo, costo):
+    """
+    Aplicar un movimiento al saldo valorizado por promedio ponderado móvil
+
+    Retorna (costo aplicado, valor del movimiento, saldo, valor del saldo,
+    promedio). Un ingreso con costo entra a ese costo; todo lo demás al
+    promedio vigente. Sin stock se conserva el último promedio conocido.
+    """
+    aplicado = Decimal(costo) if tipo == 'ingreso' and costo is not None and delta > 0 else promedio
+    valor_movimiento = (aplicado * delta).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+    saldo += delta
+    valor = valor + valor_movimiento if saldo else Decimal('0')
+    if saldo > 0:
+        promedio = (valor / saldo).quantize(DECIMALES_PROMEDIO, rounding=ROUND_HALF_UP)
+    return aplicado, valor_movimiento, saldo, valor, promedio
+
+
+def expresion_delta_stock(bodega_id=None):
+    """
+    Delta de stock de cada movimiento calculado en SQL
+
+    Usa FLOOR(cantidad) para coincidir con la conversión a entero que aplica
+    MovimientoInventario al stock (las cantidades nunca son negativas).
+    """
+    cantidad = Floor('cantidad')
+    positivos = [t for t, signo in SIGNO_STOCK_POR_TIPO.items() if signo > 0]
+    negativos = [t for t, signo in SIGNO_STOCK_POR_TIPO.items() if signo < 0]
+    casos = [
+        When(tipo__in=positivos, then=cantidad),
+        When(tipo__in=negativos, then=-cantidad),
+    ]
+    if bodega_id is not None:
+        # En el kardex de una bodega, las transferencias salen del origen y entran al destino
+        casos = [
+            When(tipo='transferencia', bodega_id=bodega_id, then=-cantidad),
+            When(tipo='transferencia', bodega_destino_id=bodega_id, then=cantidad),
+        ] + casos
+    return Case(*casos, default=Value(0), output_field=IntegerField())
+
+
+def _delta_python(fila, bodega_id=None):
+    """Delta de stock de una fila cuando el motor no soporta funciones de ventana"""
+    if bodega_id is None:
+        return SIGNO_STOCK_POR_TIPO.get(fila['tipo'], 0) * int(float(fila['cantidad']))
+    _, efectos = MovimientoInventario.calcular_efectos(
+        fila['tipo'], None, fila['bodega_id'], fila['bodega_destino_id'], fila['lote'], fila['cantidad']
+    )
+    return sum(delta for (_, bodega_efecto, _, _), delta in efectos if bodega_efecto == bodega_id)
+
+
+def saldo_inicial(producto, bodega_id=None, desde=None):
+    """
+    Saldo de apertura del kardex
+
+    Con `desde` (fecha) es el stock al cierre del día anterior, tomado del
+    snapshot más cercano. Sin `desde` es el stock vigente menos todos los
+    movimientos, de modo que el saldo final del kardex coincide con el stock
+    actual aunque el producto tenga stock cargado sin movimientos.
+    """
+    if desde is not None:
+        return stock_a_fecha(producto.pk, desde - timedelta(days=1), bodega_id)['cantidad']
+
+    movimientos = _filtrar_alcance(MovimientoInventario.objects.all(), producto, bodega_id)
+    if bodega_id is None:
+        stock = producto.stock
+    else:
+        stock = StockBodega.objects.filter(producto=producto, bodega_id=bodega_id).aggregate(total=Sum('cantidad'))['total'] or 0
+    total = movimientos.order_by().aggregate(total=Sum(expresion_delta_stock(bodega_id)))['total'] or 0
+    return stock - total
+
+
+def _filtrar_alcance(queryset, producto, bodega_id):
+    """Movimientos del producto que tocan la bodega (como origen o destino), o todos sin bodega"""
+    queryset = queryset.filter(producto=producto)
+    if bodega_id is not None:
+        queryset = queryset.filter(Q(bodega_id=bodega_id) | Q(bodega_destino_id=bodega_id))
+    return queryset
+
+
+def promedio_al(producto, bodega_id=None, desde=None):
+    """
+    Costo promedio ponderado móvil al inicio del kardex
+
+    Con `desde`, al cierre del día anterior; sin `desde`, al inicio de la
+    tabla activa (después de los movimientos archivados). Recorre una vez los
+    movimientos anteriores, partiendo del stock que no viene de movimientos
+    valorizado a costo_apertura.
+    """
+    corte = fin_del_dia(desde - timedelta(days=1)) if desde is not None else None
+    modelos = (MovimientoArchivado, MovimientoInventario) if corte is not None else (MovimientoArchivado,)
+
+    if bodega_id is None:
+        stock = producto.stock
+    else:
+        stock = StockBodega.objects.filter(producto=producto, bodega_id=bodega_id).aggregate(total=Sum('cantidad'))['total'] or 0
+    for modelo in (MovimientoArchivado, MovimientoInventario):
+        movimientos = _filtrar_alcance(modelo.objects.all(), producto, bodega_id).order_by()
+        stock -= movimientos.aggregate(total=Sum(expresion_delta_stock(bodega_id)))['total'] or 0
+
+    promedio = costo_apertura(producto)
+    saldo, valor = stock, (stock * promedio).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+    # Todos los archivados son anteriores a los activos: basta recorrer las tablas en orden
+    for modelo in modelos:
+        movimientos = _filtrar_alcance(modelo.objects.all(), producto, bodega_id)
+        if corte is not None:
+            movimientos = movimientos.filter(fecha__lt=corte)
+        filas = movimientos.order_by('fecha', 'id').annotate(delta=expresion_delta_stock(bodega_id)).values_list(
+            'delta', 'tipo', 'costo_unitario'
+        )
+        for delta, tipo, costo in filas.iterator(chunk_size=5000):
+            _, _, saldo, valor, promedio = valorizar(saldo, valor, promedio, delta, tipo, costo)
+    return promedio
+
+
+def apertura_kardex(producto, bodega_id=None, desde=None):
+    """(saldo, valor del saldo) de apertura del kardex: saldo_inicial valorizado al promedio de ese momento"""
+    saldo = saldo_inicial(producto, bodega_id, desde)
+    return saldo, (saldo * promedio_al(producto, bodega_id, desde)).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+
+
+def iterar_kardex(producto, bodega_id=None, desde=None, hasta=None, saldo_apertura=0, valor_apertura=None,
+                  cursor=None, tamano_pagina=2000, usar_ventana=None):
+    """
+    Generar las filas del kardex de un producto en orden cronológico
+
+    `desde` y `hasta` son fechas (ambas inclusive). Cada fila es un
+    diccionario con los datos del movimiento más 'entrada', 'salida', 'saldo',
+    'costo_unitario' (el aplicado), 'valor_movimiento' y 'valor_saldo'.
+    `valor_apertura` es el valor del saldo de apertura (ver apertura_kardex;
+    sin él se valoriza a costo_apertura). `cursor` permite continuar desde
+    (fecha, id, saldo, valor del saldo) de la última fila entregada.
+
+    Sin `desde` se lee solo la tabla activa. Si `desde` llega al período
+    archivado, primero se recorren los movimientos archivados y luego los
+    activos (todos los archivados son anteriores a los activos).
+    """
+    if valor_apertura is None:
+        valor_apertura = (saldo_apertura * costo_apertura(producto)).quantize(CENTAVO, rounding=ROUND_HALF_UP)
+    limite = limite_archivo() if desde is not None else None
+    if limite is not None and fin_del_dia(desde - timedelta(days=1)) <= limite and (cursor is None or cursor[0] <= limite):
+        saldo, valor = (saldo_apertura, valor_apertura) if cursor is None else cursor[2:]
+        for fila in _iterar_kardex_modelo(
+            MovimientoArchivado, producto, bodega_id, desde, hasta, saldo_apertura, valor_apertura, cursor,
+            tamano_pagina, usar_ventana,
+        ):
+            saldo, valor = fila['saldo'], fila['valor_saldo']
+            yield fila
+        # La tabla activa continúa desde el saldo valorizado del último movimiento archivado
+        saldo_apertura, valor_apertura, cursor = saldo, valor, None
+    yield from _iterar_kardex_modelo(
+        MovimientoInventario, producto, bodega_id, desde, hasta, saldo_apertura, valor_apertura, cursor,
+        tamano_pagina, usar_ventana,
+    )
+
+
+def _iterar_kardex_modelo(modelo, producto, bodega_id, desde, hasta, saldo_apertura, valor_apertura, cursor,
+                          tamano_pagina, usar_ventana):
+    """Filas del kardex leídas de una tabla de movimientos (activa o archivo)"""
+    if usar_ventana is None:
+        usar_ventana = connection.features.supports_over_clause
+    tipos = dict(MovimientoInventario.TIPO_MOVIMIENTO_CHOICES)
+
+    base = _filtrar_alcance(modelo.objects.all(), producto, bodega_id)
+    if desde is not None:
+        base = base.filter(fecha__gte=fin_del_dia(desde - timedelta(days=1)))
+    if hasta is not None:
+        base = base.filter(fecha__lt=fin_del_dia(hasta))
+    base = base.order_by('fecha', 'id')
+
+    saldo, valor = saldo_apertura, valor_apertura
+    ultimo = None
+    if cursor is not None:
+        fecha_cursor, id_cursor, saldo, valor = cursor
+        ultimo = (fecha_cursor, id_cursor)
+    promedio = (valor / saldo).quantize(DECIMALES_PROMEDIO, rounding=ROUND_HALF_UP) if saldo > 0 else costo_apertura(producto)
+
+    campos = CAMPOS_KARDEX + ['bodega_id', 'bodega_destino_id', 'costo_unitario']
+    while True:
+        pagina = base
+        if ultimo is not None:
+            # fecha__gte redundante: permite que el motor recorra el índice como rango
+            pagina = pagina.filter(fecha__gte=ultimo[0]).filter(
+                Q(fecha__gt=ultimo[0]) | Q(fecha=ultimo[0], id__gt=ultimo[1])
+            )
+
+        if usar_ventana:
+            # Acotar la página por su última fila para que la ventana recorra solo esas filas
+            limite = pagina.values_list('fecha', 'id')[tamano_pagina - 1:tamano_pagina].first()
+            if limite is not None:
+                pagina = pagina.filter(fecha__lte=limite[0]).filter(
+                    Q(fecha__lt=limite[0]) | Q(fecha=limite[0], id__lte=limite[1])
+                )
+            filas = list(pagina.annotate(
+                delta=expresion_delta_stock(bodega_id),
+                saldo_pagina=Window(Sum(expresion_delta_stock(bodega_id)), order_by=[F('fecha').asc(), F('id').asc()]),
+            ).values(*campos, 'delta', 'saldo_pagina'))
+        else:
+            filas = list(pagina.values(*campos)[:tamano_pagina])
+
+        if not filas:
+            return
+
+        saldo_base = saldo
+        for fila in filas:
+            delta = fila['delta'] if usar_ventana else _delta_python(fila, bodega_id)
+            costo, valor_movimiento, saldo, valor, promedio = valorizar(
+                saldo, valor, promedio, delta, fila['tipo'], fila['costo_unitario']
+            )
+            if usar_ventana:
+                # El saldo de la ventana parte de cero en cada página: se suma al cierre de la anterior
+                saldo = saldo_base + fila['saldo_pagina']
+            fila['tipo_display'] = tipos.get(fila['tipo'], fila['tipo'])
+            fila['entrada'] = delta if delta > 0 else 0
+            fila['salida'] = -delta if delta < 0 else 0
+            fila['saldo'] = saldo
+            fila['costo_unitario'] = costo
+            fila['valor_movimiento'] = valor_movimiento
+            fila['valor_saldo'] = valor
+            yield fila
+
+        ultimo = (filas[-1]['fecha'], filas[-1]['id'])
+        if len(filas) < tamano_pagina:
+            return
+
+
+def fila_exportable(fila):
+    """Convertir una fila del kardex en la lista de valores de ENCABEZADOS_KARDEX"""
+    return [
+        timezone.localtime(fila['fecha']).strftime('%d-%m-%Y %H:%M') if fila['fecha'] else '',
+        fila['tipo_display'],
+        fila['bodega__codigo'] or '',
+        fila['bodega_destino__codigo'] or '',
+        fila['proveedor__razon_social'] or '',
+        fila['lote'],
+        fila['doc_referencia'],
+        fila['entrada'],
+        fila['salida'],
+        fila['saldo'],
+        fila['costo_unitario'],
+        fila['valor_movimiento'],
+        fila['valor_saldo'],
+    ]
+
+
+def codificar_cursor(fila):
+    """Token opaco para continuar el kardex después de `fila` (con su saldo y valor del saldo)"""
+    datos = json.dumps([fila['fecha'].isoformat(), fila['id'], fila['saldo'], str(fila['valor_saldo'])])
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(token):
+    """Cursor (fecha, id, saldo, valor del saldo) de un token; None si viene vacío o no es válido"""
+    if not token:
+        return None
+    try:
+        fecha, pk, saldo, valor = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return datetime.fromisoformat(fecha), int(pk), int(saldo), Decimal(valor)
+    except (ValueError, TypeError, InvalidOperation):
+        return None
@@ -0,0 +1,142 @@
+"""
+Sugerencias de reposición por producto
+
+Todo el cálculo sale de tres consultas (productos activos, salidas agrupadas
+por producto en la ventana de demanda y proveedores por producto) y una sola
+pasada en memoria, sin consultas por producto.
+"""
+import math
+from datetime import timedelta
+from decimal import Decimal, ROUND_CEILING
+
+from django.db.models import Sum
+from django.utils import timezone
+
+from .inventory_archivo import modelos_para_rango
+from .models import Product, ProductoProveedor
+
+
+ENCABEZADOS_REPOSICION = [
+    'SKU', 'Producto', 'Stock', 'Stock Mínimo', 'Punto de Reorden', 'Stock Máximo',
+    'Demanda Diaria', 'Días de Cobertura', 'Proveedor', 'Lead Time (días)', 'Lote Mínimo',
+    'Punto de Reorden Efectivo', 'Cantidad Sugerida', 'Costo Estimado',
+]
+
+
+def proveedores_por_producto():
+    """Proveedor a usar por producto: el preferente, o el de menor costo si no hay preferente"""
+    proveedores = {}
+    filas = ProductoProveedor.objects.order_by('product_id', '-es_preferente', 'costo').values_list(
+        'product_id', 'proveedor_id', 'proveedor__razon_social', 'lead_time', 'min_lote', 'costo'
+    )
+    for producto_id, proveedor_id, razon_social, lead_time, min_lote, costo in filas:
+        if producto_id not in proveedores:
+            proveedores[producto_id] = {
+                'proveedor_id': proveedor_id,
+                'proveedor': razon_social,
+                'lead_time': lead_time,
+                'min_lote': min_lote,
+                'costo': costo,
+            }
+    return proveedores
+
+
+def _sin_ceros(valor):
+    """Quitar ceros decimales sobrantes sin caer en notación exponencial (10.000 -> 10, no 1E+1)"""
+    if valor == valor.to_integral_value():
+        return valor.quantize(Decimal('1'))
+    return valor.normalize()
+
+
+def redondear_a_lote(cantidad, min_lote):
+    """Redondear hacia arriba al múltiplo de min_lote"""
+    if not min_lote or min_lote <= 0:
+        return Decimal(cantidad)
+    multiplos = (Decimal(cantidad) / min_lote).to_integral_value(rounding=ROUND_CEILING)
+    return _sin_ceros(multiplos * min_lote)
+
+
+def calcular_reposicion(dias_demanda=90, solo_necesarios=False):
+    """
+    Calcular la sugerencia de reposición de todos los productos activos
+
+    La demanda diaria es el total de salidas de los últimos `dias_demanda`
+    días dividido por esos días. El punto de reorden efectivo es el mayor entre
+    punto_reorden (o stock_minimo) y stock_minimo más la demanda durante el lead
+    time del proveedor. Si el stock está en o bajo ese punto se sugiere reponer
+    hasta stock_maximo (o hasta el punto efectivo más otro lead time de
+    demanda), redondeando al lote mínimo del proveedor.
+    Retorna una lista de diccionarios ordenada por urgencia (menos días de cobertura primero).
+    """
+    desde = timezone.now() - timedelta(days=dias_demanda)
+    demanda = {}
+    for modelo in modelos_para_rango(desde):
+        for producto_id, total in modelo.objects.filter(tipo='salida', fecha__gte=desde).order_by().values('producto_id').annotate(
+            total=Sum('cantidad')
+        ).values_list('producto_id', 'total'):
+            demanda[producto_id] = demanda.get(producto_id, 0) + total
+    proveedores = proveedores_por_producto()
+    productos = Product.objects.filter(is_active=True).values_list(
+        'id', 'sku', 'name', 'stock', 'stock_minimo', 'punto_reorden', 'stock_maximo'
+    )
+
+    sugerencias = []
+    for producto_id, sku, nombre, stock, stock_minimo, punto_reorden, stock_maximo in productos.iterator(chunk_size=5000):
+        demanda_diaria = float(demanda.get(producto_id) or 0) / dias_demanda
+        proveedor = proveedores.get(producto_id)
+        lead_time = proveedor['lead_time'] if proveedor else 0
+        demanda_lead_time = math.ceil(demanda_diaria * lead_time)
+
+        punto_efectivo = max(punto_reorden if punto_reorden is not None else stock_minimo, stock_minimo + demanda_lead_time)
+        necesita = stock <= punto_efectivo and (punto_efectivo > 0 or demanda_diaria > 0)
+
+        cantidad = Decimal('0')
+        if necesita:
+            objetivo = stock_maximo if stock_maximo else punto_efectivo + max(demanda_lead_time, 1)
+            if objetivo > stock:
+                cantidad = redondear_a_lote(objetivo - stock, proveedor['min_lote'] if proveedor else None)
+        if solo_necesarios and not cantidad:
+            continue
+
+        sugerencias.append({
+            'producto_id': producto_id,
+            'sku': sku,
+            'nombre': nombre,
+            'stock': stock,
+            'stock_minimo': stock_minimo,
+            'punto_reorden': punto_reorden,
+            'stock_maximo': stock_maximo,
+            'demanda_diaria': round(demanda_diaria, 2),
+            'dias_cobertura': round(stock / demanda_diaria, 1) if demanda_diaria else None,
+            'proveedor': proveedor['proveedor'] if proveedor else '',
+            'lead_time': lead_time if proveedor else None,
+            'min_lote': _sin_ceros(proveedor['min_lote']) if proveedor else None,
+            'punto_efectivo': punto_efectivo,
+            'cantidad_sugerida': cantidad,
+            'costo_estimado': (cantidad * proveedor['costo']).quantize(Decimal('0.01')) if proveedor and cantidad else None,
+        })
+
+    sugerencias.sort(key=lambda s: (
+        s['dias_cobertura'] is None, s['dias_cobertura'] or 0, s['stock'] - s['punto_efectivo']
+    ))
+    return sugerencias
+
+
+def fila_exportable(sugerencia):
+    """Convertir una sugerencia en la lista de valores de ENCABEZADOS_REPOSICION"""
+    return [
+        sugerencia['sku'],
+        sugerencia['nombre'],
+        sugerencia['stock'],
+        sugerencia['stock_minimo'],
+        sugerencia['punto_reorden'] if sugerencia['punto_reorden'] is not None else '',
+        sugerencia['stock_maximo'] or '',
+        sugerencia['demanda_diaria'],
+        sugerencia['dias_cobertura'] if sugerencia['dias_cobertura'] is not None else '',
+        sugerencia['proveedor'],
+        sugerencia['lead_time'] if sugerencia['lead_time'] is not None else '',
+        sugerencia['min_lote'] if sugerencia['min_lote'] is not None else '',
+        sugerencia['punto_efectivo'],
+        sugerencia['cantidad_sugerida'],
+        sugerencia['costo_estimado'] if sugerencia['costo_estimado'] is not None else '',
+    ]
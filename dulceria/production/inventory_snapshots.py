@@ -0,0 +1,164 @@
+"""
+Snapshots diarios de stock y consultas de stock a una fecha
+
+El stock a una fecha se obtiene del snapshot de cierre más cercano anterior
+más los movimientos registrados desde entonces, en lugar de recorrer todo
+el historial de MovimientoInventario.
+
+Un movimiento registrado, editado o eliminado con fecha en o antes del
+cierre de un snapshot cambia ese saldo de cierre: models.ajustar_snapshots suma
+su efecto a los snapshots de ese día en adelante, en la misma transacción.
+Así las consultas, que solo aplican los movimientos posteriores al
+snapshot, también cuentan los movimientos con fecha pasada.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .inventory_archivo import modelos_para_rango
+from .models import MovimientoInventario, Product, StockBodega, StockSnapshot
+
+
+def fin_del_dia(fecha):
+    """Primer instante del día siguiente: límite exclusivo del cierre de `fecha`"""
+    return timezone.make_aware(datetime.combine(fecha + timedelta(days=1), time.min))
+
+
+def deltas_movimientos(movimientos, chunk_size=5000):
+    """
+    Recorrer una vez un conjunto de movimientos y acumular sus deltas
+
+    `movimientos` es un queryset o una lista de querysets (tabla activa y
+    archivo). Retorna (deltas por producto, deltas por (producto, bodega)).
+    """
+    if not isinstance(movimientos, (list, tuple)):
+        movimientos = [movimientos]
+    totales = defaultdict(int)
+    por_bodega = defaultdict(int)
+    for queryset in movimientos:
+        filas = queryset.order_by().values_list(
+            'tipo', 'producto_id', 'bodega_id', 'bodega_destino_id', 'lote', 'cantidad'
+        )
+        for tipo, producto_id, bodega_id, bodega_destino_id, lote, cantidad in filas.iterator(chunk_size=chunk_size):
+            delta, efectos = MovimientoInventario.calcular_efectos(tipo, producto_id, bodega_id, bodega_destino_id, lote, cantidad)
+            totales[producto_id] += delta
+            for (_, bodega_efecto, _, _), delta_bodega in efectos:
+                por_bodega[(producto_id, bodega_efecto)] += delta_bodega
+    return totales, por_bodega
+
+
+def _movimientos_desde(inicio, **filtros):
+    """Querysets con fecha >= `inicio` y `filtros`, incluyendo el archivo solo si el rango lo alcanza"""
+    return [modelo.objects.filter(fecha__gte=inicio, **filtros) for modelo in modelos_para_rango(inicio)]
+
+
+def ultimo_snapshot(fecha):
+    """Fecha del último snapshot con cierre en o antes de `fecha` (usa snap_fecha_idx)"""
+    return StockSnapshot.objects.filter(fecha__lte=fecha).order_by('-fecha').values_list('fecha', flat=True).first()
+
+
+def generar_snapshot(fecha):
+    """
+    Guardar los saldos de cierre de `fecha` por producto y por producto/bodega
+
+    Parte del stock vigente (Product.stock y StockBodega) y descuenta los
+    movimientos posteriores al cierre; ejecutado cada noche, esos movimientos
+    son solo los de unas pocas horas. Reemplaza el snapshot existente de esa fecha.
+    """
+    totales_post, bodegas_post = deltas_movimientos(_movimientos_desde(fin_del_dia(fecha)))
+
+    totales = defaultdict(int)
+    for producto_id, stock in Product.objects.values_list('id', 'stock').iterator(chunk_size=5000):
+        totales[producto_id] = stock - totales_post.get(producto_id, 0)
+
+    bodegas = defaultdict(int)
+    for producto_id, bodega_id, cantidad in StockBodega.objects.values_list('producto_id', 'bodega_id', 'cantidad').iterator(chunk_size=5000):
+        bodegas[(producto_id, bodega_id)] += cantidad
+    for clave, delta in bodegas_post.items():
+        bodegas[clave] -= delta
+
+    filas = [
+        StockSnapshot(fecha=fecha, producto_id=producto_id, bodega_id=None, cantidad=cantidad)
+        for producto_id, cantidad in totales.items() if cantidad
+    ]
+    filas += [
+        StockSnapshot(fecha=fecha, producto_id=producto_id, bodega_id=bodega_id, cantidad=cantidad)
+        for (producto_id, bodega_id), cantidad in bodegas.items() if cantidad and bodega_id is not None
+    ]
+
+    with transaction.atomic():
+        StockSnapshot.objects.filter(fecha=fecha).delete()
+        StockSnapshot.objects.bulk_create(filas, batch_size=1000)
+    return len(filas)
+
+
+def stock_a_fecha(producto_id, fecha, bodega_id=None):
+    """
+    Stock de un producto (opcionalmente en una bodega) al cierre de `fecha`
+
+    Retorna {'cantidad': int, 'snapshot': fecha del snapshot usado o None}.
+    Sin snapshot previo se parte del stock vigente y se descuentan los
+    movimientos posteriores al cierre.
+    """
+    base = ultimo_snapshot(fecha)
+
+    if base is not None:
+        cantidad = StockSnapshot.objects.filter(
+            fecha=base, producto_id=producto_id, bodega_id=bodega_id
+        ).values_list('cantidad', flat=True).first() or 0
+        # Usa mov_prod_fecha_idx: solo los movimientos entre el snapshot y la fecha pedida
+        movimientos = _movimientos_desde(fin_del_dia(base), producto_id=producto_id, fecha__lt=fin_del_dia(fecha))
+        signo = 1
+    else:
+        if bodega_id is None:
+            cantidad = Product.objects.filter(pk=producto_id).values_list('stock', flat=True).first() or 0
+        else:
+            cantidad = sum(StockBodega.objects.filter(producto_id=producto_id, bodega_id=bodega_id).values_list('cantidad', flat=True))
+        movimientos = _movimientos_desde(fin_del_dia(fecha), producto_id=producto_id)
+        signo = -1
+
+    if bodega_id is not None:
+        movimientos = [queryset.filter(Q(bodega_id=bodega_id) | Q(bodega_destino_id=bodega_id)) for queryset in movimientos]
+
+    totales, por_bodega = deltas_movimientos(movimientos)
+    delta = totales.get(producto_id, 0) if bodega_id is None else por_bodega.get((producto_id, bodega_id), 0)
+    return {'cantidad': cantidad + signo * delta, 'snapshot': base}
+
+
+def stock_a_fecha_todos(fecha, bodega_id=None):
+    """
+    Stock de todos los productos al cierre de `fecha`
+
+    Retorna (dict producto_id -> cantidad, fecha del snapshot usado o None).
+    """
+    base = ultimo_snapshot(fecha)
+    saldos = defaultdict(int)
+
+    if base is not None:
+        saldos.update(StockSnapshot.objects.filter(fecha=base, bodega_id=bodega_id).values_list('producto_id', 'cantidad'))
+        movimientos = _movimientos_desde(fin_del_dia(base), fecha__lt=fin_del_dia(fecha))
+        signo = 1
+    else:
+        if bodega_id is None:
+            saldos.update(Product.objects.values_list('id', 'stock'))
+        else:
+            for producto_id, cantidad in StockBodega.objects.filter(bodega_id=bodega_id).values_list('producto_id', 'cantidad'):
+                saldos[producto_id] += cantidad
+        movimientos = _movimientos_desde(fin_del_dia(fecha))
+        signo = -1
+
+    if bodega_id is not None:
+        movimientos = [queryset.filter(Q(bodega_id=bodega_id) | Q(bodega_destino_id=bodega_id)) for queryset in movimientos]
+
+    totales, por_bodega = deltas_movimientos(movimientos)
+    if bodega_id is None:
+        for producto_id, delta in totales.items():
+            saldos[producto_id] += signo * delta
+    else:
+        for (producto_id, bodega_efecto), delta in por_bodega.items():
+            if bodega_efecto == bodega_id:
+                saldos[producto_id] += signo * delta
+    return saldos, base
@@ -0,0 +1,112 @@
+"""
+Escaneo de vencimientos próximos (lotes en bodega y productos)
+
+El escaneo recorre por rangos del índice de fecha de vencimiento los lotes
+de StockBodega y los productos con fecha o mes de vencimiento, en lotes de
+tamaño fijo, y guarda el resultado en VencimientoProximo. En la misma
+transacción guarda en ContadorInventario el total de registros y, para cada
+día hasta el límite del escaneo, cuántos estarán vencidos ese día: el
+dashboard lee esos contadores y los primeros registros, sin agregados.
+"""
+import calendar
+from bisect import bisect_left
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (
+    CONTADOR_VENCIMIENTOS_TOTAL, PREFIJO_VENCIDOS_AL, ContadorInventario, Product, StockBodega, VencimientoProximo,
+    clave_vencidos_al,
+)
+
+
+def _recorrer_por_fecha(queryset, campos, chunk_size):
+    """Recorrer un queryset por (fecha_vencimiento, id) en páginas por cursor"""
+    ultimo = None
+    while True:
+        pagina = queryset
+        if ultimo is not None:
+            pagina = pagina.filter(fecha_vencimiento__gte=ultimo[0]).filter(
+                Q(fecha_vencimiento__gt=ultimo[0]) | Q(fecha_vencimiento=ultimo[0], id__gt=ultimo[1])
+            )
+        filas = list(pagina.order_by('fecha_vencimiento', 'id').values_list('id', 'fecha_vencimiento', *campos)[:chunk_size])
+        yield from filas
+        if len(filas) < chunk_size:
+            return
+        ultimo = (filas[-1][1], filas[-1][0])
+
+
+def fin_de_mes(mes, hoy):
+    """Último día del mes `mes` (1-12) en su próxima ocurrencia desde `hoy`"""
+    anio = hoy.year if mes >= hoy.month else hoy.year + 1
+    return date(anio, mes, calendar.monthrange(anio, mes)[1])
+
+
+def escanear_vencimientos(dias=30, chunk_size=2000):
+    """
+    Reemplazar VencimientoProximo con lo que vence dentro de `dias` días
+
+    Incluye lo ya vencido que aún tiene stock. Retorna un diccionario con la
+    cantidad de registros por origen.
+    """
+    hoy = timezone.localdate()
+    limite = hoy + timedelta(days=dias)
+    generado_en = timezone.now()
+    filas = []
+
+    lotes = StockBodega.objects.filter(fecha_vencimiento__lte=limite, cantidad__gt=0)
+    for _, fecha_vencimiento, producto_id, bodega_id, lote, cantidad in _recorrer_por_fecha(
+        lotes, ('producto_id', 'bodega_id', 'lote', 'cantidad'), chunk_size
+    ):
+        filas.append(VencimientoProximo(
+            origen='lote', producto_id=producto_id, bodega_id=bodega_id, lote=lote,
+            fecha_vencimiento=fecha_vencimiento, cantidad=cantidad, generado_en=generado_en,
+        ))
+
+    productos = Product.objects.filter(is_active=True, stock__gt=0)
+    for producto_id, fecha_vencimiento, stock in _recorrer_por_fecha(
+        productos.filter(fecha_vencimiento__lte=limite), ('stock',), chunk_size
+    ):
+        filas.append(VencimientoProximo(
+            origen='producto', producto_id=producto_id, fecha_vencimiento=fecha_vencimiento,
+            cantidad=stock, generado_en=generado_en,
+        ))
+
+    # Productos que solo informan el mes de vencimiento: se considera el último día de ese mes
+    meses = {m: fin_de_mes(m, hoy) for m in range(1, 13)}
+    meses = {m: fin for m, fin in meses.items() if fin <= limite}
+    if meses:
+        ultimo_id = 0
+        candidatos = productos.filter(fecha_vencimiento__isnull=True, mes_vencimiento__in=list(meses))
+        while True:
+            pagina = list(candidatos.filter(id__gt=ultimo_id).order_by('id').values_list('id', 'mes_vencimiento', 'stock')[:chunk_size])
+            for producto_id, mes, stock in pagina:
+                filas.append(VencimientoProximo(
+                    origen='mes', producto_id=producto_id, fecha_vencimiento=meses[mes],
+                    cantidad=stock, generado_en=generado_en,
+                ))
+            if len(pagina) < chunk_size:
+                break
+            ultimo_id = pagina[-1][0]
+
+    # Vencidos al día d: registros con vencimiento anterior a d (pasado limite + 1 son todos)
+    fechas = sorted(fila.fecha_vencimiento for fila in filas)
+    resumen = [ContadorInventario(clave=CONTADOR_VENCIMIENTOS_TOTAL, valor=len(filas))]
+    resumen += [
+        ContadorInventario(clave=clave_vencidos_al(dia), valor=bisect_left(fechas, dia))
+        for dia in (hoy + timedelta(days=i) for i in range(dias + 2))
+    ]
+
+    with transaction.atomic():
+        VencimientoProximo.objects.all().delete()
+        VencimientoProximo.objects.bulk_create(filas, batch_size=1000)
+        ContadorInventario.objects.filter(clave__startswith=PREFIJO_VENCIDOS_AL).delete()
+        ContadorInventario.objects.filter(clave=CONTADOR_VENCIMIENTOS_TOTAL).delete()
+        ContadorInventario.objects.bulk_create(resumen)
+
+    conteo = {origen: 0 for origen, _ in VencimientoProximo.ORIGEN_CHOICES}
+    for fila in filas:
+        conteo[fila.origen] += 1
+    return conteo
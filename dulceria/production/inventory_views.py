@@ -4,17 +4,40 @@ Vistas para el módulo de inventario transaccional
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Q, Sum, Count
+from django.db.models import Q
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.views.decorators.http import require_POST, require_http_methods
 from django.utils import timezone
-from datetime import datetime, date
-from .models import MovimientoInventario, Bodega, Product, Proveedor
-from .inventory_forms import MovimientoInventarioForm
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, date, time, timedelta
+from itertools import chain, islice
+import csv
+import tempfile
+import uuid
+from .models import MovimientoArchivado, MovimientoInventario, Bodega, Product, Proveedor, StockBodega, StockInsuficienteError, VencimientoProximo
+from .inventory_forms import MovimientoInventarioForm, ImportarMovimientosForm
+from .inventory_import import ErrorImportacion, importar_movimientos, leer_filas
+from .inventory_archivo import inicio_periodo_abierto, modelos_para_rango
+from .inventory_busqueda import filtrar_busqueda_movimientos
+from .inventory_autocompletar import ALCANCE_TODOS, ALCANCE_VIGENTES, INDICES, LIMITE_MAXIMO, LIMITE_RESULTADOS
+from .inventory_codigos import buscar_codigo
+from .inventory_contadores import contadores_dashboard
+from .inventory_cursor import conteo_aproximado, paginar_por_cursor
+from .export_jobs import encolar_exportacion
+from .inventory_export import lineas_movimientos
+from .inventory_fefo import registrar_salida_fefo, requiere_fefo
+from .inventory_idempotencia import buscar_resultado, clave_de_solicitud, ejecutar_una_vez
+from .inventory_reposicion import (
+    ENCABEZADOS_REPOSICION, calcular_reposicion, fila_exportable as fila_exportable_reposicion,
+)
+from .inventory_snapshots import stock_a_fecha, stock_a_fecha_todos
+from .inventory_kardex import (
+    ENCABEZADOS_KARDEX, apertura_kardex, codificar_cursor, decodificar_cursor,
+    fila_exportable, iterar_kardex,
+)
 from .views import get_user_role, get_pagination_per_page
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from openpyxl import Workbook
-from accounts.models import UserProfile
 
 
 @login_required
@@ -27,31 +50,27 @@ def inventory_dashboard(request):
         messages.error(request, 'No tienes permiso para acceder a esta página.')
         return redirect('dashboard')
     
-    # Estadísticas del día
-    hoy = timezone.now().date()
-    movimientos_hoy = MovimientoInventario.objects.filter(fecha__date=hoy).count()
-    
-    # Stock total (suma de todos los productos)
-    stock_total = Product.objects.filter(is_active=True, estado_aprobacion='APROBADO').aggregate(
-        total=Sum('stock')
-    )['total'] or 0
-    
-    # Productos únicos con stock
-    productos_unicos = Product.objects.filter(
-        is_active=True,
-        estado_aprobacion='APROBADO',
-        stock__gt=0
-    ).count()
+    # Movimientos de hoy, stock total y productos con stock - contadores mantenidos por las escrituras
+    hoy = timezone.localdate()
+    contadores = contadores_dashboard()
     
     # Últimos movimientos
     ultimos_movimientos = MovimientoInventario.objects.select_related(
         'producto', 'proveedor', 'bodega', 'creado_por'
     ).order_by('-fecha')[:10]
     
+    # Vencimientos próximos - los primeros de la tabla resumen del último scan_vencimientos
+    # (stock por bodega y totales de vencimientos vienen de los contadores)
+    vencimientos = VencimientoProximo.objects.select_related('producto', 'bodega').order_by('fecha_vencimiento')[:10]
+    
     context = {
-        'movimientos_hoy': movimientos_hoy,
-        'stock_total': int(stock_total),
-        'productos_unicos': productos_unicos,
+        'movimientos_hoy': contadores['movimientos_hoy'],
+        'stock_por_bodega': contadores['stock_por_bodega'],
+        'vencimientos_resumen': contadores['vencimientos_resumen'],
+        'vencimientos': vencimientos,
+        'hoy': hoy,
+        'stock_total': contadores['stock_total'],
+        'productos_unicos': contadores['productos_unicos'],
         'ultimos_movimientos': ultimos_movimientos,
         'user_role': role,
     }
@@ -59,69 +78,180 @@ def inventory_dashboard(request):
     return render(request, 'production/inventory_dashboard.html', context)
 
 
-@login_required
-def movimientos_list(request):
-    """Lista de movimientos de inventario con filtros y búsqueda"""
-    role = get_user_role(request)
-    
-    # Admin, manager, employee (BODEGA) y viewer (CONSULTA) pueden ver
-    # CONSULTA solo puede ver, no crear/editar (verificado en templates y vistas)
-    if role not in ['admin', 'manager', 'employee', 'viewer']:
-        messages.error(request, 'No tienes permiso para acceder a esta página.')
-        return redirect('dashboard')
-    
-    # Obtener parámetros de búsqueda y filtros
+def _filtrar_movimientos(request, modelo=MovimientoInventario):
+    """
+    Aplicar los filtros de la lista de movimientos (q, tipo, fecha_desde, fecha_hasta)
+
+    Retorna (queryset, filtros) donde filtros son los valores recibidos, para
+    el contexto de la plantilla. Lo usan la lista y las exportaciones.
+    `modelo` puede ser MovimientoArchivado (ver _movimientos_con_archivo).
+    """
     q = request.GET.get('q', '')
     tipo = request.GET.get('tipo', '')
     fecha_desde = request.GET.get('fecha_desde', '')
     fecha_hasta = request.GET.get('fecha_hasta', '')
     
     # Obtener movimientos - optimizado con select_related para evitar N+1 queries
-    movimientos = MovimientoInventario.objects.select_related(
+    movimientos = modelo.objects.select_related(
         'producto', 'producto__category',  # Optimizar acceso a producto y categoría
         'proveedor',  # Optimizar acceso a proveedor
         'bodega',  # Optimizar acceso a bodega
         'creado_por'  # Optimizar acceso a usuario creador
     ).all()
     
-    # Aplicar búsqueda - optimizado para usar índices
+    # Búsqueda sobre texto_busqueda (SKU, producto, proveedor, doc. ref., lote y serie),
+    # con FULLTEXT en MySQL o FTS5 en SQLite; sin joins
     if q:
-        search_conditions = Q()
-        # Buscar en campos indexados primero
-        search_conditions |= Q(producto__sku__icontains=q)  # Usa índice de producto.sku
-        search_conditions |= Q(producto__name__icontains=q)  # Usa índice de producto.name
-        search_conditions |= Q(proveedor__razon_social__icontains=q)  # Usa índice de proveedor.razon_social
-        search_conditions |= Q(proveedor__rut__icontains=q)  # Usa índice de proveedor.rut
-        search_conditions |= Q(doc_referencia__icontains=q)
-        search_conditions |= Q(lote__icontains=q)
-        search_conditions |= Q(serie__icontains=q)
-        movimientos = movimientos.filter(search_conditions)
+        movimientos = filtrar_busqueda_movimientos(movimientos, q)
     
     # Filtrar por tipo - usa índice mov_tipo_fecha_idx
     if tipo:
         movimientos = movimientos.filter(tipo=tipo)
     
-    # Filtrar por fecha - optimizado usando índice mov_fecha_idx
+    # Filtrar por fecha como rango sobre la columna (fecha__date aplica una función y no usa mov_fecha_idx)
     if fecha_desde:
         try:
             fecha_desde_obj = datetime.strptime(fecha_desde, '%Y-%m-%d').date()
-            movimientos = movimientos.filter(fecha__date__gte=fecha_desde_obj)
+            movimientos = movimientos.filter(fecha__gte=_inicio_del_dia(fecha_desde_obj))
         except ValueError:
             pass
     
     if fecha_hasta:
         try:
             fecha_hasta_obj = datetime.strptime(fecha_hasta, '%Y-%m-%d').date()
-            movimientos = movimientos.filter(fecha__date__lte=fecha_hasta_obj)
+            movimientos = movimientos.filter(fecha__lt=_inicio_del_dia(fecha_hasta_obj + timedelta(days=1)))
         except ValueError:
             pass
     
-    # Ordenar por fecha descendente - usa índice mov_fecha_idx
-    movimientos = movimientos.order_by('-fecha', '-created_at')
+    filtros = {
+        'q': q,
+        'tipo': tipo,
+        'fecha_desde': fecha_desde,
+        'fecha_hasta': fecha_hasta,
+    }
+    return movimientos, filtros
+
+
+def _movimientos_con_archivo(request, inicio=None):
+    """
+    Movimientos filtrados de la tabla activa y, si el rango llega al período archivado, también del archivo
+
+    El rango empieza en `inicio` o, si no se entrega, en fecha_desde. Sin
+    fecha de inicio solo se consulta la tabla activa. Retorna
+    (lista de querysets, filtros, usa_archivo).
+    """
+    movimientos, filtros = _filtrar_movimientos(request)
+    if inicio is None and filtros['fecha_desde']:
+        try:
+            inicio = _inicio_del_dia(datetime.strptime(filtros['fecha_desde'], '%Y-%m-%d').date())
+        except ValueError:
+            pass
+    if inicio is None or len(modelos_para_rango(inicio)) == 1:
+        return [movimientos], filtros, False
+    archivados, _ = _filtrar_movimientos(request, MovimientoArchivado)
+    return [movimientos, archivados], filtros, True
+
+
+def _inicio_del_dia(dia):
+    """Medianoche local del día, como datetime con zona horaria"""
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+@login_required
+def movimientos_list(request):
+    """Lista de movimientos de inventario con filtros y búsqueda"""
+    role = get_user_role(request)
     
-    # Paginación
+    # Admin, manager, employee (BODEGA) y viewer (CONSULTA) pueden ver
+    # CONSULTA solo puede ver, no crear/editar (verificado en templates y vistas)
+    if role not in ['admin', 'manager', 'employee', 'viewer']:
+        messages.error(request, 'No tienes permiso para acceder a esta página.')
+        return redirect('dashboard')
+    
+    querysets, filtros, usa_archivo = _movimientos_con_archivo(request)
+    movimientos = querysets[0]
     per_page = get_pagination_per_page(request, session_key='movimientos_per_page', default=25)
-    paginator = Paginator(movimientos, per_page)
+    
+    # Por defecto se pagina por cursor (keyset): el costo no crece con la profundidad de la página.
+    # ?modo=paginas mantiene la paginación numerada con OFFSET y COUNT(*) exacto, salvo que el
+    # rango incluya el archivo (las páginas numeradas no pueden intercalar dos tablas).
+    modo = 'paginas' if request.GET.get('modo') == 'paginas' and not usa_archivo else 'cursor'
+    total_aproximado = None
+    if modo == 'cursor':
+        page_obj = paginar_por_cursor(querysets, request.GET.get('cursor'), per_page)
+        if request.GET.get('contar') == '1':
+            conteos = [conteo_aproximado(queryset) for queryset in querysets]
+            total_aproximado = {
+                'total': sum(total for total, _ in conteos),
+                'exacto': all(exacto for _, exacto in conteos),
+            }
+    else:
+        # Ordenar por fecha descendente - usa índice mov_fecha_creado_idx
+        paginator = Paginator(movimientos.order_by('-fecha', '-created_at', '-id'), per_page)
+        page = request.GET.get('page', 1)
+        
+        try:
+            page_obj = paginator.page(page)
+        except PageNotAnInteger:
+            page_obj = paginator.page(1)
+        except EmptyPage:
+            page_obj = paginator.page(paginator.num_pages)
+    
+    # Parámetros de filtro para los enlaces de navegación (sin cursor ni página)
+    parametros = request.GET.copy()
+    for clave in ('cursor', 'page'):
+        parametros.pop(clave, None)
+    
+    # Obtener tipos de movimiento para el filtro
+    tipos_movimiento = MovimientoInventario.TIPO_MOVIMIENTO_CHOICES
+    
+    context = {
+        'movimientos': page_obj,
+        **filtros,
+        'modo': modo,
+        'usa_archivo': usa_archivo,
+        'inicio_periodo_abierto': inicio_periodo_abierto() if usa_archivo else None,
+        'contar': request.GET.get('contar') == '1',
+        'total_aproximado': total_aproximado,
+        'parametros': parametros.urlencode(),
+        'tipos_movimiento': tipos_movimiento,
+        'per_page': per_page,
+        'per_page_options': [25, 50, 100, 250, 500],  # Opciones optimizadas para grandes volúmenes
+        'user_role': role,
+    }
+    
+    return render(request, 'production/movimientos_list.html', context)
+
+
+@login_required
+def stock_bodega_list(request):
+    """Stock actual por bodega y lote, leído desde la proyección StockBodega"""
+    role = get_user_role(request)
+    
+    if role not in ['admin', 'manager', 'employee', 'viewer']:
+        messages.error(request, 'No tienes permiso para acceder a esta página.')
+        return redirect('dashboard')
+    
+    q = request.GET.get('q', '')
+    bodega_id = request.GET.get('bodega', '')
+    
+    saldos = StockBodega.objects.select_related('producto', 'bodega').exclude(cantidad=0)
+    
+    # Filtrar por bodega - usa índice stockbod_bod_prod_idx
+    if bodega_id:
+        saldos = saldos.filter(bodega_id=bodega_id)
+    
+    if q:
+        saldos = saldos.filter(
+            Q(producto__sku__icontains=q) |
+            Q(producto__name__icontains=q) |
+            Q(lote__icontains=q)
+        )
+    
+    saldos = saldos.order_by('bodega__codigo', 'producto__name', 'fecha_vencimiento', 'lote')
+    
+    per_page = get_pagination_per_page(request, session_key='stock_bodega_per_page', default=25)
+    paginator = Paginator(saldos, per_page)
     page = request.GET.get('page', 1)
     
     try:
@@ -131,22 +261,403 @@ def movimientos_list(request):
     except EmptyPage:
         page_obj = paginator.page(paginator.num_pages)
     
-    # Obtener tipos de movimiento para el filtro
-    tipos_movimiento = MovimientoInventario.TIPO_MOVIMIENTO_CHOICES
+    context = {
+        'saldos': page_obj,
+        'bodegas': Bodega.objects.filter(is_active=True).order_by('codigo'),
+        'q': q,
+        'bodega_id': bodega_id,
+        'per_page': per_page,
+        'per_page_options': [25, 50, 100, 250, 500],
+        'user_role': role,
+    }
+    
+    return render(request, 'production/stock_bodega_list.html', context)
+
+
+def _parsear_fecha_param(valor):
+    """Fecha YYYY-MM-DD de un parámetro GET; hoy si viene vacía o inválida"""
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return timezone.localdate()
+
+
+@login_required
+def stock_a_fecha_view(request):
+    """Stock de todos los productos al cierre de una fecha (snapshot + movimientos posteriores)"""
+    role = get_user_role(request)
+    
+    if role not in ['admin', 'manager', 'employee', 'viewer']:
+        messages.error(request, 'No tienes permiso para acceder a esta página.')
+        return redirect('dashboard')
+    
+    fecha = _parsear_fecha_param(request.GET.get('fecha'))
+    bodega_id = request.GET.get('bodega', '')
+    q = request.GET.get('q', '')
+    
+    bodega = Bodega.objects.filter(pk=bodega_id).first() if bodega_id.isdigit() else None
+    saldos, snapshot_base = stock_a_fecha_todos(fecha, bodega.pk if bodega else None)
+    
+    productos = Product.objects.filter(is_active=True, estado_aprobacion='APROBADO')
+    if q:
+        productos = productos.filter(Q(sku__icontains=q) | Q(name__icontains=q))
+    productos = productos.order_by('name').only('id', 'sku', 'name', 'stock')
+    
+    per_page = get_pagination_per_page(request, session_key='stock_fecha_per_page', default=25)
+    paginator = Paginator(productos, per_page)
+    page = request.GET.get('page', 1)
+    
+    try:
+        page_obj = paginator.page(page)
+    except PageNotAnInteger:
+        page_obj = paginator.page(1)
+    except EmptyPage:
+        page_obj = paginator.page(paginator.num_pages)
+    
+    for producto in page_obj:
+        producto.stock_a_fecha = saldos.get(producto.pk, 0)
     
     context = {
-        'movimientos': page_obj,
+        'productos': page_obj,
+        'fecha': fecha.strftime('%Y-%m-%d'),
+        'snapshot_base': snapshot_base,
+        'bodegas': Bodega.objects.filter(is_active=True).order_by('codigo'),
+        'bodega_id': bodega_id,
         'q': q,
-        'tipo': tipo,
-        'fecha_desde': fecha_desde,
-        'fecha_hasta': fecha_hasta,
-        'tipos_movimiento': tipos_movimiento,
         'per_page': per_page,
-        'per_page_options': [25, 50, 100, 250, 500],  # Opciones optimizadas para grandes volúmenes
+        'per_page_options': [25, 50, 100, 250, 500],
         'user_role': role,
     }
     
-    return render(request, 'production/movimientos_list.html', context)
+    return render(request, 'production/stock_a_fecha.html', context)
+
+
+@login_required
+def stock_a_fecha_api(request):
+    """API JSON: stock de un producto al cierre de una fecha (?sku=&fecha=YYYY-MM-DD&bodega=CODIGO)"""
+    role = get_user_role(request)
+    
+    if role not in ['admin', 'manager', 'employee', 'viewer']:
+        return JsonResponse({'ok': False, 'message': 'No tienes permiso para consultar el stock.'}, status=403)
+    
+    producto = Product.objects.filter(sku=request.GET.get('sku', '')).only('id', 'sku', 'name').first()
+    if not producto:
+        return JsonResponse({'ok': False, 'message': 'Producto no encontrado.'}, status=404)
+    
+    bodega = None
+    codigo_bodega = request.GET.get('bodega', '')
+    if codigo_bodega:
+        bodega = Bodega.objects.filter(codigo=codigo_bodega).first()
+        if not bodega:
+            return JsonResponse({'ok': False, 'message': 'Bodega no encontrada.'}, status=404)
+    
+    fecha = _parsear_fecha_param(request.GET.get('fecha'))
+    resultado = stock_a_fecha(producto.pk, fecha, bodega.pk if bodega else None)
+    
+    return JsonResponse({
+        'ok': True,
+        'sku': producto.sku,
+        'producto': producto.name,
+        'bodega': bodega.codigo if bodega else None,
+        'fecha': fecha.isoformat(),
+        'stock': resultado['cantidad'],
+        'snapshot': resultado['snapshot'].isoformat() if resultado['snapshot'] else None,
+    })
+
+
+@login_required
+def producto_por_codigo_api(request):
+    """API JSON para la caja: producto, precio y stock por EAN/UPC o SKU (?codigo=)"""
+    role = get_user_role(request)
+    
+    if role not in ['admin', 'manager', 'employee', 'viewer']:
+        return JsonResponse({'ok': False, 'message': 'No tienes permiso para consultar productos.'}, status=403)
+    
+    # Índice en memoria (inventory_codigos): no consulta la base de datos
+    producto = buscar_codigo(request.GET.get('codigo', ''))
+    if producto is None:
+        return JsonResponse({'ok': False, 'message': 'Producto no encontrado.'}, status=404)
+    
+    return JsonResponse({'ok': True, **producto})
+
+
+def _autocompletar(request, nombre):
+    role = get_user_role(request)
+    
+    if role not in ['admin', 'manager', 'employee', 'viewer']:
+        return JsonResponse({'ok': False, 'message': 'No tienes permiso para consultar este listado.'}, status=403)
+    
+    # Con ?alcance=todos (panel de administración) también se listan inactivos y pendientes
+    alcance = request.GET.get('alcance', ALCANCE_VIGENTES)
+    if alcance not in INDICES[nombre]:
+        return JsonResponse({'ok': False, 'message': 'Alcance no válido.'}, status=400)
+    if alcance == ALCANCE_TODOS and role not in ['admin', 'manager'] and not request.user.is_superuser:
+        return JsonResponse({'ok': False, 'message': 'No tienes permiso para consultar este listado.'}, status=403)
+    indice = INDICES[nombre][alcance]
+    
+    limite = request.GET.get('limite', '')
+    limite = min(int(limite), LIMITE_MAXIMO) if limite.isdigit() and int(limite) > 0 else LIMITE_RESULTADOS
+    # Índice de prefijos en memoria (inventory_autocompletar): no consulta la base de datos
+    return JsonResponse({'ok': True, 'resultados': indice.buscar(request.GET.get('q', ''), limite)})
+
+
+@login_required
+def autocompletar_productos_api(request):
+    """API JSON de autocompletado de productos activos y aprobados (o todos) por SKU, nombre o EAN/UPC (?q=&limite=&alcance=)"""
+    return _autocompletar(request, 'productos')
+
+
+@login_required
+def autocompletar_proveedores_api(request):
+    """API JSON de autocompletado de proveedores activos (o todos) por RUT, razón social o nombre de fantasía (?q=&limite=&alcance=)"""
+    return _autocompletar(request, 'proveedores')
+
+
+def _filtros_kardex(request):
+    """Bodega y rango de fechas (opcionales) de los parámetros GET del kardex"""
+    bodega_id = request.GET.get('bodega', '')
+    bodega = Bodega.objects.filter(pk=bodega_id).first() if bodega_id.isdigit() else None
+    desde = _parsear_fecha_param(request.GET.get('desde')) if request.GET.get('desde') else None
+    hasta = _parsear_fecha_param(request.GET.get('hasta')) if request.GET.get('hasta') else None
+    return bodega, desde, hasta
+
+
+@login_required
+def kardex_view(request, pk):
+    """Kardex de un producto con saldo y valorización acumulados, paginado por cursor"""
+    role = get_user_role(request)
+    
+    if role not in ['admin', 'manager', 'employee', 'viewer']:
+        messages.error(request, 'No tienes permiso para acceder a esta página.')
+        return redirect('dashboard')
+    
+    producto = get_object_or_404(Product, pk=pk)
+    bodega, desde, hasta = _filtros_kardex(request)
+    bodega_id = bodega.pk if bodega else None
+    per_page = get_pagination_per_page(request, session_key='kardex_per_page', default=100)
+    
+    # El saldo valorizado de apertura solo se calcula en la primera página; las siguientes lo traen en el cursor
+    cursor = decodificar_cursor(request.GET.get('cursor'))
+    apertura, valor_apertura = (None, None) if cursor else apertura_kardex(producto, bodega_id, desde)
+    filas = list(islice(iterar_kardex(
+        producto, bodega_id=bodega_id, desde=desde, hasta=hasta, saldo_apertura=apertura or 0,
+        valor_apertura=valor_apertura, cursor=cursor, tamano_pagina=per_page + 1,
+    ), per_page + 1))
+    siguiente = codificar_cursor(filas[per_page - 1]) if len(filas) > per_page else None
+    filas = filas[:per_page]
+    
+    parametros = request.GET.copy()
+    parametros.pop('cursor', None)
+    parametros.pop('page', None)
+    
+    context = {
+        'producto': producto,
+        'filas': filas,
+        'saldo_apertura': apertura,
+        'valor_apertura': valor_apertura,
+        'siguiente': siguiente,
+        'es_primera': cursor is None,
+        'parametros': parametros.urlencode(),
+        'bodegas': Bodega.objects.filter(is_active=True).order_by('codigo'),
+        'bodega_id': str(bodega_id or ''),
+        'desde': desde.strftime('%Y-%m-%d') if desde else '',
+        'hasta': hasta.strftime('%Y-%m-%d') if hasta else '',
+        'per_page': per_page,
+        'per_page_options': [25, 50, 100, 250, 500],
+        'user_role': role,
+    }
+    
+    return render(request, 'production/kardex.html', context)
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer que devuelve cada línea en vez de guardarla"""
+    def write(self, valor):
+        return valor
+
+
+def _respuesta_exportacion(formato, nombre, titulo, encabezados, filas):
+    """
+    Respuesta de descarga para un iterable de filas: CSV en streaming o XLSX
+
+    El XLSX se arma con un libro write_only sobre un archivo temporal, de
+    modo que las filas nunca se mantienen todas en memoria.
+    """
+    if formato == 'xlsx':
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(title=titulo)
+        ws.append(encabezados)
+        for fila in filas:
+            ws.append(fila)
+        archivo = tempfile.TemporaryFile(suffix='.xlsx')
+        wb.save(archivo)
+        archivo.seek(0)
+        return FileResponse(
+            archivo,
+            as_attachment=True,
+            filename=f'{nombre}.xlsx',
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+    
+    writer = csv.writer(_Eco())
+    lineas = chain([writer.writerow(encabezados)], (writer.writerow(fila) for fila in filas))
+    response = StreamingHttpResponse(lineas, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{nombre}.csv"'
+    return response
+
+
+@login_required
+def kardex_export(request, pk):
+    """Exportar el kardex completo de un producto en CSV (streaming) o XLSX (?formato=csv|xlsx)"""
+    role = get_user_role(request)
+    
+    if role not in ['admin', 'manager', 'employee']:
+        messages.error(request, 'No tienes permiso para exportar la información de inventario.')
+        return redirect('inventory_dashboard')
+    
+    producto = get_object_or_404(Product, pk=pk)
+    bodega, desde, hasta = _filtros_kardex(request)
+    bodega_id = bodega.pk if bodega else None
+    apertura, valor_apertura = apertura_kardex(producto, bodega_id, desde)
+    filas = iterar_kardex(
+        producto, bodega_id=bodega_id, desde=desde, hasta=hasta,
+        saldo_apertura=apertura, valor_apertura=valor_apertura,
+    )
+    nombre = f'kardex_{producto.sku}_{timezone.localtime():%Y%m%d_%H%M%S}'
+    
+    return _respuesta_exportacion(
+        request.GET.get('formato'), nombre, 'Kardex', ENCABEZADOS_KARDEX, (fila_exportable(fila) for fila in filas)
+    )
+
+
+@login_required
+def movimientos_export(request):
+    """
+    Exportar movimientos en CSV o NDJSON (?formato=csv|ndjson), en streaming
+    
+    Acepta los filtros de la lista (q, tipo, fecha_desde, fecha_hasta) y,
+    para integraciones que consultan cada pocos minutos, `desde` / `hasta`
+    como fecha y hora ISO 8601 (desde inclusivo, hasta exclusivo). Con
+    Accept-Encoding: gzip la respuesta sale comprimida por GZipMiddleware.
+    Si el rango llega al período archivado se incluyen los movimientos archivados.
+    """
+    role = get_user_role(request)
+    
+    if role not in ['admin', 'manager', 'employee']:
+        messages.error(request, 'No tienes permiso para exportar la información de inventario.')
+        return redirect('inventory_dashboard')
+    
+    instantes = {}
+    for parametro in ('desde', 'hasta'):
+        valor = request.GET.get(parametro, '')
+        if not valor:
+            continue
+        try:
+            instante = parse_datetime(valor)
+        except ValueError:
+            instante = None
+        if instante is None:
+            return HttpResponseBadRequest(f'"{parametro}" debe ser una fecha y hora ISO 8601, por ejemplo 2025-01-31T08:00:00-03:00.')
+        instantes[parametro] = timezone.make_aware(instante) if timezone.is_naive(instante) else instante
+    
+    # El archivo se lee solo si el rango llega a él
+    movimientos, filtros, _ = _movimientos_con_archivo(request, inicio=instantes.get('desde'))
+    if 'desde' in instantes:
+        movimientos = [queryset.filter(fecha__gte=instantes['desde']) for queryset in movimientos]
+    if 'hasta' in instantes:
+        movimientos = [queryset.filter(fecha__lt=instantes['hasta']) for queryset in movimientos]
+    
+    formato = 'ndjson' if request.GET.get('formato') == 'ndjson' else 'csv'
+    content_type = 'application/x-ndjson; charset=utf-8' if formato == 'ndjson' else 'text/csv; charset=utf-8'
+    response = StreamingHttpResponse(lineas_movimientos(movimientos, formato), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="movimientos_{timezone.localtime():%Y%m%d_%H%M%S}.{formato}"'
+    return response
+
+
+def _parametros_reposicion(request):
+    """Ventana de demanda (días) y filtros de la página de reposición"""
+    dias = request.GET.get('dias', '90')
+    dias = int(dias) if dias.isdigit() and 0 < int(dias) <= 365 else 90
+    solo_necesarios = request.GET.get('todos') != '1'
+    q = request.GET.get('q', '').strip()
+    return dias, solo_necesarios, q
+
+
+def _filtrar_sugerencias(sugerencias, q):
+    if not q:
+        return sugerencias
+    q = q.lower()
+    return [s for s in sugerencias if q in s['sku'].lower() or q in s['nombre'].lower()]
+
+
+@login_required
+def reposicion_view(request):
+    """Sugerencias de reposición según punto de reorden, demanda de salidas y lead time del proveedor"""
+    role = get_user_role(request)
+    
+    if role not in ['admin', 'manager']:
+        messages.error(request, 'No tienes permiso para acceder a esta página.')
+        return redirect('dashboard')
+    
+    dias, solo_necesarios, q = _parametros_reposicion(request)
+    sugerencias = _filtrar_sugerencias(calcular_reposicion(dias_demanda=dias, solo_necesarios=solo_necesarios), q)
+    costo_total = sum(s['costo_estimado'] or 0 for s in sugerencias)
+    
+    per_page = get_pagination_per_page(request, session_key='reposicion_per_page', default=25)
+    paginator = Paginator(sugerencias, per_page)
+    page = request.GET.get('page', 1)
+    
+    try:
+        page_obj = paginator.page(page)
+    except PageNotAnInteger:
+        page_obj = paginator.page(1)
+    except EmptyPage:
+        page_obj = paginator.page(paginator.num_pages)
+    
+    parametros = request.GET.copy()
+    parametros.pop('page', None)
+    
+    context = {
+        'sugerencias': page_obj,
+        'total_sugerencias': len(sugerencias),
+        'costo_total': costo_total,
+        'dias': dias,
+        'dias_opciones': [30, 60, 90, 180],
+        'solo_necesarios': solo_necesarios,
+        'q': q,
+        'parametros': parametros.urlencode(),
+        'per_page': per_page,
+        'per_page_options': [25, 50, 100, 250, 500],
+        'user_role': role,
+    }
+    
+    return render(request, 'production/reposicion.html', context)
+
+
+@login_required
+def reposicion_export(request):
+    """Exportar las sugerencias de reposición en CSV o XLSX (?formato=csv|xlsx)"""
+    role = get_user_role(request)
+    
+    if role not in ['admin', 'manager']:
+        messages.error(request, 'No tienes permiso para exportar la información de inventario.')
+        return redirect('inventory_dashboard')
+    
+    dias, solo_necesarios, q = _parametros_reposicion(request)
+    sugerencias = _filtrar_sugerencias(calcular_reposicion(dias_demanda=dias, solo_necesarios=solo_necesarios), q)
+    nombre = f'reposicion_{timezone.localtime():%Y%m%d_%H%M%S}'
+    
+    return _respuesta_exportacion(
+        request.GET.get('formato'), nombre, 'Reposición', ENCABEZADOS_REPOSICION,
+        (fila_exportable_reposicion(s) for s in sugerencias),
+    )
+
+
+def _responder_reenvio(request, resultado):
+    """Respuesta a un envío repetido de movimiento_create: el resultado original, sin registrar nada"""
+    mensaje = resultado.get('mensaje') or 'El movimiento ya estaba registrado.'
+    messages.info(request, f'{mensaje} (Envío repetido: no se volvió a registrar.)')
+    return redirect('movimientos_list')
 
 
 @login_required
@@ -163,29 +674,99 @@ def movimiento_create(request):
     
     if request.method == 'POST':
         form = MovimientoInventarioForm(request.POST)
+        clave = clave_de_solicitud(request)
+        # Reenvío de un movimiento ya registrado: una sola búsqueda por índice, sin validar el formulario
+        resultado = buscar_resultado(request.user, clave) if clave else None
+        if resultado is not None:
+            return _responder_reenvio(request, resultado)
         if form.is_valid():
             movimiento = form.save(commit=False)
             movimiento.creado_por = request.user
             # Si no se especifica fecha, usar la actual
             if not movimiento.fecha:
                 movimiento.fecha = timezone.now()
-            movimiento.save()
-            messages.success(request, f'Movimiento de {movimiento.get_tipo_display()} registrado exitosamente.')
-            return redirect('movimientos_list')
+            
+            def registrar():
+                if movimiento.tipo == 'salida' and not movimiento.lote and requiere_fefo(movimiento.producto):
+                    # Salida sin lote de un producto con control de lote: se reparte por vencimiento (FEFO)
+                    piezas = registrar_salida_fefo(movimiento)
+                    lotes = ', '.join(pieza.lote for pieza in piezas if pieza.lote)
+                else:
+                    movimiento.save()
+                    piezas, lotes = [movimiento], ''
+                if lotes:
+                    mensaje = f'Movimiento de {movimiento.get_tipo_display()} registrado exitosamente (lotes asignados por vencimiento: {lotes}).'
+                else:
+                    mensaje = f'Movimiento de {movimiento.get_tipo_display()} registrado exitosamente.'
+                return {'movimientos': [pieza.pk for pieza in piezas], 'mensaje': mensaje}
+            
+            try:
+                resultado, repetido = ejecutar_una_vez(request.user, clave, registrar)
+            except StockInsuficienteError as e:
+                form.add_error('cantidad', e)
+                messages.error(request, 'Por favor corrige los errores en el formulario.')
+            else:
+                if repetido:
+                    return _responder_reenvio(request, resultado)
+                messages.success(request, resultado['mensaje'])
+                return redirect('movimientos_list')
         else:
             messages.error(request, 'Por favor corrige los errores en el formulario.')
     else:
         form = MovimientoInventarioForm(initial={'fecha': timezone.now()})
+        clave = None
     
     context = {
         'form': form,
         'action': 'Registrar',
         'user_role': role,
+        # Se conserva la clave si el formulario vuelve con errores: ese envío no registró nada
+        'clave_idempotencia': clave or uuid.uuid4().hex,
     }
     
     return render(request, 'production/movimiento_form.html', context)
 
 
+@login_required
+@require_http_methods(["GET", "POST"])
+def movimientos_importar(request):
+    """Carga masiva de movimientos desde un archivo CSV o XLSX"""
+    role = get_user_role(request)
+    
+    # Mismos roles que pueden registrar movimientos individuales
+    if role not in ['admin', 'manager', 'employee']:
+        messages.error(request, 'No tienes permiso para importar movimientos de inventario.')
+        return redirect('movimientos_list')
+    
+    errores = []
+    if request.method == 'POST':
+        form = ImportarMovimientosForm(request.POST, request.FILES)
+        if form.is_valid():
+            archivo = form.cleaned_data['archivo']
+            try:
+                creados = importar_movimientos(leer_filas(archivo, archivo.name), usuario=request.user)
+            except ErrorImportacion as e:
+                errores = e.errores
+                messages.error(request, 'El archivo contiene errores. No se importó ningún movimiento.')
+            except StockInsuficienteError as e:
+                messages.error(request, f'{e.messages[0]} No se importó ningún movimiento.')
+            except (UnicodeDecodeError, ValueError, KeyError) as e:
+                messages.error(request, f'No se pudo leer el archivo: {e}')
+            else:
+                messages.success(request, f'{creados} movimientos importados exitosamente.')
+                return redirect('movimientos_list')
+    else:
+        form = ImportarMovimientosForm()
+    
+    context = {
+        'form': form,
+        'errores': errores,
+        'user_role': role,
+    }
+    
+    return render(request, 'production/movimientos_importar.html', context)
+
+
 @login_required
 @require_http_methods(["GET", "POST"])
 def movimiento_edit(request, pk):
@@ -211,7 +792,9 @@ def movimiento_edit(request, pk):
             # Guardar el resto de los campos editables
             movimiento.proveedor = form.cleaned_data.get('proveedor')
             movimiento.bodega = form.cleaned_data.get('bodega')
+            movimiento.bodega_destino = form.cleaned_data.get('bodega_destino')
             movimiento.cantidad = form.cleaned_data.get('cantidad')
+            movimiento.costo_unitario = form.cleaned_data.get('costo_unitario')
             movimiento.lote = form.cleaned_data.get('lote', '')
             movimiento.serie = form.cleaned_data.get('serie', '')
             movimiento.fecha_vencimiento = form.cleaned_data.get('fecha_vencimiento')
@@ -219,9 +802,15 @@ def movimiento_edit(request, pk):
             movimiento.observaciones = form.cleaned_data.get('observaciones', '')
             movimiento.motivo = form.cleaned_data.get('motivo', '')
             
-            movimiento.save()
-            messages.success(request, f'Movimiento actualizado exitosamente.')
-            return redirect('movimientos_list')
+            # save() aplica al stock solo la diferencia con el movimiento original
+            try:
+                movimiento.save()
+            except StockInsuficienteError as e:
+                form.add_error('cantidad', e)
+                messages.error(request, 'Por favor corrige los errores en el formulario.')
+            else:
+                messages.success(request, f'Movimiento actualizado exitosamente.')
+                return redirect('movimientos_list')
         else:
             messages.error(request, 'Por favor corrige los errores en el formulario.')
     else:
@@ -251,7 +840,11 @@ def movimiento_delete(request, pk):
     movimiento = get_object_or_404(MovimientoInventario, pk=pk)
     movimiento_str = str(movimiento)
     
-    movimiento.delete()
+    try:
+        movimiento.delete()
+    except StockInsuficienteError:
+        messages.error(request, f'No se puede eliminar el movimiento "{movimiento_str}": el stock del producto quedaría en negativo.')
+        return redirect('movimientos_list')
     
     messages.success(request, f'Movimiento "{movimiento_str}" eliminado exitosamente.')
     return redirect('movimientos_list')
@@ -259,149 +852,15 @@ def movimiento_delete(request, pk):
 
 @login_required
 def export_inventory_excel(request):
-    """Generar un archivo Excel con productos, usuarios por rol y movimientos"""
+    """Encolar el reporte Excel de productos, usuarios por rol y movimientos (ver inventory_export)"""
     role = get_user_role(request)
 
     if role not in ['admin', 'manager', 'employee']:
         messages.error(request, 'No tienes permiso para exportar la información de inventario.')
         return redirect('inventory_dashboard')
 
-    wb = Workbook()
-
-    # --- Hoja de productos ---
-    ws_productos = wb.active
-    ws_productos.title = 'Productos'
-    ws_productos.append([
-        'SKU', 'Nombre', 'Categoría', 'Estado Aprobación', 'Stock', 'Stock Mínimo',
-        'Stock Máximo', 'Precio Venta', 'IVA (%)', 'Unidad Compra', 'Unidad Venta',
-        'Factor Conversión', 'Perecible', 'Control Lote', 'Control Serie',
-        'Fecha Vencimiento', 'Creado Por'
-    ])
-
-    productos = Product.objects.select_related('category', 'creado_por').all().order_by('sku')
-    for producto in productos:
-        categoria = producto.category.name if producto.category else ''
-        creado_por = producto.creado_por.get_full_name() if producto.creado_por else ''
-        if not creado_por and producto.creado_por:
-            creado_por = producto.creado_por.username
-        ws_productos.append([
-            producto.sku,
-            producto.name,
-            categoria,
-            producto.get_estado_aprobacion_display(),
-            producto.stock,
-            producto.stock_minimo,
-            producto.stock_maximo or '',
-            producto.price or '',
-            producto.iva,
-            producto.uom_compra,
-            producto.uom_venta,
-            producto.factor_conversion,
-            'Sí' if producto.es_perecible else 'No',
-            'Sí' if producto.control_por_lote else 'No',
-            'Sí' if producto.control_por_serie else 'No',
-            producto.fecha_vencimiento.strftime('%d-%m-%Y') if producto.fecha_vencimiento else '',
-            creado_por,
-        ])
-
-    # --- Hojas de usuarios por rol ---
-    perfiles = UserProfile.objects.select_related('user', 'organization').order_by('role', 'user__username')
-    roles_definidos = dict(UserProfile.ROLE_CHOICES)
-
-    for valor_rol, etiqueta in UserProfile.ROLE_CHOICES:
-        perfiles_rol = [perfil for perfil in perfiles if perfil.role == valor_rol]
-        if not perfiles_rol:
-            continue
-
-        nombre_hoja = f"Usuarios {etiqueta}"
-        if len(nombre_hoja) > 31:
-            nombre_hoja = nombre_hoja[:28] + '...'
-
-        ws_rol = wb.create_sheet(title=nombre_hoja)
-        ws_rol.append([
-            'Username', 'Email', 'Nombres', 'Apellidos', 'Rol', 'Estado',
-            'MFA Habilitado', 'Organización', 'Teléfono', 'Área / Unidad',
-            'Observaciones', 'Último acceso'
-        ])
-
-        for perfil in perfiles_rol:
-            usuario = perfil.user
-            last_login = usuario.last_login
-            if last_login and timezone.is_naive(last_login):
-                last_login_display = last_login.strftime('%d-%m-%Y %H:%M')
-            elif last_login:
-                last_login_display = timezone.localtime(last_login).strftime('%d-%m-%Y %H:%M')
-            else:
-                last_login_display = ''
-
-            ws_rol.append([
-                usuario.username,
-                usuario.email,
-                usuario.first_name,
-                usuario.last_name,
-                roles_definidos.get(perfil.role, perfil.role),
-                perfil.get_state_display(),
-                'Sí' if perfil.mfa_enabled else 'No',
-                perfil.organization.name if perfil.organization else '',
-                perfil.phone,
-                perfil.area,
-                perfil.observaciones,
-                last_login_display,
-            ])
-
-    # --- Hoja de movimientos ---
-    ws_mov = wb.create_sheet(title='Movimientos')
-    ws_mov.append([
-        'Fecha', 'Tipo', 'SKU', 'Producto', 'Proveedor', 'Bodega', 'Cantidad',
-        'Lote', 'Serie', 'Fecha Vencimiento', 'Doc. Referencia', 'Motivo',
-        'Observaciones', 'Creado Por'
-    ])
-
-    movimientos = MovimientoInventario.objects.select_related(
-        'producto', 'proveedor', 'bodega', 'creado_por'
-    ).order_by('-fecha')
-
-    for mov in movimientos:
-        fecha_mov = mov.fecha
-        if fecha_mov and timezone.is_naive(fecha_mov):
-            fecha_mov_display = fecha_mov.strftime('%d-%m-%Y %H:%M')
-        elif fecha_mov:
-            fecha_mov_display = timezone.localtime(fecha_mov).strftime('%d-%m-%Y %H:%M')
-        else:
-            fecha_mov_display = ''
-
-        creado_por = mov.creado_por.get_full_name() if mov.creado_por else ''
-        if not creado_por and mov.creado_por:
-            creado_por = mov.creado_por.username
-
-        ws_mov.append([
-            fecha_mov_display,
-            mov.get_tipo_display(),
-            mov.producto.sku if mov.producto else '',
-            mov.producto.name if mov.producto else '',
-            mov.proveedor.razon_social if mov.proveedor else '',
-            mov.bodega.codigo if mov.bodega else '',
-            mov.cantidad,
-            mov.lote,
-            mov.serie,
-            mov.fecha_vencimiento.strftime('%d-%m-%Y') if mov.fecha_vencimiento else '',
-            mov.doc_referencia,
-            mov.motivo,
-            mov.observaciones,
-            creado_por,
-        ])
-
-    # Preparar respuesta HTTP
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    current_time = timezone.now()
-    if timezone.is_naive(current_time):
-        timestamp_str = current_time.strftime('%Y%m%d_%H%M%S')
-    else:
-        timestamp_str = timezone.localtime(current_time).strftime('%Y%m%d_%H%M%S')
-
-    wb.save(response)
-    response['Content-Disposition'] = f'attachment; filename="reporte_inventario_{timestamp_str}.xlsx"'
-    return response
+    # El libro lo genera el worker de exportaciones; el usuario lo descarga desde "Mis exportaciones"
+    encolar_exportacion('inventario', request.user, f'reporte_inventario_{timezone.localtime():%Y%m%d_%H%M%S}.xlsx')
+    messages.info(request, 'El reporte de inventario se está generando. Podrás descargarlo desde "Mis exportaciones".')
+    return redirect('exportaciones_list')
 
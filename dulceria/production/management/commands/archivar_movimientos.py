@@ -0,0 +1,70 @@
+"""
+Comando para trasladar movimientos antiguos a la tabla de archivo (MovimientoArchivado)
+
+Solo archiva movimientos cubiertos por un snapshot de stock (ver
+snapshot_stock). Programar con cron después del snapshot nocturno, por ejemplo:
+    30 0 * * 0 python manage.py archivar_movimientos
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from production.inventory_archivo import TAMANO_LOTE, archivar_movimientos
+from production.inventory_snapshots import fin_del_dia, ultimo_snapshot
+from production.models import MovimientoInventario
+
+
+class Command(BaseCommand):
+    help = 'Traslada al archivo los movimientos con más de N días ya cubiertos por un snapshot de stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=None,
+            help='Antigüedad mínima en días (default: ARCHIVO_MOVIMIENTOS_DIAS)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=TAMANO_LOTE,
+            help=f'Movimientos trasladados por transacción (default: {TAMANO_LOTE})'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo informar cuántos movimientos se archivarían'
+        )
+
+    def handle(self, *args, **options):
+        dias = options['dias'] if options['dias'] is not None else getattr(settings, 'ARCHIVO_MOVIMIENTOS_DIAS', 365)
+        if dias < 1:
+            raise CommandError('--dias debe ser al menos 1.')
+        if options['lote'] < 1:
+            raise CommandError('--lote debe ser al menos 1.')
+
+        if options['dry_run']:
+            snapshot = ultimo_snapshot(timezone.localdate() - timedelta(days=dias))
+            if snapshot is None:
+                self.stdout.write(self.style.WARNING('⚠️ No hay snapshot de stock anterior al corte: no se archivaría nada'))
+                return
+            pendientes = MovimientoInventario.objects.filter(fecha__lt=fin_del_dia(snapshot)).count()
+            self.stdout.write(f'  Se archivarían {pendientes} movimientos hasta el cierre del {snapshot:%d/%m/%Y} (dry-run)')
+            return
+
+        inicio = time.perf_counter()
+
+        def progreso(total):
+            self.stdout.write(f'  {total} movimientos archivados...')
+
+        total, snapshot = archivar_movimientos(dias=dias, lote=options['lote'], progreso=progreso)
+        duracion = time.perf_counter() - inicio
+        if snapshot is None:
+            self.stdout.write(self.style.WARNING('⚠️ No hay snapshot de stock anterior al corte: no se archivó nada'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {total} movimientos archivados hasta el cierre del {snapshot:%d/%m/%Y} en {duracion:.1f}s'
+        ))
@@ -0,0 +1,104 @@
+"""
+Benchmark de la caché de filas (ver production.cache_utils.CacheFilas)
+
+Llama N veces a la vista de categorías (categories_overview) con la caché
+vacía en la primera llamada, y reporta la latencia de fallos y aciertos, las
+consultas SQL de datos hechas en los aciertos (deben ser 0: solo quedan las
+de sesión y usuario) y las estadísticas de la caché de filas. También mide
+cache_query sin `campos` (instancias de Product reconstruidas con from_db).
+"""
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from production.cache_utils import ETIQUETA_PRODUCTOS, cache_filas, cache_query
+from production.models import Product
+from production.views import categories_overview
+
+
+# Tablas que la vista consulta para autenticar y resolver el rol (no son datos de la vista)
+TABLAS_AUTENTICACION = ('django_session', 'auth_user', 'accounts_userprofile', 'accounts_cliente', 'auth_permission')
+
+
+def _consultas_de_datos(capturadas):
+    return [
+        consulta['sql'] for consulta in capturadas
+        if not any(tabla in consulta['sql'] for tabla in TABLAS_AUTENTICACION)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Mide aciertos y fallos de la caché de filas en la vista de categorías y en cache_query'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeticiones', type=int, default=200, help='Llamadas a la vista (default: 200)')
+        parser.add_argument('--usuario', default=None, help='Usuario con el que se llama a la vista (default: primer superusuario)')
+
+    def handle(self, *args, **options):
+        repeticiones = options['repeticiones']
+        if repeticiones < 2:
+            raise CommandError('--repeticiones debe ser al menos 2.')
+
+        filtro = {'username': options['usuario']} if options['usuario'] else {'is_superuser': True}
+        usuario = User.objects.select_related('userprofile').filter(**filtro).first()
+        if usuario is None:
+            raise CommandError('No se encontró el usuario para llamar a la vista.')
+
+        fabrica = RequestFactory()
+        cache.clear()
+        cache_filas.reiniciar_estadisticas()
+
+        tiempos, consultas_datos = [], []
+        for _ in range(repeticiones):
+            request = fabrica.get('/categories/')
+            SessionMiddleware(lambda r: None).process_request(request)
+            request.user = usuario
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                respuesta = categories_overview(request)
+                tiempos.append(time.perf_counter() - inicio)
+            if respuesta.status_code != 200:
+                raise CommandError(f'La vista respondió {respuesta.status_code}.')
+            consultas_datos.append(len(_consultas_de_datos(capturadas.captured_queries)))
+
+        aciertos = tiempos[1:]
+        self.stdout.write(f'Vista de categorías ({repeticiones} llamadas):')
+        self.stdout.write(f'  fallo (1ª llamada): {tiempos[0] * 1000:.2f} ms, {consultas_datos[0]} consultas de datos')
+        self.stdout.write(
+            f'  aciertos: p50 {statistics.median(aciertos) * 1000:.2f} ms, máx {max(aciertos) * 1000:.2f} ms, '
+            f'{max(consultas_datos[1:])} consultas de datos como máximo'
+        )
+
+        # cache_query sin campos: instancias completas de Product sin consultar en el acierto
+        def productos():
+            return Product.objects.filter(is_active=True).order_by('name')
+
+        inicio = time.perf_counter()
+        cache_query('bench_cache_filas_productos', productos, etiquetas=[ETIQUETA_PRODUCTOS])
+        fallo = time.perf_counter() - inicio
+        with CaptureQueriesContext(connection) as capturadas:
+            inicio = time.perf_counter()
+            instancias = cache_query('bench_cache_filas_productos', productos, etiquetas=[ETIQUETA_PRODUCTOS])
+            acierto = time.perf_counter() - inicio
+            # Acceder a los campos no debe consultar (no hay campos diferidos)
+            sum(producto.stock for producto in instancias)
+        self.stdout.write(
+            f'cache_query de {len(instancias)} productos: fallo {fallo * 1000:.2f} ms, '
+            f'acierto {acierto * 1000:.2f} ms, {len(capturadas)} consultas en el acierto'
+        )
+
+        estadisticas = cache_filas.estadisticas()
+        self.stdout.write(
+            f'Estadísticas: {estadisticas["aciertos"]} aciertos, {estadisticas["fallos"]} fallos, '
+            f'{estadisticas["omitidos"]} omitidos por tamaño (tasa {estadisticas["tasa_aciertos"]:.1%})'
+        )
+        if max(consultas_datos[1:]) or len(capturadas):
+            raise CommandError('Hubo consultas a la base de datos en aciertos de la caché.')
+        self.stdout.write(self.style.SUCCESS('✅ Aciertos sin consultas SQL de datos'))
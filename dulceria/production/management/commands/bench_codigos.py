@@ -0,0 +1,99 @@
+"""
+Benchmark de la consulta por código de barras (ver production.inventory_codigos)
+
+Simula N escaneos en caja con códigos EAN/UPC y SKU de productos indexados
+(y una fracción de códigos inexistentes) y reporta la latencia por consulta
+(p50, p95, p99 y máximo) del índice y de la vista JSON completa, además de
+las consultas a la base de datos hechas durante los escaneos (deben ser 0).
+"""
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from production.inventory_codigos import buscar_codigo, indice
+from production.inventory_views import producto_por_codigo_api
+from production.models import Product
+
+
+def _percentiles(tiempos):
+    tiempos = sorted(tiempos)
+    ultimo = len(tiempos) - 1
+    return {p: tiempos[min(ultimo, int(len(tiempos) * p / 100))] * 1000 for p in (50, 95, 99)} | {'max': tiempos[-1] * 1000}
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia de N consultas por código de barras contra el índice en memoria y la vista JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escaneos', type=int, default=10000, help='Número de escaneos (default: 10000)')
+        parser.add_argument('--inexistentes', type=float, default=0.05, help='Fracción de códigos inexistentes (default: 0.05)')
+        parser.add_argument('--usuario', default=None, help='Usuario con el que se llama a la vista (default: primer superusuario)')
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla para elegir los códigos (default: 42)')
+
+    def handle(self, *args, **options):
+        escaneos = options['escaneos']
+        if escaneos <= 0:
+            raise CommandError('--escaneos debe ser mayor que cero.')
+
+        filtro = {'username': options['usuario']} if options['usuario'] else {'is_superuser': True}
+        usuario = User.objects.select_related('userprofile').filter(**filtro).first()
+        if usuario is None:
+            raise CommandError('No se encontró el usuario para llamar a la vista.')
+
+        codigos = []
+        for sku, ean in Product.objects.filter(is_active=True, estado_aprobacion='APROBADO').values_list('sku', 'ean_upc'):
+            codigos.append(sku)
+            if ean:
+                codigos.append(ean)
+        if not codigos:
+            raise CommandError('No hay productos activos y aprobados para consultar.')
+
+        azar = random.Random(options['semilla'])
+        muestra = [
+            f'NOEXISTE-{i}' if azar.random() < options['inexistentes'] else azar.choice(codigos)
+            for i in range(escaneos)
+        ]
+
+        inicio = time.perf_counter()
+        productos = len(indice)
+        carga = time.perf_counter() - inicio
+        self.stdout.write(f'Productos indexados: {productos} ({len(codigos)} códigos), carga inicial {carga * 1000:.1f} ms')
+
+        factory = RequestFactory()
+        tiempos_indice, tiempos_vista = [], []
+        encontrados = 0
+        with CaptureQueriesContext(connection) as consultas:
+            for codigo in muestra:
+                t0 = time.perf_counter()
+                if buscar_codigo(codigo) is not None:
+                    encontrados += 1
+                tiempos_indice.append(time.perf_counter() - t0)
+
+            for codigo in muestra:
+                request = factory.get('/inventario/api/codigo/', {'codigo': codigo})
+                request.user = usuario
+                t0 = time.perf_counter()
+                respuesta = producto_por_codigo_api(request)
+                tiempos_vista.append(time.perf_counter() - t0)
+                if respuesta.status_code not in (200, 404):
+                    raise CommandError(f'Respuesta inesperada {respuesta.status_code} para {codigo}')
+
+        self.stdout.write(f'Escaneos:            {escaneos} ({encontrados} encontrados)')
+        for nombre, tiempos in (('Índice', tiempos_indice), ('Vista JSON', tiempos_vista)):
+            p = _percentiles(tiempos)
+            self.stdout.write(
+                f'{nombre + ":":<20} media {statistics.fmean(tiempos) * 1000:.4f} ms | p50 {p[50]:.4f} ms | '
+                f'p95 {p[95]:.4f} ms | p99 {p[99]:.4f} ms | máx {p["max"]:.4f} ms'
+            )
+        self.stdout.write(f'Consultas a la BD:   {len(consultas.captured_queries)}')
+
+        if _percentiles(tiempos_vista)[99] < 2 and not consultas.captured_queries:
+            self.stdout.write(self.style.SUCCESS('✅ p99 bajo 2 ms y sin consultas a la base de datos'))
+        else:
+            self.stdout.write(self.style.WARNING('⚠️ No se cumplió el objetivo (p99 < 2 ms sin consultas a la BD)'))
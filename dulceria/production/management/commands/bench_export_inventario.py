@@ -0,0 +1,60 @@
+"""
+Benchmark del reporte de inventario en Excel
+
+Escribe el reporte completo (productos, usuarios y movimientos) en un archivo
+temporal y reporta filas por segundo y el pico de memoria residente (RSS)
+del proceso, muestreado en un hilo aparte mientras se genera.
+"""
+import os
+import tempfile
+import threading
+import time
+
+import psutil
+from django.core.management.base import BaseCommand
+
+from production.inventory_export import escribir_reporte_inventario
+
+
+class Command(BaseCommand):
+    help = 'Genera el reporte de inventario en Excel y reporta filas/segundo y pico de RSS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, default=0.05, help='Segundos entre muestras de RSS (default: 0.05)')
+        parser.add_argument('--conservar', metavar='RUTA', help='Guardar el archivo generado en RUTA en vez de descartarlo')
+
+    def handle(self, *args, **options):
+        proceso = psutil.Process(os.getpid())
+        rss_inicial = proceso.memory_info().rss
+        pico = {'rss': rss_inicial}
+        terminado = threading.Event()
+
+        def muestrear():
+            while not terminado.wait(options['intervalo']):
+                pico['rss'] = max(pico['rss'], proceso.memory_info().rss)
+
+        muestreador = threading.Thread(target=muestrear, daemon=True)
+        muestreador.start()
+
+        inicio = time.perf_counter()
+        if options['conservar']:
+            filas = escribir_reporte_inventario(options['conservar'])
+            tamano = os.path.getsize(options['conservar'])
+        else:
+            with tempfile.TemporaryFile(suffix='.xlsx') as archivo:
+                filas = escribir_reporte_inventario(archivo)
+                tamano = archivo.tell()
+        duracion = time.perf_counter() - inicio
+
+        terminado.set()
+        muestreador.join()
+        pico['rss'] = max(pico['rss'], proceso.memory_info().rss)
+
+        mb = 1024 * 1024
+        self.stdout.write(f'Filas escritas:   {filas}')
+        self.stdout.write(f'Duración:         {duracion:.2f}s')
+        self.stdout.write(f'Filas/segundo:    {filas / duracion:,.0f}' if duracion else 'Filas/segundo:    -')
+        self.stdout.write(f'Archivo:          {tamano / mb:.1f} MB')
+        self.stdout.write(f'RSS inicial:      {rss_inicial / mb:.1f} MB')
+        self.stdout.write(f'RSS pico:         {pico["rss"] / mb:.1f} MB (+{(pico["rss"] - rss_inicial) / mb:.1f} MB)')
+        self.stdout.write(self.style.SUCCESS('✅ Benchmark completado'))
@@ -0,0 +1,134 @@
+"""
+Benchmark de concurrencia para los movimientos de inventario
+
+Lanza N hilos que registran movimientos sobre un mismo producto y verifica
+que el stock final coincide exactamente con la suma de los movimientos.
+"""
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, transaction, OperationalError
+from django.utils import timezone
+
+from production.inventory_contadores import reconciliar_contadores
+from production.models import Bodega, Category, MovimientoInventario, Product, StockInsuficienteError
+
+# Intentos por movimiento cuando la base está bloqueada
+MAX_INTENTOS = 50
+
+
+class Command(BaseCommand):
+    help = 'Registra movimientos concurrentes sobre un producto y verifica que el stock final sea exacto'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8, help='Número de hilos concurrentes (default: 8)')
+        parser.add_argument('--movimientos', type=int, default=50, help='Movimientos por hilo (default: 50)')
+        parser.add_argument('--stock-inicial', type=int, default=100, help='Stock inicial del producto de prueba (default: 100)')
+        parser.add_argument('--conservar', action='store_true', help='No eliminar el producto ni los movimientos de prueba')
+
+    def handle(self, *args, **options):
+        num_hilos = options['hilos']
+        por_hilo = options['movimientos']
+
+        bodega = Bodega.objects.filter(is_active=True).first()
+        categoria = Category.objects.first()
+        if not bodega or not categoria:
+            raise CommandError('Se necesita al menos una bodega y una categoría. Ejecuta create_bodegas y create_categorias_dulces.')
+        usuario = User.objects.filter(is_superuser=True).first()
+
+        producto = Product.objects.create(
+            name=f'Benchmark concurrencia {timezone.now():%Y%m%d%H%M%S}',
+            category=categoria,
+            stock=options['stock_inicial'],
+            estado_aprobacion='APROBADO',
+        )
+        self.stdout.write(f'Producto de prueba: {producto}')
+
+        # Cada hilo alterna ingresos de 2 unidades y salidas de 1 unidad
+        resultados = {'aplicados': 0, 'esperado': 0, 'rechazados': 0, 'reintentos': 0, 'fallidos': 0}
+        lock = threading.Lock()
+
+        def trabajador(indice):
+            close_old_connections()
+            aplicados = esperado = rechazados = reintentos = fallidos = 0
+            try:
+                for i in range(por_hilo):
+                    tipo, cantidad = ('ingreso', 2) if i % 2 == 0 else ('salida', 1)
+                    movimiento = MovimientoInventario(
+                        fecha=timezone.now(),
+                        tipo=tipo,
+                        producto_id=producto.pk,
+                        bodega=bodega,
+                        cantidad=Decimal(cantidad),
+                        creado_por=usuario,
+                        doc_referencia=f'BENCH-{indice}-{i}',
+                    )
+                    for _ in range(MAX_INTENTOS):
+                        confirmado = []
+                        try:
+                            with transaction.atomic():
+                                # Primer callback tras el commit: distingue una falla antes del commit de una posterior
+                                transaction.on_commit(lambda: confirmado.append(True))
+                                movimiento.save()
+                        except StockInsuficienteError:
+                            rechazados += 1
+                        except OperationalError:
+                            if confirmado:
+                                # El movimiento quedó registrado: no se vuelve a insertar
+                                aplicados += 1
+                                esperado += movimiento.delta_stock()
+                                break
+                            # SQLite serializa escrituras: la transacción se revirtió y se puede reintentar
+                            reintentos += 1
+                            movimiento.pk = None
+                            movimiento._state.adding = True
+                            time.sleep(0.01)
+                            continue
+                        else:
+                            aplicados += 1
+                            esperado += movimiento.delta_stock()
+                        break
+                    else:
+                        fallidos += 1
+            finally:
+                connection.close()
+            with lock:
+                resultados['aplicados'] += aplicados
+                resultados['esperado'] += esperado
+                resultados['rechazados'] += rechazados
+                resultados['reintentos'] += reintentos
+                resultados['fallidos'] += fallidos
+
+        hilos = [threading.Thread(target=trabajador, args=(n,)) for n in range(num_hilos)]
+        inicio = time.perf_counter()
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        duracion = time.perf_counter() - inicio
+
+        producto.refresh_from_db(fields=['stock'])
+        stock_esperado = options['stock_inicial'] + resultados['esperado']
+        total = resultados['aplicados'] + resultados['rechazados'] + resultados['fallidos']
+
+        self.stdout.write(
+            f'Hilos: {num_hilos} | Movimientos: {total} | Rechazados por stock: {resultados["rechazados"]} '
+            f'| Reintentos: {resultados["reintentos"]} | Sin registrar tras {MAX_INTENTOS} intentos: {resultados["fallidos"]}'
+        )
+        self.stdout.write(f'Duración: {duracion:.2f}s ({total / duracion if duracion else 0:.0f} movimientos/s)')
+        self.stdout.write(f'Stock final: {producto.stock} | Stock esperado: {stock_esperado}')
+
+        if not options['conservar']:
+            # Uno a uno y del último al primero: delete() revierte StockBodega, snapshots y contadores
+            for movimiento in MovimientoInventario.objects.filter(producto=producto).order_by('-fecha', '-pk'):
+                movimiento.delete()
+            producto.delete()
+            # Sumas de contadores que no alcanzaron a aplicarse durante la carga
+            reconciliar_contadores(dias=1)
+
+        if producto.stock != stock_esperado:
+            raise CommandError('El stock final no coincide: se perdieron actualizaciones concurrentes.')
+        self.stdout.write(self.style.SUCCESS('✅ Stock final exacto'))
@@ -0,0 +1,42 @@
+"""
+Comando para generar las miniaturas y versiones WebP de las imágenes ya subidas
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import UserProfile
+from production.imagenes import actualizar_derivados
+from production.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Genera los derivados (miniaturas en varios anchos y WebP) de las imágenes de productos y avatares existentes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--forzar',
+            action='store_true',
+            help='Regenerar también las imágenes que ya tienen derivados (por ejemplo, tras cambiar IMAGENES_ANCHOS)'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        fuentes = [
+            ('productos', Product.objects.exclude(imagen='').exclude(imagen__isnull=True), 'imagen', 'imagen_derivados'),
+            ('avatares', UserProfile.objects.exclude(avatar='').exclude(avatar__isnull=True), 'avatar', 'avatar_derivados'),
+        ]
+        for nombre, queryset, campo, campo_derivados in fuentes:
+            generados = fallidos = 0
+            for instancia in queryset.only('pk', campo, campo_derivados).iterator(chunk_size=200):
+                if not actualizar_derivados(instancia, campo, campo_derivados, forzar=options['forzar']):
+                    continue
+                if getattr(instancia, campo_derivados):
+                    generados += 1
+                else:
+                    fallidos += 1
+                    self.stdout.write(self.style.WARNING(f'⚠️ No se pudo procesar {getattr(instancia, campo).name}'))
+            self.stdout.write(f'{nombre}: {generados} con derivados nuevos, {fallidos} sin procesar')
+
+        duracion = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f'✅ Derivados de imágenes generados en {duracion:.1f}s'))
@@ -0,0 +1,66 @@
+"""
+Comando para importar movimientos de inventario de forma masiva desde CSV o XLSX
+"""
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from production.inventory_import import ErrorImportacion, importar_movimientos, leer_filas, validar_filas
+from production.models import StockInsuficienteError
+
+
+class Command(BaseCommand):
+    help = 'Importa movimientos de inventario desde un archivo CSV o XLSX (validación completa antes de escribir)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta al archivo .csv o .xlsx')
+        parser.add_argument(
+            '--usuario',
+            help='Username que quedará como creador de los movimientos (default: primer superusuario)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Movimientos por INSERT masivo (default: 2000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo validar el archivo, sin importar'
+        )
+
+    def handle(self, *args, **options):
+        ruta = options['archivo']
+        if options['usuario']:
+            usuario = User.objects.filter(username=options['usuario']).first()
+            if not usuario:
+                raise CommandError(f'No existe el usuario "{options["usuario"]}"')
+        else:
+            usuario = User.objects.filter(is_superuser=True).first()
+
+        inicio = time.perf_counter()
+        try:
+            with open(ruta, 'rb') as archivo:
+                filas = leer_filas(archivo, ruta)
+                if options['dry_run']:
+                    total = len(validar_filas(filas))
+                else:
+                    total = importar_movimientos(filas, usuario=usuario, chunk_size=options['chunk_size'])
+        except FileNotFoundError:
+            raise CommandError(f'No existe el archivo "{ruta}"')
+        except ErrorImportacion as e:
+            for error in e.errores:
+                self.stdout.write(self.style.ERROR(error))
+            raise CommandError('El archivo contiene errores. No se importó ningún movimiento.')
+        except StockInsuficienteError as e:
+            raise CommandError(f'{e.messages[0]} No se importó ningún movimiento.')
+        duracion = time.perf_counter() - inicio
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'✅ {total} movimientos válidos (dry-run, no se importó nada)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f'✅ {total} movimientos importados en {duracion:.1f}s ({total / duracion if duracion else 0:.0f} filas/s)'
+            ))
@@ -0,0 +1,29 @@
+"""
+Eliminar las claves de idempotencia vencidas (ver production.inventory_idempotencia)
+
+Las claves solo sirven mientras un reenvío es posible. Para mantener la tabla
+pequeña, programarlo con cron, por ejemplo cada hora:
+    0 * * * * python manage.py limpiar_claves_idempotencia
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from production.inventory_idempotencia import limpiar_claves
+
+
+class Command(BaseCommand):
+    help = 'Elimina las claves de idempotencia de movimientos más antiguas que IDEMPOTENCIA_HORAS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--horas',
+            type=int,
+            default=None,
+            help='Antigüedad mínima en horas de las claves a eliminar (default: IDEMPOTENCIA_HORAS)'
+        )
+
+    def handle(self, *args, **options):
+        horas = options['horas']
+        if horas is not None and horas < 0:
+            raise CommandError('--horas no puede ser negativo.')
+        eliminadas = limpiar_claves(horas)
+        self.stdout.write(self.style.SUCCESS(f'{eliminadas} claves de idempotencia eliminadas.'))
@@ -0,0 +1,75 @@
+"""
+Worker de exportaciones en segundo plano (ver production.export_jobs)
+
+Con EXPORTACIONES_WORKER=comando las vistas solo encolan; este comando
+procesa la cola en un proceso aparte, por ejemplo con systemd o supervisor:
+    python manage.py procesar_exportaciones
+
+Para limpiar exportaciones antiguas con cron, una vez al día:
+    0 3 * * * python manage.py procesar_exportaciones --una-vez --limpiar
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from production.export_jobs import limpiar_exportaciones, marcar_interrumpidos, procesar_siguiente
+
+
+class Command(BaseCommand):
+    help = 'Procesa las exportaciones a Excel pendientes; por defecto queda esperando nuevos trabajos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--una-vez',
+            action='store_true',
+            help='Procesar los trabajos pendientes y terminar'
+        )
+        parser.add_argument(
+            '--intervalo',
+            type=float,
+            default=2.0,
+            help='Segundos entre revisiones de la cola cuando está vacía (default: 2)'
+        )
+        parser.add_argument(
+            '--tiempo-maximo',
+            type=int,
+            default=3600,
+            help='Segundos tras los cuales un trabajo en proceso se da por interrumpido (default: 3600)'
+        )
+        parser.add_argument(
+            '--limpiar',
+            action='store_true',
+            help='Eliminar exportaciones terminadas hace más de EXPORTACIONES_DIAS_RETENCION días'
+        )
+
+    def handle(self, *args, **options):
+        if options['intervalo'] <= 0:
+            raise CommandError('--intervalo debe ser mayor que cero.')
+
+        if options['limpiar']:
+            dias = getattr(settings, 'EXPORTACIONES_DIAS_RETENCION', 7)
+            eliminados = limpiar_exportaciones(dias)
+            self.stdout.write(f'  Exportaciones eliminadas (más de {dias} días): {eliminados}')
+
+        interrumpidos = marcar_interrumpidos(options['tiempo_maximo'])
+        if interrumpidos:
+            self.stdout.write(self.style.WARNING(f'  Trabajos interrumpidos marcados con error: {interrumpidos}'))
+
+        procesados = 0
+        try:
+            while True:
+                if procesar_siguiente():
+                    procesados += 1
+                    self.stdout.write(f'  Exportaciones procesadas: {procesados}')
+                    continue
+                if options['una_vez']:
+                    break
+                close_old_connections()
+                time.sleep(options['intervalo'])
+                marcar_interrumpidos(options['tiempo_maximo'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'✅ {procesados} exportaciones procesadas'))
@@ -0,0 +1,99 @@
+"""
+Comando para reconstruir Product.costo_promedio desde el historial de movimientos
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from production.inventory_archivo import recorrer_historial
+from production.inventory_kardex import expresion_delta_stock
+from production.models import MovimientoArchivado, MovimientoInventario, Product, ProductoProveedor, promedio_ponderado
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el costo promedio ponderado de todos los productos recorriendo una sola vez el historial de movimientos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Movimientos leídos por lote desde la base de datos (default: 5000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Solo informar cuántos productos cambiarían, sin guardar'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+
+        # Stock de apertura = stock vigente menos el neto de todos sus movimientos, activos y archivados
+        # (una consulta agrupada por tabla)
+        netos = {}
+        for modelo in (MovimientoInventario, MovimientoArchivado):
+            for producto_id, neto in modelo.objects.order_by().values('producto_id').annotate(
+                neto=Sum(expresion_delta_stock())
+            ).values_list('producto_id', 'neto'):
+                netos[producto_id] = netos.get(producto_id, 0) + (neto or 0)
+        productos = {
+            producto_id: (stock - (netos.get(producto_id) or 0), costo_estandar, costo_promedio)
+            for producto_id, stock, costo_estandar, costo_promedio in Product.objects.values_list(
+                'id', 'stock', 'costo_estandar', 'costo_promedio'
+            ).iterator(chunk_size=options['chunk_size'])
+        }
+        # Ingresos históricos sin costo registrado se valorizan al costo pactado con el proveedor
+        costos_proveedor = {
+            (producto_id, proveedor_id): costo
+            for producto_id, proveedor_id, costo in ProductoProveedor.objects.values_list('product_id', 'proveedor_id', 'costo')
+        }
+
+        movimientos = recorrer_historial(
+            ('producto_id', 'fecha', 'id'),
+            ('producto_id', 'tipo', 'proveedor_id', 'cantidad', 'costo_unitario'),
+            chunk_size=options['chunk_size'],
+        )
+
+        cambios = {}
+        actual_id = None
+        stock = promedio = None
+        valorizado = False
+        total = 0
+
+        def cerrar_producto():
+            if actual_id is not None and valorizado and promedio != productos[actual_id][2]:
+                cambios[actual_id] = promedio
+
+        for producto_id, tipo, proveedor_id, cantidad, costo in movimientos:
+            if producto_id != actual_id:
+                cerrar_producto()
+                actual_id = producto_id
+                stock, promedio, _ = productos[producto_id]
+                valorizado = False
+            delta = MovimientoInventario.calcular_efectos(tipo, producto_id, None, None, '', cantidad)[0]
+            if tipo == 'ingreso' and delta > 0:
+                if costo is None:
+                    costo = costos_proveedor.get((producto_id, proveedor_id))
+                if costo is not None:
+                    promedio = promedio_ponderado(stock, promedio, delta, costo)
+                    valorizado = True
+            stock += delta
+            total += 1
+        cerrar_producto()
+
+        if not options['dry_run']:
+            with transaction.atomic():
+                Product.objects.bulk_update(
+                    [Product(pk=producto_id, costo_promedio=promedio) for producto_id, promedio in cambios.items()],
+                    ['costo_promedio'],
+                    batch_size=500,
+                )
+
+        duracion = time.perf_counter() - inicio
+        accion = 'cambiarían (dry-run)' if options['dry_run'] else 'actualizados'
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {len(cambios)} costos promedio {accion} desde {total} movimientos en {duracion:.1f}s'
+        ))
@@ -0,0 +1,22 @@
+"""
+Comando para reconstruir la proyección StockBodega desde el historial de movimientos
+"""
+from django.core.management.base import BaseCommand
+
+from production.models import reconstruir_stock_bodega
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el stock por bodega (StockBodega) recorriendo una sola vez el historial de movimientos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Movimientos leídos por lote desde la base de datos (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        filas, total = reconstruir_stock_bodega(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'✅ {filas} saldos por bodega reconstruidos desde {total} movimientos'))
@@ -0,0 +1,24 @@
+"""
+Comando para recalcular los contadores precalculados del dashboard de inventario
+"""
+from django.core.management.base import BaseCommand
+
+from production.inventory_contadores import reconciliar_contadores
+
+
+class Command(BaseCommand):
+    help = 'Recalcula stock total, productos con stock y movimientos por día, y corrige los contadores desviados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=7,
+            help='Días hacia atrás (incluido hoy) cuyos contadores de movimientos se recalculan (default: 7)'
+        )
+
+    def handle(self, *args, **options):
+        desviados = reconciliar_contadores(dias=options['dias'])
+        for clave, (guardado, correcto) in sorted(desviados.items()):
+            self.stdout.write(f'  {clave}: {guardado if guardado is not None else "(sin registro)"} -> {correcto}')
+        self.stdout.write(self.style.SUCCESS(f'✅ Contadores reconciliados ({len(desviados)} corregidos)'))
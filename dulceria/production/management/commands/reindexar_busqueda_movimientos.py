@@ -0,0 +1,36 @@
+"""
+Comando para recalcular el índice de búsqueda de movimientos de inventario
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from production.inventory_busqueda import asegurar_indice_busqueda, reindexar_busqueda_movimientos
+from production.models import MovimientoArchivado, MovimientoInventario
+
+
+class Command(BaseCommand):
+    help = 'Recalcula texto_busqueda de todos los movimientos (también los archivados) y reconstruye el índice FULLTEXT (MySQL) o FTS5 (SQLite)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Movimientos procesados por lote (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        actualizados = sum(
+            reindexar_busqueda_movimientos(modelo.objects.all(), chunk_size=options['chunk_size'])
+            for modelo in (MovimientoInventario, MovimientoArchivado)
+        )
+        indice = asegurar_indice_busqueda(reconstruir=True)
+        duracion = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {actualizados} textos de búsqueda actualizados en {duracion:.1f}s'
+        ))
+        if not indice:
+            self.stdout.write(self.style.WARNING('⚠️ El motor no tiene índice de texto: la búsqueda usará LIKE sobre texto_busqueda'))
@@ -0,0 +1,36 @@
+"""
+Comando para recalcular el índice de búsqueda de productos
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from production.busqueda_productos import asegurar_indice_productos, reindexar_busqueda_productos
+from production.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los textos de búsqueda de todos los productos y reconstruye el índice FULLTEXT (MySQL), FTS5 (SQLite) o invertido (otros motores)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Productos procesados por lote (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        # Primero el índice del motor (si falta, sus triggers quedan activos antes de actualizar los textos)
+        indice = asegurar_indice_productos(reconstruir=True)
+        actualizados = reindexar_busqueda_productos(
+            Product.objects.all(), chunk_size=options['chunk_size'], terminos=not indice,
+        )
+        duracion = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✅ {actualizados} textos de búsqueda de productos actualizados en {duracion:.1f}s'
+        ))
+        if not indice:
+            self.stdout.write(self.style.WARNING('⚠️ El motor no tiene índice de texto: la búsqueda usará el índice invertido TerminoProducto'))
@@ -0,0 +1,42 @@
+"""
+Comando para escanear vencimientos próximos y actualizar el panel del dashboard
+
+Programar con cron cada hora, por ejemplo:
+    0 * * * * python manage.py scan_vencimientos --dias 30
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from production.inventory_vencimientos import escanear_vencimientos
+
+
+class Command(BaseCommand):
+    help = 'Guarda en VencimientoProximo los lotes y productos que vencen dentro de N días (incluye vencidos con stock)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=30,
+            help='Horizonte en días desde hoy (default: 30)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='Filas leídas por consulta (default: 2000)'
+        )
+
+    def handle(self, *args, **options):
+        if options['dias'] < 0:
+            raise CommandError('--dias no puede ser negativo.')
+
+        inicio = time.perf_counter()
+        conteo = escanear_vencimientos(dias=options['dias'], chunk_size=options['chunk_size'])
+        duracion = time.perf_counter() - inicio
+
+        self.stdout.write(f"  Lotes en bodega: {conteo['lote']}")
+        self.stdout.write(f"  Productos con fecha de vencimiento: {conteo['producto']}")
+        self.stdout.write(f"  Productos con mes de vencimiento: {conteo['mes']}")
+        self.stdout.write(self.style.SUCCESS(f'✅ Escaneo de vencimientos completado en {duracion:.2f}s'))
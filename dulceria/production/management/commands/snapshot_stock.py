@@ -0,0 +1,44 @@
+"""
+Comando nocturno para guardar los saldos de cierre diarios (StockSnapshot)
+
+Programar con cron poco después de medianoche, por ejemplo:
+    5 0 * * * python manage.py snapshot_stock
+"""
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from production.inventory_snapshots import generar_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Guarda el stock de cierre por producto y por bodega (default: cierre de ayer)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fecha',
+            help='Fecha de cierre en formato YYYY-MM-DD (default: ayer)'
+        )
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=1,
+            help='Cantidad de días hacia atrás a generar terminando en --fecha (default: 1)'
+        )
+
+    def handle(self, *args, **options):
+        if options['fecha']:
+            try:
+                fecha = datetime.strptime(options['fecha'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Formato de fecha inválido. Usa YYYY-MM-DD.')
+        else:
+            fecha = timezone.localdate() - timedelta(days=1)
+
+        for i in range(options['dias'] - 1, -1, -1):
+            dia = fecha - timedelta(days=i)
+            filas = generar_snapshot(dia)
+            self.stdout.write(f'  Cierre {dia:%Y-%m-%d}: {filas} saldos guardados')
+
+        self.stdout.write(self.style.SUCCESS('✅ Snapshots de stock generados'))
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5 on 2026-10-17 10:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0007_add_performance_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientoinventario',
+            name='bodega_destino',
+            field=models.ForeignKey(blank=True, help_text='Solo para transferencias', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movimientos_entrantes', to='production.bodega', verbose_name='Bodega de Destino'),
+        ),
+        migrations.CreateModel(
+            name='StockBodega',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lote', models.CharField(blank=True, default='', max_length=50, verbose_name='Lote')),
+                ('cantidad', models.IntegerField(default=0, verbose_name='Cantidad')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de actualización')),
+                ('bodega', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_productos', to='production.bodega', verbose_name='Bodega')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_bodegas', to='production.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Stock por Bodega',
+                'verbose_name_plural': 'Stock por Bodega',
+                'ordering': ['bodega__codigo', 'producto__name', 'lote'],
+                'indexes': [models.Index(fields=['bodega', 'producto'], name='stockbod_bod_prod_idx')],
+                'constraints': [models.UniqueConstraint(fields=('producto', 'bodega', 'lote'), name='stockbod_prod_bod_lote_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 10:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0008_stockbodega'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha de cierre')),
+                ('cantidad', models.IntegerField(verbose_name='Cantidad')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('bodega', models.ForeignKey(blank=True, help_text='Vacío = stock total del producto', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='production.bodega', verbose_name='Bodega')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='production.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Snapshot de Stock',
+                'verbose_name_plural': 'Snapshots de Stock',
+                'ordering': ['-fecha', 'producto__name'],
+                'indexes': [models.Index(fields=['-fecha'], name='snap_fecha_idx'), models.Index(fields=['producto', 'bodega', '-fecha'], name='snap_prod_bod_fecha_idx')],
+            },
+        ),
+    ]
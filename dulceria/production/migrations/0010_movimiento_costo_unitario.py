@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-17 10:38
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0009_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientoinventario',
+            name='costo_unitario',
+            field=models.DecimalField(blank=True, decimal_places=6, help_text='Costo de compra por unidad (solo ingresos)', max_digits=18, null=True, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Costo Unitario'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0010_movimiento_costo_unitario'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='stockbodega',
+            options={'ordering': ['bodega__codigo', 'producto__name', 'fecha_vencimiento', 'lote'], 'verbose_name': 'Stock por Bodega', 'verbose_name_plural': 'Stock por Bodega'},
+        ),
+        migrations.AddField(
+            model_name='stockbodega',
+            name='fecha_vencimiento',
+            field=models.DateField(blank=True, null=True, verbose_name='Fecha de Vencimiento'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockbodega',
+            constraint=models.UniqueConstraint(fields=('producto', 'bodega', 'fecha_vencimiento', 'lote'), name='stockbod_prod_bod_venc_lote_uniq'),
+        ),
+        # Se elimina después de crear la nueva: en MySQL el índice único respalda la FK de producto
+        migrations.RemoveConstraint(
+            model_name='stockbodega',
+            name='stockbod_prod_bod_lote_uniq',
+        ),
+    ]
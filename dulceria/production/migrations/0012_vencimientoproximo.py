@@ -0,0 +1,54 @@
+# Generated by Django 5.2.5 on 2026-10-17 10:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0011_stockbodega_fecha_vencimiento'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VencimientoProximo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origen', models.CharField(choices=[('lote', 'Lote en bodega'), ('producto', 'Vencimiento del producto'), ('mes', 'Mes de vencimiento')], max_length=10, verbose_name='Origen')),
+                ('lote', models.CharField(blank=True, default='', max_length=50, verbose_name='Lote')),
+                ('fecha_vencimiento', models.DateField(verbose_name='Fecha de Vencimiento')),
+                ('cantidad', models.IntegerField(verbose_name='Cantidad')),
+                ('generado_en', models.DateTimeField(verbose_name='Generado en')),
+            ],
+            options={
+                'verbose_name': 'Vencimiento Próximo',
+                'verbose_name_plural': 'Vencimientos Próximos',
+                'ordering': ['fecha_vencimiento', 'producto__name'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['fecha_vencimiento'], name='prod_venc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockbodega',
+            index=models.Index(fields=['fecha_vencimiento'], name='stockbod_venc_idx'),
+        ),
+        migrations.AddField(
+            model_name='vencimientoproximo',
+            name='bodega',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='vencimientos_proximos', to='production.bodega', verbose_name='Bodega'),
+        ),
+        migrations.AddField(
+            model_name='vencimientoproximo',
+            name='producto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vencimientos_proximos', to='production.product', verbose_name='Producto'),
+        ),
+        migrations.AddIndex(
+            model_name='vencimientoproximo',
+            index=models.Index(fields=['fecha_vencimiento'], name='venc_prox_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-17 10:48
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0012_vencimientoproximo'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimientoinventario',
+            index=models.Index(fields=['-fecha', '-created_at', '-id'], name='mov_fecha_creado_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-17 10:50
+
+from django.db import migrations, models
+
+from production.inventory_busqueda import (
+    asegurar_indice_busqueda, eliminar_indice_busqueda, reindexar_busqueda_movimientos,
+)
+
+
+def poblar_texto_busqueda(apps, schema_editor):
+    """Calcular texto_busqueda de los movimientos existentes"""
+    MovimientoInventario = apps.get_model('production', 'MovimientoInventario')
+    reindexar_busqueda_movimientos(MovimientoInventario.objects.using(schema_editor.connection.alias))
+
+
+def crear_indice(apps, schema_editor):
+    """FULLTEXT en MySQL o FTS5 en SQLite, construido con los textos ya poblados"""
+    asegurar_indice_busqueda(schema_editor, reconstruir=True)
+
+
+def eliminar_indice(apps, schema_editor):
+    eliminar_indice_busqueda(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0013_movimiento_indice_cursor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimientoinventario',
+            name='texto_busqueda',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Texto de búsqueda'),
+        ),
+        migrations.RunPython(poblar_texto_busqueda, reverse_code=migrations.RunPython.noop),
+        migrations.RunPython(crear_indice, reverse_code=eliminar_indice),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-17 10:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0014_movimiento_texto_busqueda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=50, unique=True, verbose_name='Clave')),
+                ('valor', models.BigIntegerField(default=0, verbose_name='Valor')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de actualización')),
+            ],
+            options={
+                'verbose_name': 'Contador de Inventario',
+                'verbose_name_plural': 'Contadores de Inventario',
+                'ordering': ['clave'],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:13
+
+import django.db.models.deletion
+import production.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0015_contadorinventario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrabajoExportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('inventario', 'Reporte de inventario'), ('usuarios', 'Usuarios'), ('modelo_admin', 'Listado del panel de administración')], max_length=20, verbose_name='Tipo')),
+                ('parametros', models.JSONField(blank=True, default=dict, verbose_name='Parámetros')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_proceso', 'En proceso'), ('completado', 'Completado'), ('error', 'Error')], default='pendiente', max_length=20, verbose_name='Estado')),
+                ('progreso', models.IntegerField(default=0, verbose_name='Filas escritas')),
+                ('total', models.IntegerField(blank=True, null=True, verbose_name='Filas estimadas')),
+                ('archivo', models.FileField(blank=True, max_length=255, upload_to=production.models.ruta_exportacion, verbose_name='Archivo')),
+                ('nombre_archivo', models.CharField(blank=True, max_length=150, verbose_name='Nombre de descarga')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de solicitud')),
+                ('iniciado_en', models.DateTimeField(blank=True, null=True, verbose_name='Iniciado en')),
+                ('terminado_en', models.DateTimeField(blank=True, null=True, verbose_name='Terminado en')),
+                ('solicitado_por', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exportaciones', to=settings.AUTH_USER_MODEL, verbose_name='Solicitado por')),
+            ],
+            options={
+                'verbose_name': 'Exportación',
+                'verbose_name_plural': 'Exportaciones',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['estado', 'created_at'], name='export_estado_idx'), models.Index(fields=['solicitado_por', '-created_at'], name='export_usuario_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0016_trabajoexportacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(verbose_name='Fecha y Hora')),
+                ('tipo', models.CharField(choices=[('ingreso', 'Ingreso'), ('salida', 'Salida'), ('ajuste', 'Ajuste'), ('devolucion', 'Devolución'), ('transferencia', 'Transferencia')], max_length=20, verbose_name='Tipo de Movimiento')),
+                ('cantidad', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Cantidad')),
+                ('costo_unitario', models.DecimalField(blank=True, decimal_places=6, max_digits=18, null=True, verbose_name='Costo Unitario')),
+                ('lote', models.CharField(blank=True, max_length=50, verbose_name='Lote')),
+                ('serie', models.CharField(blank=True, max_length=50, verbose_name='Serie')),
+                ('fecha_vencimiento', models.DateField(blank=True, null=True, verbose_name='Fecha de Vencimiento')),
+                ('doc_referencia', models.CharField(blank=True, max_length=100, verbose_name='Documento de Referencia')),
+                ('observaciones', models.TextField(blank=True, verbose_name='Observaciones')),
+                ('motivo', models.CharField(blank=True, max_length=255, verbose_name='Motivo')),
+                ('texto_busqueda', models.TextField(blank=True, default='', editable=False, verbose_name='Texto de búsqueda')),
+                ('created_at', models.DateTimeField(verbose_name='Fecha de creación')),
+                ('updated_at', models.DateTimeField(verbose_name='Fecha de actualización')),
+                ('archivado_en', models.DateTimeField(verbose_name='Archivado en')),
+                ('bodega', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movimientos_archivados', to='production.bodega', verbose_name='Bodega')),
+                ('bodega_destino', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movimientos_archivados_entrantes', to='production.bodega', verbose_name='Bodega de Destino')),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_archivados', to=settings.AUTH_USER_MODEL, verbose_name='Creado por')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movimientos_archivados', to='production.product', verbose_name='Producto')),
+                ('proveedor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_archivados', to='production.proveedor', verbose_name='Proveedor')),
+            ],
+            options={
+                'verbose_name': 'Movimiento Archivado',
+                'verbose_name_plural': 'Movimientos Archivados',
+                'ordering': ['-fecha', '-created_at'],
+                'indexes': [models.Index(fields=['-fecha', '-created_at', '-id'], name='movarch_fecha_creado_idx'), models.Index(fields=['producto', '-fecha'], name='movarch_prod_fecha_idx')],
+            },
+        ),
+    ]
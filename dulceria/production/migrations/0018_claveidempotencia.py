@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0017_movimientoarchivado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=64, verbose_name='Clave')),
+                ('resultado', models.JSONField(blank=True, default=dict, verbose_name='Resultado')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha de registro')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claves_idempotencia', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Clave de Idempotencia',
+                'verbose_name_plural': 'Claves de Idempotencia',
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'clave'), name='idempotencia_usuario_clave_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:34
+
+from django.db import migrations, models
+
+
+def crear_secuencia_sku(apps, schema_editor):
+    """Iniciar la secuencia de SKU en el mayor número ya asignado"""
+    Product = apps.get_model('production', 'Product')
+    Secuencia = apps.get_model('production', 'Secuencia')
+    numeros = []
+    for sku in Product.objects.values_list('sku', flat=True).iterator():
+        try:
+            numeros.append(int(sku.replace('SKU-', '').replace('SKU', '')))
+        except (ValueError, AttributeError):
+            pass
+    Secuencia.objects.create(nombre='sku', valor=max(numeros, default=0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0018_claveidempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Secuencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True, verbose_name='Nombre')),
+                ('valor', models.BigIntegerField(default=0, verbose_name='Último valor')),
+            ],
+            options={
+                'verbose_name': 'Secuencia',
+                'verbose_name_plural': 'Secuencias',
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.RunPython(crear_secuencia_sku, reverse_code=migrations.RunPython.noop),
+    ]
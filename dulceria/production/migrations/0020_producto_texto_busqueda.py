@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from production.busqueda_productos import (
+    asegurar_indice_productos, eliminar_indice_productos, reindexar_busqueda_productos,
+)
+
+
+def crear_indice(apps, schema_editor):
+    """
+    FULLTEXT en MySQL o FTS5 en SQLite, creado antes de poblar los textos
+
+    FTS5 se reconstruye con los textos aún vacíos: sus triggers de UPDATE
+    borran la versión anterior de cada fila, que debe estar en el índice.
+    """
+    asegurar_indice_productos(schema_editor, reconstruir=True)
+
+
+def eliminar_indice(apps, schema_editor):
+    eliminar_indice_productos(schema_editor)
+
+
+def poblar_textos_busqueda(apps, schema_editor):
+    """Calcular los textos de búsqueda de los productos existentes (y el índice invertido si el motor lo usa)"""
+    Product = apps.get_model('production', 'Product')
+    reindexar_busqueda_productos(Product.objects.using(schema_editor.connection.alias))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0019_secuencia'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='texto_busqueda',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Texto de búsqueda'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='texto_descripcion',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Texto de búsqueda de la descripción'),
+        ),
+        migrations.CreateModel(
+            name='TerminoProducto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('termino', models.CharField(db_index=True, max_length=64, verbose_name='Término')),
+                ('peso', models.PositiveSmallIntegerField(default=1, verbose_name='Peso')),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terminos_busqueda', to='production.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Término de Búsqueda',
+                'verbose_name_plural': 'Términos de Búsqueda',
+            },
+        ),
+        migrations.RunPython(crear_indice, reverse_code=eliminar_indice),
+        migrations.RunPython(poblar_textos_busqueda, reverse_code=migrations.RunPython.noop),
+    ]
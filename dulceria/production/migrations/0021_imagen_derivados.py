@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0020_producto_texto_busqueda'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='imagen_derivados',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Derivados de la imagen'),
+        ),
+    ]
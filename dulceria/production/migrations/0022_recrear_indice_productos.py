@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:05
+
+from django.db import migrations
+
+from production.busqueda_productos import asegurar_indice_productos
+
+
+def recrear_indice(apps, schema_editor):
+    """
+    Volver a crear los triggers FTS5 de production_product y reconstruir el índice
+
+    En SQLite, el AddField de 0021 reconstruye la tabla de productos y con
+    ella se pierden los triggers creados en 0020. Los productos guardados
+    mientras faltaron no están en el índice, por eso se reconstruye.
+    """
+    asegurar_indice_productos(schema_editor, reconstruir=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0021_imagen_derivados'),
+    ]
+
+    operations = [
+        migrations.RunPython(recrear_indice, reverse_code=migrations.RunPython.noop),
+    ]
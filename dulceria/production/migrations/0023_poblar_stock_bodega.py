@@ -0,0 +1,105 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:09
+
+import heapq
+from collections import defaultdict
+from datetime import date
+
+from django.db import migrations
+
+
+# Copia de SIGNO_STOCK_POR_TIPO al momento de esta migración
+SIGNOS = {'ingreso': 1, 'salida': -1, 'ajuste': 1, 'devolucion': 1, 'transferencia': 0}
+CAMPOS = ('tipo', 'producto_id', 'bodega_id', 'bodega_destino_id', 'lote', 'cantidad', 'fecha_vencimiento')
+
+
+def _historial(apps):
+    """Movimientos archivados y activos intercalados en orden (fecha, id)"""
+    fuentes = [
+        apps.get_model('production', nombre).objects.order_by('fecha', 'id').values_list(
+            'fecha', 'id', *CAMPOS
+        ).iterator(chunk_size=5000)
+        for nombre in ('MovimientoArchivado', 'MovimientoInventario')
+    ]
+    for fila in heapq.merge(*fuentes, key=lambda fila: fila[:2]):
+        yield fila[2:]
+
+
+def poblar_stock_bodega(apps, schema_editor):
+    """
+    Calcular StockBodega desde los movimientos existentes
+
+    0008 creó la tabla vacía: los movimientos registrados antes solo estaban
+    en Product.stock, y las salidas de esas unidades dejaban filas en
+    negativo. Ahora que aplicar_delta_stock_bodega exige saldo suficiente,
+    la proyección debe partir completa y sin negativos:
+
+    - Las transferencias sin bodega de destino no movieron stock: se omiten
+      (restarlas del origen sin abonarlas en ningún lado perdería unidades).
+    - El stock del producto que no viene de movimientos (stock inicial)
+      queda sin lote en la primera bodega activa por código.
+    - Lo que una salida sin lote deja en negativo se descuenta de los lotes
+      de la misma bodega, del vencimiento más próximo al más lejano.
+    """
+    Bodega = apps.get_model('production', 'Bodega')
+    Product = apps.get_model('production', 'Product')
+    StockBodega = apps.get_model('production', 'StockBodega')
+
+    saldos = defaultdict(int)
+    netos = defaultdict(int)
+    vencimientos = {}
+    for tipo, producto_id, bodega_id, destino_id, lote, cantidad, vencimiento in _historial(apps):
+        lote = lote or ''
+        if lote:
+            if vencimiento is not None:
+                vencimientos[(producto_id, lote)] = vencimiento
+            elif tipo in ('salida', 'transferencia'):
+                vencimiento = vencimientos.get((producto_id, lote))
+        cantidad = int(float(cantidad))
+        if tipo == 'transferencia':
+            if destino_id is None:
+                continue
+            saldos[(producto_id, bodega_id, lote, vencimiento)] -= cantidad
+            saldos[(producto_id, destino_id, lote, vencimiento)] += cantidad
+            continue
+        delta = SIGNOS.get(tipo, 0) * cantidad
+        netos[producto_id] += delta
+        saldos[(producto_id, bodega_id, lote, vencimiento)] += delta
+
+    apertura = Bodega.objects.filter(is_active=True).order_by('codigo').values_list('pk', flat=True).first()
+    if apertura is not None:
+        for producto_id, stock in Product.objects.values_list('pk', 'stock').iterator(chunk_size=5000):
+            if stock != netos.get(producto_id, 0):
+                saldos[(producto_id, apertura, '', None)] += stock - netos.get(producto_id, 0)
+
+    lotes = defaultdict(list)
+    for clave, cantidad in saldos.items():
+        if cantidad > 0:
+            lotes[clave[:2]].append(clave)
+    for clave in [clave for clave, cantidad in saldos.items() if cantidad < 0 and not clave[2]]:
+        for otra in sorted(lotes[clave[:2]], key=lambda otra: (otra[3] is None, otra[3] or date.min, otra[2])):
+            tomar = min(-saldos[clave], saldos[otra])
+            saldos[otra] -= tomar
+            saldos[clave] += tomar
+            if not saldos[clave]:
+                break
+
+    StockBodega.objects.all().delete()
+    StockBodega.objects.bulk_create(
+        (
+            StockBodega(producto_id=producto_id, bodega_id=bodega_id, lote=lote, fecha_vencimiento=vencimiento, cantidad=cantidad)
+            for (producto_id, bodega_id, lote, vencimiento), cantidad in saldos.items()
+            if bodega_id is not None and cantidad
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0022_recrear_indice_productos'),
+    ]
+
+    operations = [
+        migrations.RunPython(poblar_stock_bodega, reverse_code=migrations.RunPython.noop),
+    ]
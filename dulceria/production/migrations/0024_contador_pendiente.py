@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-17 12:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0023_poblar_stock_bodega'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lote', models.UUIDField(db_index=True, verbose_name='Lote')),
+                ('clave', models.CharField(max_length=50, verbose_name='Clave')),
+                ('delta', models.BigIntegerField(verbose_name='Delta')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+            ],
+            options={
+                'verbose_name': 'Contador Pendiente',
+                'verbose_name_plural': 'Contadores Pendientes',
+            },
+        ),
+    ]
@@ -1,9 +1,20 @@
-from decimal import Decimal
+import logging
+import uuid
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
 
-from django.db import models
+from django.db import connection, models, transaction, DatabaseError, IntegrityError
+from django.db.models import F, Sum
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from accounts.models import validate_rut_chileno
+from .cache_utils import ETIQUETA_STOCK, invalidar_etiquetas
+from .busqueda_productos import textos_busqueda_producto
+from .inventory_busqueda import texto_busqueda_movimiento
+
+logger = logging.getLogger(__name__)
 
 
 class Category(models.Model):
@@ -21,6 +32,80 @@ class Category(models.Model):
         return self.name
 
 
+class Secuencia(models.Model):
+    """
+    Contador con nombre para asignar números correlativos (por ejemplo, el SKU)
+    
+    siguiente_valor() lo incrementa con un UPDATE sobre una sola fila, que
+    queda bloqueada hasta el commit: dos creaciones concurrentes nunca
+    obtienen el mismo número. Los números de una transacción revertida
+    pueden reutilizarse; los de productos eliminados no.
+    """
+    nombre = models.CharField(max_length=50, unique=True, verbose_name='Nombre')
+    valor = models.BigIntegerField(default=0, verbose_name='Último valor')
+    
+    class Meta:
+        verbose_name = 'Secuencia'
+        verbose_name_plural = 'Secuencias'
+        ordering = ['nombre']
+    
+    def __str__(self):
+        return f"{self.nombre}: {self.valor}"
+
+
+SECUENCIA_SKU = 'sku'
+
+
+def siguiente_valor(nombre, inicial=None):
+    """
+    Incrementar la secuencia `nombre` y retornar el nuevo valor
+    
+    Si la secuencia no existe se crea partiendo de `inicial()` (por ejemplo,
+    el mayor número ya usado). Debe llamarse dentro de la transacción que usa
+    el número, para que el bloqueo de la fila dure hasta su commit.
+    """
+    with transaction.atomic():
+        secuencias = Secuencia.objects.filter(nombre=nombre)
+        if not secuencias.update(valor=F('valor') + 1):
+            try:
+                with transaction.atomic():
+                    Secuencia.objects.create(nombre=nombre, valor=(inicial() if inicial else 0) + 1)
+            except IntegrityError:
+                # Otro proceso creó la secuencia entre el UPDATE y el INSERT
+                secuencias.update(valor=F('valor') + 1)
+        return secuencias.values_list('valor', flat=True).get()
+
+
+def numero_sku(sku):
+    """Número de un SKU con el formato SKU-001; None si no tiene ese formato"""
+    try:
+        return int(sku.replace('SKU-', '').replace('SKU', ''))
+    except (ValueError, AttributeError):
+        return None
+
+
+def mayor_numero_sku():
+    """Mayor número de SKU usado (recorre los SKU una vez, solo al crear la secuencia)"""
+    return max((n for n in map(numero_sku, Product.objects.values_list('sku', flat=True).iterator()) if n is not None), default=0)
+
+
+def formatear_sku(numero):
+    return f"SKU-{str(numero).zfill(3)}"
+
+
+def siguiente_sku():
+    """SKU libre siguiente según la secuencia SECUENCIA_SKU"""
+    while True:
+        sku = formatear_sku(siguiente_valor(SECUENCIA_SKU, inicial=mayor_numero_sku))
+        # Un SKU puesto a mano pudo adelantarse a la secuencia: se salta
+        if not Product.objects.filter(sku=sku).exists():
+            return sku
+
+
+# Campos de Product que forman sus textos de búsqueda
+CAMPOS_BUSQUEDA_PRODUCTO = {'sku', 'name', 'marca', 'category', 'description'}
+
+
 class Product(models.Model):
     # Identificación
     name = models.CharField(max_length=200, verbose_name='Nombre')  # Índice creado mediante migración personalizada
@@ -60,6 +145,8 @@ class Product(models.Model):
     # Otros
     is_active = models.BooleanField(default=True, verbose_name='Activo')
     imagen = models.ImageField(upload_to='productos/', null=True, blank=True, verbose_name='Imagen')
+    # Miniaturas y WebP generados a partir de `imagen` (ver production/imagenes.py)
+    imagen_derivados = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Derivados de la imagen')
     
     # Aprobación de productos
     ESTADO_APROBACION_CHOICES = [
@@ -91,6 +178,10 @@ class Product(models.Model):
         verbose_name='Creado por'
     )
     
+    # Textos normalizados para la búsqueda (ver busqueda_productos)
+    texto_busqueda = models.TextField(blank=True, default='', editable=False, verbose_name='Texto de búsqueda')
+    texto_descripcion = models.TextField(blank=True, default='', editable=False, verbose_name='Texto de búsqueda de la descripción')
+    
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Fecha de actualización')
 
@@ -98,7 +189,10 @@ class Product(models.Model):
         verbose_name = 'Producto'
         verbose_name_plural = 'Productos'
         ordering = ['name']
-        indexes = []  # Los índices se crean mediante migración personalizada 0007
+        # Los demás índices se crean mediante migración personalizada 0007
+        indexes = [
+            models.Index(fields=['fecha_vencimiento'], name='prod_venc_idx'),
+        ]
         # Nota: Django crea automáticamente los permisos:
         # - production.add_product
         # - production.change_product
@@ -106,23 +200,20 @@ class Product(models.Model):
         # - production.view_product
 
     def save(self, *args, **kwargs):
-        """Generar SKU automáticamente si no existe"""
+        """Generar SKU automáticamente si no existe y recalcular los textos de búsqueda"""
         if not self.sku:
-            # Obtener el último número de SKU
-            ultimo_producto = Product.objects.order_by('-id').first()
-            if ultimo_producto and ultimo_producto.sku:
-                try:
-                    # Extraer el número del SKU (ej: SKU-001 -> 1)
-                    numero = int(ultimo_producto.sku.replace('SKU-', '').replace('SKU', ''))
-                except (ValueError, AttributeError):
-                    numero = 0
-            else:
-                numero = 0
-            # Generar nuevo SKU
-            self.sku = f"SKU-{str(numero + 1).zfill(3)}"
+            # El SKU se asigna una vez desde una secuencia y no cambia (no se renumera al eliminar productos)
+            self.sku = siguiente_sku()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or CAMPOS_BUSQUEDA_PRODUCTO & set(update_fields):
+            self.texto_busqueda, self.texto_descripcion = textos_busqueda_producto(self)
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'texto_busqueda', 'texto_descripcion'}
         if self.punto_reorden is None:
             self.punto_reorden = self.stock_minimo
-        super().save(*args, **kwargs)
+        # Atómico: las señales llevan a StockBodega el stock escrito directamente y pueden rechazarlo
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} ({self.sku})"
@@ -289,6 +380,375 @@ class Bodega(models.Model):
         return f"{self.codigo} - {self.nombre}"
 
 
+class StockInsuficienteError(ValidationError):
+    """El movimiento dejaría el stock de un producto en negativo"""
+
+
+# Signo con que cada tipo de movimiento afecta el stock total del producto
+# (los ajustes suman la cantidad; las transferencias solo mueven stock entre bodegas)
+SIGNO_STOCK_POR_TIPO = {
+    'ingreso': 1,
+    'salida': -1,
+    'ajuste': 1,
+    'devolucion': 1,
+    'transferencia': 0,
+}
+
+
+def aplicar_delta_stock(producto_id, delta):
+    """
+    Sumar `delta` al stock de un producto con un único UPDATE condicional
+    
+    La condición stock >= -delta se evalúa en la base de datos junto con el
+    incremento, por lo que movimientos concurrentes sobre el mismo producto
+    no pierden actualizaciones y el stock nunca queda negativo.
+    Debe llamarse dentro de la transacción del movimiento.
+    """
+    if not delta:
+        return
+    productos = Product.objects.filter(pk=producto_id)
+    if delta < 0:
+        productos = productos.filter(stock__gte=-delta)
+    if not productos.update(stock=F('stock') + delta):
+        raise StockInsuficienteError(
+            'Stock insuficiente: el movimiento dejaría el stock del producto en negativo.',
+            code='stock_insuficiente',
+        )
+    # update() no emite post_save: el índice de códigos de barras se parchea aquí
+    from .inventory_codigos import registrar_cambio_stock
+    registrar_cambio_stock(producto_id, delta)
+    # y se invalidan las consultas cacheadas que muestran stock
+    transaction.on_commit(lambda: invalidar_etiquetas(ETIQUETA_STOCK))
+
+
+# Campos de MovimientoInventario que cambian su efecto en el stock
+CAMPOS_CON_EFECTO_STOCK = {'tipo', 'producto', 'bodega', 'bodega_destino', 'lote', 'fecha_vencimiento', 'cantidad'}
+
+# Campos que cambian el aporte de un ingreso al costo promedio
+CAMPOS_CON_EFECTO_COSTO = {'tipo', 'producto', 'cantidad', 'costo_unitario'}
+
+# Campos que forman MovimientoInventario.texto_busqueda
+CAMPOS_BUSQUEDA = {'producto', 'proveedor', 'doc_referencia', 'lote', 'serie'}
+
+
+def aplicar_delta_stock_bodega(producto_id, bodega_id, lote, fecha_vencimiento, delta):
+    """
+    Sumar `delta` a la fila de StockBodega de (producto, bodega, lote, vencimiento)
+    
+    Usa un UPDATE incremental y solo crea la fila si aún no existe. Antes de
+    crearla bloquea el producto, porque la restricción única no impide
+    duplicados cuando el vencimiento es NULL; si aun así otro proceso la crea
+    en paralelo, la restricción hace reintentar el UPDATE.
+    
+    Un delta negativo es un UPDATE condicional (cantidad >= -delta), igual que
+    en aplicar_delta_stock: si la bodega no tiene esas unidades de ese lote
+    lanza StockInsuficienteError y la fila nunca queda en negativo. Una
+    salida sin lote que la fila sin lote no cubre toma el resto de los lotes
+    de la bodega (ver _retirar_de_lotes).
+    """
+    if not delta or bodega_id is None:
+        return
+    filas = StockBodega.objects.filter(
+        producto_id=producto_id, bodega_id=bodega_id, lote=lote, fecha_vencimiento=fecha_vencimiento
+    )
+    if delta < 0:
+        if filas.filter(cantidad__gte=-delta).update(cantidad=F('cantidad') + delta):
+            return
+        if lote:
+            raise _stock_bodega_insuficiente()
+        _retirar_de_lotes(producto_id, bodega_id, fecha_vencimiento, -delta)
+        return
+    if filas.update(cantidad=F('cantidad') + delta):
+        return
+    list(Product.objects.select_for_update().filter(pk=producto_id).values_list('pk'))
+    if filas.update(cantidad=F('cantidad') + delta):
+        return
+    try:
+        with transaction.atomic():
+            StockBodega.objects.create(
+                producto_id=producto_id, bodega_id=bodega_id, lote=lote,
+                fecha_vencimiento=fecha_vencimiento, cantidad=delta,
+            )
+    except IntegrityError:
+        filas.update(cantidad=F('cantidad') + delta)
+
+
+def _stock_bodega_insuficiente():
+    return StockInsuficienteError(
+        'Stock insuficiente en la bodega: el movimiento dejaría el saldo del lote en negativo.',
+        code='stock_insuficiente',
+    )
+
+
+def _retirar_de_lotes(producto_id, bodega_id, fecha_vencimiento, unidades):
+    """
+    Retirar `unidades` sin lote de una bodega, empezando por la fila sin lote
+    y siguiendo por los lotes del vencimiento más próximo al más lejano
+    
+    Una salida sin lote no dice de qué lote salen las unidades (productos sin
+    control por lote, importaciones): se descuentan del saldo de la bodega.
+    Al revertirla (editar o eliminar) las unidades vuelven a la fila sin lote.
+    """
+    saldos = list(
+        StockBodega.objects.select_for_update()
+        .filter(producto_id=producto_id, bodega_id=bodega_id, cantidad__gt=0)
+        .order_by(F('fecha_vencimiento').asc(nulls_last=True), 'lote')
+        .values_list('pk', 'lote', 'fecha_vencimiento', 'cantidad')
+    )
+    saldos.sort(key=lambda fila: not (fila[1] == '' and fila[2] == fecha_vencimiento))
+    if sum(fila[3] for fila in saldos) < unidades:
+        raise _stock_bodega_insuficiente()
+    for pk, _, _, cantidad in saldos:
+        tomar = min(unidades, cantidad)
+        StockBodega.objects.filter(pk=pk).update(cantidad=F('cantidad') - tomar)
+        unidades -= tomar
+        if not unidades:
+            break
+
+
+def bodega_apertura():
+    """Bodega que recibe el stock escrito directamente en el producto: la primera activa por código"""
+    return Bodega.objects.filter(is_active=True).order_by('codigo').values_list('pk', flat=True).first()
+
+
+def ajustar_stock_apertura(producto_id, delta):
+    """
+    Llevar a StockBodega un cambio de Product.stock hecho sin movimiento
+    
+    El stock inicial de un producto creado con stock (formulario,
+    Product.objects.create, datos de prueba) queda sin lote en la bodega de
+    apertura, para que la suma de StockBodega siga igual a Product.stock.
+    """
+    bodega_id = bodega_apertura()
+    if bodega_id is not None:
+        aplicar_delta_stock_bodega(producto_id, bodega_id, '', None, delta)
+
+
+def reconstruir_stock_bodega(chunk_size=5000):
+    """
+    Reconstruir la proyección StockBodega recorriendo una vez el historial de movimientos
+    
+    Reemplaza todas las filas en una transacción. El stock de cada producto
+    que no viene de movimientos (stock inicial) queda en la bodega de
+    apertura, y lo que las salidas sin lote dejan en negativo se descuenta de
+    los lotes de su bodega, como en aplicar_delta_stock_bodega. Retorna
+    (filas creadas, movimientos recorridos).
+    """
+    from .inventory_archivo import recorrer_historial
+    
+    saldos = defaultdict(int)
+    netos = defaultdict(int)
+    # Orden cronológico para conocer el vencimiento de cada lote antes de sus salidas;
+    # incluye los movimientos archivados, que también forman parte del saldo
+    movimientos = recorrer_historial(
+        ('fecha', 'id'),
+        ('tipo', 'producto_id', 'bodega_id', 'bodega_destino_id', 'lote', 'cantidad', 'fecha_vencimiento'),
+        chunk_size=chunk_size,
+    )
+    vencimientos = {}
+    
+    total = 0
+    for tipo, producto_id, bodega_id, bodega_destino_id, lote, cantidad, vencimiento in movimientos:
+        if tipo == 'transferencia' and bodega_destino_id is None:
+            # Transferencia sin destino (datos antiguos): no movió stock; restarla del origen perdería unidades
+            total += 1
+            continue
+        if lote:
+            if vencimiento is not None:
+                vencimientos[(producto_id, lote)] = vencimiento
+            elif tipo in ('salida', 'transferencia'):
+                # Movimientos anteriores a FEFO: la salida de un lote hereda su último vencimiento conocido
+                vencimiento = vencimientos.get((producto_id, lote))
+        delta, efectos = MovimientoInventario.calcular_efectos(
+            tipo, producto_id, bodega_id, bodega_destino_id, lote, cantidad, fecha_vencimiento=vencimiento
+        )
+        netos[producto_id] += delta
+        for clave, delta_bodega in efectos:
+            saldos[clave] += delta_bodega
+        total += 1
+    
+    bodega_id = bodega_apertura()
+    if bodega_id is not None:
+        for producto_id, stock in Product.objects.values_list('pk', 'stock').iterator(chunk_size=chunk_size):
+            if stock != netos.get(producto_id, 0):
+                saldos[(producto_id, bodega_id, '', None)] += stock - netos.get(producto_id, 0)
+    _cubrir_salidas_sin_lote(saldos)
+    
+    filas = [
+        StockBodega(producto_id=producto_id, bodega_id=bodega_id, lote=lote, fecha_vencimiento=vencimiento, cantidad=cantidad)
+        for (producto_id, bodega_id, lote, vencimiento), cantidad in saldos.items()
+        if bodega_id is not None and cantidad
+    ]
+    
+    with transaction.atomic():
+        StockBodega.objects.all().delete()
+        StockBodega.objects.bulk_create(filas, batch_size=1000)
+    return len(filas), total
+
+
+def _cubrir_salidas_sin_lote(saldos):
+    """Descontar de los lotes de la misma bodega, por vencimiento, los saldos sin lote negativos de `saldos`"""
+    lotes = defaultdict(list)
+    for clave, cantidad in saldos.items():
+        if cantidad > 0:
+            lotes[clave[:2]].append(clave)
+    for clave in [clave for clave, cantidad in saldos.items() if cantidad < 0 and not clave[2]]:
+        for otra in sorted(lotes[clave[:2]], key=lambda otra: (otra[3] is None, otra[3] or date.min, otra[2])):
+            tomar = min(-saldos[clave], saldos[otra])
+            saldos[otra] -= tomar
+            saldos[clave] += tomar
+            if not saldos[clave]:
+                break
+
+
+def promedio_ponderado(stock, promedio, cantidad, costo):
+    """
+    Costo promedio ponderado después de ingresar `cantidad` unidades a `costo`
+    
+    Sin stock previo (o sin promedio conocido) el nuevo promedio es el costo del ingreso.
+    """
+    if promedio is None or stock <= 0:
+        nuevo = Decimal(costo)
+    else:
+        nuevo = (Decimal(promedio) * stock + Decimal(costo) * cantidad) / (stock + cantidad)
+    return nuevo.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def promedio_sin_ingreso(stock, promedio, cantidad, costo):
+    """
+    (stock, promedio) sin un ingreso de `cantidad` unidades a `costo` ya incorporado (inverso de promedio_ponderado)
+    
+    Si sin el ingreso no queda stock, o el valor restante sería negativo
+    (las salidas posteriores se llevaron unidades a otro costo), se conserva
+    el promedio: es el último costo conocido.
+    """
+    restante = stock - cantidad
+    if promedio is None or restante <= 0:
+        return restante, promedio
+    valor = Decimal(promedio) * stock - Decimal(costo) * cantidad
+    if valor < 0:
+        return restante, promedio
+    return restante, (valor / restante).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+def costo_proveedor(producto_id, proveedor_id):
+    """Costo pactado con el proveedor para el producto (ProductoProveedor), o None"""
+    if proveedor_id is None:
+        return None
+    return ProductoProveedor.objects.filter(
+        product_id=producto_id, proveedor_id=proveedor_id
+    ).values_list('costo', flat=True).first()
+
+
+def actualizar_costo_promedio(producto_id, cantidad, costo, anterior=None):
+    """
+    Incorporar un ingreso al costo promedio del producto en O(1)
+    
+    `anterior` es (cantidad, costo) de un ingreso ya incorporado que se edita
+    o se elimina: primero se retira su aporte y luego se incorpora el nuevo
+    (con `costo` None solo se retira). Bloquea la fila del producto para leer
+    stock y promedio vigentes, por lo que debe llamarse dentro de la
+    transacción del movimiento y antes de aplicar su delta de stock.
+    """
+    retirar = anterior is not None and anterior[1] is not None and anterior[0] > 0
+    incorporar = costo is not None and cantidad > 0
+    if not retirar and not incorporar:
+        return
+    actual = Product.objects.select_for_update().filter(pk=producto_id).values('stock', 'costo_promedio').first()
+    if actual is None:
+        return
+    stock, promedio = actual['stock'], actual['costo_promedio']
+    if retirar:
+        stock, promedio = promedio_sin_ingreso(stock, promedio, *anterior)
+    if incorporar:
+        promedio = promedio_ponderado(stock, promedio, cantidad, costo)
+    Product.objects.filter(pk=producto_id).update(costo_promedio=promedio)
+
+
+def ajustar_snapshots(fecha, deltas_producto, deltas_bodega):
+    """
+    Sumar el efecto de un movimiento con fecha `fecha` a los snapshots de ese día en adelante
+    
+    `fecha` es la fecha y hora del movimiento, o directamente el día. Recibe
+    los mismos deltas que aplicar_deltas_stock (por producto y por
+    (producto, bodega, lote, vencimiento)). Sin snapshots desde ese día, que
+    es lo normal para los movimientos del día, cuesta una consulta. Los
+    saldos que no tenían fila (0) se crean con el delta; se bloquean antes
+    los productos para que dos movimientos en paralelo no dupliquen la fila.
+    Debe llamarse dentro de la transacción del movimiento (ver inventory_snapshots).
+    """
+    dia = timezone.localtime(fecha).date() if isinstance(fecha, datetime) else fecha
+    fechas = set(StockSnapshot.objects.filter(fecha__gte=dia).order_by().values_list('fecha', flat=True).distinct())
+    if not fechas:
+        return
+    
+    saldos = defaultdict(int)
+    for producto_id, delta in deltas_producto.items():
+        saldos[(producto_id, None)] += delta
+    for (producto_id, bodega_id, _, _), delta in deltas_bodega.items():
+        if bodega_id is not None:
+            saldos[(producto_id, bodega_id)] += delta
+    saldos = {clave: delta for clave, delta in saldos.items() if delta}
+    if not saldos:
+        return
+    
+    list(Product.objects.select_for_update().filter(pk__in={producto_id for producto_id, _ in saldos}).values_list('pk'))
+    nuevas = []
+    for (producto_id, bodega_id), delta in saldos.items():
+        filas = StockSnapshot.objects.filter(fecha__gte=dia, producto_id=producto_id, bodega_id=bodega_id)
+        existentes = set(filas.values_list('fecha', flat=True))
+        filas.update(cantidad=F('cantidad') + delta)
+        nuevas += [
+            StockSnapshot(fecha=cierre, producto_id=producto_id, bodega_id=bodega_id, cantidad=delta)
+            for cierre in fechas - existentes
+        ]
+    StockSnapshot.objects.bulk_create(nuevas, batch_size=1000)
+
+
+def aplicar_deltas_stock(deltas_producto, deltas_bodega):
+    """Aplicar deltas agregados por producto y por (producto, bodega, lote, vencimiento)"""
+    for producto_id, delta in deltas_producto.items():
+        aplicar_delta_stock(producto_id, delta)
+    
+    # Contadores del dashboard: el stock se lee después del UPDATE, con la fila ya bloqueada
+    con_cambio = [producto_id for producto_id, delta in deltas_producto.items() if delta]
+    if con_cambio:
+        stock_total = productos_con_stock = 0
+        for producto_id, stock, is_active, estado in Product.objects.filter(pk__in=con_cambio).values_list(
+            'pk', 'stock', 'is_active', 'estado_aprobacion'
+        ):
+            despues = aporte_contadores_producto(stock, is_active, estado)
+            antes = aporte_contadores_producto(stock - deltas_producto[producto_id], is_active, estado)
+            stock_total += despues[0] - antes[0]
+            productos_con_stock += despues[1] - antes[1]
+        sumar_contadores({CONTADOR_STOCK_TOTAL: stock_total, CONTADOR_PRODUCTOS_CON_STOCK: productos_con_stock})
+    # Primero los ingresos: una salida sin lote puede tomar unidades de un lote que ingresa en la misma operación
+    ordenados = sorted(deltas_bodega.items(), key=lambda item: item[1] < 0)
+    for (producto_id, bodega_id, lote, fecha_vencimiento), delta in ordenados:
+        aplicar_delta_stock_bodega(producto_id, bodega_id, lote, fecha_vencimiento, delta)
+    
+    # Contadores por bodega: unidades y productos con saldo positivo (saldo leído después de aplicar los deltas)
+    netos = defaultdict(int)
+    for (producto_id, bodega_id, _, _), delta in deltas_bodega.items():
+        if bodega_id is not None:
+            netos[(producto_id, bodega_id)] += delta
+    netos = {clave: delta for clave, delta in netos.items() if delta}
+    if netos:
+        saldos = defaultdict(int)
+        saldos.update(
+            ((producto_id, bodega_id), total)
+            for producto_id, bodega_id, total in StockBodega.objects.filter(
+                producto_id__in={producto_id for producto_id, _ in netos}, bodega_id__in={bodega_id for _, bodega_id in netos},
+            ).order_by().values('producto_id', 'bodega_id').annotate(total=Sum('cantidad')).values_list('producto_id', 'bodega_id', 'total')
+        )
+        contadores = defaultdict(int)
+        for (producto_id, bodega_id), delta in netos.items():
+            despues = saldos[(producto_id, bodega_id)]
+            contadores[clave_stock_bodega(bodega_id)] += delta
+            contadores[clave_productos_bodega(bodega_id)] += (despues > 0) - (despues - delta > 0)
+        sumar_contadores(contadores)
+
+
 class MovimientoInventario(models.Model):
     """Modelo para movimientos de inventario"""
     TIPO_MOVIMIENTO_CHOICES = [
@@ -305,7 +765,9 @@ class MovimientoInventario(models.Model):
     producto = models.ForeignKey(Product, on_delete=models.PROTECT, verbose_name='Producto', related_name='movimientos')
     proveedor = models.ForeignKey(Proveedor, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Proveedor', related_name='movimientos')
     bodega = models.ForeignKey(Bodega, on_delete=models.PROTECT, verbose_name='Bodega', related_name='movimientos')
+    bodega_destino = models.ForeignKey(Bodega, on_delete=models.PROTECT, null=True, blank=True, verbose_name='Bodega de Destino', related_name='movimientos_entrantes', help_text='Solo para transferencias')
     cantidad = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)], verbose_name='Cantidad')
+    costo_unitario = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True, validators=[MinValueValidator(0)], verbose_name='Costo Unitario', help_text='Costo de compra por unidad (solo ingresos)')
     
     # Control avanzado
     lote = models.CharField(max_length=50, blank=True, verbose_name='Lote', help_text='Número de lote')
@@ -317,6 +779,9 @@ class MovimientoInventario(models.Model):
     observaciones = models.TextField(blank=True, verbose_name='Observaciones', help_text='Notas de operación, recibo, daño, etc.')
     motivo = models.CharField(max_length=255, blank=True, verbose_name='Motivo', help_text='Diferencia inventario, devolución cliente, etc.')
     
+    # Búsqueda: SKU, producto, proveedor, doc. referencia, lote y serie normalizados (ver inventory_busqueda)
+    texto_busqueda = models.TextField(blank=True, default='', editable=False, verbose_name='Texto de búsqueda')
+    
     # Auditoría
     creado_por = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_creados', verbose_name='Creado por')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')
@@ -332,44 +797,516 @@ class MovimientoInventario(models.Model):
             models.Index(fields=['producto', '-fecha'], name='mov_prod_fecha_idx'),
             models.Index(fields=['bodega', '-fecha'], name='mov_bod_fecha_idx'),
             # mov_tipo_fecha_idx se crea en migración 0007 personalizada
+            # Orden completo de la paginación por cursor de movimientos_list
+            models.Index(fields=['-fecha', '-created_at', '-id'], name='mov_fecha_creado_idx'),
         ]
     
+    # Los movimientos archivados (MovimientoArchivado) son de solo lectura
+    archivado = False
+    
     def __str__(self):
         return f"{self.get_tipo_display()} - {self.producto.sku} - {self.cantidad} - {self.fecha.strftime('%d/%m/%Y %H:%M')}"
     
+    def delta_stock(self):
+        """Cambio (con signo) que produce este movimiento en el stock total del producto"""
+        return SIGNO_STOCK_POR_TIPO.get(self.tipo, 0) * int(float(self.cantidad))
+    
+    @staticmethod
+    def calcular_efectos(tipo, producto_id, bodega_id, bodega_destino_id, lote, cantidad, signo=1, fecha_vencimiento=None):
+        """
+        Deltas de stock que produce un movimiento
+        
+        Retorna (delta_producto, [((producto_id, bodega_id, lote, fecha_vencimiento), delta), ...]).
+        Una transferencia se registra como una salida de la bodega de origen
+        y un ingreso en la bodega de destino (con el mismo lote y vencimiento),
+        sin cambiar el stock total.
+        """
+        cantidad = int(float(cantidad)) * signo
+        lote = lote or ''
+        if tipo == 'transferencia':
+            return 0, [
+                ((producto_id, bodega_id, lote, fecha_vencimiento), -cantidad),
+                ((producto_id, bodega_destino_id, lote, fecha_vencimiento), cantidad),
+            ]
+        delta = SIGNO_STOCK_POR_TIPO.get(tipo, 0) * cantidad
+        return delta, [((producto_id, bodega_id, lote, fecha_vencimiento), delta)]
+    
+    def _efectos(self, signo=1):
+        return self.calcular_efectos(
+            self.tipo, self.producto_id, self.bodega_id, self.bodega_destino_id, self.lote, self.cantidad, signo,
+            self.fecha_vencimiento,
+        )
+    
     def save(self, *args, **kwargs):
-        """Actualizar stock del producto al guardar el movimiento"""
-        is_new = self.pk is None
-        super().save(*args, **kwargs)
+        """Guardar el movimiento y aplicar su efecto en el stock en la misma transacción"""
+        update_fields = kwargs.get('update_fields')
+        self.texto_busqueda = texto_busqueda_movimiento(self)
+        if update_fields is not None and CAMPOS_BUSQUEDA & set(update_fields):
+            kwargs['update_fields'] = update_fields = set(update_fields) | {'texto_busqueda'}
+        if update_fields is not None and not (CAMPOS_CON_EFECTO_STOCK | CAMPOS_CON_EFECTO_COSTO) & set(update_fields):
+            # El guardado no toca campos que afecten el stock ni el costo promedio
+            return super().save(*args, **kwargs)
         
-        if is_new:
-            # Actualizar stock según el tipo de movimiento
-            cantidad_int = int(float(self.cantidad))
-            if self.tipo == 'ingreso':
-                self.producto.stock += cantidad_int
-            elif self.tipo == 'salida':
-                self.producto.stock = max(0, self.producto.stock - cantidad_int)
-            elif self.tipo == 'ajuste':
-                # Los ajustes pueden ser positivos o negativos según la cantidad
-                self.producto.stock = max(0, self.producto.stock + cantidad_int)
-            elif self.tipo == 'devolucion':
-                self.producto.stock += cantidad_int
-            # Transferencias no afectan el stock total, solo entre bodegas
+        with transaction.atomic():
+            deltas_producto = defaultdict(int)
+            deltas_bodega = defaultdict(int)
+            
+            anterior = None
+            ingreso_anterior = None
+            if self.pk is not None:
+                anterior = MovimientoInventario.objects.select_for_update().filter(pk=self.pk).values(
+                    'tipo', 'producto_id', 'bodega_id', 'bodega_destino_id', 'lote', 'cantidad', 'fecha_vencimiento', 'fecha',
+                    'costo_unitario',
+                ).first()
+                if anterior is not None:
+                    fecha_anterior = anterior.pop('fecha')
+                    costo_anterior = anterior.pop('costo_unitario')
+                    if anterior['tipo'] == 'ingreso':
+                        ingreso_anterior = (anterior['producto_id'], int(float(anterior['cantidad'])), costo_anterior)
+                    # Edición: revertir lo ya registrado para aplicar solo la diferencia
+                    delta, efectos = self.calcular_efectos(signo=-1, **anterior)
+                    deltas_producto[anterior['producto_id']] += delta
+                    for clave, delta_bodega in efectos:
+                        deltas_bodega[clave] += delta_bodega
+                    ajustar_snapshots(fecha_anterior, {anterior['producto_id']: delta}, dict(efectos))
             
-            self.producto.save(update_fields=['stock'])
+            if self.lote and self.fecha_vencimiento is None and self.tipo in ('salida', 'transferencia'):
+                # Un lote que sale hereda el vencimiento con que está registrado en la bodega
+                self.fecha_vencimiento = StockBodega.vencimiento_lote(self.producto_id, self.bodega_id, self.lote)
+            
+            if self.tipo == 'ingreso' and self.costo_unitario is None:
+                self.costo_unitario = costo_proveedor(self.producto_id, self.proveedor_id)
+            ingreso = (self.producto_id, self.delta_stock(), self.costo_unitario) if self.tipo == 'ingreso' else None
+            if ingreso != ingreso_anterior:
+                # Edición de un ingreso: se retira su aporte anterior al promedio y se incorpora el nuevo
+                if ingreso_anterior is not None and ingreso_anterior[0] != self.producto_id:
+                    actualizar_costo_promedio(ingreso_anterior[0], 0, None, anterior=ingreso_anterior[1:])
+                    ingreso_anterior = None
+                actualizar_costo_promedio(
+                    self.producto_id, *(ingreso[1:] if ingreso else (0, None)),
+                    anterior=ingreso_anterior[1:] if ingreso_anterior else None,
+                )
+            
+            delta, efectos = self._efectos()
+            deltas_producto[self.producto_id] += delta
+            for clave, delta_bodega in efectos:
+                deltas_bodega[clave] += delta_bodega
+            # Con fecha en o antes del cierre de un snapshot, también cambia ese saldo
+            ajustar_snapshots(self.fecha, {self.producto_id: delta}, dict(efectos))
+            
+            aplicar_deltas_stock(deltas_producto, deltas_bodega)
+            super().save(*args, **kwargs)
+            
+            if anterior is None:
+                sumar_contadores({clave_movimientos_dia(self.fecha): 1})
+            elif clave_movimientos_dia(fecha_anterior) != clave_movimientos_dia(self.fecha):
+                sumar_contadores({clave_movimientos_dia(fecha_anterior): -1, clave_movimientos_dia(self.fecha): 1})
     
     def delete(self, *args, **kwargs):
         """Revertir el stock al eliminar un movimiento"""
-        # Revertir el cambio en el stock
-        cantidad_int = int(float(self.cantidad))
-        if self.tipo == 'ingreso':
-            self.producto.stock = max(0, self.producto.stock - cantidad_int)
-        elif self.tipo == 'salida':
-            self.producto.stock += cantidad_int
-        elif self.tipo == 'ajuste':
-            self.producto.stock = max(0, self.producto.stock - cantidad_int)
-        elif self.tipo == 'devolucion':
-            self.producto.stock = max(0, self.producto.stock - cantidad_int)
-        
-        self.producto.save(update_fields=['stock'])
-        super().delete(*args, **kwargs)
\ No newline at end of file
+        with transaction.atomic():
+            if self.tipo == 'ingreso':
+                # Retirar su aporte al costo promedio antes de descontar el stock
+                actualizar_costo_promedio(self.producto_id, 0, None, anterior=(self.delta_stock(), self.costo_unitario))
+            delta, efectos = self._efectos(signo=-1)
+            aplicar_deltas_stock({self.producto_id: delta}, dict(efectos))
+            ajustar_snapshots(self.fecha, {self.producto_id: delta}, dict(efectos))
+            sumar_contadores({clave_movimientos_dia(self.fecha): -1})
+            return super().delete(*args, **kwargs)
+
+
+class StockBodega(models.Model):
+    """
+    Stock actual por producto, bodega, lote y vencimiento
+    
+    Proyección mantenida incrementalmente por los movimientos de inventario,
+    para consultar el stock de una bodega sin recorrer el historial y para
+    asignar salidas por vencimiento (FEFO).
+    """
+    producto = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Producto', related_name='stock_bodegas')
+    bodega = models.ForeignKey(Bodega, on_delete=models.CASCADE, verbose_name='Bodega', related_name='stock_productos')
+    lote = models.CharField(max_length=50, blank=True, default='', verbose_name='Lote')
+    fecha_vencimiento = models.DateField(null=True, blank=True, verbose_name='Fecha de Vencimiento')
+    cantidad = models.IntegerField(default=0, verbose_name='Cantidad')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Fecha de actualización')
+    
+    class Meta:
+        verbose_name = 'Stock por Bodega'
+        verbose_name_plural = 'Stock por Bodega'
+        ordering = ['bodega__codigo', 'producto__name', 'fecha_vencimiento', 'lote']
+        constraints = [
+            # El orden (producto, bodega, vencimiento) permite recorrer los lotes en orden FEFO desde el índice
+            models.UniqueConstraint(fields=['producto', 'bodega', 'fecha_vencimiento', 'lote'], name='stockbod_prod_bod_venc_lote_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['bodega', 'producto'], name='stockbod_bod_prod_idx'),
+            models.Index(fields=['fecha_vencimiento'], name='stockbod_venc_idx'),
+        ]
+    
+    def __str__(self):
+        lote = f" [{self.lote}]" if self.lote else ''
+        vencimiento = f" (vence {self.fecha_vencimiento:%d/%m/%Y})" if self.fecha_vencimiento else ''
+        return f"{self.producto.sku} @ {self.bodega.codigo}{lote}{vencimiento}: {self.cantidad}"
+    
+    @classmethod
+    def stock_en(cls, producto, bodega):
+        """Stock de un producto en una bodega (suma de sus lotes) usando el índice único"""
+        total = cls.objects.filter(producto=producto, bodega=bodega).aggregate(total=models.Sum('cantidad'))['total']
+        return total or 0
+    
+    @classmethod
+    def vencimiento_lote(cls, producto_id, bodega_id, lote):
+        """Vencimiento más próximo con stock de un lote en una bodega (None si no está registrado)"""
+        return cls.objects.filter(
+            producto_id=producto_id, bodega_id=bodega_id, lote=lote, cantidad__gt=0
+        ).order_by(F('fecha_vencimiento').asc(nulls_last=True)).values_list('fecha_vencimiento', flat=True).first()
+
+
+class StockSnapshot(models.Model):
+    """
+    Saldo de cierre diario por producto (bodega vacía) y por producto/bodega
+    
+    Permite responder "¿cuál era el stock al día X?" leyendo el snapshot más
+    cercano y aplicando solo los movimientos posteriores. Los saldos en cero
+    no se guardan: la ausencia de fila en una fecha con snapshot equivale a 0.
+    """
+    fecha = models.DateField(verbose_name='Fecha de cierre')
+    producto = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Producto', related_name='snapshots')
+    bodega = models.ForeignKey(Bodega, on_delete=models.CASCADE, null=True, blank=True, verbose_name='Bodega', related_name='snapshots', help_text='Vacío = stock total del producto')
+    cantidad = models.IntegerField(verbose_name='Cantidad')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')
+    
+    class Meta:
+        verbose_name = 'Snapshot de Stock'
+        verbose_name_plural = 'Snapshots de Stock'
+        ordering = ['-fecha', 'producto__name']
+        indexes = [
+            models.Index(fields=['-fecha'], name='snap_fecha_idx'),
+            models.Index(fields=['producto', 'bodega', '-fecha'], name='snap_prod_bod_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        bodega = self.bodega.codigo if self.bodega_id else 'TOTAL'
+        return f"{self.fecha:%d/%m/%Y} - {self.producto.sku} @ {bodega}: {self.cantidad}"
+
+
+class VencimientoProximo(models.Model):
+    """
+    Resultado del último escaneo de vencimientos (comando scan_vencimientos)
+    
+    Tabla resumen que el dashboard lee directamente; cada escaneo la reemplaza
+    completa, de modo que abrir el dashboard nunca recorre lotes ni productos.
+    """
+    ORIGEN_CHOICES = [
+        ('lote', 'Lote en bodega'),
+        ('producto', 'Vencimiento del producto'),
+        ('mes', 'Mes de vencimiento'),
+    ]
+    
+    origen = models.CharField(max_length=10, choices=ORIGEN_CHOICES, verbose_name='Origen')
+    producto = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Producto', related_name='vencimientos_proximos')
+    bodega = models.ForeignKey(Bodega, on_delete=models.CASCADE, null=True, blank=True, verbose_name='Bodega', related_name='vencimientos_proximos')
+    lote = models.CharField(max_length=50, blank=True, default='', verbose_name='Lote')
+    fecha_vencimiento = models.DateField(verbose_name='Fecha de Vencimiento')
+    cantidad = models.IntegerField(verbose_name='Cantidad')
+    generado_en = models.DateTimeField(verbose_name='Generado en')
+    
+    class Meta:
+        verbose_name = 'Vencimiento Próximo'
+        verbose_name_plural = 'Vencimientos Próximos'
+        ordering = ['fecha_vencimiento', 'producto__name']
+        indexes = [
+            models.Index(fields=['fecha_vencimiento'], name='venc_prox_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        lote = f" [{self.lote}]" if self.lote else ''
+        return f"{self.producto.sku}{lote} vence {self.fecha_vencimiento:%d/%m/%Y}: {self.cantidad}"
+
+
+class ContadorInventario(models.Model):
+    """
+    Contadores del dashboard de inventario mantenidos por las escrituras
+    
+    Los movimientos y los productos suman sus cambios al confirmar la
+    transacción (sumar_contadores, vía ContadorPendiente), de modo que el
+    dashboard lee valores ya calculados sin agregar tablas. El comando reconciliar_contadores los
+    recalcula desde cero para corregir cualquier desvío.
+    """
+    clave = models.CharField(max_length=50, unique=True, verbose_name='Clave')
+    valor = models.BigIntegerField(default=0, verbose_name='Valor')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Fecha de actualización')
+    
+    class Meta:
+        verbose_name = 'Contador de Inventario'
+        verbose_name_plural = 'Contadores de Inventario'
+        ordering = ['clave']
+    
+    def __str__(self):
+        return f"{self.clave}: {self.valor}"
+
+
+class ContadorPendiente(models.Model):
+    """
+    Suma a ContadorInventario registrada en la transacción que la origina
+    
+    Cada llamada a sumar_contadores inserta sus deltas con un mismo `lote`;
+    al confirmar, _aplicar_contadores borra el lote y lo suma. Si una
+    reconciliación los leyó antes (sus efectos ya estaban en los agregados),
+    los borra ella y la suma posterior no encuentra nada que aplicar.
+    """
+    lote = models.UUIDField(db_index=True, verbose_name='Lote')
+    clave = models.CharField(max_length=50, verbose_name='Clave')
+    delta = models.BigIntegerField(verbose_name='Delta')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')
+    
+    class Meta:
+        verbose_name = 'Contador Pendiente'
+        verbose_name_plural = 'Contadores Pendientes'
+    
+    def __str__(self):
+        return f"{self.clave}: {self.delta:+d}"
+
+
+# Claves de ContadorInventario
+CONTADOR_STOCK_TOTAL = 'stock_total'
+CONTADOR_PRODUCTOS_CON_STOCK = 'productos_con_stock'
+# Registros de VencimientoProximo del último escaneo (su updated_at es la hora del escaneo)
+CONTADOR_VENCIMIENTOS_TOTAL = 'vencimientos_total'
+PREFIJO_VENCIDOS_AL = 'vencidos_al_'
+
+
+def clave_stock_bodega(bodega_id):
+    """Clave del contador de unidades en la bodega (suma de StockBodega)"""
+    return f'bodega_{bodega_id}_stock'
+
+
+def clave_productos_bodega(bodega_id):
+    """Clave del contador de productos con saldo positivo en la bodega"""
+    return f'bodega_{bodega_id}_productos'
+
+
+def clave_vencidos_al(fecha):
+    """Clave de los registros del último escaneo de vencimientos que ya están vencidos en `fecha`"""
+    return f'{PREFIJO_VENCIDOS_AL}{fecha:%Y-%m-%d}'
+
+
+def clave_movimientos_dia(fecha):
+    """Clave del contador de movimientos del día (local) de `fecha`"""
+    if isinstance(fecha, datetime) and timezone.is_aware(fecha):
+        fecha = timezone.localdate(fecha)
+    elif isinstance(fecha, datetime):
+        fecha = fecha.date()
+    return f'movimientos_{fecha:%Y-%m-%d}'
+
+
+def aporte_contadores_producto(stock, is_active, estado_aprobacion):
+    """Lo que un producto aporta a (stock_total, productos_con_stock): solo cuentan los activos y aprobados"""
+    if not is_active or estado_aprobacion != 'APROBADO':
+        return 0, 0
+    return stock, 1 if stock > 0 else 0
+
+
+def sumar_contadores(deltas):
+    """
+    Sumar {clave: delta} a los contadores cuando se confirme la transacción en curso
+    
+    Los deltas quedan en ContadorPendiente dentro de la transacción y se
+    aplican después del commit en UPDATEs cortos, para que las filas de
+    contadores no queden bloqueadas durante la transacción de cada movimiento
+    ni se sumen cambios que terminan revertidos. Si esa suma falla (bloqueo,
+    deadlock) el movimiento ya está confirmado: se registra en el log y las
+    filas pendientes quedan para reconciliar_contadores.
+    """
+    deltas = {clave: delta for clave, delta in deltas.items() if delta}
+    if deltas:
+        lote = uuid.uuid4()
+        ContadorPendiente.objects.bulk_create(
+            ContadorPendiente(lote=lote, clave=clave, delta=delta) for clave, delta in deltas.items()
+        )
+        transaction.on_commit(lambda: _aplicar_contadores(lote, deltas), robust=True)
+
+
+def _aplicar_contadores(lote, deltas):
+    try:
+        _sumar_lote_contadores(lote, deltas)
+    except DatabaseError:
+        logger.warning(
+            'No se pudieron sumar los contadores del lote %s; quedan pendientes para reconciliar_contadores',
+            lote, exc_info=True,
+        )
+
+
+def _sumar_lote_contadores(lote, deltas):
+    with transaction.atomic():
+        # Mismo orden de bloqueo que reconciliar_contadores: primero los contadores. Sin
+        # SELECT ... FOR UPDATE (SQLite) la lectura solo haría que la transacción pida
+        # después el bloqueo de escritura y falle en vez de esperarlo
+        if connection.features.has_select_for_update:
+            list(ContadorInventario.objects.select_for_update().filter(clave__in=deltas).values_list('id', flat=True))
+        borrados, _ = ContadorPendiente.objects.filter(lote=lote).delete()
+        if not borrados:
+            # Una reconciliación ya contó estos cambios
+            return
+        for clave, delta in deltas.items():
+            if ContadorInventario.objects.filter(clave=clave).update(valor=F('valor') + delta, updated_at=timezone.now()):
+                continue
+            try:
+                with transaction.atomic():
+                    ContadorInventario.objects.create(clave=clave, valor=delta)
+            except IntegrityError:
+                # Otro proceso creó la fila entre el UPDATE y el INSERT
+                ContadorInventario.objects.filter(clave=clave).update(valor=F('valor') + delta, updated_at=timezone.now())
+
+
+def ruta_exportacion(instance, filename):
+    """exportaciones/<token aleatorio>/<nombre>: la ruta no se puede adivinar desde el id del trabajo"""
+    return f'exportaciones/{uuid.uuid4().hex}/{filename}'
+
+
+class TrabajoExportacion(models.Model):
+    """
+    Exportación a Excel procesada fuera del request (ver export_jobs)
+    
+    El request solo crea el trabajo; un worker (hilo local o el comando
+    procesar_exportaciones) lo toma, escribe el archivo bajo MEDIA_ROOT e
+    informa el avance en `progreso`.
+    """
+    TIPO_CHOICES = [
+        ('inventario', 'Reporte de inventario'),
+        ('usuarios', 'Usuarios'),
+        ('modelo_admin', 'Listado del panel de administración'),
+    ]
+    
+    ESTADO_CHOICES = [
+        ('pendiente', 'Pendiente'),
+        ('en_proceso', 'En proceso'),
+        ('completado', 'Completado'),
+        ('error', 'Error'),
+    ]
+    
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES, verbose_name='Tipo')
+    parametros = models.JSONField(default=dict, blank=True, verbose_name='Parámetros')
+    estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='pendiente', verbose_name='Estado')
+    progreso = models.IntegerField(default=0, verbose_name='Filas escritas')
+    total = models.IntegerField(null=True, blank=True, verbose_name='Filas estimadas')
+    archivo = models.FileField(upload_to=ruta_exportacion, max_length=255, blank=True, verbose_name='Archivo')
+    nombre_archivo = models.CharField(max_length=150, blank=True, verbose_name='Nombre de descarga')
+    error = models.TextField(blank=True, verbose_name='Error')
+    solicitado_por = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='exportaciones', verbose_name='Solicitado por')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Fecha de solicitud')
+    iniciado_en = models.DateTimeField(null=True, blank=True, verbose_name='Iniciado en')
+    terminado_en = models.DateTimeField(null=True, blank=True, verbose_name='Terminado en')
+    
+    class Meta:
+        verbose_name = 'Exportación'
+        verbose_name_plural = 'Exportaciones'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['estado', 'created_at'], name='export_estado_idx'),
+            models.Index(fields=['solicitado_por', '-created_at'], name='export_usuario_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_tipo_display()} #{self.pk} ({self.get_estado_display()})"
+    
+    @property
+    def porcentaje(self):
+        """Avance de 0 a 100 según las filas estimadas (None si no hay estimación)"""
+        if self.estado == 'completado':
+            return 100
+        if not self.total:
+            return None
+        return min(99, int(self.progreso * 100 / self.total))
+
+
+class MovimientoArchivado(models.Model):
+    """
+    Movimiento de inventario antiguo trasladado fuera de la tabla activa (ver inventory_archivo)
+    
+    Conserva el id y los datos del MovimientoInventario original. Solo se
+    archivan movimientos cubiertos por un snapshot de stock, así que moverlos
+    no cambia ningún saldo. Es de solo lectura: no aplica efectos de stock.
+    """
+    TIPO_MOVIMIENTO_CHOICES = MovimientoInventario.TIPO_MOVIMIENTO_CHOICES
+    
+    archivado = True
+    
+    id = models.BigIntegerField(primary_key=True, verbose_name='ID')
+    fecha = models.DateTimeField(verbose_name='Fecha y Hora')
+    tipo = models.CharField(max_length=20, choices=TIPO_MOVIMIENTO_CHOICES, verbose_name='Tipo de Movimiento')
+    producto = models.ForeignKey(Product, on_delete=models.PROTECT, verbose_name='Producto', related_name='movimientos_archivados')
+    proveedor = models.ForeignKey(Proveedor, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='Proveedor', related_name='movimientos_archivados')
+    bodega = models.ForeignKey(Bodega, on_delete=models.PROTECT, verbose_name='Bodega', related_name='movimientos_archivados')
+    bodega_destino = models.ForeignKey(Bodega, on_delete=models.PROTECT, null=True, blank=True, verbose_name='Bodega de Destino', related_name='movimientos_archivados_entrantes')
+    cantidad = models.DecimalField(max_digits=12, decimal_places=2, verbose_name='Cantidad')
+    costo_unitario = models.DecimalField(max_digits=18, decimal_places=6, null=True, blank=True, verbose_name='Costo Unitario')
+    lote = models.CharField(max_length=50, blank=True, verbose_name='Lote')
+    serie = models.CharField(max_length=50, blank=True, verbose_name='Serie')
+    fecha_vencimiento = models.DateField(null=True, blank=True, verbose_name='Fecha de Vencimiento')
+    doc_referencia = models.CharField(max_length=100, blank=True, verbose_name='Documento de Referencia')
+    observaciones = models.TextField(blank=True, verbose_name='Observaciones')
+    motivo = models.CharField(max_length=255, blank=True, verbose_name='Motivo')
+    texto_busqueda = models.TextField(blank=True, default='', editable=False, verbose_name='Texto de búsqueda')
+    creado_por = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_archivados', verbose_name='Creado por')
+    # Fechas originales: sin auto_now para que el traslado no las cambie
+    created_at = models.DateTimeField(verbose_name='Fecha de creación')
+    updated_at = models.DateTimeField(verbose_name='Fecha de actualización')
+    archivado_en = models.DateTimeField(verbose_name='Archivado en')
+    
+    class Meta:
+        verbose_name = 'Movimiento Archivado'
+        verbose_name_plural = 'Movimientos Archivados'
+        ordering = ['-fecha', '-created_at']
+        indexes = [
+            models.Index(fields=['-fecha', '-created_at', '-id'], name='movarch_fecha_creado_idx'),
+            models.Index(fields=['producto', '-fecha'], name='movarch_prod_fecha_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_tipo_display()} - {self.producto.sku} - {self.cantidad} - {self.fecha.strftime('%d/%m/%Y %H:%M')} (archivado)"
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Clave de idempotencia de un registro de movimiento (ver inventory_idempotencia)
+    
+    Cada envío del formulario de movimiento lleva una clave única. Si el
+    mismo envío llega otra vez (doble clic, reintento del lector o de la red)
+    se responde con el resultado guardado aquí sin volver a mover stock. Las
+    claves vencen a las IDEMPOTENCIA_HORAS horas.
+    """
+    usuario = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='claves_idempotencia', verbose_name='Usuario')
+    clave = models.CharField(max_length=64, verbose_name='Clave')
+    resultado = models.JSONField(default=dict, blank=True, verbose_name='Resultado')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha de registro')
+    
+    class Meta:
+        verbose_name = 'Clave de Idempotencia'
+        verbose_name_plural = 'Claves de Idempotencia'
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='idempotencia_usuario_clave_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.clave} ({self.usuario})"
+
+
+class TerminoProducto(models.Model):
+    """
+    Índice invertido de búsqueda de productos para motores sin índice de texto
+    
+    Una fila por término normalizado y producto, con el peso del campo donde
+    aparece (ver busqueda_productos). En MySQL (FULLTEXT) y SQLite (FTS5) la
+    tabla queda vacía.
+    """
+    termino = models.CharField(max_length=64, db_index=True, verbose_name='Término')
+    producto = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='terminos_busqueda', verbose_name='Producto')
+    peso = models.PositiveSmallIntegerField(default=1, verbose_name='Peso')
+    
+    class Meta:
+        verbose_name = 'Término de Búsqueda'
+        verbose_name_plural = 'Términos de Búsqueda'
+    
+    def __str__(self):
+        return f"{self.termino} -> {self.producto_id} ({self.peso})"
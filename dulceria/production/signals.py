@@ -1,25 +1,20 @@
-from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.core.cache import cache
-from .models import Product, Category
-
-
-@receiver(post_delete, sender=Product)
-def actualizar_sku_despues_eliminar(sender, instance, **kwargs):
-    """Actualizar los SKU de los productos restantes después de eliminar uno"""
-    # Obtener todos los productos ordenados por ID
-    productos = Product.objects.all().order_by('id')
-    
-    # Renumerar los SKU
-    for index, producto in enumerate(productos, start=1):
-        nuevo_sku = f"SKU-{str(index).zfill(3)}"
-        if producto.sku != nuevo_sku:
-            producto.sku = nuevo_sku
-            # Usar update para evitar recursión
-            Product.objects.filter(pk=producto.pk).update(sku=nuevo_sku)
-    
-    # Invalidar caché de dashboard después de eliminar producto
-    cache.delete('dashboard_total_products')
+from django.db import transaction
+from .cache_utils import ETIQUETA_CATEGORIAS, ETIQUETA_PRODUCTOS, invalidar_etiquetas
+from .inventory_autocompletar import (
+    CAMPOS_PRODUCTO, CAMPOS_PROVEEDOR, indice_productos, indice_proveedores, registrar_cambio,
+)
+from .imagenes import registrar_imagen_guardada
+from .inventory_codigos import registrar_producto_eliminado, registrar_producto_guardado
+from .busqueda_productos import producto_guardado, reindexar_busqueda_productos
+from .inventory_busqueda import SEPARADOR, normalizar_busqueda, reindexar_busqueda_movimientos
+from .models import (
+    Product, Category, MovimientoArchivado, MovimientoInventario, Proveedor,
+    CONTADOR_PRODUCTOS_CON_STOCK, CONTADOR_STOCK_TOTAL, ajustar_stock_apertura, aporte_contadores_producto,
+    sumar_contadores,
+)
 
 
 @receiver(post_save, sender=Product)
@@ -28,12 +23,41 @@ def invalidar_cache_productos(sender, instance, **kwargs):
     """Invalidar caché relacionado con productos"""
     # Invalidar caché de conteos
     cache.delete('dashboard_total_products')
-    # Invalidar caché de listas (si existe)
-    try:
-        if hasattr(cache, 'delete_pattern'):
-            cache.delete_pattern('products_list_*')
-    except Exception:
-        pass
+    # Invalidar las listas, conteos y el grid de la tienda cacheados con la etiqueta de productos
+    # (al confirmar, para que nadie vuelva a cachear los datos anteriores)
+    transaction.on_commit(lambda: invalidar_etiquetas(ETIQUETA_PRODUCTOS))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def actualizar_indice_codigos(sender, instance, **kwargs):
+    """Parchear el índice de códigos de barras (EAN/UPC y SKU) de la consulta en caja"""
+    if kwargs.get('signal') is post_delete:
+        registrar_producto_eliminado(instance.pk)
+    else:
+        registrar_producto_guardado(instance, kwargs.get('update_fields'))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def actualizar_autocompletar_productos(sender, instance, **kwargs):
+    """Reconstruir el índice de autocompletado de productos si cambió SKU, EAN, nombre o visibilidad"""
+    registrar_cambio(indice_productos, CAMPOS_PRODUCTO, kwargs.get('update_fields'))
+
+
+@receiver(post_save, sender=Proveedor)
+@receiver(post_delete, sender=Proveedor)
+def actualizar_autocompletar_proveedores(sender, instance, **kwargs):
+    """Reconstruir el índice de autocompletado de proveedores si cambió RUT, nombres o estado"""
+    registrar_cambio(indice_proveedores, CAMPOS_PROVEEDOR, kwargs.get('update_fields'))
+
+
+@receiver(post_save, sender=Product)
+def generar_derivados_imagen_producto(sender, instance, **kwargs):
+    """Generar miniaturas y WebP de la imagen del producto cuando cambia"""
+    if registrar_imagen_guardada(instance, 'imagen', 'imagen_derivados', kwargs.get('update_fields')):
+        # Después de generarlos, para que el grid de la tienda no quede cacheado con la imagen original
+        transaction.on_commit(lambda: invalidar_etiquetas(ETIQUETA_PRODUCTOS))
 
 
 @receiver(post_save, sender=Category)
@@ -42,9 +66,97 @@ def invalidar_cache_categorias(sender, instance, **kwargs):
     """Invalidar caché relacionado con categorías"""
     cache.delete('dashboard_total_categories')
     cache.delete('categorias_list')
-    try:
-        if hasattr(cache, 'delete_pattern'):
-            cache.delete_pattern('categories_overview_*')
-    except Exception:
-        pass
+    transaction.on_commit(lambda: invalidar_etiquetas(ETIQUETA_CATEGORIAS))
+
 
+
+@receiver(post_save, sender=Product)
+def reindexar_busqueda_producto(sender, instance, created, **kwargs):
+    """Actualizar texto_busqueda de los movimientos si cambió el SKU o el nombre del producto"""
+    if created:
+        return
+    # El texto de búsqueda comienza con SKU y nombre: solo se recalculan los que no coinciden
+    prefijo = normalizar_busqueda(instance.sku) + SEPARADOR + normalizar_busqueda(instance.name) + SEPARADOR
+    for modelo in (MovimientoInventario, MovimientoArchivado):
+        reindexar_busqueda_movimientos(
+            modelo.objects.filter(producto=instance).exclude(texto_busqueda__startswith=prefijo)
+        )
+
+
+@receiver(post_save, sender=Product)
+def indexar_busqueda_producto(sender, instance, **kwargs):
+    """Mantener el índice invertido de búsqueda de productos (solo en motores sin FULLTEXT/FTS5)"""
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'texto_busqueda' not in update_fields:
+        return
+    producto_guardado(instance.pk, instance.texto_busqueda, instance.texto_descripcion)
+
+
+@receiver(post_save, sender=Category)
+def reindexar_busqueda_categoria(sender, instance, created, **kwargs):
+    """Actualizar los textos de búsqueda de los productos si cambió el nombre de la categoría"""
+    if created:
+        return
+    # La categoría es la última parte de texto_busqueda: solo se recalculan los que no coinciden
+    sufijo = SEPARADOR + normalizar_busqueda(instance.name)
+    reindexar_busqueda_productos(Product.objects.filter(category=instance).exclude(texto_busqueda__endswith=sufijo))
+
+
+@receiver(post_save, sender=Proveedor)
+def reindexar_busqueda_proveedor(sender, instance, created, **kwargs):
+    """Actualizar texto_busqueda de los movimientos si cambió la razón social o el RUT del proveedor"""
+    if created:
+        return
+    fragmento = SEPARADOR + normalizar_busqueda(instance.razon_social) + SEPARADOR + normalizar_busqueda(instance.rut) + SEPARADOR
+    for modelo in (MovimientoInventario, MovimientoArchivado):
+        reindexar_busqueda_movimientos(
+            modelo.objects.filter(proveedor=instance).exclude(texto_busqueda__contains=fragmento)
+        )
+
+
+def _afecta_contadores(update_fields):
+    # Un guardado parcial que no toca estos campos deja los contadores igual
+    return update_fields is None or bool({'stock', 'is_active', 'estado_aprobacion'} & set(update_fields))
+
+
+@receiver(pre_save, sender=Product)
+def recordar_aporte_contadores(sender, instance, **kwargs):
+    """Guardar lo que el producto aportaba a los contadores del dashboard antes de este guardado"""
+    if not _afecta_contadores(kwargs.get('update_fields')):
+        return
+    anterior = None
+    if instance.pk is not None:
+        anterior = Product.objects.filter(pk=instance.pk).values_list('stock', 'is_active', 'estado_aprobacion').first()
+    instance._aporte_contadores = aporte_contadores_producto(*anterior) if anterior else (0, 0)
+    # También el stock guardado, para llevar a StockBodega lo que se escriba directamente
+    instance._stock_anterior = anterior[0] if anterior else 0
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def actualizar_contadores_producto(sender, instance, **kwargs):
+    """Sumar a los contadores del dashboard el cambio de stock, estado o aprobación del producto"""
+    if kwargs.get('signal') is post_delete:
+        despues = (0, 0)
+        antes = aporte_contadores_producto(instance.stock, instance.is_active, instance.estado_aprobacion)
+    elif not _afecta_contadores(kwargs.get('update_fields')):
+        return
+    else:
+        despues = aporte_contadores_producto(instance.stock, instance.is_active, instance.estado_aprobacion)
+        antes = getattr(instance, '_aporte_contadores', (0, 0))
+        instance._aporte_contadores = despues
+    sumar_contadores({
+        CONTADOR_STOCK_TOTAL: despues[0] - antes[0],
+        CONTADOR_PRODUCTOS_CON_STOCK: despues[1] - antes[1],
+    })
+
+
+@receiver(post_save, sender=Product)
+def sincronizar_stock_apertura(sender, instance, raw=False, **kwargs):
+    """Llevar a la bodega de apertura el stock escrito directamente en el producto (sin movimiento)"""
+    if raw or not _afecta_contadores(kwargs.get('update_fields')):
+        return
+    delta = instance.stock - getattr(instance, '_stock_anterior', 0)
+    instance._stock_anterior = instance.stock
+    if delta:
+        ajustar_stock_apertura(instance.pk, delta)
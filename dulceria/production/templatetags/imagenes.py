@@ -0,0 +1,54 @@
+"""
+Tags de plantilla para imágenes con derivados (srcset, WebP y carga diferida)
+
+    {% load imagenes %}
+    {% imagen_responsive product.imagen product.imagen_derivados alt=product.name sizes="50px" clase="rounded" %}
+"""
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..imagenes import nombre_derivado, vigentes
+
+
+register = template.Library()
+
+
+def _srcset(storage, derivados, extension):
+    return format_html_join(', ', '{} {}w', (
+        (storage.url(nombre_derivado(derivados['origen'], ancho, extension)), ancho)
+        for ancho in derivados['anchos']
+    ))
+
+
+@register.simple_tag
+def imagen_responsive(archivo, derivados=None, alt='', sizes='100vw', clase='', estilo=''):
+    """
+    <picture> con srcset WebP y de respaldo, loading="lazy" y dimensiones intrínsecas
+
+    `sizes` indica el ancho con que se muestra la imagen (por ejemplo "50px"
+    o "(min-width: 992px) 25vw, 100vw") para que el navegador elija el
+    derivado más pequeño que alcance. Sin derivados vigentes se usa la
+    imagen original.
+    """
+    if not archivo:
+        return ''
+    if not vigentes(archivo, derivados):
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" style="{}" loading="lazy" decoding="async">',
+            archivo.url, alt, clase, estilo,
+        )
+
+    storage = archivo.storage
+    mayor = derivados['anchos'][-1]
+    alto = max(1, round(derivados['alto'] * mayor / derivados['ancho']))
+    # display: contents deja que el <img> se ajuste al contenedor como si <picture> no existiera
+    return format_html(
+        '<picture style="display: contents">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" style="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        _srcset(storage, derivados, 'webp'), sizes,
+        storage.url(nombre_derivado(derivados['origen'], mayor, derivados['respaldo'])),
+        _srcset(storage, derivados, derivados['respaldo']), sizes,
+        mayor, alto, alt, clase, estilo,
+    )
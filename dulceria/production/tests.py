@@ -1,3 +1,1067 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import unittest
+import uuid
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from django.utils import timezone
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+try:
+    from django.core.cache.backends.redis import RedisCache
+    from fakeredis import FakeConnection
+except ImportError:
+    FakeConnection = None
+
+from accounts.models import UserProfile
+from organizations.models import Organization
+
+from . import busqueda_productos
+from .busqueda_productos import TABLA_FTS_PRODUCTOS, TRIGGERS_FTS_PRODUCTOS, buscar_productos
+from .admin_views import get_widget_for_field
+from .forms import ProductForm
+from .cache_utils import CacheEtiquetada
+from .imagenes import nombres_derivados
+from .export_jobs import marcar_interrumpidos, procesar_siguiente, procesar_trabajo
+from .inventory_codigos import CLAVE_VERSION, IndiceCodigos, buscar_codigo
+from .inventory_contadores import contadores_dashboard, reconciliar_contadores
+from .inventory_archivo import archivar_movimientos, inicio_periodo_abierto, modelos_para_rango
+from .inventory_busqueda import filtrar_busqueda_movimientos, normalizar_busqueda
+from .inventory_export import escribir_reporte_inventario, recorrer_movimientos
+from .inventory_cursor import ANTERIOR, codificar_token, paginar_por_cursor
+from .inventory_fefo import registrar_salida_fefo
+from .inventory_idempotencia import buscar_resultado, ejecutar_una_vez
+from .inventory_import import ErrorImportacion, importar_movimientos
+from .inventory_kardex import apertura_kardex, codificar_cursor, decodificar_cursor, iterar_kardex
+from .inventory_snapshots import fin_del_dia, generar_snapshot, stock_a_fecha, stock_a_fecha_todos
+from .inventory_vencimientos import escanear_vencimientos
+from .models import (
+    Bodega, Category, ContadorInventario, ContadorPendiente, MovimientoArchivado, MovimientoInventario, Product,
+    ProductoProveedor, Proveedor, TrabajoExportacion,
+    StockBodega, StockInsuficienteError, VencimientoProximo, aplicar_delta_stock, clave_productos_bodega,
+    clave_stock_bodega, clave_vencidos_al, reconstruir_stock_bodega,
+)
+
+
+def _triggers_fts():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s", [f'{TABLA_FTS_PRODUCTOS}_%'])
+        return {fila[0] for fila in cursor.fetchall()}
+
+
+def _ultima_migracion(app):
+    executor = MigrationExecutor(connection)
+    return [hoja for hoja in executor.loader.graph.leaf_nodes() if hoja[0] == app]
+
+
+class BusquedaProductosSqliteTests(TransactionTestCase):
+    """Índice FTS5 de productos en SQLite: migraciones que reconstruyen la tabla y triggers faltantes"""
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('El índice FTS5 solo existe en SQLite')
+        busqueda_productos._motores.clear()
+        self.categoria = Category.objects.create(name='Chocolates')
+
+    def tearDown(self):
+        busqueda_productos._motores.clear()
+
+    def _encontrados(self, q):
+        return list(buscar_productos(Product.objects.all(), q).values_list('name', flat=True))
+
+    def test_busqueda_despues_de_migrar_desde_0020(self):
+        # 0021 reconstruye production_product en SQLite; 0022 debe dejar los triggers de nuevo
+        executor = MigrationExecutor(connection)
+        executor.migrate([('production', '0020_producto_texto_busqueda')])
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(_ultima_migracion('production'))
+        busqueda_productos._motores.clear()
+
+        self.assertEqual(_triggers_fts(), set(TRIGGERS_FTS_PRODUCTOS))
+        Product.objects.create(name='Bombón de cereza', category=self.categoria)
+        self.assertEqual(busqueda_productos._motor_busqueda(), 'fts5')
+        self.assertEqual(self._encontrados('cerezas'), ['Bombón de cereza'])
+
+    def test_sin_triggers_recorre_los_textos(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER {TRIGGERS_FTS_PRODUCTOS[0]}')
+        busqueda_productos._motores.clear()
+        try:
+            # El índice FTS5 no recibe esta fila: solo la encuentra el recorrido de los textos
+            Product.objects.create(name='Alfajor de manjar', description='Relleno de cereza', category=self.categoria)
+            Product.objects.create(name='Cereza confitada', category=self.categoria)
+            self.assertEqual(busqueda_productos._motor_busqueda(), 'textos')
+            self.assertEqual(self._encontrados('alfajor'), ['Alfajor de manjar'])
+            # El nombre pesa más que la descripción
+            self.assertEqual(self._encontrados('cer'), ['Cereza confitada', 'Alfajor de manjar'])
+        finally:
+            busqueda_productos.asegurar_indice_productos(reconstruir=True)
+        self.assertEqual(busqueda_productos._motor_busqueda(), 'fts5')
+        self.assertEqual(self._encontrados('alfajor'), ['Alfajor de manjar'])
+
+
+class PoblarStockBodegaMigracionTests(TransactionTestCase):
+    """0023 calcula StockBodega desde el historial con los modelos históricos"""
+
+    def test_poblar_desde_el_historial(self):
+        categoria = Category.objects.create(name='Chocolates')
+        central = Bodega.objects.create(codigo='BOD-CENTRAL', nombre='Central')
+        sala = Bodega.objects.create(codigo='BOD-SALA', nombre='Sala de ventas')
+        producto = Product.objects.create(name='Barra de chocolate', category=categoria, stock=50)
+        # Historial anterior a StockBodega: filas insertadas sin pasar por save()
+        ahora = timezone.now()
+        MovimientoInventario.objects.bulk_create([
+            MovimientoInventario(fecha=ahora, tipo='ingreso', producto=producto, bodega=sala, cantidad=8, lote='L-1'),
+            MovimientoInventario(fecha=ahora, tipo='salida', producto=producto, bodega=sala, cantidad=3),
+            MovimientoInventario(fecha=ahora, tipo='transferencia', producto=producto, bodega=central, cantidad=4),
+        ])
+        Product.objects.filter(pk=producto.pk).update(stock=55)
+        StockBodega.objects.all().delete()
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([('production', '0022_recrear_indice_productos')])
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(_ultima_migracion('production'))
+
+        saldos = StockBodega.objects.filter(producto=producto).values_list('bodega__codigo', 'lote', 'cantidad')
+        # Stock inicial (55 - 5 de movimientos) en la bodega de apertura; la transferencia sin destino no mueve nada;
+        # la salida sin lote de la sala se descuenta del lote L-1
+        self.assertEqual(sorted(saldos), [('BOD-CENTRAL', '', 50), ('BOD-SALA', 'L-1', 5)])
+
+
+def _imagen(nombre, formato):
+    contenido = BytesIO()
+    Image.new('RGB', (400, 300), 'red').save(contenido, format=formato)
+    return SimpleUploadedFile(nombre, contenido.getvalue())
+
+
+class DerivadosImagenesTests(TestCase):
+    """Derivados de imágenes con el mismo nombre base y distinta extensión"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, IMAGENES_ANCHOS=(160, 320))
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.categoria = Category.objects.create(name='Caramelos')
+
+    def _producto(self, nombre, imagen):
+        with self.captureOnCommitCallbacks(execute=True):
+            producto = Product.objects.create(name=nombre, category=self.categoria, imagen=imagen)
+        producto.refresh_from_db()
+        return producto
+
+    def test_jpg_y_png_no_comparten_derivados(self):
+        jpg = self._producto('Caramelo rojo', _imagen('foto.jpg', 'JPEG'))
+        png = self._producto('Caramelo azul', _imagen('foto.png', 'PNG'))
+        nombres_jpg = set(nombres_derivados(jpg.imagen_derivados))
+        nombres_png = set(nombres_derivados(png.imagen_derivados))
+        self.assertEqual(len(nombres_jpg), 4)
+        self.assertFalse(nombres_jpg & nombres_png)
+
+        # Quitar la imagen de uno borra sus derivados y no los del otro
+        jpg.imagen = None
+        with self.captureOnCommitCallbacks(execute=True):
+            jpg.save()
+        self.assertFalse(any(default_storage.exists(nombre) for nombre in nombres_jpg))
+        self.assertTrue(all(default_storage.exists(nombre) for nombre in nombres_png))
+
+
+def _usuario(username, role):
+    usuario = User.objects.create_user(username, password='clave-de-prueba')
+    organizacion, _ = Organization.objects.get_or_create(name='Dulcería')
+    UserProfile.objects.create(user=usuario, role=role, organization=organizacion)
+    return usuario
+
+
+@override_settings(INDICE_CODIGOS_SEGUNDOS=0)
+class AutocompletarAlcanceTests(TestCase):
+    """Alcance del autocompletado: los formularios de movimientos y el panel de administración"""
+
+    def setUp(self):
+        cache.clear()
+        categoria = Category.objects.create(name='Gomitas')
+        self.aprobado = Product.objects.create(name='Gomita ácida', category=categoria, estado_aprobacion='APROBADO')
+        self.pendiente = Product.objects.create(name='Gomita dulce', category=categoria, estado_aprobacion='PENDIENTE')
+        self.url = reverse('autocompletar_productos_api')
+
+    def _ids(self, usuario, **parametros):
+        self.client.force_login(usuario)
+        respuesta = self.client.get(self.url, {'q': 'gomita', **parametros})
+        return respuesta.status_code, {fila['id'] for fila in respuesta.json().get('resultados', [])}
+
+    def test_alcance_vigentes_y_todos(self):
+        admin = _usuario('admin', 'admin')
+        self.assertEqual(self._ids(admin), (200, {self.aprobado.pk}))
+        self.assertEqual(self._ids(admin, alcance='todos'), (200, {self.aprobado.pk, self.pendiente.pk}))
+
+    def test_alcance_todos_solo_admin_y_gerente(self):
+        self.assertEqual(self._ids(_usuario('bodega', 'employee'), alcance='todos'), (403, set()))
+
+    def test_panel_usa_alcance_todos(self):
+        widget = get_widget_for_field(ProductoProveedor._meta.get_field('product'))
+        self.assertIn('alcance=todos', str(widget.attrs['data-autocompletar-url']))
+
+
+class StockMovimientosTestCase(TestCase):
+    """Producto y dos bodegas para registrar movimientos"""
+
+    def setUp(self):
+        categoria = Category.objects.create(name='Chocolates')
+        self.producto = Product.objects.create(name='Barra de chocolate', category=categoria)
+        self.central = Bodega.objects.create(codigo='BOD-CENTRAL', nombre='Central')
+        self.sala = Bodega.objects.create(codigo='BOD-SALA', nombre='Sala de ventas')
+
+    def _movimiento(self, tipo, cantidad, bodega=None, **campos):
+        return MovimientoInventario.objects.create(
+            fecha=campos.pop('fecha', timezone.now()), tipo=tipo, producto=self.producto,
+            bodega=bodega or self.central, cantidad=cantidad, **campos,
+        )
+
+    def _stock(self):
+        return Product.objects.get(pk=self.producto.pk).stock
+
+    def _saldos(self):
+        """Saldo por bodega (suma de sus lotes), sin las bodegas en cero"""
+        saldos = StockBodega.objects.filter(producto=self.producto).order_by().values('bodega__codigo').annotate(
+            total=Sum('cantidad')
+        ).exclude(total=0)
+        return {fila['bodega__codigo']: fila['total'] for fila in saldos}
+
+
+class StockBodegaTests(StockMovimientosTestCase):
+    """Saldos por bodega: nunca negativos y reconstruibles desde el historial"""
+
+    def test_salida_sin_saldo_en_la_bodega(self):
+        self._movimiento('ingreso', 10, self.central)
+        # El producto tiene stock, pero no en la sala
+        with self.assertRaises(StockInsuficienteError):
+            self._movimiento('salida', 1, self.sala)
+        self.assertEqual(self._stock(), 10)
+        self.assertEqual(self._saldos(), {'BOD-CENTRAL': 10})
+
+    def test_transferencia_mayor_al_saldo_de_origen(self):
+        self._movimiento('ingreso', 5, self.central)
+        with self.assertRaises(StockInsuficienteError):
+            self._movimiento('transferencia', 6, self.central, bodega_destino=self.sala)
+        self.assertEqual(self._saldos(), {'BOD-CENTRAL': 5})
+
+    def test_reconstruir_desde_el_historial(self):
+        self._movimiento('ingreso', 8, self.central)
+        self._movimiento('transferencia', 3, self.central, bodega_destino=self.sala)
+        self._movimiento('salida', 1, self.sala)
+        StockBodega.objects.all().delete()
+        self.assertEqual(reconstruir_stock_bodega(), (2, 3))
+        self.assertEqual(self._saldos(), {'BOD-CENTRAL': 5, 'BOD-SALA': 2})
+
+
+    def test_producto_creado_con_stock(self):
+        # El stock inicial queda en la bodega de apertura (la primera activa por código)
+        producto = Product.objects.create(name='Caramelos', category=self.producto.category, stock=50)
+        saldos = StockBodega.objects.filter(producto=producto).values_list('bodega__codigo', 'cantidad')
+        self.assertEqual(dict(saldos), {'BOD-CENTRAL': 50})
+        MovimientoInventario.objects.create(
+            fecha=timezone.now(), tipo='salida', producto=producto, bodega=self.central, cantidad=1,
+        )
+        self.assertEqual(Product.objects.get(pk=producto.pk).stock, 49)
+
+    def test_el_formulario_no_edita_el_stock(self):
+        self.assertTrue(ProductForm(instance=self.producto).fields['stock'].disabled)
+        self.assertFalse(ProductForm().fields['stock'].disabled)
+
+    def test_salida_sin_lote_toma_de_los_lotes(self):
+        self._movimiento('ingreso', 10, lote='L-1')
+        salida = self._movimiento('salida', 4)
+        self.assertEqual(self._stock(), 6)
+        lotes = StockBodega.objects.filter(producto=self.producto).values_list('lote', 'cantidad')
+        self.assertEqual(dict(lotes), {'L-1': 6})
+        # Al eliminarla las unidades vuelven sin lote
+        salida.delete()
+        self.assertEqual(self._saldos(), {'BOD-CENTRAL': 10})
+        with self.assertRaises(StockInsuficienteError):
+            self._movimiento('salida', 11)
+
+    def test_importar_salida_sin_lote(self):
+        importar_movimientos([
+            {'fecha': timezone.now(), 'tipo': 'ajuste', 'sku': self.producto.sku, 'bodega': 'BOD-CENTRAL',
+             'cantidad': 10, 'lote': 'L-1'},
+            {'fecha': timezone.now(), 'tipo': 'salida', 'sku': self.producto.sku, 'bodega': 'BOD-CENTRAL', 'cantidad': 3},
+        ])
+        self.assertEqual(self._stock(), 7)
+        self.assertEqual(self._saldos(), {'BOD-CENTRAL': 7})
+
+    def test_importar_salida_antes_del_ingreso(self):
+        fila = {'fecha': timezone.now(), 'sku': self.producto.sku, 'bodega': 'BOD-CENTRAL', 'cantidad': 4, 'lote': 'L-1'}
+        with self.assertRaises(ErrorImportacion) as contexto:
+            importar_movimientos([
+                {**fila, 'tipo': 'ajuste', 'lote': 'L-2', 'cantidad': 10},
+                {**fila, 'tipo': 'salida'},
+                {**fila, 'tipo': 'ajuste'},
+                {**fila, 'tipo': 'salida', 'lote': '', 'cantidad': 11},
+            ])
+        self.assertEqual(len(contexto.exception.errores), 1)
+        self.assertTrue(contexto.exception.errores[0].startswith('Línea 3: stock insuficiente'))
+        self.assertEqual(self._saldos(), {})
+        self.assertFalse(MovimientoInventario.objects.exists())
+
+    def test_importar_salida_sin_lote_sin_stock(self):
+        fila = {'fecha': timezone.now(), 'sku': self.producto.sku, 'bodega': 'BOD-CENTRAL', 'cantidad': 5}
+        with self.assertRaises(ErrorImportacion) as contexto:
+            importar_movimientos([
+                {**fila, 'tipo': 'ajuste', 'lote': 'L-1'},
+                {**fila, 'tipo': 'transferencia', 'bodega_destino': 'BOD-SALA', 'cantidad': 2},
+                {**fila, 'tipo': 'salida'},
+            ])
+        self.assertEqual([error[:9] for error in contexto.exception.errores], ['Línea 4: '])
+
+    def test_reconstruir_con_stock_inicial(self):
+        producto = Product.objects.create(name='Caramelos', category=self.producto.category, stock=50)
+        MovimientoInventario.objects.create(
+            fecha=timezone.now(), tipo='ingreso', producto=producto, bodega=self.sala, cantidad=5, lote='L-1',
+        )
+        MovimientoInventario.objects.create(
+            fecha=timezone.now(), tipo='salida', producto=producto, bodega=self.sala, cantidad=2,
+        )
+        StockBodega.objects.all().delete()
+        reconstruir_stock_bodega()
+        self.assertEqual(
+            dict(StockBodega.objects.filter(producto=producto).values_list('bodega__codigo', 'cantidad')),
+            {'BOD-CENTRAL': 50, 'BOD-SALA': 3},
+        )
+
+
+class SnapshotsMovimientosConFechaPasadaTests(StockMovimientosTestCase):
+    """Movimientos con fecha en o antes del cierre de un snapshot"""
+
+    def setUp(self):
+        super().setUp()
+        self.hoy = timezone.localdate()
+        self.ayer = self.hoy - timedelta(days=1)
+        self.hace_tres_dias = timezone.now() - timedelta(days=3)
+        self._movimiento('ingreso', 10, fecha=self.hace_tres_dias)
+        generar_snapshot(self.ayer)
+
+    def _a_fecha(self, fecha, bodega=None):
+        return stock_a_fecha(self.producto.pk, fecha, bodega.pk if bodega else None)['cantidad']
+
+    def test_registrar_editar_y_eliminar_con_fecha_pasada(self):
+        salida = self._movimiento('salida', 3, fecha=self.hace_tres_dias + timedelta(hours=1))
+        self.assertEqual(self._stock(), 7)
+        self.assertEqual(self._a_fecha(self.ayer), 7)
+        self.assertEqual(self._a_fecha(self.ayer, self.central), 7)
+        self.assertEqual(self._a_fecha(self.hoy), 7)
+        self.assertEqual(stock_a_fecha_todos(self.ayer)[0][self.producto.pk], 7)
+
+        salida.cantidad = 5
+        salida.save()
+        self.assertEqual(self._a_fecha(self.ayer), 5)
+        self.assertEqual(self._a_fecha(self.ayer, self.central), 5)
+
+        salida.delete()
+        self.assertEqual(self._a_fecha(self.ayer), 10)
+        self.assertEqual(self._a_fecha(self.ayer, self.central), 10)
+
+    def test_saldo_sin_fila_en_el_snapshot(self):
+        # La sala no tenía saldo al cierre: la transferencia crea su fila en el snapshot
+        self._movimiento('transferencia', 4, fecha=self.hace_tres_dias + timedelta(hours=1), bodega_destino=self.sala)
+        self.assertEqual(self._a_fecha(self.ayer, self.sala), 4)
+        self.assertEqual(self._a_fecha(self.ayer, self.central), 6)
+        self.assertEqual(self._a_fecha(self.ayer), 10)
+
+    def test_importar_con_fecha_pasada(self):
+        importar_movimientos([
+            {'fecha': self.hace_tres_dias + timedelta(hours=2), 'tipo': 'salida', 'sku': self.producto.sku,
+             'bodega': 'BOD-CENTRAL', 'cantidad': 2},
+            {'fecha': timezone.now(), 'tipo': 'salida', 'sku': self.producto.sku, 'bodega': 'BOD-CENTRAL', 'cantidad': 1},
+        ])
+        self.assertEqual(self._a_fecha(self.ayer), 8)
+        self.assertEqual(self._a_fecha(self.hoy), 7)
+        self.assertEqual(self._stock(), 7)
+
+
+class CostoPromedioTests(StockMovimientosTestCase):
+    """Costo promedio ponderado al registrar, editar y eliminar ingresos valorizados"""
+
+    def setUp(self):
+        super().setUp()
+        self._movimiento('ingreso', 10, costo_unitario=Decimal('100'))
+        self.ingreso = self._movimiento('ingreso', 10, costo_unitario=Decimal('200'))
+
+    def _promedio(self):
+        return Product.objects.get(pk=self.producto.pk).costo_promedio
+
+    def test_ingresos_nuevos(self):
+        self.assertEqual(self._promedio(), Decimal('150.00'))
+
+    def test_editar_costo(self):
+        self.ingreso.costo_unitario = Decimal('300')
+        self.ingreso.save()
+        self.assertEqual(self._promedio(), Decimal('200.00'))
+
+    def test_editar_cantidad(self):
+        self.ingreso.cantidad = 30
+        self.ingreso.save()
+        self.assertEqual(self._promedio(), Decimal('175.00'))
+        self.assertEqual(self._stock(), 40)
+
+    def test_editar_sin_cambiar_el_ingreso_no_redondea(self):
+        self.ingreso.doc_referencia = 'FAC-1'
+        self.ingreso.save()
+        self.assertEqual(self._promedio(), Decimal('150.00'))
+
+    def test_eliminar(self):
+        self.ingreso.delete()
+        self.assertEqual(self._promedio(), Decimal('100.00'))
+
+
+class KardexValorizacionTests(StockMovimientosTestCase):
+    """Kardex valorizado con el costo de cada ingreso y promedio ponderado móvil"""
+
+    def setUp(self):
+        super().setUp()
+        inicio = timezone.now() - timedelta(hours=1)
+        self._movimiento('ingreso', 10, costo_unitario=Decimal('100'), fecha=inicio)
+        self._movimiento('ingreso', 10, costo_unitario=Decimal('200'), fecha=inicio + timedelta(minutes=1))
+        self._movimiento('salida', 5, fecha=inicio + timedelta(minutes=2))
+        self._movimiento('ingreso', 5, costo_unitario=Decimal('300'), fecha=inicio + timedelta(minutes=3))
+        # Un costo estándar actual distinto no debe revalorizar el historial
+        Product.objects.filter(pk=self.producto.pk).update(costo_estandar=Decimal('999'))
+        self.producto.refresh_from_db()
+
+    def _filas(self, **opciones):
+        saldo, valor = apertura_kardex(self.producto)
+        return list(iterar_kardex(self.producto, saldo_apertura=saldo, valor_apertura=valor, **opciones))
+
+    def test_valoriza_con_el_costo_de_cada_movimiento(self):
+        filas = self._filas()
+        self.assertEqual([fila['costo_unitario'] for fila in filas], [Decimal('100'), Decimal('200'), Decimal('150'), Decimal('300')])
+        self.assertEqual([fila['valor_movimiento'] for fila in filas], [Decimal('1000'), Decimal('2000'), Decimal('-750'), Decimal('1500')])
+        self.assertEqual([fila['valor_saldo'] for fila in filas], [Decimal('1000'), Decimal('3000'), Decimal('2250'), Decimal('3750')])
+        self.assertEqual(filas[-1]['saldo'], 20)
+
+    def test_paginas_continuan_el_saldo_valorizado(self):
+        completas = self._filas()
+        for usar_ventana in (True, False):
+            with self.subTest(usar_ventana=usar_ventana):
+                primera = self._filas(tamano_pagina=2, usar_ventana=usar_ventana)[:2]
+                cursor = decodificar_cursor(codificar_cursor(primera[-1]))
+                resto = list(iterar_kardex(self.producto, cursor=cursor, tamano_pagina=2, usar_ventana=usar_ventana))
+                self.assertEqual(
+                    [(fila['saldo'], fila['valor_saldo']) for fila in primera + resto],
+                    [(fila['saldo'], fila['valor_saldo']) for fila in completas],
+                )
+
+    def test_apertura_desde_una_fecha(self):
+        salida = MovimientoInventario.objects.get(tipo='salida')
+        MovimientoInventario.objects.filter(tipo='ingreso', costo_unitario=Decimal('300')).update(
+            fecha=salida.fecha + timedelta(days=1)
+        )
+        MovimientoInventario.objects.exclude(costo_unitario=Decimal('300')).update(fecha=salida.fecha - timedelta(days=1))
+        desde = timezone.localdate(salida.fecha + timedelta(days=1))
+        self.assertEqual(apertura_kardex(self.producto, desde=desde), (15, Decimal('2250')))
+
+
+class ContadoresDashboardTests(StockMovimientosTestCase):
+    """Stock por bodega y resumen de vencimientos del dashboard leídos desde ContadorInventario"""
+
+    def _movimiento(self, *args, **kwargs):
+        # Los contadores se suman al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            return super()._movimiento(*args, **kwargs)
+
+    def test_stock_por_bodega(self):
+        self._movimiento('ingreso', 10, self.central)
+        self._movimiento('transferencia', 4, self.central, bodega_destino=self.sala)
+        salida = self._movimiento('salida', 4, self.sala)
+        self.assertEqual(
+            [(fila['bodega__codigo'], fila['productos'], fila['total']) for fila in contadores_dashboard()['stock_por_bodega']],
+            [('BOD-CENTRAL', 1, 6)],
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            salida.delete()
+        incremental = dict(ContadorInventario.objects.values_list('clave', 'valor'))
+        self.assertEqual(incremental[clave_stock_bodega(self.sala.pk)], 4)
+        self.assertEqual(incremental[clave_productos_bodega(self.sala.pk)], 1)
+        # La reconciliación no encuentra diferencias
+        self.assertEqual(reconciliar_contadores(dias=1), {})
+
+    def test_resumen_de_vencimientos(self):
+        hoy = timezone.localdate()
+        self._movimiento('ingreso', 5, lote='L-1', fecha_vencimiento=hoy - timedelta(days=2))
+        self._movimiento('ingreso', 5, lote='L-2', fecha_vencimiento=hoy + timedelta(days=5))
+        self.assertEqual(contadores_dashboard()['vencimientos_resumen']['generado_en'], None)
+        escanear_vencimientos(dias=30)
+        resumen = contadores_dashboard()['vencimientos_resumen']
+        self.assertEqual(resumen['total'], VencimientoProximo.objects.count())
+        self.assertEqual(resumen['vencidos'], VencimientoProximo.objects.filter(fecha_vencimiento__lt=hoy).count())
+        self.assertEqual(resumen['vencidos'], 1)
+        self.assertIsNotNone(resumen['generado_en'])
+        valores = dict(ContadorInventario.objects.values_list('clave', 'valor'))
+        self.assertEqual(valores[clave_vencidos_al(hoy + timedelta(days=6))], resumen['total'])
+
+    def test_reconciliar_con_sumas_pendientes(self):
+        self._movimiento('ingreso', 10, self.central)
+        with self.captureOnCommitCallbacks() as pendientes:
+            super()._movimiento('salida', 3, self.central)
+        # El movimiento está confirmado pero sus sumas aún no se aplican
+        reconciliar_contadores(dias=1)
+        for callback in pendientes:
+            callback()
+        self.assertFalse(ContadorPendiente.objects.exists())
+        self.assertEqual(reconciliar_contadores(dias=1), {})
+        self.assertEqual(ContadorInventario.objects.get(clave=clave_stock_bodega(self.central.pk)).valor, 7)
+
+    def test_falla_al_sumar_no_falla_el_movimiento(self):
+        self._movimiento('ingreso', 10, self.central)
+        with mock.patch('production.models._sumar_lote_contadores', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('production.models', 'WARNING'):
+                self._movimiento('salida', 3, self.central)
+        self.assertEqual(self._stock(), 7)
+        # Las sumas quedan pendientes y la reconciliación las aplica
+        self.assertTrue(ContadorPendiente.objects.exists())
+        reconciliar_contadores(dias=1)
+        self.assertFalse(ContadorPendiente.objects.exists())
+        self.assertEqual(ContadorInventario.objects.get(clave=clave_stock_bodega(self.central.pk)).valor, 7)
+
+
+class CacheEtiquetadaCasos:
+    """
+    Invalidación por etiquetas con dos instancias del backend sobre el mismo
+    almacenamiento, que hacen de dos procesos web con la caché compartida:
+    lo que una invalida, la otra debe dejar de verlo
+    """
+
+    def _backends(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.proceso_a, self.proceso_b = self._backends()
+        self.a, self.b = CacheEtiquetada(self.proceso_a), CacheEtiquetada(self.proceso_b)
+        self.a.set('lista', 'v1', ['productos'])
+        self.a.set('resumen', 'r1', ['categorias'])
+        self.a.set('grid', 'g1', ['productos', 'categorias'])
+
+    def test_lectura_desde_otro_proceso(self):
+        self.assertEqual(self.b.get('lista', ['productos']), 'v1')
+        # El orden de las etiquetas no cambia la clave
+        self.assertEqual(self.b.get('grid', ['categorias', 'productos']), 'g1')
+
+    def test_invalidar_en_otro_proceso(self):
+        self.b.invalidar('productos')
+        self.assertIsNone(self.a.get('lista', ['productos']))
+        self.assertEqual(self.a.get('resumen', ['categorias']), 'r1')
+        # Una entrada con varias etiquetas cae con cualquiera
+        self.assertIsNone(self.a.get('grid', ['productos', 'categorias']))
+        self.a.set('lista', 'v2', ['productos'])
+        self.assertEqual(self.b.get('lista', ['productos']), 'v2')
+
+    def test_get_or_set_guarda_none(self):
+        llamadas = []
+        for _ in range(3):
+            self.b.get_or_set('vacio', lambda: llamadas.append(1), ['productos'])
+        self.assertEqual(len(llamadas), 1)
+
+    def test_version_perdida_no_sirve_el_valor_viejo(self):
+        # La caché expulsa la versión de la etiqueta
+        self.proceso_a.delete(CacheEtiquetada.PREFIJO + 'productos')
+        self.assertIsNone(self.b.get('lista', ['productos']))
+
+    def test_invalidar_una_etiqueta_inexistente_la_crea(self):
+        self.a.invalidar('nueva')
+        self.assertIsNotNone(self.proceso_b.get(CacheEtiquetada.PREFIJO + 'nueva'))
+
+
+class CacheEtiquetadaLocMemTests(CacheEtiquetadaCasos, SimpleTestCase):
+
+    def _backends(self):
+        ubicacion = f'etiquetas-{uuid.uuid4().hex}'
+        return LocMemCache(ubicacion, {}), LocMemCache(ubicacion, {})
+
+
+@unittest.skipIf(FakeConnection is None, 'Hace falta fakeredis')
+class CacheEtiquetadaRedisTests(CacheEtiquetadaCasos, SimpleTestCase):
+    """Los mismos casos contra RedisCache sobre un servidor fakeredis compartido"""
+
+    def _backends(self):
+        # Prefijo único: cada prueba parte de un almacenamiento vacío
+        opciones = {'OPTIONS': {'connection_class': FakeConnection}, 'KEY_PREFIX': uuid.uuid4().hex}
+        return RedisCache('redis://localhost:6379/15', opciones), RedisCache('redis://localhost:6379/15', opciones)
+
+
+class MovimientosStockTests(StockMovimientosTestCase):
+    """Deltas condicionales de stock al registrar, editar y eliminar movimientos"""
+
+    def test_delta_condicional(self):
+        self._movimiento('ingreso', 5)
+        with self.assertRaises(StockInsuficienteError):
+            aplicar_delta_stock(self.producto.pk, -6)
+        self.assertEqual(self._stock(), 5)
+        aplicar_delta_stock(self.producto.pk, -5)
+        self.assertEqual(self._stock(), 0)
+
+    def test_instancia_desactualizada_no_pisa_el_stock(self):
+        # self.producto sigue con stock 0 en memoria: los movimientos suman deltas, no escriben el valor leído
+        self._movimiento('ingreso', 10)
+        self._movimiento('salida', 3)
+        self.assertEqual(self.producto.stock, 0)
+        self.assertEqual(self._stock(), 7)
+
+    def test_salida_mayor_al_stock(self):
+        self._movimiento('ingreso', 5)
+        with self.assertRaises(StockInsuficienteError):
+            self._movimiento('salida', 6)
+        self.assertEqual(self._stock(), 5)
+        self.assertEqual(MovimientoInventario.objects.filter(tipo='salida').count(), 0)
+
+    def test_editar_revierte_el_efecto_anterior(self):
+        self._movimiento('ingreso', 10)
+        salida = self._movimiento('salida', 3)
+        salida.cantidad = 5
+        salida.save()
+        self.assertEqual(self._stock(), 5)
+        self.assertEqual(self._saldos(), {'BOD-CENTRAL': 5})
+        salida.tipo = 'ingreso'
+        salida.save()
+        self.assertEqual(self._stock(), 15)
+
+    def test_editar_que_deja_stock_negativo(self):
+        ingreso = self._movimiento('ingreso', 10)
+        self._movimiento('salida', 8)
+        ingreso.cantidad = 5
+        with self.assertRaises(StockInsuficienteError):
+            ingreso.save()
+        self.assertEqual(self._stock(), 2)
+        self.assertEqual(MovimientoInventario.objects.get(pk=ingreso.pk).cantidad, 10)
+
+    def test_eliminar_revierte(self):
+        ingreso = self._movimiento('ingreso', 10)
+        salida = self._movimiento('salida', 4)
+        salida.delete()
+        self.assertEqual(self._stock(), 10)
+        self._movimiento('salida', 8)
+        # Eliminar el ingreso dejaría el stock en negativo
+        with self.assertRaises(StockInsuficienteError):
+            ingreso.delete()
+        self.assertTrue(MovimientoInventario.objects.filter(pk=ingreso.pk).exists())
+        self.assertEqual(self._stock(), 2)
+
+    def test_transferencia(self):
+        self._movimiento('ingreso', 10)
+        transferencia = self._movimiento('transferencia', 4, bodega_destino=self.sala)
+        self.assertEqual(self._stock(), 10)
+        self.assertEqual(self._saldos(), {'BOD-CENTRAL': 6, 'BOD-SALA': 4})
+        transferencia.cantidad = 6
+        transferencia.save()
+        self.assertEqual(self._saldos(), {'BOD-CENTRAL': 4, 'BOD-SALA': 6})
+        transferencia.delete()
+        self.assertEqual(self._stock(), 10)
+        self.assertEqual(self._saldos(), {'BOD-CENTRAL': 10})
+
+
+class SalidasFEFOTests(StockMovimientosTestCase):
+    """Salidas sin lote repartidas entre lotes del vencimiento más próximo al más lejano"""
+
+    def setUp(self):
+        super().setUp()
+        hoy = timezone.localdate()
+        self._movimiento('ingreso', 5, lote='L-TARDE', fecha_vencimiento=hoy + timedelta(days=30))
+        self._movimiento('ingreso', 3, lote='L-PRONTO', fecha_vencimiento=hoy + timedelta(days=5))
+        self._movimiento('ingreso', 4, lote='L-SIN-VENCIMIENTO')
+
+    def _salida(self, cantidad):
+        return registrar_salida_fefo(MovimientoInventario(
+            fecha=timezone.now(), tipo='salida', producto=self.producto, bodega=self.central, cantidad=cantidad,
+        ))
+
+    def _lotes(self):
+        return dict(StockBodega.objects.filter(producto=self.producto).values_list('lote', 'cantidad'))
+
+    def test_salida_repartida_entre_lotes(self):
+        piezas = self._salida(10)
+        self.assertEqual(
+            [(pieza.lote, pieza.cantidad) for pieza in piezas],
+            [('L-PRONTO', 3), ('L-TARDE', 5), ('L-SIN-VENCIMIENTO', 2)],
+        )
+        self.assertEqual(self._lotes(), {'L-PRONTO': 0, 'L-TARDE': 0, 'L-SIN-VENCIMIENTO': 2})
+        self.assertEqual(self._stock(), 2)
+
+    def test_eliminar_una_parte_devuelve_su_lote(self):
+        piezas = self._salida(6)
+        piezas[1].delete()
+        self.assertEqual(self._lotes(), {'L-PRONTO': 0, 'L-TARDE': 5, 'L-SIN-VENCIMIENTO': 4})
+
+    def test_salida_mayor_al_stock(self):
+        with self.assertRaises(StockInsuficienteError):
+            self._salida(13)
+        self.assertEqual(MovimientoInventario.objects.filter(tipo='salida').count(), 0)
+        self.assertEqual(self._lotes(), {'L-PRONTO': 3, 'L-TARDE': 5, 'L-SIN-VENCIMIENTO': 4})
+
+
+class IdempotenciaMovimientosTests(StockMovimientosTestCase):
+    """Un reenvío con la misma clave responde el resultado original sin registrar de nuevo"""
+
+    def setUp(self):
+        super().setUp()
+        self.usuario = _usuario('bodega', 'employee')
+        self._movimiento('ingreso', 10)
+
+    def _registrar_salida(self, cantidad):
+        def registrar():
+            movimiento = self._movimiento('salida', cantidad)
+            return {'movimientos': [movimiento.pk], 'mensaje': 'registrado'}
+        return registrar
+
+    def test_reenvio_devuelve_el_resultado_guardado(self):
+        resultado, repetido = ejecutar_una_vez(self.usuario, 'clave-0001', self._registrar_salida(3))
+        self.assertFalse(repetido)
+        reenvio, repetido = ejecutar_una_vez(self.usuario, 'clave-0001', self._registrar_salida(3))
+        self.assertTrue(repetido)
+        self.assertEqual(reenvio, resultado)
+        self.assertEqual(buscar_resultado(self.usuario, 'clave-0001'), resultado)
+        self.assertEqual(self._stock(), 7)
+
+    def test_la_clave_es_por_usuario(self):
+        ejecutar_una_vez(self.usuario, 'clave-0001', self._registrar_salida(3))
+        _, repetido = ejecutar_una_vez(_usuario('sala', 'employee'), 'clave-0001', self._registrar_salida(3))
+        self.assertFalse(repetido)
+        self.assertEqual(self._stock(), 4)
+
+    def test_una_falla_libera_la_clave(self):
+        with self.assertRaises(StockInsuficienteError):
+            ejecutar_una_vez(self.usuario, 'clave-0001', self._registrar_salida(11))
+        self.assertIsNone(buscar_resultado(self.usuario, 'clave-0001'))
+        _, repetido = ejecutar_una_vez(self.usuario, 'clave-0001', self._registrar_salida(4))
+        self.assertFalse(repetido)
+        self.assertEqual(self._stock(), 6)
+
+    def test_formulario_reenviado(self):
+        # El formulario solo ofrece productos aprobados
+        Product.objects.filter(pk=self.producto.pk).update(estado_aprobacion='APROBADO')
+        self.client.force_login(self.usuario)
+        datos = {
+            'fecha': timezone.localtime().strftime('%Y-%m-%dT%H:%M'), 'tipo': 'salida', 'producto': self.producto.pk,
+            'bodega': self.central.pk, 'cantidad': '2', 'clave_idempotencia': 'clave-0001',
+        }
+        for _ in range(2):
+            respuesta = self.client.post(reverse('movimiento_create'), datos)
+            self.assertRedirects(respuesta, reverse('movimientos_list'), fetch_redirect_response=False)
+        self.assertEqual(MovimientoInventario.objects.filter(tipo='salida').count(), 1)
+        self.assertEqual(self._stock(), 8)
+
+
+class PaginacionCursorTests(StockMovimientosTestCase):
+    """Paginación por cursor (fecha, created_at, id) de la lista de movimientos"""
+
+    def setUp(self):
+        super().setUp()
+        # Varios movimientos con la misma fecha: el desempate es created_at e id
+        fecha = timezone.now() - timedelta(hours=1)
+        self.movimientos = [
+            self._movimiento('ajuste', 1, fecha=fecha + timedelta(minutes=i // 2)) for i in range(7)
+        ]
+        self.esperados = [m.pk for m in sorted(
+            self.movimientos, key=lambda m: (m.fecha, m.created_at, m.pk), reverse=True
+        )]
+
+    def _recorrer(self, queryset):
+        vistos, token = [], None
+        while True:
+            pagina = paginar_por_cursor(queryset, token, 3)
+            vistos.extend(m.pk for m in pagina)
+            if not pagina.has_next():
+                return vistos
+            token = pagina.token_siguiente
+
+    def test_recorre_todo_sin_repetir(self):
+        self.assertEqual(self._recorrer(MovimientoInventario.objects.all()), self.esperados)
+
+    def test_pagina_anterior(self):
+        primera = paginar_por_cursor(MovimientoInventario.objects.all(), None, 3)
+        segunda = paginar_por_cursor(MovimientoInventario.objects.all(), primera.token_siguiente, 3)
+        self.assertTrue(segunda.has_previous())
+        anterior = paginar_por_cursor(MovimientoInventario.objects.all(), segunda.token_anterior, 3)
+        self.assertEqual([m.pk for m in anterior], [m.pk for m in primera])
+        self.assertFalse(anterior.has_previous())
+
+    def test_intercala_varias_tablas(self):
+        pares = MovimientoInventario.objects.filter(pk__in=self.esperados[::2])
+        impares = MovimientoInventario.objects.exclude(pk__in=self.esperados[::2])
+        self.assertEqual(self._recorrer([pares, impares]), self.esperados)
+
+    def test_token_invalido_es_la_primera_pagina(self):
+        pagina = paginar_por_cursor(MovimientoInventario.objects.all(), 'no-es-un-token', 3)
+        self.assertEqual([m.pk for m in pagina], self.esperados[:3])
+        self.assertFalse(pagina.has_previous())
+
+    def test_vista(self):
+        self.client.force_login(_usuario('consulta', 'viewer'))
+        ultimo = MovimientoInventario.objects.get(pk=self.esperados[0])
+        respuesta = self.client.get(reverse('movimientos_list'), {'cursor': codificar_token(ultimo, ANTERIOR)})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(len(respuesta.context['movimientos']), 0)
+        respuesta = self.client.get(reverse('movimientos_list'), {'modo': 'paginas', 'page': 99})
+        self.assertEqual(respuesta.context['modo'], 'paginas')
+
+
+class BusquedaMovimientosTests(StockMovimientosTestCase):
+    """Búsqueda de movimientos sobre texto_busqueda normalizado"""
+
+    def setUp(self):
+        super().setUp()
+        Product.objects.filter(pk=self.producto.pk).update(name='Bombón de maní')
+        self.producto.refresh_from_db()
+        self.proveedor = Proveedor.objects.create(rut='76086428-5', razon_social='Dulces del Sur', email='ventas@sur.cl')
+        self.ingreso = self._movimiento('ingreso', 10, proveedor=self.proveedor, doc_referencia='OC-123', lote='L-7')
+        self.otro = self._movimiento('ajuste', 1, doc_referencia='OC 9', motivo='123')
+
+    def _buscar(self, q, queryset=None):
+        return set(filtrar_busqueda_movimientos(queryset or MovimientoInventario.objects.all(), q).values_list('pk', flat=True))
+
+    def test_normalizar(self):
+        self.assertEqual(normalizar_busqueda('  Bombón_de MANÍ (OC-123) '), 'bombon de mani oc 123')
+
+    def test_busca_sin_tildes_ni_signos(self):
+        self.assertEqual(self._buscar('bombon'), {self.ingreso.pk, self.otro.pk})
+        self.assertEqual(self._buscar('oc-123'), {self.ingreso.pk})
+        self.assertEqual(self._buscar('OC 123'), {self.ingreso.pk})
+        self.assertEqual(self._buscar('dulces 76086428'), {self.ingreso.pk})
+        self.assertEqual(self._buscar('oc 12'), {self.ingreso.pk})
+
+    def test_las_palabras_no_cruzan_campos(self):
+        # "sur" termina la razón social y "76086428" inicia el RUT: separados por SEPARADOR
+        self.assertEqual(self._buscar('sur76086428'), set())
+        self.assertEqual(self._buscar('mani l'), {self.ingreso.pk})
+
+    def test_renombrar_producto_y_proveedor(self):
+        self.producto.name = 'Calugas'
+        self.producto.save()
+        self.proveedor.razon_social = 'Golosinas Andinas'
+        self.proveedor.save()
+        self.assertEqual(self._buscar('calugas'), {self.ingreso.pk, self.otro.pk})
+        self.assertEqual(self._buscar('bombon'), set())
+        self.assertEqual(self._buscar('andinas'), {self.ingreso.pk})
+
+    def test_archivo_usa_like(self):
+        campos = {campo.attname: getattr(self.ingreso, campo.attname) for campo in MovimientoInventario._meta.concrete_fields}
+        MovimientoArchivado.objects.create(archivado_en=timezone.now(), **campos)
+        self.assertEqual(self._buscar('oc-123', MovimientoArchivado.objects.all()), {self.ingreso.pk})
+
+
+class ReporteInventarioTests(StockMovimientosTestCase):
+    """Reporte Excel de inventario escrito en modo write_only con lotes por cursor"""
+
+    def setUp(self):
+        super().setUp()
+        fecha = timezone.now() - timedelta(hours=1)
+        self.movimientos = [
+            self._movimiento('ajuste', i + 1, fecha=fecha + timedelta(minutes=i // 2), doc_referencia=f'DOC-{i}')
+            for i in range(5)
+        ]
+        _usuario('bodega', 'employee')
+
+    def test_recorre_en_lotes(self):
+        esperados = [m.pk for m in sorted(self.movimientos, key=lambda m: (m.fecha, m.created_at, m.pk), reverse=True)]
+        self.assertEqual([fila[0] for fila in recorrer_movimientos(MovimientoInventario.objects.all(), ['id'], chunk_size=2)], esperados)
+        partes = [MovimientoInventario.objects.filter(pk__in=esperados[::2]), MovimientoInventario.objects.exclude(pk__in=esperados[::2])]
+        self.assertEqual([fila[0] for fila in recorrer_movimientos(partes, ['id'], chunk_size=2)], esperados)
+
+    def test_libro(self):
+        from openpyxl import load_workbook
+
+        destino = BytesIO()
+        avances = []
+        total = escribir_reporte_inventario(destino, progreso=avances.append, cada=2)
+        libro = load_workbook(destino, read_only=True)
+        self.assertEqual(libro.sheetnames, ['Productos', 'Usuarios Empleado', 'Movimientos'])
+        movimientos = list(libro['Movimientos'].iter_rows(min_row=2, values_only=True))
+        self.assertEqual([fila[10] for fila in movimientos], ['DOC-4', 'DOC-3', 'DOC-2', 'DOC-1', 'DOC-0'])
+        self.assertEqual(movimientos[0][2], self.producto.sku)
+        self.assertEqual(total, 1 + 1 + 5)
+        self.assertEqual(avances, [2, 4, 6, 7])
+
+
+@override_settings(EXPORTACIONES_WORKER='comando')
+class ExportacionesSegundoPlanoTests(TestCase):
+    """Exportaciones encoladas, procesadas por el worker y descargadas solo por quien las pidió"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.usuario = _usuario('bodega', 'employee')
+        self.client.force_login(self.usuario)
+
+    def _encolar(self):
+        respuesta = self.client.get(reverse('export_inventory_excel'))
+        self.assertRedirects(respuesta, reverse('exportaciones_list'), fetch_redirect_response=False)
+        return TrabajoExportacion.objects.get(solicitado_por=self.usuario)
+
+    def test_encolar_procesar_y_descargar(self):
+        trabajo = self._encolar()
+        self.assertEqual(trabajo.estado, 'pendiente')
+        self.assertTrue(procesar_siguiente())
+        self.assertFalse(procesar_siguiente())
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.estado, 'completado')
+        self.assertEqual(trabajo.progreso, 1)
+
+        estado = self.client.get(reverse('exportacion_estado', args=[trabajo.pk])).json()
+        self.assertEqual(estado['descargar_url'], reverse('exportacion_descargar', args=[trabajo.pk]))
+        respuesta = self.client.get(estado['descargar_url'])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(b''.join(respuesta.streaming_content).startswith(b'PK'))
+
+    def test_solo_quien_la_pidio(self):
+        trabajo = self._encolar()
+        self.client.force_login(_usuario('otro', 'employee'))
+        self.assertEqual(self.client.get(reverse('exportacion_estado', args=[trabajo.pk])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('exportacion_descargar', args=[trabajo.pk])).status_code, 404)
+
+    def test_un_trabajo_se_procesa_una_vez(self):
+        trabajo = self._encolar()
+        self.assertTrue(procesar_trabajo(trabajo.pk))
+        self.assertFalse(procesar_trabajo(trabajo.pk))
+
+    def test_error_e_interrumpidos(self):
+        trabajo = self._encolar()
+        with mock.patch('production.export_jobs.exportar_inventario', side_effect=RuntimeError('sin disco')), \
+                self.assertLogs('production.export_jobs', 'ERROR'):
+            procesar_trabajo(trabajo.pk)
+        trabajo.refresh_from_db()
+        self.assertEqual((trabajo.estado, trabajo.error), ('error', 'sin disco'))
+
+        otro = TrabajoExportacion.objects.create(
+            tipo='inventario', solicitado_por=self.usuario, estado='en_proceso',
+            iniciado_en=timezone.now() - timedelta(hours=2),
+        )
+        self.assertEqual(marcar_interrumpidos(3600), 1)
+        otro.refresh_from_db()
+        self.assertEqual(otro.estado, 'error')
+
+
+class ArchivoMovimientosTests(StockMovimientosTestCase):
+    """Traslado de movimientos antiguos cubiertos por un snapshot al archivo"""
+
+    def setUp(self):
+        super().setUp()
+        self.hoy = timezone.localdate()
+        self.antiguos = [
+            self._movimiento('ajuste', 10, fecha=timezone.now() - timedelta(days=400)),
+            self._movimiento('salida', 3, fecha=timezone.now() - timedelta(days=399)),
+        ]
+        self.reciente = self._movimiento('salida', 2, fecha=timezone.now() - timedelta(days=1))
+
+    def test_sin_snapshot_no_archiva(self):
+        self.assertEqual(archivar_movimientos(dias=365), (0, None))
+        self.assertEqual(MovimientoInventario.objects.count(), 3)
+        self.assertIsNone(inicio_periodo_abierto())
+
+    def test_archivar(self):
+        generar_snapshot(self.hoy - timedelta(days=390))
+        avances = []
+        self.assertEqual(archivar_movimientos(dias=365, lote=1, progreso=avances.append), (2, self.hoy - timedelta(days=390)))
+        self.assertEqual(avances, [1, 2])
+        self.assertEqual(list(MovimientoInventario.objects.values_list('pk', flat=True)), [self.reciente.pk])
+        self.assertEqual(
+            sorted(MovimientoArchivado.objects.values_list('pk', flat=True)), sorted(m.pk for m in self.antiguos)
+        )
+        # Los saldos no cambian
+        self.assertEqual(self._stock(), 5)
+        self.assertEqual(self._saldos(), {'BOD-CENTRAL': 5})
+        reconstruir_stock_bodega()
+        self.assertEqual(self._saldos(), {'BOD-CENTRAL': 5})
+
+    def test_periodo_cerrado(self):
+        generar_snapshot(self.hoy - timedelta(days=390))
+        archivar_movimientos(dias=365)
+        limite = self.antiguos[-1].fecha
+        self.assertEqual(inicio_periodo_abierto(), fin_del_dia(timezone.localtime(limite).date()))
+        self.assertEqual(modelos_para_rango(limite + timedelta(days=1)), [MovimientoInventario])
+        self.assertEqual(modelos_para_rango(None), [MovimientoInventario, MovimientoArchivado])
+        with self.assertRaises(ErrorImportacion) as contexto:
+            importar_movimientos([{
+                'fecha': limite.strftime('%Y-%m-%d'), 'tipo': 'ajuste', 'sku': self.producto.sku,
+                'bodega': 'BOD-CENTRAL', 'cantidad': 1,
+            }])
+        self.assertIn('período cerrado', contexto.exception.errores[0])
+
+    def test_kardex_cruza_el_archivo(self):
+        generar_snapshot(self.hoy - timedelta(days=390))
+        archivar_movimientos(dias=365)
+        desde = self.hoy - timedelta(days=401)
+        saldo, valor = apertura_kardex(self.producto, desde=desde)
+        filas = list(iterar_kardex(self.producto, desde=desde, saldo_apertura=saldo, valor_apertura=valor))
+        self.assertEqual([fila['id'] for fila in filas], [m.pk for m in self.antiguos] + [self.reciente.pk])
+        self.assertEqual([fila['saldo'] for fila in filas], [10, 7, 5])
+
+
+@override_settings(INDICE_CODIGOS_SEGUNDOS=60)
+class IndiceCodigosTests(StockMovimientosTestCase):
+    """Índice en memoria de códigos de barras: consulta sin base de datos y parches al confirmar"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        parche = mock.patch('production.inventory_codigos.indice', IndiceCodigos())
+        self.indice = parche.start()
+        self.addCleanup(parche.stop)
+        Product.objects.filter(pk=self.producto.pk).update(estado_aprobacion='APROBADO', ean_upc='7801234567890')
+        self.producto.refresh_from_db()
+
+    def test_busca_por_ean_y_sku(self):
+        self.assertEqual(buscar_codigo(' 7801234567890 ')['id'], self.producto.pk)
+        self.assertEqual(buscar_codigo(self.producto.sku.lower())['id'], self.producto.pk)
+        self.assertIsNone(buscar_codigo('0000000000000'))
+        with self.assertNumQueries(0):
+            buscar_codigo('7801234567890')
+
+    def test_parches_al_confirmar(self):
+        buscar_codigo('7801234567890')
+        with self.captureOnCommitCallbacks(execute=True):
+            self._movimiento('ajuste', 7)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.refresh_from_db()
+            self.producto.ean_upc = '7809999999999'
+            self.producto.save()
+        with self.assertNumQueries(0):
+            self.assertIsNone(buscar_codigo('7801234567890'))
+            self.assertEqual(buscar_codigo('7809999999999')['stock'], 7)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.is_active = False
+            self.producto.save()
+        self.assertIsNone(buscar_codigo('7809999999999'))
+
+    @override_settings(INDICE_CODIGOS_SEGUNDOS=0)
+    def test_reconstruye_si_otro_proceso_cambio_la_version(self):
+        buscar_codigo('7801234567890')
+        # Otro proceso cambió el producto: aquí solo se ve la nueva versión en la caché
+        Product.objects.filter(pk=self.producto.pk).update(name='Barra rellena')
+        cache.set(CLAVE_VERSION, 99, timeout=None)
+        self.assertEqual(buscar_codigo('7801234567890')['nombre'], 'Barra rellena')
+
+    def test_vista(self):
+        self.client.force_login(_usuario('caja', 'employee'))
+        url = reverse('producto_por_codigo_api')
+        respuesta = self.client.get(url, {'codigo': '7801234567890'})
+        self.assertEqual(respuesta.json()['ok'], True)
+        self.assertEqual(respuesta.json()['id'], self.producto.pk)
+        respuesta = self.client.get(url, {'codigo': 'no-existe'})
+        self.assertEqual((respuesta.status_code, respuesta.json()['ok']), (404, False))
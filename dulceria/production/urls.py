@@ -2,6 +2,7 @@ from django.urls import path
 from . import views
 from . import admin_views
 from . import inventory_views
+from . import export_views
 
 urlpatterns = [
     # CRUD de productos
@@ -37,8 +38,25 @@ urlpatterns = [
     # Módulo de inventario
     path("inventario/", inventory_views.inventory_dashboard, name="inventory_dashboard"),
     path("inventario/movimientos/", inventory_views.movimientos_list, name="movimientos_list"),
+    path("inventario/stock-bodega/", inventory_views.stock_bodega_list, name="stock_bodega_list"),
+    path("inventario/stock-a-fecha/", inventory_views.stock_a_fecha_view, name="stock_a_fecha"),
+    path("inventario/api/stock-a-fecha/", inventory_views.stock_a_fecha_api, name="stock_a_fecha_api"),
+    path("inventario/api/codigo/", inventory_views.producto_por_codigo_api, name="producto_por_codigo_api"),
+    path("inventario/api/autocompletar/productos/", inventory_views.autocompletar_productos_api, name="autocompletar_productos_api"),
+    path("inventario/api/autocompletar/proveedores/", inventory_views.autocompletar_proveedores_api, name="autocompletar_proveedores_api"),
+    path("inventario/kardex/<int:pk>/", inventory_views.kardex_view, name="kardex"),
+    path("inventario/kardex/<int:pk>/exportar/", inventory_views.kardex_export, name="kardex_export"),
+    path("inventario/reposicion/", inventory_views.reposicion_view, name="reposicion"),
+    path("inventario/reposicion/exportar/", inventory_views.reposicion_export, name="reposicion_export"),
     path("inventario/movimientos/crear/", inventory_views.movimiento_create, name="movimiento_create"),
+    path("inventario/movimientos/exportar/", inventory_views.movimientos_export, name="movimientos_export"),
+    path("inventario/movimientos/importar/", inventory_views.movimientos_importar, name="movimientos_importar"),
     path("inventario/movimientos/<int:pk>/editar/", inventory_views.movimiento_edit, name="movimiento_edit"),
     path("inventario/movimientos/<int:pk>/eliminar/", inventory_views.movimiento_delete, name="movimiento_delete"),
     path("inventario/exportar-excel/", inventory_views.export_inventory_excel, name="export_inventory_excel"),
+    
+    # Exportaciones en segundo plano
+    path("exportaciones/", export_views.exportaciones_list, name="exportaciones_list"),
+    path("exportaciones/<int:pk>/estado/", export_views.exportacion_estado, name="exportacion_estado"),
+    path("exportaciones/<int:pk>/descargar/", export_views.exportacion_descargar, name="exportacion_descargar"),
 ]
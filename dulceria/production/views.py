@@ -1,13 +1,20 @@
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.db.models import Q, Count, Prefetch
+from django.db.models import Count
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.http import JsonResponse, HttpResponseBadRequest
 from django.views.decorators.http import require_POST, require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+import hashlib
+from collections import defaultdict
 from .models import Product, Category
+from .busqueda_productos import buscar_productos
+from .cache_utils import ETIQUETA_CATEGORIAS, ETIQUETA_PRODUCTOS, ETIQUETA_STOCK, cache_etiquetada, cache_query
 from .forms import ProductForm
 from organizations.models import Organization, Zone
 
@@ -96,7 +103,8 @@ def products_list(request):
     
     # Obtener parámetros de búsqueda y ordenamiento
     q = request.GET.get('q', '')
-    sort = request.GET.get('sort', 'name')
+    # Con búsqueda, por defecto se ordena por relevancia
+    sort = request.GET.get('sort', 'relevancia' if q else 'name')
     
     # Obtener productos según el rol - optimizado con índices
     if role == 'proveedor':
@@ -113,22 +121,15 @@ def products_list(request):
             estado_aprobacion='APROBADO'
         )
     
-    # Aplicar búsqueda - optimizado para usar índices
+    # Aplicar búsqueda con el índice de texto (ordena por relevancia)
     if q:
-        # Optimizar búsqueda: usar índices en name y sku cuando sea posible
-        search_conditions = Q()
-        if q.isdigit() or len(q) >= 3:  # Si parece un SKU o búsqueda sustancial
-            search_conditions |= Q(sku__icontains=q)  # Índice en sku
-        search_conditions |= Q(name__icontains=q)  # Índice en name
-        search_conditions |= Q(description__icontains=q)
-        search_conditions |= Q(category__name__icontains=q)
-        products = products.filter(search_conditions)
+        products = buscar_productos(products, q)
     
     # Aplicar ordenamiento
     allowed_sort_fields = ['name', '-name', 'price', '-price', 'stock', '-stock', 'category__name', '-category__name']
     if sort in allowed_sort_fields:
         products = products.order_by(sort)
-    else:
+    elif not (q and sort == 'relevancia'):
         products = products.order_by('name')
     
     # Obtener elementos por página
@@ -136,6 +137,12 @@ def products_list(request):
     
     # Paginación - usar count() cacheado si es posible para mejorar rendimiento
     paginator = Paginator(products, per_page)
+    # El total no depende del orden: se cachea por alcance y búsqueda con la etiqueta de productos
+    alcance = f'proveedor{request.user.pk}' if role == 'proveedor' else 'aprobados'
+    paginator.count = cache_etiquetada.get_or_set(
+        'products_list_count:' + hashlib.md5(f'{alcance}|{q}'.encode()).hexdigest(),
+        lambda: paginator.count, [ETIQUETA_PRODUCTOS],
+    )
     page = request.GET.get('page', 1)
     
     try:
@@ -330,30 +337,36 @@ def categories_overview(request):
     # Filtrar productos según el rol
     if role == 'proveedor':
         # Proveedores ven sus productos
-        products_filter = Product.objects.filter(
+        alcance = f'proveedor{request.user.pk}'
+        products_filter = lambda: Product.objects.filter(
             is_active=True,
             creado_por=request.user
         ).order_by('name')
-    elif role in ['admin', 'manager', 'employee']:
-        # Admin, manager y empleados ven productos aprobados
-        products_filter = Product.objects.filter(
-            is_active=True,
-            estado_aprobacion='APROBADO'
-        ).order_by('name')
     else:
-        # Clientes ven productos aprobados
-        products_filter = Product.objects.filter(
+        # Admin, manager, empleados y clientes ven productos aprobados
+        alcance = 'aprobados'
+        products_filter = lambda: Product.objects.filter(
             is_active=True,
             estado_aprobacion='APROBADO'
         ).order_by('name')
     
-    categories = Category.objects.all().prefetch_related(
-        Prefetch(
-            'product_set',
-            queryset=products_filter,
-            to_attr='active_products'
-        )
+    # Filas cacheadas (sin consultas en un acierto); el stock invalida por su propia etiqueta
+    productos = cache_query(
+        f'categories_overview_productos:{alcance}', products_filter,
+        campos=['id', 'name', 'sku', 'stock', 'price', 'category_id'],
+        etiquetas=[ETIQUETA_PRODUCTOS, ETIQUETA_STOCK],
+    )
+    categorias = cache_query(
+        'categories_overview_categorias', lambda: Category.objects.order_by('name'),
+        campos=['id', 'name'], timeout=3600, etiquetas=[ETIQUETA_CATEGORIAS],
     )
+    por_categoria = defaultdict(list)
+    for producto in productos:
+        por_categoria[producto.category_id].append(producto)
+    categories = [
+        {'id': categoria.id, 'name': categoria.name, 'active_products': por_categoria[categoria.id]}
+        for categoria in categorias
+    ]
 
     context = {
         'categories': categories,
@@ -366,17 +379,12 @@ def categories_overview(request):
 # VISTAS PARA CLIENTES (TIENDA ONLINE)
 # ===========================================
 
-def tienda_online(request):
-    """Vista principal de la tienda online para clientes"""
-    # Contador de visitas en sesión
-    visitas = request.session.get('visitas', 0)
-    request.session['visitas'] = visitas + 1
-    
-    # Obtener parámetros de búsqueda y ordenamiento
-    q = request.GET.get('q', '')
-    sort = request.GET.get('sort', 'name')
-    categoria_id = request.GET.get('categoria', '')
-    
+# Reemplaza al token CSRF en el grid cacheado de la tienda (se comparte entre visitantes)
+MARCADOR_CSRF = '__csrf_token_tienda__'
+
+
+def _renderizar_grid_tienda(q, sort, categoria_id, page, per_page):
+    """HTML del grid de productos y la paginación de la tienda (sin datos del visitante)"""
     # Obtener productos activos disponibles (stock > 0) y aprobados
     # Optimizado con select_related y uso de índices
     products = Product.objects.select_related('category').filter(
@@ -385,14 +393,9 @@ def tienda_online(request):
         estado_aprobacion='APROBADO'
     )
     
-    # Aplicar búsqueda
+    # Aplicar búsqueda con el índice de texto (ordena por relevancia)
     if q:
-        products = products.filter(
-            Q(name__icontains=q) |
-            Q(sku__icontains=q) |
-            Q(description__icontains=q) |
-            Q(category__name__icontains=q)
-        )
+        products = buscar_productos(products, q)
     
     # Filtrar por categoría
     if categoria_id:
@@ -402,37 +405,62 @@ def tienda_online(request):
     allowed_sort_fields = ['name', '-name', 'price', '-price']
     if sort in allowed_sort_fields:
         products = products.order_by(sort)
-    else:
+    elif not (q and sort == 'relevancia'):
         products = products.order_by('name')
     
-    # Obtener elementos por página
-    per_page = get_pagination_per_page(request, session_key='tienda_per_page', default=10)
-    
     # Paginación
     paginator = Paginator(products, per_page)
-    page = request.GET.get('page', 1)
-    
     try:
         page_obj = paginator.page(page)
-    except PageNotAnInteger:
-        page_obj = paginator.page(1)
     except EmptyPage:
         page_obj = paginator.page(paginator.num_pages)
     
-    # Obtener categorías para el filtro - cachear IDs para mejor rendimiento
-    from django.core.cache import cache
-    cache_key_categorias = 'categorias_list_ids'
-    categoria_ids = cache.get(cache_key_categorias)
-    if categoria_ids is None:
-        categorias = Category.objects.all().order_by('name')
-        categoria_ids = list(categorias.values_list('id', flat=True))
-        cache.set(cache_key_categorias, categoria_ids, 3600)  # Cachear IDs por 1 hora
-        categorias = Category.objects.filter(id__in=categoria_ids).order_by('name')
-    else:
-        categorias = Category.objects.filter(id__in=categoria_ids).order_by('name')
+    return render_to_string('production/tienda_productos.html', {
+        'products': page_obj,
+        'q': q,
+        'sort': sort,
+        'categoria_id': categoria_id,
+        # {% csrf_token %} dibuja este marcador; la vista pone el token de cada visitante
+        'csrf_token': MARCADOR_CSRF,
+    })
+
+
+def tienda_online(request):
+    """Vista principal de la tienda online para clientes"""
+    # Contador de visitas en sesión
+    visitas = request.session.get('visitas', 0)
+    request.session['visitas'] = visitas + 1
+    
+    # Obtener parámetros de búsqueda y ordenamiento
+    q = request.GET.get('q', '')
+    # Con búsqueda, por defecto se ordena por relevancia
+    sort = request.GET.get('sort', 'relevancia' if q else 'name')
+    categoria_id = request.GET.get('categoria', '')
+    
+    # Obtener elementos por página
+    per_page = get_pagination_per_page(request, session_key='tienda_per_page', default=10)
+    page = request.GET.get('page', '1')
+    page = page if page.isdigit() else '1'
+    
+    # El grid se cachea renderizado por parámetros con las etiquetas de productos,
+    # categorías y stock (solo muestra productos con stock > 0 y su cantidad):
+    # cambiar cualquiera de ellos deja obsoletas todas las páginas a la vez
+    catalogo = [ETIQUETA_PRODUCTOS, ETIQUETA_CATEGORIAS, ETIQUETA_STOCK]
+    segundos = getattr(settings, 'TIENDA_CACHE_SEGUNDOS', 300)
+    parametros = hashlib.md5(f'{q}|{categoria_id}|{sort}|{page}|{per_page}'.encode()).hexdigest()
+    productos_html = cache_etiquetada.get_or_set(
+        f'tienda_grid:{parametros}',
+        lambda: _renderizar_grid_tienda(q, sort, categoria_id, page, per_page),
+        catalogo, segundos,
+    )
+    categorias = cache_etiquetada.get_or_set(
+        'tienda_categorias',
+        lambda: list(Category.objects.order_by('name').values('id', 'name')),
+        [ETIQUETA_CATEGORIAS], segundos,
+    )
     
     context = {
-        'products': page_obj,
+        'productos_html': mark_safe(productos_html.replace(MARCADOR_CSRF, get_token(request))),
         'categorias': categorias,
         'q': q,
         'sort': sort,
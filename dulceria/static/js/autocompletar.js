@@ -0,0 +1,156 @@
+/*
+ * Autocompletado para los <select data-autocompletar-url> (SelectAutocompletar)
+ *
+ * El select queda oculto y conserva solo la opción elegida; en su lugar se
+ * muestra un campo de texto que consulta el endpoint mientras se escribe.
+ * Enter elige la primera sugerencia sin enviar el formulario, para que los
+ * lectores de código de barras (que terminan con Enter) funcionen.
+ */
+(function () {
+    'use strict';
+
+    const ESPERA_MS = 200;
+
+    function iniciar(select) {
+        const contenedor = document.createElement('div');
+        contenedor.className = 'position-relative';
+
+        const entrada = document.createElement('input');
+        entrada.type = 'text';
+        entrada.className = 'form-control';
+        entrada.autocomplete = 'off';
+        entrada.placeholder = select.dataset.placeholder || '';
+        const elegida = select.options[select.selectedIndex];
+        entrada.value = elegida && elegida.value ? elegida.text : '';
+        if (select.hasAttribute('readonly') || select.disabled) {
+            entrada.readOnly = true;
+        }
+
+        const lista = document.createElement('div');
+        lista.className = 'list-group position-absolute w-100 shadow-sm d-none';
+        lista.style.zIndex = 1000;
+        lista.style.maxHeight = '20rem';
+        lista.style.overflowY = 'auto';
+
+        select.classList.add('d-none');
+        select.parentNode.insertBefore(contenedor, select);
+        contenedor.appendChild(entrada);
+        contenedor.appendChild(lista);
+        contenedor.appendChild(select);
+
+        let resultados = [];
+        let activo = -1;
+        let temporizador = null;
+        let solicitud = 0;
+
+        function cerrar() {
+            lista.classList.add('d-none');
+            lista.innerHTML = '';
+            resultados = [];
+            activo = -1;
+        }
+
+        function elegir(resultado) {
+            select.innerHTML = '';
+            select.add(new Option('---------', ''));
+            if (resultado) {
+                select.add(new Option(resultado.texto, resultado.id, true, true));
+                entrada.value = resultado.texto;
+            }
+            select.dispatchEvent(new Event('change', { bubbles: true }));
+            cerrar();
+        }
+
+        function marcar(indice) {
+            activo = indice;
+            Array.from(lista.children).forEach(function (item, i) {
+                item.classList.toggle('active', i === activo);
+            });
+        }
+
+        function mostrar(datos) {
+            lista.innerHTML = '';
+            resultados = datos;
+            activo = datos.length ? 0 : -1;
+            if (!datos.length) {
+                const vacio = document.createElement('div');
+                vacio.className = 'list-group-item text-muted small';
+                vacio.textContent = 'Sin resultados';
+                lista.appendChild(vacio);
+            }
+            datos.forEach(function (resultado, i) {
+                const item = document.createElement('button');
+                item.type = 'button';
+                item.className = 'list-group-item list-group-item-action' + (i === 0 ? ' active' : '');
+                item.textContent = resultado.texto;
+                // mousedown en vez de click: se dispara antes del blur de la entrada
+                item.addEventListener('mousedown', function (evento) {
+                    evento.preventDefault();
+                    elegir(resultado);
+                });
+                lista.appendChild(item);
+            });
+            lista.classList.remove('d-none');
+        }
+
+        function consultar() {
+            const texto = entrada.value.trim();
+            if (!texto) {
+                cerrar();
+                return;
+            }
+            const numero = ++solicitud;
+            const url = new URL(select.dataset.autocompletarUrl, window.location.origin);
+            url.searchParams.set('q', texto);
+            fetch(url, { headers: { 'Accept': 'application/json' }, credentials: 'same-origin' })
+                .then(function (respuesta) { return respuesta.json(); })
+                .then(function (datos) {
+                    // Se descartan las respuestas de consultas que ya fueron reemplazadas
+                    if (numero === solicitud && datos.ok) {
+                        mostrar(datos.resultados);
+                    }
+                })
+                .catch(cerrar);
+        }
+
+        entrada.addEventListener('input', function () {
+            if (!entrada.value.trim() && select.value) {
+                elegir(null);
+            }
+            clearTimeout(temporizador);
+            temporizador = setTimeout(consultar, ESPERA_MS);
+        });
+
+        entrada.addEventListener('keydown', function (evento) {
+            if (evento.key === 'ArrowDown' && resultados.length) {
+                evento.preventDefault();
+                marcar(Math.min(activo + 1, resultados.length - 1));
+            } else if (evento.key === 'ArrowUp' && resultados.length) {
+                evento.preventDefault();
+                marcar(Math.max(activo - 1, 0));
+            } else if (evento.key === 'Enter') {
+                evento.preventDefault();
+                if (activo >= 0) {
+                    elegir(resultados[activo]);
+                } else {
+                    // Enter antes de que llegue la respuesta (lector de códigos): consultar ya
+                    clearTimeout(temporizador);
+                    consultar();
+                }
+            } else if (evento.key === 'Escape') {
+                cerrar();
+            }
+        });
+
+        entrada.addEventListener('blur', function () {
+            // Si se dejó texto sin elegir una sugerencia, se vuelve a mostrar la opción elegida
+            const actual = select.options[select.selectedIndex];
+            entrada.value = actual && actual.value ? actual.text : '';
+            cerrar();
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('select[data-autocompletar-url]').forEach(iniciar);
+    });
+})();